@@ -1,12 +1,17 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, g, has_request_context, Response
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, g, has_request_context, Response, stream_with_context
+from flask import before_render_template, template_rendered
 from flask.sessions import SessionInterface, SessionMixin
-from functools import wraps
+from functools import partial, wraps
 from config import Config
+import build_static
 import models
+from models import WorkflowTransitionError
 from datetime import datetime, date, timedelta, timezone
-from collections import Counter
+from collections import Counter, deque
 import os
 import io
+import gzip
+import queue
 import csv
 import re
 import copy
@@ -22,6 +27,8 @@ import time
 import hmac
 import hashlib
 import secrets
+import tempfile
+import threading
 from uuid import uuid4
 from werkzeug.exceptions import (
     BadGateway,
@@ -36,18 +43,32 @@ from werkzeug.exceptions import (
     TooManyRequests,
     Unauthorized,
 )
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
 from werkzeug.datastructures import CallbackDict
 from werkzeug.utils import secure_filename
 try:
-    from openpyxl import load_workbook
+    from openpyxl import Workbook, load_workbook
 except Exception:
-    load_workbook = None
+    Workbook = load_workbook = None
+try:
+    from rapidfuzz import fuzz as _fuzz, process as _fuzz_process
+except ImportError:
+    _fuzz = _fuzz_process = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 config = Config()
 app = Flask(__name__)
 app.config['SECRET_KEY'] = config.SECRET_KEY
-app.config['TEMPLATES_AUTO_RELOAD'] = True
-app.jinja_env.auto_reload = True
+app.config['TEMPLATES_AUTO_RELOAD'] = config.TEMPLATE_AUTO_RELOAD
+app.jinja_env.auto_reload = config.TEMPLATE_AUTO_RELOAD
+if config.TEMPLATE_BYTECODE_CACHE_DIR:
+    os.makedirs(config.TEMPLATE_BYTECODE_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(config.TEMPLATE_BYTECODE_CACHE_DIR)
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['SESSION_COOKIE_SECURE'] = config.SESSION_COOKIE_SECURE
@@ -195,6 +216,20 @@ HELP_RESOURCE_TYPES = {'manual', 'flowchart', 'video', 'office_order', 'news'}
 HELP_RESOURCE_STORAGE_KINDS = {'upload', 'external_url'}
 LOGIN_ATTEMPTS = {}
 PETITION_SUBMISSION_ATTEMPTS = {}
+CHATBOT_SNAPSHOT_LIMIT = 20
+# Endpoints whose successful POSTs write petitions; after them the petition data version is bumped.
+PETITION_WRITE_ENDPOINTS = {'petition_new', 'petition_action', 'petitions_import_upload', 'api_petitions_bulk_action'}
+# Queue actions that /api/petitions/bulk-action applies to many petitions in one transaction.
+BULK_WORKFLOW_ACTIONS = {
+    'forward_to_cvo': {'transition': 'forwarded_to_cvo', 'roles': ('super_admin', 'data_entry')},
+    'assign_inspector': {
+        'transition': 'assigned_to_inspector',
+        'roles': ('super_admin', 'cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'),
+    },
+    'po_lodge': {'transition': 'lodged_by_po', 'roles': ('super_admin', 'po')},
+    'close': {'transition': 'closed', 'roles': ('super_admin', 'po')},
+}
+BULK_WORKFLOW_MAX_PETITIONS = 200
 VALID_RECEIVED_AT = {'jmd_office', 'cvo_apspdcl_tirupathi', 'cvo_apepdcl_vizag', 'cvo_apcpdcl_vijayawada'}
 VALID_TARGET_CVO = {'apspdcl', 'apepdcl', 'apcpdcl', 'headquarters'}
 VALID_ORGANIZATIONS = {'aptransco', 'apgenco'}
@@ -1581,10 +1616,38 @@ def _get_or_create_csrf_token():
     return token
 
 
+def _mask_csrf_token(token):
+    """Render the session token behind a fresh one-time pad, so no two responses carry the same bytes.
+
+    Compressed pages can then hold the token without leaking it through response sizes (BREACH).
+    """
+    if not token:
+        return ''
+    raw = token.encode('utf-8')
+    pad = secrets.token_bytes(len(raw))
+    return base64.urlsafe_b64encode(pad + bytes(a ^ b for a, b in zip(pad, raw))).decode('ascii')
+
+
+def _csrf_token_matches(sent_token, expected_token):
+    expected = expected_token.encode('utf-8')
+    sent = sent_token.encode('utf-8')
+    # The bare session token is still accepted from pages rendered before tokens were masked.
+    if hmac.compare_digest(sent, expected):
+        return True
+    try:
+        masked = base64.urlsafe_b64decode(sent)
+    except ValueError:
+        return False
+    if len(masked) != 2 * len(expected):
+        return False
+    pad, cipher = masked[:len(expected)], masked[len(expected):]
+    return hmac.compare_digest(bytes(a ^ b for a, b in zip(pad, cipher)), expected)
+
+
 def _current_csrf_token():
     if 'user_id' in session:
-        return _get_or_create_csrf_token()
-    return session.get('_csrf_token', '')
+        return _mask_csrf_token(_get_or_create_csrf_token())
+    return _mask_csrf_token(session.get('_csrf_token', ''))
 
 
 def _safe_internal_redirect_target(target, fallback_endpoint='dashboard'):
@@ -1662,6 +1725,16 @@ def get_effective_system_settings():
     if cached is not None:
         return cached
 
+    if config.REFERENCE_CACHE_ENABLED:
+        effective = models.REFERENCE_CACHE.get('system_settings', 'effective', _load_effective_system_settings)
+    else:
+        effective = _load_effective_system_settings()
+    if has_request_context():
+        g._effective_system_settings = effective
+    return effective
+
+
+def _load_effective_system_settings():
     effective = _system_setting_defaults()
     raw_overrides = {}
     if hasattr(models, 'get_system_settings'):
@@ -1680,9 +1753,6 @@ def get_effective_system_settings():
             continue
         value = max(int(meta['min']), min(int(meta['max']), value))
         effective[key] = value
-
-    if has_request_context():
-        g._effective_system_settings = effective
     return effective
 
 
@@ -1964,7 +2034,7 @@ def _security_before_request():
         if 'user_id' in session:
             sent_token = (request.form.get('_csrf_token') or request.headers.get('X-CSRF-Token') or '').strip()
             expected_token = session.get('_csrf_token') or ''
-            if not expected_token or not sent_token or not hmac.compare_digest(sent_token, expected_token):
+            if not expected_token or not sent_token or not _csrf_token_matches(sent_token, expected_token):
                 log_security_event('web.csrf_validation_failed', severity='warning')
                 if _request_prefers_json():
                     return jsonify({'error': 'Invalid or missing CSRF token.'}), 403
@@ -1976,6 +2046,295 @@ def _security_before_request():
     return None
 
 
+# Text responses worth compressing; images, PDFs and spreadsheets are already compressed.
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+}
+STATIC_DIST_DIR = os.path.join(app.static_folder, build_static.DIST_DIRNAME)
+STATIC_ASSET_MAX_AGE_SECONDS = 365 * 24 * 3600
+
+
+def _load_static_manifest():
+    try:
+        with open(os.path.join(STATIC_DIST_DIR, build_static.MANIFEST_NAME), encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+STATIC_MANIFEST = _load_static_manifest()
+
+
+@app.template_global()
+def asset_url(filename, **values):
+    """url_for('static', ...) that points at the fingerprinted build of filename when there is one."""
+    fingerprinted = STATIC_MANIFEST.get(filename)
+    if fingerprinted:
+        return url_for('static_asset', filename=fingerprinted)
+    return url_for('static', filename=filename, **values)
+
+
+@app.route('/assets/<path:filename>')
+def static_asset(filename):
+    """Fingerprinted build output: cached forever, served from the precompressed copy the client accepts."""
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(STATIC_DIST_DIR, filename + suffix)):
+            response = send_from_directory(STATIC_DIST_DIR, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(STATIC_DIST_DIR, filename, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = f'public, max-age={STATIC_ASSET_MAX_AGE_SECONDS}, immutable'
+    return response
+
+
+# ========================================
+# TRANSLATIONS
+# ========================================
+# static/i18n/<lang>.json is compiled once at startup: templates render data-i18n strings with
+# t() in the language of the ui_lang cookie (set by app.js), and the browser fetches the same
+# catalog, for auto-translated and dynamic text, from a content-versioned, immutable URL.
+
+I18N_DIR = os.path.join(app.static_folder, 'i18n')
+I18N_DEFAULT_LANGUAGE = 'en'
+I18N_COOKIE_NAME = 'ui_lang'
+
+
+def _is_corrupt_translation(value):
+    # Same rule as isCorruptI18nValue in app.js: mis-encoded values keep the English text.
+    return not value.strip() or '???' in value or '\ufffd' in value
+
+
+def compile_i18n_catalogs(i18n_dir=I18N_DIR):
+    """{lang: {'messages', 'bundle', 'version'}} for each <lang>.json in i18n_dir."""
+    catalogs = {}
+    for filename in sorted(os.listdir(i18n_dir)) if os.path.isdir(i18n_dir) else []:
+        lang, ext = os.path.splitext(filename)
+        if ext != '.json':
+            continue
+        with open(os.path.join(i18n_dir, filename), encoding='utf-8') as fh:
+            raw = json.load(fh)
+        messages = {
+            key: value for key, value in raw.items()
+            if key != '__auto__' and isinstance(value, str) and not _is_corrupt_translation(value)
+        }
+        bundle = json.dumps(
+            dict(messages, __auto__=raw.get('__auto__') or {}),
+            ensure_ascii=False, separators=(',', ':'), sort_keys=True,
+        ).encode('utf-8')
+        catalogs[lang] = {
+            'messages': messages,
+            'bundle': bundle,
+            'version': hashlib.sha256(bundle).hexdigest()[:12],
+        }
+    return catalogs
+
+
+I18N_CATALOGS = compile_i18n_catalogs()
+
+
+def current_language():
+    lang = request.cookies.get(I18N_COOKIE_NAME) if has_request_context() else None
+    return lang if lang in I18N_CATALOGS else I18N_DEFAULT_LANGUAGE
+
+
+@app.template_global()
+def t(key, default=''):
+    """The current language's text for a data-i18n key, or default when it has none."""
+    catalog = I18N_CATALOGS.get(current_language())
+    return (catalog['messages'].get(key) if catalog else None) or default
+
+
+def i18n_bundle_urls():
+    return {
+        lang: url_for('i18n_bundle', lang=lang, version=catalog['version'])
+        for lang, catalog in I18N_CATALOGS.items()
+    }
+
+
+@app.route('/i18n/<lang>/<version>.json')
+def i18n_bundle(lang, version):
+    catalog = I18N_CATALOGS.get(lang)
+    if not catalog:
+        return jsonify({'error': 'Not found'}), 404
+    response = Response(catalog['bundle'], mimetype='application/json')
+    # An old version in the URL still gets the current catalog, just not cached forever.
+    if version == catalog['version']:
+        response.headers['Cache-Control'] = f'public, max-age={STATIC_ASSET_MAX_AGE_SECONDS}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# ========================================
+# TEMPLATE RENDERING
+# ========================================
+
+class TemplateRenderStats:
+    """Per-process render count, total and slowest time per template, for /api/admin/template-metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            count, total, slowest = self._stats.get(name, (0, 0.0, 0.0))
+            self._stats[name] = (count + 1, total + seconds, max(slowest, seconds))
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+        rows = [
+            {
+                'template': name,
+                'renders': count,
+                'total_ms': round(total * 1000, 1),
+                'avg_ms': round(total * 1000 / count, 1),
+                'max_ms': round(slowest * 1000, 1),
+            }
+            for name, (count, total, slowest) in stats.items()
+        ]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+TEMPLATE_RENDER_STATS = TemplateRenderStats()
+
+
+@before_render_template.connect_via(app)
+def _start_template_timer(sender, template, context, **extra):
+    g.setdefault('template_render_starts', []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _record_template_render(sender, template, context, **extra):
+    starts = g.get('template_render_starts')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    name = template.name or '<string>'
+    TEMPLATE_RENDER_STATS.record(name, elapsed)
+    if elapsed * 1000 >= config.TEMPLATE_SLOW_RENDER_MS:
+        app.logger.warning('Slow template render: %s took %.0f ms', name, elapsed * 1000)
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key, tags %}...{% endcache %}: keep the rendered block in models.CACHE.
+
+    key is any JSON-able value; the stored key also carries the template and line and the UI
+    language. tags (petition:<id>, scope:<office>, user:<id>, petitions) are the ones the
+    invalidates_* decorators drop after workflow writes, exactly as for cached_query reads, so
+    a hit costs one cache lookup and no database query. Views pass the block's data as
+    callables that the block calls, so a hit also skips loading it. Without
+    FRAGMENT_CACHE_ENABLED and a CACHE_BACKEND the block renders as usual.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(()))
+        args.append(nodes.Const(f'{parser.name}:{lineno}'))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_fragment', args), [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, key, tags, site, caller):
+        if not (config.FRAGMENT_CACHE_ENABLED and models.fragment_cache_active()):
+            return caller()
+        raw = models.encode_cache_value([site, key, current_language()])
+        cache_key = f"fragment:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+        html = models.CACHE.get_or_set(
+            cache_key, lambda: str(caller()), config.FRAGMENT_CACHE_TTL_SECONDS, list(tags)
+        )
+        return Markup(html)
+
+
+app.jinja_env.add_extension(FragmentCacheExtension)
+
+
+@app.template_global()
+def fragment_scope():
+    """Key part for fragments that show the signed-in user's petition scope (None when not caching)."""
+    if not config.FRAGMENT_CACHE_ENABLED:
+        return None
+    user_id = session.get('user_id') or 0
+    user_role = session.get('user_role')
+    if user_role == 'data_entry':
+        # The SLA dashboard narrows data entry users to the petitions they created or hold.
+        return f'data_entry:{int(user_id)}'
+    return models.report_scope_key(user_id, user_role)
+
+
+@app.template_global()
+def fragment_scope_tags():
+    if not config.FRAGMENT_CACHE_ENABLED:
+        return []
+    return models.petition_scope_cache_tags({'user_role': session.get('user_role'), 'user_id': session.get('user_id')})
+
+
+def precompile_templates():
+    """Compile every .html template now (and into the bytecode cache) instead of on first render."""
+    compiled = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except Exception:
+            app.logger.exception('Template precompile failed for %s', name)
+    return compiled
+
+
+# Long-lived public caching is set by these views; the no-store default below must not apply.
+IMMUTABLE_CACHE_ENDPOINTS = {'static_asset', 'i18n_bundle'}
+
+
+# Registered before the other after_request hooks so it runs last, on the final body.
+@app.after_request
+def _compress_after_request(response):
+    if (
+        not config.COMPRESSION_ENABLED
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+    response.vary.add('Accept-Encoding')
+    if brotli is not None and request.accept_encodings['br']:
+        encoding = 'br'
+    elif request.accept_encodings['gzip']:
+        encoding = 'gzip'
+    else:
+        return response
+    body = response.get_data()
+    if len(body) < config.COMPRESSION_MIN_BYTES:
+        return response
+    # Pages only ever carry the CSRF token masked per response (_mask_csrf_token), so
+    # compressing HTML does not expose it to BREACH-style length probing.
+    level = min(9, max(1, config.COMPRESSION_LEVEL))
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=min(11, level)))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=level))
+    response.headers['Content-Encoding'] = encoding
+    if response.get_etag()[0]:
+        response.headers['ETag'] = f'W/"{response.get_etag()[0]}"'
+    return response
+
+
 @app.after_request
 def _security_after_request(response):
     response.headers.setdefault('X-Content-Type-Options', 'nosniff')
@@ -2001,7 +2360,7 @@ def _security_after_request(response):
             "frame-ancestors 'none'"
         )
     # Prevent caching of authenticated / sensitive responses.
-    if (
+    if request.endpoint not in IMMUTABLE_CACHE_ENDPOINTS and (
         'user_id' in session
         or request.path.startswith('/api/')
         or request.path == '/login'
@@ -2013,12 +2372,72 @@ def _security_after_request(response):
     return response
 
 
+@app.after_request
+def _bump_petition_data_version_after_write(response):
+    # Registered before the rollup refresh so it runs after it (after_request runs in reverse):
+    # a report snapshot stamped with the new version must see an inline rollup refresh. A
+    # queued refresh bumps the version again once the worker has run it.
+    if (
+        config.REPORT_SNAPSHOTS_ENABLED
+        and request.method == 'POST'
+        and request.endpoint in PETITION_WRITE_ENDPOINTS
+        and response.status_code < 400
+    ):
+        try:
+            models.bump_petition_data_version()
+        except Exception:
+            app.logger.exception('Could not bump the petition data version')
+    return response
+
+
+@app.after_request
+def _refresh_petition_rollups_after_write(response):
+    # Keep the touched received days current between the worker's full rebuilds.
+    if not (
+        config.ANALYTICS_ROLLUPS_ENABLED
+        and request.method == 'POST'
+        and response.status_code < 400
+        and request.endpoint in PETITION_WRITE_ENDPOINTS
+    ):
+        return response
+    try:
+        if request.endpoint == 'petition_action':
+            _queue_petition_rollup_refresh(petition_ids=[request.view_args['petition_id']])
+        elif request.endpoint == 'api_petitions_bulk_action':
+            petition_ids = getattr(g, 'bulk_action_petition_ids', None)
+            if petition_ids:
+                _queue_petition_rollup_refresh(petition_ids=petition_ids)
+        elif request.endpoint == 'petitions_import_upload':
+            # Set only when the import ran inline; a queued import refreshes from its job.
+            received_days = getattr(g, 'imported_received_days', None)
+            if received_days:
+                _queue_petition_rollup_refresh(days=received_days)
+        else:
+            received_date = parse_date_input(request.form.get('received_date'))
+            if received_date:
+                _queue_petition_rollup_refresh(days=[received_date])
+    except Exception:
+        app.logger.exception('Petition rollup refresh failed')
+    return response
+
+
 def get_effective_form_field_configs():
     if has_request_context():
         cached_cfg = getattr(g, '_effective_form_field_configs', None)
         if isinstance(cached_cfg, dict):
             return cached_cfg
 
+    if config.REFERENCE_CACHE_ENABLED:
+        # Frozen and shared by every request in this process; callers copy before changing anything.
+        merged = models.REFERENCE_CACHE.get('form_field_configs', 'effective', _load_effective_form_field_configs)
+    else:
+        merged = _load_effective_form_field_configs()
+    if has_request_context():
+        g._effective_form_field_configs = merged
+    return merged
+
+
+def _load_effective_form_field_configs():
     merged = copy.deepcopy(DEFAULT_FORM_FIELD_CONFIGS)
     try:
         overrides = models.get_form_field_configs()
@@ -2048,8 +2467,6 @@ def get_effective_form_field_configs():
                             valid_options.append({'value': value, 'label': label})
                     if valid_options:
                         merged[key]['options'] = valid_options
-    if has_request_context():
-        g._effective_form_field_configs = merged
     return merged
 
 
@@ -2514,97 +2931,132 @@ def role_required(*roles):
 # CONTEXT PROCESSOR
 # ========================================
 
+STATUS_LABELS = {
+    'received': 'Received',
+    'forwarded_to_cvo': 'Forwarded to CVO/DSP',
+    'sent_for_permission': 'Sent for Permission',
+    'permission_approved': 'Permission Approved',
+    'permission_rejected': 'Permission Rejected',
+    'assigned_to_inspector': 'Assigned to Inspector',
+    'sent_back_for_reenquiry': 'Sent Back for Re-enquiry',
+    'enquiry_in_progress': 'Enquiry In Progress',
+    'enquiry_report_submitted': 'Enquiry Report Submitted',
+    'cvo_comments_added': 'CVO/DSP Comments Added',
+    'forwarded_to_jmd': 'Forwarded to PO (Legacy)',
+    'forwarded_to_po': 'Forwarded to PO',
+    'conclusion_given': 'Conclusion Given',
+    'action_instructed': 'Sent to CMD for Action',
+    'action_taken': 'CMD Action Report Submitted',
+    'lodged': 'Lodged',
+    'closed': 'Closed'
+}
+
+
+ROLE_LABELS = {
+    'super_admin': 'Super Admin',
+    'data_entry': 'Data Entry Operator',
+    'po': 'Personal Officer (Vigilance)',
+    'cmd_apspdcl': 'CMD - APSPDCL',
+    'cmd_apepdcl': 'CMD - APEPDCL',
+    'cmd_apcpdcl': 'CMD - APCPDCL',
+    'cgm_hr_transco': 'CGM/HR TRANSCO (Headquarters)',
+    'dsp': 'DSP (Deputy Superintendent of Police) - Headquarters',
+    'cvo_apspdcl': 'CVO/DSP - APSPDCL (Tirupathi)',
+    'cvo_apepdcl': 'CVO/DSP - APEPDCL (Vizag)',
+    'cvo_apcpdcl': 'CVO/DSP - APCPDCL (Vijayawada)',
+    'inspector': 'Field Inspector (CI/SI)'
+}
+
+STATUS_COLORS = {
+    'received': '#3b82f6',
+    'forwarded_to_cvo': '#8b5cf6',
+    'sent_for_permission': '#f59e0b',
+    'permission_approved': '#10b981',
+    'permission_rejected': '#ef4444',
+    'assigned_to_inspector': '#6366f1',
+    'sent_back_for_reenquiry': '#f97316',
+    'enquiry_in_progress': '#0ea5e9',
+    'enquiry_report_submitted': '#14b8a6',
+    'cvo_comments_added': '#8b5cf6',
+    'forwarded_to_jmd': '#f97316',
+    'forwarded_to_po': '#ec4899',
+    'conclusion_given': '#84cc16',
+    'action_instructed': '#06b6d4',
+    'action_taken': '#22c55e',
+    'lodged': '#0ea5e9',
+    'closed': '#6b7280'
+}
+
+WORKFLOW_STAGE_LABELS = {
+    1: 'Petition Initiated',
+    2: 'Enquiry in Progress',
+    3: 'Report Finalized & Submitted',
+    4: 'Action Pending',
+    5: 'Petition Lodged',
+    6: 'Petition Closed'
+}
+
+STATUS_TO_STAGE = {
+    'received': 1,
+    'forwarded_to_cvo': 1,
+    'sent_for_permission': 1,
+    'permission_approved': 1,
+    'permission_rejected': 1,
+    'assigned_to_inspector': 2,
+    'sent_back_for_reenquiry': 2,
+    'enquiry_in_progress': 2,
+    'enquiry_report_submitted': 3,
+    'cvo_comments_added': 3,
+    'forwarded_to_po': 3,
+    'forwarded_to_jmd': 3,
+    'action_instructed': 4,
+    'action_taken': 4,
+    'lodged': 5,
+    'closed': 6
+}
+
+PETITION_SOURCE_LABELS = {
+    'media': 'Electronic and Print Media',
+    'public_individual': 'Public (Individual)',
+    'govt': 'Govt',
+    'sumoto': 'Sumoto',
+    'cmd_office': 'O/o CMD',
+}
+
+
+def bell_notification(pending_petitions, received_count, pending_count):
+    """Badge, summary counts and the first six queue items for the notification bell."""
+    return {
+        'received_count': received_count,
+        'pending_count': pending_count,
+        'badge_count': pending_count,
+        'badge_text': '9+' if pending_count > 9 else str(pending_count),
+        'items': [
+            {
+                'id': p.get('id'),
+                'sno': p.get('sno') or f"#{p.get('id')}",
+                'status_label': STATUS_LABELS.get(p.get('status'), str(p.get('status') or '-').replace('_', ' ').title()),
+                'subject': p.get('subject') or 'No subject',
+                'received_date': p.get('received_date').strftime('%d/%m/%Y') if p.get('received_date') else '-',
+            }
+            for p in pending_petitions[:6]
+            if p.get('id')
+        ],
+    }
+
+
+def inbox_bell_notification(user_id):
+    """bell_notification() from the inbox table: the user's open queue without scanning visible petitions."""
+    counts = models.get_inbox_counts(user_id)
+    items = [dict(item, id=item['petition_id']) for item in models.get_inbox_page(user_id, limit=6)['items']]
+    return bell_notification(items, counts['by_status'].get('received', 0), counts['total'])
+
+
 @app.context_processor
 def inject_globals():
     current_user = _load_current_authenticated_user(refresh_activity=False) if session.get('user_id') else None
     current_user_id = (current_user or {}).get('id') if isinstance(current_user, dict) else None
     current_user_role = (current_user or {}).get('role') if isinstance(current_user, dict) else None
-    role_labels = {
-        'super_admin': 'Super Admin',
-        'data_entry': 'Data Entry Operator',
-        'po': 'Personal Officer (Vigilance)',
-        'cmd_apspdcl': 'CMD - APSPDCL',
-        'cmd_apepdcl': 'CMD - APEPDCL',
-        'cmd_apcpdcl': 'CMD - APCPDCL',
-        'cgm_hr_transco': 'CGM/HR TRANSCO (Headquarters)',
-        'dsp': 'DSP (Deputy Superintendent of Police) - Headquarters',
-        'cvo_apspdcl': 'CVO/DSP - APSPDCL (Tirupathi)',
-        'cvo_apepdcl': 'CVO/DSP - APEPDCL (Vizag)',
-        'cvo_apcpdcl': 'CVO/DSP - APCPDCL (Vijayawada)',
-        'inspector': 'Field Inspector (CI/SI)'
-    }
-    status_labels = {
-        'received': 'Received',
-        'forwarded_to_cvo': 'Forwarded to CVO/DSP',
-        'sent_for_permission': 'Sent for Permission',
-        'permission_approved': 'Permission Approved',
-        'permission_rejected': 'Permission Rejected',
-        'assigned_to_inspector': 'Assigned to Inspector',
-        'sent_back_for_reenquiry': 'Sent Back for Re-enquiry',
-        'enquiry_in_progress': 'Enquiry In Progress',
-        'enquiry_report_submitted': 'Enquiry Report Submitted',
-        'cvo_comments_added': 'CVO/DSP Comments Added',
-        'forwarded_to_jmd': 'Forwarded to PO (Legacy)',
-        'forwarded_to_po': 'Forwarded to PO',
-        'conclusion_given': 'Conclusion Given',
-        'action_instructed': 'Sent to CMD for Action',
-        'action_taken': 'CMD Action Report Submitted',
-        'lodged': 'Lodged',
-        'closed': 'Closed'
-    }
-    status_colors = {
-        'received': '#3b82f6',
-        'forwarded_to_cvo': '#8b5cf6',
-        'sent_for_permission': '#f59e0b',
-        'permission_approved': '#10b981',
-        'permission_rejected': '#ef4444',
-        'assigned_to_inspector': '#6366f1',
-        'sent_back_for_reenquiry': '#f97316',
-        'enquiry_in_progress': '#0ea5e9',
-        'enquiry_report_submitted': '#14b8a6',
-        'cvo_comments_added': '#8b5cf6',
-        'forwarded_to_jmd': '#f97316',
-        'forwarded_to_po': '#ec4899',
-        'conclusion_given': '#84cc16',
-        'action_instructed': '#06b6d4',
-        'action_taken': '#22c55e',
-        'lodged': '#0ea5e9',
-        'closed': '#6b7280'
-    }
-    workflow_stage_labels = {
-        1: 'Petition Initiated',
-        2: 'Enquiry in Progress',
-        3: 'Report Finalized & Submitted',
-        4: 'Action Pending',
-        5: 'Petition Lodged',
-        6: 'Petition Closed'
-    }
-    status_to_stage = {
-        'received': 1,
-        'forwarded_to_cvo': 1,
-        'sent_for_permission': 1,
-        'permission_approved': 1,
-        'permission_rejected': 1,
-        'assigned_to_inspector': 2,
-        'sent_back_for_reenquiry': 2,
-        'enquiry_in_progress': 2,
-        'enquiry_report_submitted': 3,
-        'cvo_comments_added': 3,
-        'forwarded_to_po': 3,
-        'forwarded_to_jmd': 3,
-        'action_instructed': 4,
-        'action_taken': 4,
-        'lodged': 5,
-        'closed': 6
-    }
-    petition_types = PETITION_TYPE_LABELS
-    petition_sources = {
-        'media': 'Electronic and Print Media',
-        'public_individual': 'Public (Individual)',
-        'govt': 'Govt',
-        'sumoto': 'Sumoto',
-        'cmd_office': 'O/o CMD',
-    }
     cfg = get_effective_form_field_configs()
     govt_options = cfg.get('deo_petition.govt_institution_type', {}).get('options', [])
     govt_labels = {o.get('value'): o.get('label') for o in govt_options if isinstance(o, dict)}
@@ -2626,30 +3078,19 @@ def inject_globals():
     user_role = current_user_role
     if user_id and user_role:
         try:
-            visible_petitions = get_petitions_for_user_cached(
-                user_id, user_role, session.get('cvo_office'), status_filter=None
-            )
-            # Show notifications only for items that are currently in this login's queue.
-            pending_in_login = [
-                p for p in visible_petitions
-                if p.get('status') != 'closed' and p.get('current_handler_id') == user_id
-            ]
-            received_petitions = [p for p in pending_in_login if p.get('status') == 'received']
-            notification['received_count'] = len(received_petitions)
-            notification['pending_count'] = len(pending_in_login)
-            notification['badge_count'] = notification['pending_count']
-            notification['badge_text'] = '9+' if notification['badge_count'] > 9 else str(notification['badge_count'])
-            notification['items'] = [
-                {
-                    'id': p.get('id'),
-                    'sno': p.get('sno') or f"#{p.get('id')}",
-                    'status_label': status_labels.get(p.get('status'), str(p.get('status') or '-').replace('_', ' ').title()),
-                    'subject': p.get('subject') or 'No subject',
-                    'received_date': p.get('received_date').strftime('%d/%m/%Y') if p.get('received_date') else '-',
-                }
-                for p in pending_in_login[:6]
-                if p.get('id')
-            ]
+            if config.INBOX_ENABLED:
+                notification = inbox_bell_notification(user_id)
+            else:
+                visible_petitions = get_petitions_for_user_cached(
+                    user_id, user_role, session.get('cvo_office'), status_filter=None
+                )
+                # Show notifications only for items that are currently in this login's queue.
+                pending_in_login = [
+                    p for p in visible_petitions
+                    if p.get('status') != 'closed' and p.get('current_handler_id') == user_id
+                ]
+                received_petitions = [p for p in pending_in_login if p.get('status') == 'received']
+                notification = bell_notification(pending_in_login, len(received_petitions), len(pending_in_login))
         except Exception:
             pass
     return dict(
@@ -2657,18 +3098,18 @@ def inject_globals():
         brand_subtitle=config.BRAND_SUBTITLE,
         brand_logo_file=config.BRAND_LOGO_FILE,
         brand_logo_fallback=config.BRAND_LOGO_FALLBACK,
-        role_labels=role_labels,
-        status_labels=status_labels,
-        status_colors=status_colors,
-        petition_types=petition_types,
-        petition_sources=petition_sources,
+        role_labels=ROLE_LABELS,
+        status_labels=STATUS_LABELS,
+        status_colors=STATUS_COLORS,
+        petition_types=PETITION_TYPE_LABELS,
+        petition_sources=PETITION_SOURCE_LABELS,
         govt_institution_labels=govt_labels,
         get_field_cfg=lambda form_key, field_key: cfg.get(
             f'{form_key}.{field_key}',
             {'label': field_key, 'type': 'text', 'required': False, 'options': []}
         ),
-        workflow_stage_labels=workflow_stage_labels,
-        status_to_stage=status_to_stage,
+        workflow_stage_labels=WORKFLOW_STAGE_LABELS,
+        status_to_stage=STATUS_TO_STAGE,
         current_user_role=current_user_role,
         current_user_username=(current_user or {}).get('username') if isinstance(current_user, dict) else None,
         current_user_name=current_user_name,
@@ -2681,6 +3122,9 @@ def inject_globals():
         ),
         csrf_token=_current_csrf_token(),
         notification=notification,
+        events_enabled=config.EVENTS_ENABLED and bool(user_id),
+        ui_lang=current_language(),
+        i18n_bundle_urls=i18n_bundle_urls(),
         now=datetime.now()
     )
 
@@ -3315,7 +3759,6 @@ def dashboard():
     if dashboard_filter['officer_id']:
         active_filter_labels.append(f"Officer: {officer_lookup.get(dashboard_filter['officer_id'], str(dashboard_filter['officer_id']))}")
 
-    stats = _build_filtered_dashboard_stats(user_role, user_id, petitions, filtered_petitions)
     analytics = _build_dashboard_analytics([], {'sla_within': 0, 'sla_breached': 0})
 
     total_items = len(filtered_petitions)
@@ -3326,23 +3769,24 @@ def dashboard():
     end = start + page_size
     paged_petitions = filtered_petitions[start:end]
 
+    stats_filter = {
+        'from_date': dashboard_filter['from_date'].strftime('%Y-%m-%d') if dashboard_filter['from_date'] else '',
+        'to_date': dashboard_filter['to_date'].strftime('%Y-%m-%d') if dashboard_filter['to_date'] else '',
+        'petition_type': dashboard_filter['petition_type'],
+        'source_of_petition': dashboard_filter['source_of_petition'],
+        'received_at': dashboard_filter['received_at'],
+        'target_cvo': dashboard_filter['target_cvo'],
+        'officer_id': str(dashboard_filter['officer_id']) if dashboard_filter['officer_id'] else 'all',
+    }
     return render_template(
         'dashboard.html',
-        stats=stats,
+        # Called inside the cached stats fragment, so a fragment cache hit skips the SLA queries.
+        dashboard_stats=partial(_build_filtered_dashboard_stats, user_role, user_id, petitions, filtered_petitions),
+        dashboard_stats_key=stats_filter,
         petitions=paged_petitions,
         analytics=analytics,
         officer_options=officer_options,
-        dashboard_filter={
-            'from_date': dashboard_filter['from_date'].strftime('%Y-%m-%d') if dashboard_filter['from_date'] else '',
-            'to_date': dashboard_filter['to_date'].strftime('%Y-%m-%d') if dashboard_filter['to_date'] else '',
-            'petition_type': dashboard_filter['petition_type'],
-            'source_of_petition': dashboard_filter['source_of_petition'],
-            'received_at': dashboard_filter['received_at'],
-            'target_cvo': dashboard_filter['target_cvo'],
-            'officer_id': str(dashboard_filter['officer_id']) if dashboard_filter['officer_id'] else 'all',
-            'page': page,
-            'page_size': page_size,
-        },
+        dashboard_filter=dict(stats_filter, page=page, page_size=page_size),
         dashboard_active_filter_count=len(active_filter_labels),
         dashboard_active_filter_labels=active_filter_labels,
         dashboard_pagination={
@@ -3362,6 +3806,14 @@ def sla_dashboard():
     user_role = session['user_role']
     user_id = session['user_id']
     cvo_office = session.get('cvo_office')
+    # The whole page body is one cached fragment; it loads the data only when it renders.
+    return render_template(
+        'sla_dashboard.html',
+        sla_dashboard_data=partial(_sla_dashboard_context, user_role, user_id, cvo_office),
+    )
+
+
+def _sla_dashboard_context(user_role, user_id, cvo_office):
     sla_data = models.get_sla_dashboard_data_for_user(user_role, user_id, cvo_office)
     employees = sla_data.get('employees', [])
     eval_rows = sla_data.get('petitions', [])
@@ -3392,13 +3844,12 @@ def sla_dashboard():
         for r in eval_rows
         if int(r.get('id') or 0) > 0
     ]
-    return render_template(
-        'sla_dashboard.html',
-        sla_summary=sla_data.get('summary', {}),
-        sla_employees=employees,
-        sla_employee_chart=employee_chart,
-        sla_drilldown_rows=sla_drilldown_rows,
-    )
+    return {
+        'sla_summary': sla_data.get('summary', {}),
+        'sla_employees': employees,
+        'sla_employee_chart': employee_chart,
+        'sla_drilldown_rows': sla_drilldown_rows,
+    }
 
 
 @app.route('/sla-dashboard/employee/<int:officer_id>')
@@ -3439,6 +3890,34 @@ def sla_employee_profile(officer_id):
     )
 
 
+def _load_analytics_rows(user_id, user_role, cvo_office):
+    """Rows for analytics charts and (True, rollup rows) when rollups can answer this user.
+
+    Rollup rows carry the same keys the dashboard filters read, so _apply_dashboard_filters
+    works on either shape.
+    """
+    if config.ANALYTICS_ROLLUPS_ENABLED:
+        try:
+            rows = models.get_petition_rollup_rows(user_id, user_role)
+        except Exception:
+            app.logger.exception('Petition rollup query failed; using the petition list')
+            rows = None
+        if rows is not None:
+            return rows, True
+    return get_petitions_for_user_cached(user_id, user_role, cvo_office), False
+
+
+def _rollup_sla_stats(rows):
+    stats = {'sla_within': 0, 'sla_breached': 0}
+    for r in rows:
+        bucket = r.get('sla_bucket')
+        if bucket == 'within':
+            stats['sla_within'] += int(r.get('petition_count') or 0)
+        elif bucket == 'beyond':
+            stats['sla_breached'] += int(r.get('petition_count') or 0)
+    return stats
+
+
 def _extract_dashboard_filters(args, officer_lookup):
     from_date = parse_date_input(args.get('from_date'))
     to_date = parse_date_input(args.get('to_date'))
@@ -3551,13 +4030,13 @@ def _build_dashboard_analytics(petitions, stats):
         while m <= 0:
             m += 12
             y -= 1
-        key = f"{y:04d}-{m:02d}"
         months.append({
-            'key': key,
+            'key': f"{y:04d}-{m:02d}",
             'label': datetime(y, m, 1).strftime('%b %Y'),
-            'value': 0
+            'value': 0,
+            'ym': (y, m),
         })
-    month_index = {m['key']: m for m in months}
+    month_index = {m.pop('ym'): m for m in months}
 
     status_counts = Counter()
     type_counts = Counter()
@@ -3566,36 +4045,40 @@ def _build_dashboard_analytics(petitions, stats):
     office_counts = Counter()
     officer_counts = Counter()
     officer_label_by_id = {}
+    total_visible = 0
 
     for p in petitions:
+        # Daily rollup rows stand for petition_count petitions each.
+        n = int(p.get('petition_count') or 1)
+        total_visible += n
         status = p.get('status')
         if status:
-            status_counts[status_labels.get(status, status.replace('_', ' ').title())] += 1
+            status_counts[status_labels.get(status, status.replace('_', ' ').title())] += n
 
         ptype = p.get('petition_type')
         if ptype:
-            type_counts[petition_type_labels.get(ptype, ptype.replace('_', ' ').title())] += 1
+            type_counts[petition_type_labels.get(ptype, ptype.replace('_', ' ').title())] += n
 
         source = p.get('source_of_petition')
         if source:
-            source_counts[source_labels.get(source, source.replace('_', ' ').title())] += 1
+            source_counts[source_labels.get(source, source.replace('_', ' ').title())] += n
 
-        permission_mode_counts['Permission' if p.get('requires_permission') else 'Direct'] += 1
+        permission_mode_counts['Permission' if p.get('requires_permission') else 'Direct'] += n
 
         received_at = p.get('received_at') or 'unknown'
-        office_counts[str(received_at)] += 1
+        office_counts[str(received_at)] += n
         officer_id = p.get('assigned_inspector_id')
         officer_name = (p.get('inspector_name') or '').strip()
         if officer_id and officer_name:
             oid = str(officer_id)
             officer_label_by_id[oid] = officer_name
-            officer_counts[oid] += 1
+            officer_counts[oid] += n
 
         rd = p.get('received_date')
         if rd:
-            month_key = rd.strftime('%Y-%m')
-            if month_key in month_index:
-                month_index[month_key]['value'] += 1
+            month = month_index.get((rd.year, rd.month))
+            if month:
+                month['value'] += n
 
     def _counter_to_series(counter_obj, limit=8):
         series = sorted(counter_obj.items(), key=lambda x: x[1], reverse=True)
@@ -3625,10 +4108,10 @@ def _build_dashboard_analytics(petitions, stats):
             'values': [v for _, v in officer_series],
         },
         'summary': {
-            'total_visible': len(petitions),
+            'total_visible': total_visible,
             'closed': status_counts.get('Closed', 0),
             'lodged': status_counts.get('Lodged', 0),
-            'active': max(0, len(petitions) - status_counts.get('Closed', 0)),
+            'active': max(0, total_visible - status_counts.get('Closed', 0)),
             'sla_within': stats.get('sla_within', 0),
             'sla_breached': stats.get('sla_breached', 0),
         }
@@ -3673,8 +4156,12 @@ def _format_electrical_accident_summary(detail_row):
 # ANALYSIS REPORT
 # ========================================
 
-def _build_analysis_report_data(petitions):
-    """Compute comprehensive analysis data from a (filtered) petition list."""
+def _build_analysis_report_data(petitions, from_rollups=False):
+    """Compute comprehensive analysis data from a (filtered) petition list.
+
+    With from_rollups the rows are daily rollup rows: each counts petition_count times and
+    carries its own sla_bucket, so no SLA evaluation query is needed.
+    """
     TYPE_LABELS = {
         'bribe': 'Bribe', 'corruption': 'Corruption', 'harassment': 'Harassment',
         'electrical_accident': 'Electrical Accident', 'misconduct': 'Misconduct',
@@ -3701,7 +4188,7 @@ def _build_analysis_report_data(petitions):
         'lodged': 'Lodged', 'closed': 'Closed',
     }
 
-    total = len(petitions)
+    total = sum(int(p.get('petition_count') or 1) for p in petitions)
     if total == 0:
         empty_trend = []
         now = datetime.now()
@@ -3738,17 +4225,18 @@ def _build_analysis_report_data(petitions):
         m = now.month - i; y = now.year
         while m <= 0: m += 12; y -= 1
         months.append({'key': f"{y:04d}-{m:02d}", 'label': datetime(y, m, 1).strftime('%b %Y'), 'value': 0})
-    month_set = {m['key'] for m in months}
+    month_keys = {(int(m['key'][:4]), int(m['key'][5:])): m['key'] for m in months}
 
     for p in petitions:
+        n = int(p.get('petition_count') or 1)
         status = p.get('status') or 'unknown'
-        status_counter[status] += 1
+        status_counter[status] += n
 
         ptype = p.get('petition_type') or 'unknown'
-        type_counter[ptype] += 1
+        type_counter[ptype] += n
 
         src = p.get('source_of_petition') or 'unknown'
-        source_counter[src] += 1
+        source_counter[src] += n
 
         dept = p.get('target_cvo') or 'unknown'
         if dept not in dept_map:
@@ -3757,21 +4245,21 @@ def _build_analysis_report_data(petitions):
                 'total': 0, 'closed': 0, 'lodged': 0, 'active': 0,
                 'sla_within': 0, 'sla_beyond': 0,
             }
-        dept_map[dept]['total'] += 1
-        if status == 'closed': dept_map[dept]['closed'] += 1
-        elif status == 'lodged': dept_map[dept]['lodged'] += 1
-        else: dept_map[dept]['active'] += 1
+        dept_map[dept]['total'] += n
+        if status == 'closed': dept_map[dept]['closed'] += n
+        elif status == 'lodged': dept_map[dept]['lodged'] += n
+        else: dept_map[dept]['active'] += n
 
-        if p.get('requires_permission'): permission_count += 1
-        else: direct_count += 1
-        if p.get('is_overdue_escalated'): overdue_count += 1
+        if p.get('requires_permission'): permission_count += n
+        else: direct_count += n
+        if p.get('is_overdue_escalated'): overdue_count += n
 
         eq_type = p.get('enquiry_type') or 'detailed'
-        if eq_type == 'preliminary': prelim_count += 1
-        else: detailed_count += 1
+        if eq_type == 'preliminary': prelim_count += n
+        else: detailed_count += n
 
         if ptype == 'electrical_accident':
-            accident_total += 1
+            accident_total += n
             # accident_type comes from enquiry_report join - approximate from petition data
             # (detailed accident breakdown requires enquiry_reports join - use count only here)
 
@@ -3785,35 +4273,36 @@ def _build_analysis_report_data(petitions):
                     'total': 0, 'closed': 0, 'lodged': 0, 'active': 0,
                     'overdue': 0, 'sla_within': 0, 'sla_beyond': 0,
                 }
-            officer_map[oid]['total'] += 1
-            if status == 'closed': officer_map[oid]['closed'] += 1
-            elif status == 'lodged': officer_map[oid]['lodged'] += 1
-            else: officer_map[oid]['active'] += 1
-            if p.get('is_overdue_escalated'): officer_map[oid]['overdue'] += 1
+            officer_map[oid]['total'] += n
+            if status == 'closed': officer_map[oid]['closed'] += n
+            elif status == 'lodged': officer_map[oid]['lodged'] += n
+            else: officer_map[oid]['active'] += n
+            if p.get('is_overdue_escalated'): officer_map[oid]['overdue'] += n
 
         rd = p.get('received_date')
         if rd:
-            mk = rd.strftime('%Y-%m')
-            if mk in month_set: monthly_counter[mk] += 1
+            mk = month_keys.get((rd.year, rd.month))
+            if mk: monthly_counter[mk] += n
 
     for m in months:
         m['value'] = monthly_counter.get(m['key'], 0)
 
     # SLA analysis - join tracking data
-    sla_rows = models.get_sla_evaluation_rows(petitions)
+    sla_rows = petitions if from_rollups else models.get_sla_evaluation_rows(petitions)
     sla_within = sla_beyond = 0
     for r in sla_rows:
+        n = int(r.get('petition_count') or 1)
         bucket = r.get('sla_bucket') or ''
         dept = r.get('target_cvo') or 'unknown'
         oid = str(r.get('assigned_inspector_id') or '')
         if bucket == 'within':
-            sla_within += 1
-            if dept in dept_map: dept_map[dept]['sla_within'] += 1
-            if oid in officer_map: officer_map[oid]['sla_within'] += 1
+            sla_within += n
+            if dept in dept_map: dept_map[dept]['sla_within'] += n
+            if oid in officer_map: officer_map[oid]['sla_within'] += n
         elif bucket == 'beyond':
-            sla_beyond += 1
-            if dept in dept_map: dept_map[dept]['sla_beyond'] += 1
-            if oid in officer_map: officer_map[oid]['sla_beyond'] += 1
+            sla_beyond += n
+            if dept in dept_map: dept_map[dept]['sla_beyond'] += n
+            if oid in officer_map: officer_map[oid]['sla_beyond'] += n
 
     closed_total = status_counter.get('closed', 0)
     lodged_total = status_counter.get('lodged', 0)
@@ -4086,14 +4575,40 @@ def _build_analysis_report_data(petitions):
     }
 
 
-@app.route('/analysis-report')
-@login_required
-def analysis_report():
-    user_role = session['user_role']
-    user_id = session['user_id']
-    cvo_office = session.get('cvo_office')
+def _extract_unscoped_dashboard_filters(args):
+    """Dashboard filters with the officer parsed but not checked against the visible officers.
 
-    petitions = get_petitions_for_user_cached(user_id, user_role, cvo_office)
+    For callers that apply the filters in SQL under the user's scope, where an officer outside
+    it simply matches nothing.
+    """
+    dashboard_filter = _extract_dashboard_filters(args, {})
+    officer_raw = (args.get('officer_id') or 'all').strip()
+    if officer_raw != 'all':
+        dashboard_filter['officer_id'] = parse_optional_int(officer_raw)
+    return dashboard_filter
+
+
+def _analysis_report_filter_args(args):
+    """Normalized report filters in query-string form, used as the snapshot key.
+
+    The officer is only parsed here; it is checked against the scope when the report is built.
+    """
+    dashboard_filter = _extract_unscoped_dashboard_filters(args)
+    officer_id = dashboard_filter['officer_id']
+    return {
+        'from_date': dashboard_filter['from_date'].strftime('%Y-%m-%d') if dashboard_filter['from_date'] else '',
+        'to_date': dashboard_filter['to_date'].strftime('%Y-%m-%d') if dashboard_filter['to_date'] else '',
+        'petition_type': dashboard_filter['petition_type'],
+        'source_of_petition': dashboard_filter['source_of_petition'],
+        'received_at': dashboard_filter['received_at'],
+        'target_cvo': dashboard_filter['target_cvo'],
+        'officer_id': str(officer_id) if officer_id else 'all',
+    }
+
+
+def _build_analysis_report_context(user_id, user_role, cvo_office, args):
+    """Everything analysis_report.html needs except the generated-at stamp (JSON-serializable)."""
+    petitions, from_rollups = _load_analytics_rows(user_id, user_role, cvo_office)
     officer_lookup = {}
     for p in petitions:
         oid = p.get('assigned_inspector_id')
@@ -4105,10 +4620,10 @@ def analysis_report():
         for oid, name in sorted(officer_lookup.items(), key=lambda x: x[1].lower())
     ]
 
-    dashboard_filter = _extract_dashboard_filters(request.args, officer_lookup)
+    dashboard_filter = _extract_dashboard_filters(args, officer_lookup)
     filtered = _apply_dashboard_filters(petitions, dashboard_filter)
 
-    report_data = _build_analysis_report_data(filtered)
+    report_data = _build_analysis_report_data(filtered, from_rollups=from_rollups)
 
     # Build active filter labels (same as dashboard)
     source_labels = {'media': 'Electronic and Print Media', 'public_individual': 'Public (Individual)',
@@ -4132,7 +4647,6 @@ def analysis_report():
     if dashboard_filter['officer_id']:
         active_filter_labels.append(f"Officer: {officer_lookup.get(dashboard_filter['officer_id'], str(dashboard_filter['officer_id']))}")
 
-    generated_at = datetime.now().strftime('%d %b %Y, %I:%M %p')
     period_label = 'All Time'
     if dashboard_filter['from_date'] and dashboard_filter['to_date']:
         period_label = f"{dashboard_filter['from_date'].strftime('%d %b %Y')} – {dashboard_filter['to_date'].strftime('%d %b %Y')}"
@@ -4141,14 +4655,12 @@ def analysis_report():
     elif dashboard_filter['to_date']:
         period_label = f"Until {dashboard_filter['to_date'].strftime('%d %b %Y')}"
 
-    return render_template(
-        'analysis_report.html',
-        report=report_data,
-        officer_options=officer_options,
-        active_filter_labels=active_filter_labels,
-        period_label=period_label,
-        generated_at=generated_at,
-        dashboard_filter={
+    return {
+        'report': report_data,
+        'officer_options': officer_options,
+        'active_filter_labels': active_filter_labels,
+        'period_label': period_label,
+        'dashboard_filter': {
             'from_date': dashboard_filter['from_date'].strftime('%Y-%m-%d') if dashboard_filter['from_date'] else '',
             'to_date': dashboard_filter['to_date'].strftime('%Y-%m-%d') if dashboard_filter['to_date'] else '',
             'petition_type': dashboard_filter['petition_type'],
@@ -4157,7 +4669,279 @@ def analysis_report():
             'target_cvo': dashboard_filter['target_cvo'],
             'officer_id': str(dashboard_filter['officer_id']) if dashboard_filter['officer_id'] else 'all',
         },
+    }
+
+
+def _generate_analysis_report_snapshot(snapshot_key, user_id, user_role, cvo_office, filter_args):
+    # Read the version before the data: a write landing mid-build leaves the snapshot stale, not wrong.
+    data_version = models.get_petition_data_version()
+    try:
+        context = _build_analysis_report_context(user_id, user_role, cvo_office, filter_args)
+    except Exception as e:
+        models.save_report_snapshot(snapshot_key, data_version, None, error=f'{type(e).__name__}: {e}')
+        raise
+    models.save_report_snapshot(snapshot_key, data_version, context)
+    return context
+
+
+def _load_analysis_report_snapshot(user_id, user_role, cvo_office, args):
+    """(context, generated_at, refreshing) for the report, served from analysis_report_snapshots.
+
+    A fresh snapshot is served as is. Otherwise the first request claims the refresh and queues
+    it for worker.py (or builds inline when background jobs are off); everyone else gets the
+    previous snapshot marked as refreshing, or (None, None, True) when there is none yet.
+    """
+    filter_args = _analysis_report_filter_args(args)
+    scope_key = models.report_scope_key(user_id, user_role)
+    snapshot_key = models.report_snapshot_key(scope_key, filter_args)
+    snapshot = models.get_report_snapshot(snapshot_key, config.REPORT_SNAPSHOT_MAX_AGE_SECONDS)
+    if snapshot['report'] is not None and snapshot['is_fresh']:
+        return snapshot['report'], snapshot['generated_at'], False
+
+    claimed = models.claim_report_snapshot_refresh(
+        snapshot_key, scope_key, user_id, user_role, cvo_office, filter_args,
+        lease_seconds=config.REPORT_SNAPSHOT_BUILD_LEASE_SECONDS,
+    )
+    if claimed:
+        job_id = _enqueue_background_job('analysis_report_snapshot', {
+            'snapshot_key': snapshot_key,
+            'user_id': user_id,
+            'user_role': user_role,
+            'cvo_office': cvo_office,
+            'filters': filter_args,
+        })
+        if job_id is None:
+            context = _generate_analysis_report_snapshot(snapshot_key, user_id, user_role, cvo_office, filter_args)
+            return context, datetime.now(), False
+    if snapshot['report'] is not None:
+        return snapshot['report'], snapshot['generated_at'], True
+    if not config.BACKGROUND_JOBS_ENABLED:
+        # Another request is building this one inline; don't make this viewer wait on it.
+        return _build_analysis_report_context(user_id, user_role, cvo_office, args), datetime.now(), False
+    return None, None, True
+
+
+@app.route('/analysis-report')
+@login_required
+def analysis_report():
+    user_role = session['user_role']
+    user_id = session['user_id']
+    cvo_office = session.get('cvo_office')
+
+    if not config.REPORT_SNAPSHOTS_ENABLED:
+        context = _build_analysis_report_context(user_id, user_role, cvo_office, request.args)
+        generated_at, refreshing = datetime.now(), False
+    else:
+        context, generated_at, refreshing = _load_analysis_report_snapshot(user_id, user_role, cvo_office, request.args)
+        if context is None:
+            return render_template('analysis_report_pending.html')
+
+    return render_template(
+        'analysis_report.html',
+        generated_at=generated_at.strftime('%d %b %Y, %I:%M %p'),
+        snapshot_refreshing=refreshing,
+        **context,
+    )
+
+
+# ========================================
+# EXPORTS
+# ========================================
+
+EXPORT_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+EXPORT_XLSX_CHUNK_BYTES = 64 * 1024
+PETITION_EXPORT_COLUMNS = (
+    ('sno', 'S.No'),
+    ('efile_no', 'E-Office No'),
+    ('received_date', 'Received Date'),
+    ('petitioner_name', 'Petitioner'),
+    ('contact', 'Contact'),
+    ('place', 'Place'),
+    ('subject', 'Subject'),
+    ('petition_type', 'Type'),
+    ('source_of_petition', 'Source'),
+    ('received_at', 'Received At'),
+    ('target_cvo', 'Office'),
+    ('status', 'Status'),
+    ('enquiry_type', 'Enquiry Type'),
+    ('requires_permission', 'Permission Required'),
+    ('inspector_name', 'Field Officer'),
+    ('handler_name', 'Current Handler'),
+    ('is_overdue_escalated', 'Overdue Escalated'),
+    ('created_at', 'Created At'),
+)
+SLA_EXPORT_COLUMNS = (
+    ('sno', 'S.No'),
+    ('petitioner_name', 'Petitioner'),
+    ('subject', 'Subject'),
+    ('status', 'Status'),
+    ('target_cvo', 'Office'),
+    ('officer_name', 'Officer'),
+    ('assigned_at', 'Assigned On'),
+    ('closed_at', 'Closed On'),
+    ('sla_days', 'SLA Days'),
+    ('elapsed_days', 'Elapsed Days'),
+    ('sla_state', 'SLA State'),
+)
+ANALYSIS_EXPORT_TABLES = (
+    ('Status', 'status_breakdown', (('label', 'Status'), ('count', 'Petitions'), ('pct', '% of Total'))),
+    ('Type', 'type_breakdown', (('label', 'Type'), ('count', 'Petitions'), ('pct', '% of Total'))),
+    ('Source', 'source_breakdown', (('label', 'Source'), ('count', 'Petitions'), ('pct', '% of Total'))),
+    ('Offices', 'dept_stats', (
+        ('label', 'Office'), ('total', 'Total'), ('closed', 'Closed'), ('lodged', 'Lodged'), ('active', 'Active'),
+        ('sla_within', 'Within SLA'), ('sla_beyond', 'Beyond SLA'), ('sla_compliance', 'SLA Compliance %'),
+        ('resolution_rate', 'Resolution %'),
+    )),
+    ('Officers', 'officer_stats', (
+        ('name', 'Officer'), ('total', 'Total'), ('closed', 'Closed'), ('lodged', 'Lodged'), ('active', 'Active'),
+        ('overdue', 'Overdue'), ('sla_within', 'Within SLA'), ('sla_beyond', 'Beyond SLA'),
+        ('sla_compliance', 'SLA Compliance %'), ('resolution_rate', 'Resolution %'),
+    )),
+)
+EXPORT_SOURCE_LABELS = {
+    'media': 'Electronic and Print Media', 'public_individual': 'Public (Individual)',
+    'govt': 'Govt', 'sumoto': 'Sumoto', 'cmd_office': 'O/o CMD',
+}
+SLA_STATE_EXPORT_LABELS = {'within': 'Within SLA', 'beyond': 'Beyond SLA', 'in_progress': 'In Progress'}
+
+
+def _export_cell(value):
+    """Plain cell value; text a spreadsheet would evaluate as a formula is quoted."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    if isinstance(value, str) and value.startswith(EXPORT_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _petition_export_row(row, status_labels):
+    values = dict(row)
+    values['petition_type'] = PETITION_TYPE_LABELS.get(row.get('petition_type'), row.get('petition_type'))
+    values['status'] = status_labels.get(row.get('status'), row.get('status'))
+    values['source_of_petition'] = EXPORT_SOURCE_LABELS.get(row.get('source_of_petition'), row.get('source_of_petition'))
+    return [_export_cell(values.get(key)) for key, _label in PETITION_EXPORT_COLUMNS]
+
+
+def _sla_export_row(row, status_labels):
+    values = dict(row)
+    values['status'] = status_labels.get(row.get('status'), row.get('status'))
+    values['sla_state'] = SLA_STATE_EXPORT_LABELS.get(row.get('sla_state'), row.get('sla_state'))
+    return [_export_cell(values.get(key)) for key, _label in SLA_EXPORT_COLUMNS]
+
+
+class _CsvLineBuffer:
+    # csv.writer target that hands each formatted line back instead of keeping it.
+    def write(self, value):
+        return value
+
+
+def _iter_csv_sheets(sheets):
+    writer = csv.writer(_CsvLineBuffer())
+    yield '\ufeff'  # BOM so Excel reads UTF-8 (Telugu names) correctly
+    for idx, (title, headers, rows) in enumerate(sheets):
+        if len(sheets) > 1:
+            if idx:
+                yield writer.writerow([])
+            yield writer.writerow([title])
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow(row)
+
+
+def _iter_xlsx_sheets(sheets):
+    # write_only mode spools rows to temp files as they arrive; the finished workbook lands in a
+    # spooled temp file and is sent in chunks, so memory stays flat for any row count.
+    workbook = Workbook(write_only=True)
+    for title, headers, rows in sheets:
+        sheet = workbook.create_sheet(title=title[:31])
+        sheet.append(headers)
+        for row in rows:
+            sheet.append(row)
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as out:
+        workbook.save(out)
+        out.seek(0)
+        while True:
+            chunk = out.read(EXPORT_XLSX_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _export_response(filename_base, sheets):
+    """Stream sheets [(title, headers, row iterator)] as CSV, or as XLSX with ?format=xlsx."""
+    export_format = (request.args.get('format') or 'csv').strip().lower()
+    stamp = datetime.now().strftime('%Y%m%d_%H%M')
+    log_security_event('data.export', severity='info', export=filename_base, format=export_format)
+    if export_format == 'xlsx' and Workbook is not None:
+        return Response(
+            stream_with_context(_iter_xlsx_sheets(sheets)),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            headers={'Content-Disposition': f'attachment; filename={filename_base}_{stamp}.xlsx'},
+        )
+    return Response(
+        stream_with_context(_iter_csv_sheets(sheets)),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={filename_base}_{stamp}.csv'},
+    )
+
+
+@app.route('/petitions/export')
+@login_required
+def petitions_export():
+    status_labels = status_labels_for_api()
+    rows = models.iter_petitions_for_export(
+        session['user_id'],
+        session['user_role'],
+        _extract_unscoped_dashboard_filters(request.args),
+        status_filter=(request.args.get('status') or 'all').strip(),
+        enquiry_mode=(request.args.get('mode') or 'all').strip(),
+    )
+    return _export_response('petitions', [(
+        'Petitions',
+        [label for _key, label in PETITION_EXPORT_COLUMNS],
+        (_petition_export_row(row, status_labels) for row in rows),
+    )])
+
+
+@app.route('/sla-dashboard/export')
+@login_required
+def sla_dashboard_export():
+    status_labels = status_labels_for_api()
+    rows = models.iter_sla_rows_for_export(
+        session['user_role'],
+        session['user_id'],
+        officer_id=parse_optional_int(request.args.get('officer_id')),
     )
+    return _export_response('sla_drilldown', [(
+        'SLA',
+        [label for _key, label in SLA_EXPORT_COLUMNS],
+        (_sla_export_row(row, status_labels) for row in rows),
+    )])
+
+
+@app.route('/analysis-report/export')
+@login_required
+def analysis_report_export():
+    user_role = session['user_role']
+    user_id = session['user_id']
+    cvo_office = session.get('cvo_office')
+    context = None
+    if config.REPORT_SNAPSHOTS_ENABLED:
+        context, _generated_at, _refreshing = _load_analysis_report_snapshot(user_id, user_role, cvo_office, request.args)
+    if context is None:
+        context = _build_analysis_report_context(user_id, user_role, cvo_office, request.args)
+    report = context['report']
+    sheets = [
+        (
+            title,
+            [label for _col, label in columns],
+            ([_export_cell(item.get(col)) for col, _label in columns] for item in report.get(key) or []),
+        )
+        for title, key, columns in ANALYSIS_EXPORT_TABLES
+    ]
+    return _export_response('analysis_report', sheets)
 
 
 # ========================================
@@ -4216,6 +5000,55 @@ def petitions_list():
         show_beyond_sla_tab=(user_role in ('po', 'super_admin'))
     )
 
+def _find_duplicate_candidates_for_intake(subject, petitioner_name, contact, place, received_date, limit=5):
+    # Advisory only: a lookup failure must never block petition intake.
+    try:
+        candidates = models.find_duplicate_petition_candidates(
+            subject,
+            petitioner_name=petitioner_name,
+            contact=contact,
+            place=place,
+            received_date=received_date,
+            limit=limit,
+        ) or []
+    except Exception:
+        app.logger.exception('Duplicate petition lookup failed')
+        return []
+    return candidates
+
+
+def _serialize_duplicate_candidate(candidate):
+    pid = int(candidate.get('id') or 0)
+    rd = candidate.get('received_date')
+    status = candidate.get('status') or ''
+    return {
+        'id': pid,
+        'sno': candidate.get('sno') or f'#{pid}',
+        'subject': (candidate.get('subject') or '')[:200],
+        'petitioner_name': candidate.get('petitioner_name') or '-',
+        'received_date': rd.strftime('%d/%m/%Y') if rd else '-',
+        'status': status_labels_for_api().get(status, status.replace('_', ' ').title()),
+        'score': candidate.get('score'),
+        'matched_on': list(candidate.get('matched_on') or []),
+        'view_url': url_for('petition_view', petition_id=pid) if pid else '#',
+    }
+
+
+@app.route('/api/petitions/duplicate-candidates')
+@login_required
+@role_required('super_admin', 'data_entry')
+def api_petition_duplicate_candidates():
+    subject = (request.args.get('subject') or '').strip()[:5000]
+    petitioner_name = (request.args.get('petitioner_name') or '').strip()[:255]
+    contact = (request.args.get('contact') or '').strip()[:40]
+    place = (request.args.get('place') or '').strip()[:255]
+    if len(subject) < 8 and not (petitioner_name or contact):
+        return jsonify({'items': []})
+    received_date = parse_date_input(request.args.get('received_date'))
+    candidates = _find_duplicate_candidates_for_intake(subject, petitioner_name, contact, place, received_date)
+    return jsonify({'items': [_serialize_duplicate_candidate(c) for c in candidates]})
+
+
 @app.route('/petitions/new', methods=['GET', 'POST'])
 @login_required
 @role_required('super_admin', 'data_entry')
@@ -4228,12 +5061,13 @@ def petition_new():
         (session.get('cvo_office') or '').strip().lower() in ('apepdcl', 'apspdcl')
     )
 
-    def render_petition_form():
+    def render_petition_form(duplicate_candidates=None):
         return render_template(
             'petition_form.html',
             deo_flow=deo_flow,
             deo_target_options=deo_target_options,
             show_cmd_source_option=show_cmd_source_option,
+            duplicate_candidates=duplicate_candidates or [],
         )
 
     if request.method == 'POST':
@@ -4391,6 +5225,14 @@ def petition_new():
                 return render_petition_form()
             original_name = upload_result
 
+        if request.form.get('duplicate_ack') != '1':
+            duplicate_candidates = _find_duplicate_candidates_for_intake(
+                subject, petitioner_name, contact, place, received_date
+            )
+            if duplicate_candidates:
+                flash('This petition looks similar to existing petitions. Review them below and confirm before saving.', 'warning')
+                return render_petition_form([_serialize_duplicate_candidate(c) for c in duplicate_candidates])
+
         allowed_submission, retry_after, blocked_scopes = _consume_petition_submission_slot()
         if not allowed_submission:
             log_security_event(
@@ -4521,32 +5363,8 @@ def petitions_import_template():
     )
 
 
-@app.route('/petitions/import/upload', methods=['POST'])
-@login_required
-@role_required('po', 'super_admin')
-def petitions_import_upload():
-    _return_to = (request.form.get('_return_to') or '').strip()
-    _import_back = url_for('help_page') if _return_to == 'help' else url_for('petitions_import')
-    upload = request.files.get('petitions_file')
-    if not upload or not upload.filename:
-        flash('Please choose an Excel/CSV file to upload.', 'warning')
-        return redirect(_import_back)
-
-    try:
-        rows = _parse_tabular_upload_rows(
-            upload,
-            required_headers={'subject'},
-            allowed_headers=set(IMPORT_PETITION_HEADERS),
-        )
-    except Exception as e:
-        app.logger.exception('Unable to parse petition import upload file')
-        flash('Unable to parse upload file. Please verify format and retry.', 'danger')
-        return redirect(_import_back)
-
-    if not rows:
-        flash('Uploaded file is empty.', 'warning')
-        return redirect(_import_back)
-
+def _import_petition_rows(rows, actor_user_id):
+    """Create petitions from parsed import rows and return a summary of the run."""
     active_users = [u for u in models.get_all_users() if u.get('is_active')]
     user_by_username = {(u.get('username') or '').strip().lower(): u for u in active_users if u.get('username')}
     first_role_user = {}
@@ -4588,7 +5406,7 @@ def petitions_import_upload():
     failed = 0
     warnings = []
     errors = []
-    actor_user_id = session['user_id']
+    received_days = set()
     po_handler_id = actor_user_id
 
     for idx, row in enumerate(rows, start=2):
@@ -4680,6 +5498,13 @@ def petitions_import_upload():
                 'ereceipt_no': (row.get('ereceipt_no') or '').strip() or None,
                 'ereceipt_file': None,
             }
+            duplicates = _find_duplicate_candidates_for_intake(
+                subject, petitioner_name, contact, place, received_date, limit=3
+            )
+            if duplicates:
+                warnings.append(
+                    f"Row {idx}: possible duplicate of {', '.join(str(d.get('sno') or d.get('id')) for d in duplicates)}."
+                )
             created_petition = models.create_petition(data, actor_user_id)
             petition_id = int(created_petition['id'])
 
@@ -4710,11 +5535,25 @@ def petitions_import_upload():
                 remarks=(remarks or None),
             )
             created += 1
+            received_days.add(received_date)
         except Exception:
             failed += 1
             app.logger.exception('Petition import row failed at row %s', idx)
             errors.append(f'Row {idx}: internal processing error.')
+    return {
+        'created': created,
+        'failed': failed,
+        'warnings': warnings,
+        'errors': errors,
+        'received_days': sorted(d.isoformat() for d in received_days),
+    }
 
+
+def _flash_petition_import_summary(summary):
+    created = summary.get('created', 0)
+    failed = summary.get('failed', 0)
+    warnings = summary.get('warnings') or []
+    errors = summary.get('errors') or []
     if created:
         flash(f'Petition import complete. Imported: {created}, Failed: {failed}.', 'success')
     if warnings:
@@ -4723,6 +5562,43 @@ def petitions_import_upload():
     if errors:
         preview = '; '.join(errors[:5]) + ('; ...' if len(errors) > 5 else '')
         flash(f'Import errors: {preview}', 'danger')
+
+
+@app.route('/petitions/import/upload', methods=['POST'])
+@login_required
+@role_required('po', 'super_admin')
+def petitions_import_upload():
+    _return_to = (request.form.get('_return_to') or '').strip()
+    _import_back = url_for('help_page') if _return_to == 'help' else url_for('petitions_import')
+    upload = request.files.get('petitions_file')
+    if not upload or not upload.filename:
+        flash('Please choose an Excel/CSV file to upload.', 'warning')
+        return redirect(_import_back)
+
+    try:
+        rows = _parse_tabular_upload_rows(
+            upload,
+            required_headers={'subject'},
+            allowed_headers=set(IMPORT_PETITION_HEADERS),
+        )
+    except Exception as e:
+        app.logger.exception('Unable to parse petition import upload file')
+        flash('Unable to parse upload file. Please verify format and retry.', 'danger')
+        return redirect(_import_back)
+
+    if not rows:
+        flash('Uploaded file is empty.', 'warning')
+        return redirect(_import_back)
+
+    job_id = _enqueue_background_job('petition_import', {'rows': rows, 'actor_user_id': session['user_id']})
+    if job_id:
+        flash(f'Petition import queued as background job #{job_id} ({len(rows)} rows). '
+              'Refresh the petition list shortly to see imported records.', 'info')
+        return redirect(_import_back)
+
+    summary = _import_petition_rows(rows, session['user_id'])
+    g.imported_received_days = [date.fromisoformat(d) for d in summary['received_days']]
+    _flash_petition_import_summary(summary)
     return redirect(_import_back)
 
 
@@ -4764,11 +5640,6 @@ def petition_view(petition_id):
         report_file_availability['cmd_action_report_file'] = bool(report.get('cmd_action_report_file')) and _uploaded_file_exists(
             ENQUIRY_UPLOAD_DIR, report.get('cmd_action_report_file')
         )
-    tracking_file_availability = {}
-    for row in tracking or []:
-        attachment_name = row.get('attachment_file')
-        if attachment_name and attachment_name not in tracking_file_availability:
-            tracking_file_availability[attachment_name] = _uploaded_file_exists(ENQUIRY_UPLOAD_DIR, attachment_name)
     ci_assignment_memo = None
     for row in reversed(tracking or []):
         if (row.get('action') or '').strip() == 'Assigned to Inspector' and row.get('attachment_file'):
@@ -4777,7 +5648,7 @@ def petition_view(petition_id):
                 'from_name': row.get('from_name'),
                 'created_at': row.get('created_at'),
                 'comments': row.get('comments'),
-                'is_available': tracking_file_availability.get(row.get('attachment_file'), False),
+                'is_available': _uploaded_file_exists(ENQUIRY_UPLOAD_DIR, row.get('attachment_file')),
             }
             break
     inspector_conversion_request_pending = (
@@ -4831,7 +5702,8 @@ def petition_view(petition_id):
                          petition_sla_eval=petition_sla_eval,
                          po_beyond_sla_permission_allowed=po_beyond_sla_permission_allowed,
                          ci_assignment_memo=ci_assignment_memo,
-                         tracking_file_availability=tracking_file_availability,
+                         # Called inside the cached timeline, so a cache hit skips the file checks.
+                         tracking_file_availability=partial(_tracking_file_availability, tracking),
                          ereceipt_file_available=ereceipt_file_available,
                          conclusion_file_available=conclusion_file_available,
                          report_file_availability=report_file_availability)
@@ -4840,6 +5712,15 @@ def petition_view(petition_id):
 # WORKFLOW ACTION ROUTES
 # ========================================
 
+def _tracking_file_availability(tracking):
+    availability = {}
+    for row in tracking or []:
+        attachment_name = row.get('attachment_file')
+        if attachment_name and attachment_name not in availability:
+            availability[attachment_name] = _uploaded_file_exists(ENQUIRY_UPLOAD_DIR, attachment_name)
+    return availability
+
+
 @app.route('/petitions/<int:petition_id>/action', methods=['POST'])
 @login_required
 def petition_action(petition_id):
@@ -5127,6 +6008,7 @@ def petition_action(petition_id):
                     organization=organization if organization in VALID_ORGANIZATIONS else None,
                     attachment_file=permission_filename,
                     tracking_action='Beyond SLA Permission Copy Uploaded - Sent to CVO',
+                    action_code='beyond_sla_permission_copy',
                     mark_overdue_escalated=True,
                 )
             except Exception:
@@ -5798,6 +6680,9 @@ def petition_action(petition_id):
         else:
             flash('Unsupported action.', 'warning')
             
+    except WorkflowTransitionError as exc:
+        # The status guard runs inside the transition statement, so a concurrent change lands here.
+        flash(str(exc), 'warning')
     except Exception:
         flash_internal_error('Unable to complete action. Please contact administrator.')
     
@@ -6469,62 +7354,10 @@ def user_create():
     return redirect(url_for('users_list'))
 
 
-@app.route('/users/upload', methods=['POST'])
-@login_required
-@role_required('super_admin')
-def users_upload():
-    upload = request.files.get('users_file')
-    if not upload or not upload.filename:
-        flash('Please choose an Excel/CSV file to upload.', 'warning')
-        return redirect(url_for('users_list'))
-
-    filename = secure_filename(upload.filename)
-    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-    if ext not in ('xlsx', 'csv'):
-        flash('Only .xlsx or .csv files are allowed for bulk user creation.', 'danger')
-        return redirect(url_for('users_list'))
-
-    required_headers = {'username', 'full_name', 'role'}
-    rows = []
-    try:
-        if ext == 'csv':
-            content = upload.stream.read().decode('utf-8-sig')
-            reader = csv.DictReader(io.StringIO(content))
-            headers = {h.strip().lower() for h in (reader.fieldnames or [])}
-            if not required_headers.issubset(headers):
-                flash('Missing required columns. Required: username,password,full_name,role', 'danger')
-                return redirect(url_for('users_list'))
-            for row in reader:
-                rows.append({(k or '').strip().lower(): (v or '').strip() for k, v in row.items()})
-        else:
-            if load_workbook is None:
-                flash('Excel support requires openpyxl dependency. Install and retry.', 'danger')
-                return redirect(url_for('users_list'))
-            wb = load_workbook(upload, read_only=True, data_only=True)
-            ws = wb.active
-            all_rows = list(ws.iter_rows(values_only=True))
-            if not all_rows:
-                flash('Uploaded file is empty.', 'warning')
-                return redirect(url_for('users_list'))
-            headers = [str(h).strip().lower() if h is not None else '' for h in all_rows[0]]
-            if not required_headers.issubset(set(headers)):
-                flash('Missing required columns. Required: username,password,full_name,role', 'danger')
-                return redirect(url_for('users_list'))
-            for r in all_rows[1:]:
-                data = {}
-                for idx, col in enumerate(headers):
-                    if not col:
-                        continue
-                    value = r[idx] if idx < len(r) else ''
-                    data[col] = str(value).strip() if value is not None else ''
-                if any(v for v in data.values()):
-                    rows.append(data)
-    except Exception:
-        app.logger.exception('Unable to parse users bulk upload file')
-        flash('Unable to parse upload file. Please verify format and retry.', 'danger')
-        return redirect(url_for('users_list'))
-
+def _create_users_from_rows(rows):
+    """Validate bulk user rows and create accounts, returning a summary of the run."""
     created = 0
+    skipped = 0
     failed = 0
     errors = []
     for i, row in enumerate(rows, start=2):
@@ -6593,68 +7426,145 @@ def users_upload():
             assigned_cvo_id = cvo_user['id']
 
         try:
+            # Existing usernames are skipped, so a job retried after a partial run only creates the rest.
+            if models.get_user_by_username(username):
+                skipped += 1
+                continue
             models.create_user(username, password, full_name, role, cvo_office, assigned_cvo_id, phone, email)
             created += 1
         except Exception:
             failed += 1
             app.logger.exception('Bulk user row failed at row %s', i)
             errors.append(f'Row {i}: internal processing error.')
+    return {'created': created, 'skipped': skipped, 'failed': failed, 'errors': errors}
 
-    if created:
-        flash(f'Bulk user upload complete. Created: {created}, Failed: {failed}.', 'success')
+
+def _flash_users_upload_summary(summary):
+    created = summary.get('created', 0)
+    skipped = summary.get('skipped', 0)
+    failed = summary.get('failed', 0)
+    errors = summary.get('errors') or []
+    if created or skipped:
+        flash(f'Bulk user upload complete. Created: {created}, Already existing: {skipped}, Failed: {failed}.', 'success')
     if failed:
         preview = '; '.join(errors[:5])
         if len(errors) > 5:
             preview += '; ...'
         flash(f'Upload errors: {preview}', 'warning')
 
-    return redirect(url_for('users_list'))
 
-@app.route('/users/<int:user_id>/toggle', methods=['POST'])
+@app.route('/users/upload', methods=['POST'])
 @login_required
 @role_required('super_admin')
-def user_toggle(user_id):
-    try:
-        models.toggle_user_status(user_id)
-        flash('User status updated.', 'success')
-    except Exception:
-        flash_internal_error('Unable to update user status. Please contact administrator.')
-    return redirect(url_for('users_list'))
+def users_upload():
+    upload = request.files.get('users_file')
+    if not upload or not upload.filename:
+        flash('Please choose an Excel/CSV file to upload.', 'warning')
+        return redirect(url_for('users_list'))
 
-@app.route('/users/<int:user_id>/edit', methods=['POST'])
-@login_required
-@role_required('super_admin')
-def user_edit(user_id):
-    try:
-        full_name = request.form.get('full_name', '').strip()
-        role = (request.form.get('role') or '').strip()
-        cvo_office = (request.form.get('cvo_office') or '').strip() or None
-        assigned_cvo_id = parse_optional_int(request.form.get('assigned_cvo_id'))
-        phone = request.form.get('phone', '').strip() or None
-        email = request.form.get('email', '').strip() or None
-        password = request.form.get('password', '').strip() or None
+    filename = secure_filename(upload.filename)
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext not in ('xlsx', 'csv'):
+        flash('Only .xlsx or .csv files are allowed for bulk user creation.', 'danger')
+        return redirect(url_for('users_list'))
 
-        if not full_name or len(full_name) < 3:
-            flash('Officer name must be at least 3 characters.', 'warning')
-            return redirect(url_for('users_list'))
-        if role not in VALID_USER_ROLES:
-            flash('Please select a valid role.', 'warning')
-            return redirect(url_for('users_list'))
-        if cvo_office and cvo_office not in VALID_CVO_OFFICES:
-            flash('Please select a valid office.', 'warning')
-            return redirect(url_for('users_list'))
-        if password:
-            ok_password, password_error = validate_password_strength(password, 'Password')
-            if not ok_password:
-                flash(password_error, 'warning')
-                return redirect(url_for('users_list'))
-        if not validate_contact(phone):
-            flash('Please provide a valid phone number.', 'warning')
-            return redirect(url_for('users_list'))
-        if not validate_email(email):
-            flash('Please provide a valid email address.', 'warning')
-            return redirect(url_for('users_list'))
-        if role == 'inspector':
+    required_headers = {'username', 'full_name', 'role'}
+    rows = []
+    try:
+        if ext == 'csv':
+            content = upload.stream.read().decode('utf-8-sig')
+            reader = csv.DictReader(io.StringIO(content))
+            headers = {h.strip().lower() for h in (reader.fieldnames or [])}
+            if not required_headers.issubset(headers):
+                flash('Missing required columns. Required: username,password,full_name,role', 'danger')
+                return redirect(url_for('users_list'))
+            for row in reader:
+                rows.append({(k or '').strip().lower(): (v or '').strip() for k, v in row.items()})
+        else:
+            if load_workbook is None:
+                flash('Excel support requires openpyxl dependency. Install and retry.', 'danger')
+                return redirect(url_for('users_list'))
+            wb = load_workbook(upload, read_only=True, data_only=True)
+            ws = wb.active
+            all_rows = list(ws.iter_rows(values_only=True))
+            if not all_rows:
+                flash('Uploaded file is empty.', 'warning')
+                return redirect(url_for('users_list'))
+            headers = [str(h).strip().lower() if h is not None else '' for h in all_rows[0]]
+            if not required_headers.issubset(set(headers)):
+                flash('Missing required columns. Required: username,password,full_name,role', 'danger')
+                return redirect(url_for('users_list'))
+            for r in all_rows[1:]:
+                data = {}
+                for idx, col in enumerate(headers):
+                    if not col:
+                        continue
+                    value = r[idx] if idx < len(r) else ''
+                    data[col] = str(value).strip() if value is not None else ''
+                if any(v for v in data.values()):
+                    rows.append(data)
+    except Exception:
+        app.logger.exception('Unable to parse users bulk upload file')
+        flash('Unable to parse upload file. Please verify format and retry.', 'danger')
+        return redirect(url_for('users_list'))
+    # The password column is ignored (accounts start with the default password); drop it so it
+    # is never stored in a job payload.
+    for row in rows:
+        row.pop('password', None)
+
+    job_id = _enqueue_background_job('users_upload', {'rows': rows})
+    if job_id:
+        flash(f'Bulk user upload queued as background job #{job_id} ({len(rows)} rows).', 'info')
+        return redirect(url_for('users_list'))
+
+    _flash_users_upload_summary(_create_users_from_rows(rows))
+    return redirect(url_for('users_list'))
+
+@app.route('/users/<int:user_id>/toggle', methods=['POST'])
+@login_required
+@role_required('super_admin')
+def user_toggle(user_id):
+    try:
+        models.toggle_user_status(user_id)
+        flash('User status updated.', 'success')
+    except Exception:
+        flash_internal_error('Unable to update user status. Please contact administrator.')
+    return redirect(url_for('users_list'))
+
+@app.route('/users/<int:user_id>/edit', methods=['POST'])
+@login_required
+@role_required('super_admin')
+def user_edit(user_id):
+    try:
+        full_name = request.form.get('full_name', '').strip()
+        role = (request.form.get('role') or '').strip()
+        cvo_office = (request.form.get('cvo_office') or '').strip() or None
+        assigned_cvo_id = parse_optional_int(request.form.get('assigned_cvo_id'))
+        phone = request.form.get('phone', '').strip() or None
+        email = request.form.get('email', '').strip() or None
+        password = request.form.get('password', '').strip() or None
+
+        if not full_name or len(full_name) < 3:
+            flash('Officer name must be at least 3 characters.', 'warning')
+            return redirect(url_for('users_list'))
+        if role not in VALID_USER_ROLES:
+            flash('Please select a valid role.', 'warning')
+            return redirect(url_for('users_list'))
+        if cvo_office and cvo_office not in VALID_CVO_OFFICES:
+            flash('Please select a valid office.', 'warning')
+            return redirect(url_for('users_list'))
+        if password:
+            ok_password, password_error = validate_password_strength(password, 'Password')
+            if not ok_password:
+                flash(password_error, 'warning')
+                return redirect(url_for('users_list'))
+        if not validate_contact(phone):
+            flash('Please provide a valid phone number.', 'warning')
+            return redirect(url_for('users_list'))
+        if not validate_email(email):
+            flash('Please provide a valid email address.', 'warning')
+            return redirect(url_for('users_list'))
+        if role == 'inspector':
             if not cvo_office:
                 flash('Office is required for inspector role.', 'warning')
                 return redirect(url_for('users_list'))
@@ -6851,6 +7761,272 @@ def api_inspectors(cvo_id):
     inspectors = models.get_inspectors_by_cvo(cvo_id)
     return jsonify([{'id': i['id'], 'full_name': i['full_name']} for i in inspectors])
 
+def _bulk_assign_precheck(inspector_id, enquiry_type, row):
+    # Mirrors the single assign_inspector checks in petition_action.
+    if row.get('requires_permission') and row.get('status') != 'permission_approved':
+        return 'Permission is compulsory. PO approval required before assigning inspector.'
+    if not row.get('requires_permission'):
+        if row.get('status') != 'forwarded_to_cvo':
+            return 'For Direct Enquiry, inspector can be assigned only when petition is at CVO/DSP.'
+        if not enquiry_type:
+            return 'Please select enquiry type decision (Detailed/Preliminary).'
+    locked_inspector_id = row.get('assigned_inspector_id')
+    if (
+        row.get('status') == 'permission_approved'
+        and row.get('conversion_requested')
+        and locked_inspector_id
+        and int(locked_inspector_id) != int(inspector_id)
+    ):
+        return 'For preliminary-to-detailed conversion, only previously assigned inspector is allowed.'
+    return None
+
+
+def _bulk_efile_precheck(required_message, row):
+    if not (row.get('efile_no') or '').strip():
+        return required_message
+    return None
+
+
+@app.route('/api/petitions/bulk-action', methods=['POST'])
+@login_required
+def api_petitions_bulk_action():
+    data = request.get_json(silent=True) or {}
+    action = (data.get('action') or '').strip()
+    bulk_spec = BULK_WORKFLOW_ACTIONS.get(action)
+    if not bulk_spec:
+        return jsonify({'error': 'Unsupported bulk action.'}), 400
+    user_id = session['user_id']
+    user_role = session['user_role']
+    if user_role not in bulk_spec['roles']:
+        log_security_event('access.bulk_action_forbidden', severity='warning', action=action)
+        return jsonify({'error': 'Forbidden'}), 403
+
+    raw_ids = data.get('petition_ids')
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return jsonify({'error': 'Select at least one petition.'}), 400
+    petition_ids = []
+    for raw_id in raw_ids:
+        petition_id = parse_optional_int(str(raw_id))
+        if not petition_id:
+            return jsonify({'error': 'Invalid petition id.'}), 400
+        if petition_id not in petition_ids:
+            petition_ids.append(petition_id)
+    if len(petition_ids) > BULK_WORKFLOW_MAX_PETITIONS:
+        return jsonify({'error': f'Select at most {BULK_WORKFLOW_MAX_PETITIONS} petitions at a time.'}), 400
+    comments = (data.get('comments') or '').strip()
+    if len(comments) > 5000:
+        return jsonify({'error': 'Comments are too long.'}), 400
+
+    form_cfg = get_effective_form_field_configs()
+    values = {}
+    precheck = None
+    if action == 'forward_to_cvo':
+        target_cvo = (data.get('target_cvo') or '').strip()
+        if target_cvo not in VALID_TARGET_CVO:
+            return jsonify({'error': 'Please select a valid target CVO/DSP.'}), 400
+        values['target_cvo'] = target_cvo
+    elif action == 'assign_inspector':
+        inspector_id = parse_optional_int(str(data.get('inspector_id') or ''))
+        if not inspector_id:
+            return jsonify({'error': 'Please select a valid field inspector.'}), 400
+        enquiry_type = (data.get('enquiry_type_decision') or '').strip().lower() or None
+        if enquiry_type and enquiry_type not in VALID_ENQUIRY_TYPES:
+            return jsonify({'error': 'Please select enquiry type decision (Detailed/Preliminary).'}), 400
+        values.update(handler_id=inspector_id, enquiry_type=enquiry_type)
+        precheck = partial(_bulk_assign_precheck, inspector_id, enquiry_type)
+    elif action == 'po_lodge':
+        cfg_remarks = form_cfg.get('po_decision.po_lodge_remarks', DEFAULT_FORM_FIELD_CONFIGS['po_decision.po_lodge_remarks'])
+        cfg_efile = form_cfg.get('po_decision.po_lodge_efile_no', DEFAULT_FORM_FIELD_CONFIGS['po_decision.po_lodge_efile_no'])
+        if cfg_remarks.get('required') and not comments:
+            return jsonify({'error': f"{cfg_remarks.get('label', 'PO Lodge Remarks')} is required."}), 400
+        # One file number cannot serve many petitions, so bulk lodge only reuses existing ones.
+        values['efile_no'] = None
+        if cfg_efile.get('required'):
+            precheck = partial(_bulk_efile_precheck, f"{cfg_efile.get('label', 'E-Office File No')} is required.")
+    elif action == 'close':
+        cfg_close = form_cfg.get('po_decision.close_comments', DEFAULT_FORM_FIELD_CONFIGS['po_decision.close_comments'])
+        if cfg_close.get('required') and not comments:
+            return jsonify({'error': f"{cfg_close.get('label', 'Closing Remarks')} is required."}), 400
+
+    try:
+        outcomes = models.bulk_workflow_transition(
+            petition_ids,
+            bulk_spec['transition'],
+            user_id,
+            user_role,
+            precheck=precheck,
+            comments=comments or None,
+            **values,
+        )
+    except Exception:
+        app.logger.exception('Bulk workflow action %s failed', action)
+        return jsonify({'error': 'Unable to complete action. Please contact administrator.'}), 500
+
+    g.bulk_action_petition_ids = [pid for pid in petition_ids if outcomes.get(pid) is None]
+    results = [
+        {'petition_id': pid, 'ok': outcomes.get(pid) is None, 'error': outcomes.get(pid)}
+        for pid in petition_ids
+    ]
+    succeeded = len(g.bulk_action_petition_ids)
+    return jsonify({
+        'action': action,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results,
+    })
+
+
+def _format_inbox_cursor(cursor):
+    if not cursor:
+        return None
+    since, petition_id = cursor
+    return f"{since.isoformat()}_{petition_id}"
+
+
+def _parse_inbox_cursor(raw_cursor):
+    since_text, _, petition_id = (raw_cursor or '').rpartition('_')
+    try:
+        return datetime.fromisoformat(since_text), int(petition_id)
+    except ValueError:
+        return None
+
+
+@app.route('/api/inbox')
+@login_required
+def api_inbox():
+    """The signed-in officer's work queue: counts plus one keyset page (pass next_cursor as `after`)."""
+    user_id = session['user_id']
+    after = None
+    raw_after = (request.args.get('after') or '').strip()
+    if raw_after:
+        after = _parse_inbox_cursor(raw_after)
+        if not after:
+            return jsonify({'error': 'Invalid cursor.'}), 400
+    status = (request.args.get('status') or '').strip() or None
+    limit = parse_optional_int(request.args.get('limit')) or 25
+    try:
+        counts = models.get_inbox_counts(user_id)
+        page = models.get_inbox_page(user_id, limit=limit, after=after, status=status)
+    except Exception:
+        app.logger.exception('Inbox read failed for user %s', user_id)
+        return jsonify({'error': 'Unable to load inbox.'}), 500
+    items = [
+        {
+            'petition_id': item['petition_id'],
+            'sno': item.get('sno'),
+            'subject': item.get('subject'),
+            'petitioner_name': item.get('petitioner_name'),
+            'petition_type': item.get('petition_type'),
+            'status': item.get('status'),
+            'since': item['since'].isoformat() if item.get('since') else None,
+            'due_at': item['due_at'].isoformat() if item.get('due_at') else None,
+            'received_date': item['received_date'].isoformat() if item.get('received_date') else None,
+        }
+        for item in page['items']
+    ]
+    return jsonify({
+        'counts': counts,
+        'items': items,
+        'next_cursor': _format_inbox_cursor(page['next_cursor']),
+    })
+
+
+def _format_changes_cursor(cursor):
+    updated_at, petition_id, tracking_id = cursor
+    return f"{updated_at.isoformat() if updated_at else ''}_{petition_id}_{tracking_id}"
+
+
+def _parse_changes_cursor(raw_cursor):
+    parts = (raw_cursor or '').split('_')
+    if len(parts) != 3:
+        return None
+    try:
+        updated_at = datetime.fromisoformat(parts[0]) if parts[0] else None
+        return updated_at, int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+
+def _serialize_change_row(row):
+    return {key: value.isoformat() if isinstance(value, (datetime, date)) else value for key, value in row.items()}
+
+
+@app.route('/api/petitions/changes')
+@login_required
+def api_petition_changes():
+    """Delta sync: petitions and tracking entries changed since `since` (the previous response's cursor)."""
+    since = None
+    raw_since = (request.args.get('since') or '').strip()
+    if raw_since:
+        since = _parse_changes_cursor(raw_since)
+        if not since:
+            return jsonify({'error': 'Invalid cursor.'}), 400
+    fields = None
+    raw_fields = (request.args.get('fields') or '').strip()
+    if raw_fields:
+        fields = [f.strip() for f in raw_fields.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in models.PETITION_CHANGE_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    limit = parse_optional_int(request.args.get('limit')) or 500
+    try:
+        changes = models.get_petition_changes(
+            session['user_id'], session['user_role'], since=since, limit=limit, fields=fields,
+        )
+    except Exception:
+        app.logger.exception('Petition delta sync failed')
+        return jsonify({'error': 'Unable to load changes.'}), 500
+    return jsonify({
+        'petitions': [_serialize_change_row(row) for row in changes['petitions']],
+        'tracking': [_serialize_change_row(row) for row in changes['tracking']],
+        'cursor': _format_changes_cursor(changes['cursor']),
+        'has_more': changes['has_more'],
+    })
+
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _iter_inbox_events(user_id, events):
+    """SSE body for one user: the bell now, then again whenever the inbox notifies a change."""
+    deadline = time.monotonic() + max(1, config.EVENTS_STREAM_MAX_SECONDS)
+    heartbeat = max(1, config.EVENTS_HEARTBEAT_SECONDS)
+    try:
+        yield "retry: 5000\n\n"
+        yield _sse_event('bell', inbox_bell_notification(user_id))
+        while time.monotonic() < deadline:
+            try:
+                changes = [events.get(timeout=min(heartbeat, max(0.1, deadline - time.monotonic())))]
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            # A bulk action notifies once per petition; answer the whole burst with one bell update.
+            while not events.empty():
+                changes.append(events.get_nowait())
+            for change in changes:
+                if change.get('to_user_id') == user_id and change.get('from_user_id') != user_id:
+                    yield _sse_event('moved', {'petition_id': change.get('petition_id'), 'status': change.get('status')})
+            yield _sse_event('bell', inbox_bell_notification(user_id))
+    finally:
+        models.INBOX_EVENTS.close_stream(user_id, events)
+
+
+@app.route('/api/events')
+@login_required
+def api_events():
+    """Server-sent events for the bell: `bell` on every queue change, `moved` when a petition reaches this user."""
+    if not config.EVENTS_ENABLED:
+        return jsonify({'error': 'Not found'}), 404
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    user_id = session['user_id']
+    events = models.INBOX_EVENTS.open_stream(user_id)
+    if events is None:
+        # At the stream limit: ask the browser to come back later instead of holding a thread.
+        return Response("retry: 60000\n\n", mimetype='text/event-stream', headers=headers)
+    return Response(_iter_inbox_events(user_id, events), mimetype='text/event-stream', headers=headers)
+
+
 @app.route('/api/stats')
 @login_required
 def api_stats():
@@ -6901,7 +8077,7 @@ def api_dashboard_analytics():
     user_role = session['user_role']
     user_id = session['user_id']
     cvo_office = session.get('cvo_office')
-    petitions = get_petitions_for_user_cached(user_id, user_role, cvo_office)
+    petitions, from_rollups = _load_analytics_rows(user_id, user_role, cvo_office)
     officer_lookup = {}
     for p in petitions:
         officer_id = p.get('assigned_inspector_id')
@@ -6910,7 +8086,10 @@ def api_dashboard_analytics():
             officer_lookup[int(officer_id)] = officer_name
     dashboard_filter = _extract_dashboard_filters(request.args, officer_lookup)
     filtered_petitions = _apply_dashboard_filters(petitions, dashboard_filter)
-    stats = _build_filtered_dashboard_stats(user_role, user_id, petitions, filtered_petitions)
+    if from_rollups:
+        stats = _rollup_sla_stats(filtered_petitions)
+    else:
+        stats = _build_filtered_dashboard_stats(user_role, user_id, petitions, filtered_petitions)
     analytics = _build_dashboard_analytics(filtered_petitions, stats)
     return jsonify({'analytics': analytics, 'summary': analytics.get('summary', {})})
 
@@ -6921,16 +8100,7 @@ def api_petitioner_suggestions():
     q = _normalize_petitioner_name(request.args.get('q', ''))
     if len(q) < 2:
         return jsonify({'items': []})
-    petitions = get_petitions_for_user_cached(session['user_id'], session['user_role'], session.get('cvo_office'))
-    counter = Counter()
-    q_lower = q.lower()
-    for p in petitions:
-        pname = _normalize_petitioner_name(p.get('petitioner_name') or '')
-        if not pname or pname.lower() in {'anonymous', '-'}:
-            continue
-        if q_lower in pname.lower():
-            counter[pname] += 1
-    items = [{'name': name, 'count': count} for name, count in counter.most_common(12)]
+    items = models.search_petitioner_directory(session['user_id'], session['user_role'], q, limit=12)
     return jsonify({'items': items})
 
 
@@ -6940,7 +8110,7 @@ def api_petitioner_profile():
     name = _normalize_petitioner_name(request.args.get('name', ''))
     if not name:
         return jsonify({'error': 'Petitioner name is required.'}), 400
-    petitions = get_petitions_for_user_cached(session['user_id'], session['user_role'], session.get('cvo_office'))
+    petitions = models.get_petitioner_petitions(session['user_id'], session['user_role'], name)
     payload = _build_petitioner_profile_payload(petitions, name)
     return jsonify(payload)
 
@@ -7020,645 +8190,736 @@ def _chatbot_format_petitions_with_date(petitions):
     return out
 
 
-@app.route('/api/chatbot', methods=['POST'])
-@login_required
-def chatbot_api():
-    import re as _re
-    import random as _random
-    try:
-        from rapidfuzz import fuzz as _fuzz
-        _HAS_FUZZ = True
-    except ImportError:
-        _HAS_FUZZ = False
+# ---- Chatbot intent engine ----
+# Phrase tables, regexes and the matcher are built once at import; chatbot_api only
+# classifies the message and dispatches to a handler.
 
-    data = request.get_json(silent=True) or {}
-    message = (data.get('message') or '').strip()
-    if not message:
-        return jsonify({'type': 'text', 'text': 'Go ahead, type something! I\'m all ears. 😊'})
+_CHATBOT_GREET_PATTERNS = ('hi', 'hello', 'hey', 'namaste', 'good morning', 'good afternoon',
+                           'good evening', 'howdy', 'hii', 'helo', 'hai', 'vanakkam', 'namaskar',
+                           'sup', 'yo', 'greetings')
+_CHATBOT_GREET_RE = re.compile(
+    r'^(?:' + '|'.join(re.escape(g) for g in _CHATBOT_GREET_PATTERNS) + r')(?:$|[ !])'
+)
+_CHATBOT_HELP_MESSAGES = frozenset(('help', '?', 'help me', 'commands', 'what can you do', 'options', 'menu'))
+
+_CHATBOT_PENDING_WORDS = ('pending', 'overdue', 'waiting', 'my work', 'action needed',
+                          'not closed', 'todo', 'to do', 'due', 'my petitions',
+                          'assigned to me', 'open petition', 'outstanding', 'unresolved',
+                          'backlog', 'incomplete', 'need to act', 'not done', 'left')
+_CHATBOT_UPDATE_WORDS = ('update', 'updates', 'recent', 'activity', 'latest',
+                         "what's new", 'whats new', 'notification', 'changes',
+                         'modified', 'changed', 'progress', 'moved', 'feed', 'history')
+_CHATBOT_GUIDE_WORDS = ('guide', 'how to', 'take action', 'workflow', 'process',
+                        'next step', 'what should i do', 'instructions', 'steps',
+                        'procedure', 'help me do', 'walkthrough', 'how do i', 'what do i do')
+_CHATBOT_STATS_WORDS = ('stats', 'statistics', 'count', 'total', 'summary', 'how many',
+                        'petition count', 'numbers', 'overview', 'breakdown', 'tally', 'figure')
+
+# Substring intents in priority order: when phrases of several intents occur in a message
+# the earliest intent wins. Exact-match help commands rank just before role_info.
+_CHATBOT_PHRASE_INTENTS = (
+    ('thanks', ('thanks', 'thank you', 'thank u', 'thx', 'ty', 'appreciated',
+                'great job', 'well done', 'nice', 'awesome', 'perfect', 'good bot',
+                'helpful', 'superb', 'excellent', 'brilliant', 'amazing', 'fantastic',
+                'good work', 'great', 'wonderful', 'cheers')),
+    ('bye', ('bye', 'goodbye', 'good bye', 'see you', 'cya', 'later', 'take care',
+             'ok thanks', 'ok bye', 'got it thanks', 'that is all', "that's all",
+             'no thanks', 'nothing else', 'all good', 'im done', "i'm done")),
+    ('how_are_you', ('how are you', 'how r u', 'how do you do', 'whats up',
+                     "what's up", 'hows it going', "how's it going", 'all good')),
+    ('who_are_you', ('who are you', 'what are you', 'who r u',
+                     'introduce yourself', 'tell me about yourself', 'your name')),
+    ('frustration', ('not working', "doesn't work", 'doesnt work', 'broken', 'problem',
+                     'issue', 'fail', 'failed', 'wrong', 'useless', 'bad bot',
+                     'frustrated', 'stuck', 'confused', 'lost', 'no idea', 'dont understand',
+                     "don't understand", 'not helpful', 'bad', 'terrible', 'hate this')),
+    ('role_info', ('my role', 'my responsibility', 'my responsibilities', 'my duties',
+                   'my job', 'what is my role', 'what should i do', 'role info',
+                   'what is my job', 'my work', 'who am i', 'what do i do',
+                   'officer duty', 'my function', 'my task', 'my designation')),
+    ('pending', _CHATBOT_PENDING_WORDS),
+    ('updates', _CHATBOT_UPDATE_WORDS),
+    ('guide', _CHATBOT_GUIDE_WORDS),
+    ('stats', _CHATBOT_STATS_WORDS),
+    ('download', ('download', 'report', 'analysis', 'export', 'analysis report',
+                  'download report', 'generate report', 'view report',
+                  'excel', 'pdf report', 'csv report', 'see report')),
+    ('urgent', ('urgent', 'overdue', 'sla breach', 'beyond sla', 'critical',
+                'escalate', 'delayed', 'late', 'sla', 'priority cases',
+                'breach', 'violation', 'missed deadline')),
+    ('summary', ('today', 'daily', 'my day', 'daily report', 'today summary',
+                 'day summary', 'what happened today', 'daily summary', 'todays update')),
+    ('suggest', ('what next', 'suggest', 'recommendation', 'next action',
+                 'what should i work on', 'help me prioritize', 'what to do next',
+                 'prioritize', 'my priority', 'next steps', 'suggest me', 'advise me')),
+)
+_CHATBOT_HELP_RANK = [name for name, _ in _CHATBOT_PHRASE_INTENTS].index('role_info')
+
+# Searches run only when no phrase intent matched, in this order.
+_CHATBOT_SEARCH_PATTERNS = (
+    ('search_name', re.compile(r'(?:search|find|name|petitioner)[:\s]+(.+)')),
+    ('search_efile', re.compile(r'(?:eoffice|efile|e-office|e-file|file\s*no)[:\s#]*([A-Za-z0-9/_\-\.]+)')),
+    ('search_ereceipt', re.compile(r'(?:ereceipt|e-receipt|receipt)[:\s#]*([A-Za-z0-9/_\-\.]+)')),
+    ('search_sno', re.compile(r'(?:sno|serial|vig)[:\s#]*([A-Za-z0-9/_\-]+)')),
+)
+# Bare numbers typed without a prefix: e-receipts like "ER2024001" / "ER/2024001",
+# e-office files like "VIG/HQ/2024/01".
+_CHATBOT_BARE_ERECEIPT_RE = re.compile(r'^[a-z]{1,4}[\-/]?\d{4,}')
+_CHATBOT_BARE_EFILE_RE = re.compile(r'^[a-z0-9]+(?:/[a-z0-9]+){2,}')
+
+# Typo fallback ("pendin", "stas", "updtes"): single-word keywords of the main intents.
+_CHATBOT_FUZZY_MIN_SCORE = 78
+_CHATBOT_FUZZY_KEYWORDS = tuple(
+    (kw, intent)
+    for intent, words in (
+        ('pending', _CHATBOT_PENDING_WORDS),
+        ('updates', _CHATBOT_UPDATE_WORDS),
+        ('guide', _CHATBOT_GUIDE_WORDS),
+        ('stats', _CHATBOT_STATS_WORDS),
+    )
+    for kw in words
+    if ' ' not in kw
+)
+_CHATBOT_FUZZY_CHOICES = tuple(kw for kw, _ in _CHATBOT_FUZZY_KEYWORDS)
 
-    user_id = session['user_id']
-    user_role = session.get('user_role', '')
-    cvo_office = session.get('cvo_office')
-    user_name = session.get('full_name') or session.get('user_name') or 'Officer'
-    msg_lower = message.lower().strip()
-
-    # ---- Greetings ----
-    greet_patterns = ('hi', 'hello', 'hey', 'namaste', 'good morning', 'good afternoon',
-                      'good evening', 'howdy', 'hii', 'helo', 'hai', 'vanakkam', 'namaskar',
-                      'sup', 'yo', 'greetings')
-    if any(msg_lower == g or msg_lower.startswith(g + ' ') or msg_lower.startswith(g + '!') for g in greet_patterns):
-        greet_replies = [
-            f"Hey {user_name}! 👋 Great to see you. What can I help you with today?",
-            f"Hello {user_name}! 😊 I'm Nigaa, your petition assistant. What do you need?",
-            f"Hi there, {user_name}! 👋 Ready to help — try _\"pending\"_, _\"stats\"_, or _\"guide\"_.",
-            f"Namaste, {user_name}! 🙏 How can I assist you today?",
-            f"Hey! Good to have you here, {user_name}. 😄 What's on your mind?",
-        ]
-        return jsonify({
-            'type': 'text',
-            'text': _random.choice(greet_replies) + (
-                "\n\n**Quick options:**\n"
-                "• ⏳ _\"pending\"_ — petitions needing action\n"
-                "• 🔔 _\"updates\"_ — recent activity\n"
-                "• 📊 _\"stats\"_ — petition counts\n"
-                "• 📋 _\"guide\"_ — workflow steps for your role"
+
+class _PhraseAutomaton:
+    """Aho-Corasick automaton over ranked phrases.
+
+    best_rank() scans the text once and returns the lowest rank of any phrase occurring in
+    it as a substring, or None.
+    """
+
+    __slots__ = ('_goto', '_fail', '_out')
+
+    def __init__(self, ranked_phrases):
+        goto = [{}]
+        out = [None]
+        for rank, phrase in ranked_phrases:
+            node = 0
+            for ch in phrase:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(None)
+                node = nxt
+            if out[node] is None or rank < out[node]:
+                out[node] = rank
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                inherited = out[fail[nxt]]
+                if inherited is not None and (out[nxt] is None or inherited < out[nxt]):
+                    out[nxt] = inherited
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def best_rank(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        best = None
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            rank = out[node]
+            if rank is not None and (best is None or rank < best):
+                best = rank
+                if best == 0:
+                    break
+        return best
+
+
+_CHATBOT_PHRASE_MATCHER = _PhraseAutomaton(
+    (rank, phrase)
+    for rank, (_intent, phrases) in enumerate(_CHATBOT_PHRASE_INTENTS)
+    for phrase in phrases
+)
+
+
+def _classify_chatbot_intent(msg_lower):
+    """Return (intent, regex match or None) for a lower-cased message; intent may be None."""
+    if _CHATBOT_GREET_RE.match(msg_lower):
+        return 'greet', None
+    rank = _CHATBOT_PHRASE_MATCHER.best_rank(msg_lower)
+    if msg_lower in _CHATBOT_HELP_MESSAGES and (rank is None or rank >= _CHATBOT_HELP_RANK):
+        return 'help', None
+    if rank is not None:
+        return _CHATBOT_PHRASE_INTENTS[rank][0], None
+
+    for intent, pattern in _CHATBOT_SEARCH_PATTERNS:
+        match = pattern.search(msg_lower)
+        if match:
+            return intent, match
+    bare_efile = _CHATBOT_BARE_EFILE_RE.match(msg_lower)
+    if bare_efile:
+        return 'bare_efile', bare_efile
+    bare_ereceipt = _CHATBOT_BARE_ERECEIPT_RE.match(msg_lower)
+    if bare_ereceipt:
+        return 'bare_ereceipt', bare_ereceipt
+
+    if _fuzz_process is not None:
+        best_intent = None
+        best_score = 0
+        for word in msg_lower.split():
+            hit = _fuzz_process.extractOne(
+                word, _CHATBOT_FUZZY_CHOICES, scorer=_fuzz.ratio,
+                score_cutoff=max(_CHATBOT_FUZZY_MIN_SCORE, best_score + 1e-9),
             )
-        })
+            if hit:
+                best_score = hit[1]
+                best_intent = _CHATBOT_FUZZY_KEYWORDS[hit[2]][1]
+        if best_intent:
+            return best_intent, None
+    return None, None
+
+
+_CHATBOT_ROLE_DESCRIPTIONS = {
+    'inspector': {
+        'title': 'Field Inspector',
+        'badge': '🔍',
+        'color': '#06b6d4',
+        'summary': 'You conduct field investigations on petitions assigned to you and submit enquiry reports.',
+        'responsibilities': [
+            '📥 Check petitions assigned to you under the Assigned tab',
+            '🔍 Conduct on-site field investigations and gather evidence',
+            '📝 Submit detailed enquiry reports with findings',
+            '🔁 Re-investigate cases sent back for re-enquiry promptly',
+            '📊 Keep petition status updated as you progress',
+        ],
+        'key_link': '/petitions?status=assigned_to_inspector',
+    },
+    'cvo_apspdcl': {
+        'title': 'Chief Vigilance Officer (APSPDCL)',
+        'badge': '🛡️',
+        'color': '#8b5cf6',
+        'summary': 'You oversee all petitions under your CVO jurisdiction, assign inspectors, and ensure timely resolution.',
+        'responsibilities': [
+            '📥 Review all petitions received in your CVO office',
+            '👨‍💼 Assign petitions to appropriate field inspectors',
+            '🔐 Request permission for sensitive/complex cases',
+            '📊 Monitor inspector progress and SLA compliance',
+            '⚠️ Escalate overdue cases to the Petitions Officer',
+        ],
+        'key_link': '/petitions',
+    },
+    'po': {
+        'title': 'Petitions Officer',
+        'badge': '⚖️',
+        'color': '#6366f1',
+        'summary': 'You oversee the entire petition lifecycle, approve/reject permissions, and issue action instructions.',
+        'responsibilities': [
+            '📥 Review petitions forwarded to you for action',
+            '✅ Approve or reject CVO permission requests',
+            '📣 Issue action instructions to CMD/CGM officers',
+            '📊 Monitor SLA compliance across all CVOs',
+            '⚠️ Escalate and resolve overdue petitions',
+        ],
+        'key_link': '/petitions?status=forwarded_to_po',
+    },
+    'data_entry': {
+        'title': 'Data Entry Officer',
+        'badge': '📋',
+        'color': '#f59e0b',
+        'summary': 'You register new petitions, upload documents, and route them to the correct CVO office.',
+        'responsibilities': [
+            '➕ Register new petitions with complete petitioner details',
+            '📎 Upload scanned E-Receipts and supporting documents',
+            '🏢 Route petitions to the correct CVO based on jurisdiction',
+            '🔍 Track and verify petition status after submission',
+            '✅ Ensure data accuracy and completeness at entry',
+        ],
+        'key_link': '/petitions/new',
+    },
+    'super_admin': {
+        'title': 'Super Administrator',
+        'badge': '👑',
+        'color': '#ef4444',
+        'summary': 'You have full system access — manage users, monitor all petitions, and ensure system-wide compliance.',
+        'responsibilities': [
+            '👥 Create and manage officer accounts and role assignments',
+            '📊 Monitor all petitions and SLA compliance system-wide',
+            '⚠️ Review and escalate overdue petitions across all CVOs',
+            '📂 Generate reports and review audit activity',
+            '🔧 Configure system settings and help resources',
+        ],
+        'key_link': '/users',
+    },
+}
+_CHATBOT_ROLE_DESCRIPTIONS['cvo_apepdcl'] = dict(_CHATBOT_ROLE_DESCRIPTIONS['cvo_apspdcl'], title='Chief Vigilance Officer (APEPDCL)')
+_CHATBOT_ROLE_DESCRIPTIONS['cvo_apcpdcl'] = dict(_CHATBOT_ROLE_DESCRIPTIONS['cvo_apspdcl'], title='Chief Vigilance Officer (APCPDCL)')
+_CHATBOT_ROLE_DESCRIPTIONS['dsp'] = dict(_CHATBOT_ROLE_DESCRIPTIONS['cvo_apspdcl'], title='DSP Officer', badge='🔒')
+_CHATBOT_ROLE_DESCRIPTIONS['cmd_apspdcl'] = {
+    'title': 'CMD / CGM Officer',
+    'badge': '🏛️',
+    'color': '#10b981',
+    'summary': 'You execute action instructions issued by the Petitions Officer and report back with actions taken.',
+    'responsibilities': [
+        '📥 Check action instructions assigned to you',
+        '✅ Execute required corrective or disciplinary action',
+        '📤 Submit action-taken report with supporting evidence',
+        '📊 Track closed cases for compliance records',
+    ],
+    'key_link': '/petitions?status=action_instructed',
+}
+for _r in ('cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco'):
+    _CHATBOT_ROLE_DESCRIPTIONS[_r] = _CHATBOT_ROLE_DESCRIPTIONS['cmd_apspdcl']
 
-    # ---- Thanks / Appreciation ----
-    thanks_words = ('thanks', 'thank you', 'thank u', 'thx', 'ty', 'appreciated',
-                    'great job', 'well done', 'nice', 'awesome', 'perfect', 'good bot',
-                    'helpful', 'superb', 'excellent', 'brilliant', 'amazing', 'fantastic',
-                    'good work', 'great', 'wonderful', 'cheers')
-    if any(w in msg_lower for w in thanks_words):
-        thanks_replies = [
-            "Happy to help! 😊 Anything else you need?",
-            "Glad I could assist! 🙌 Let me know if there's anything more.",
-            "You're welcome! 😄 I'm always here when you need me.",
-            "Anytime! 🤝 That's what I'm here for. Just ask!",
-            "Sure thing! 👍 Feel free to ask anything else.",
-            "Always a pleasure! 😊 Need anything else?",
-        ]
-        return jsonify({'type': 'text', 'text': _random.choice(thanks_replies)})
-
-    # ---- Goodbye / Farewell ----
-    bye_words = ('bye', 'goodbye', 'good bye', 'see you', 'cya', 'later', 'take care',
-                 'ok thanks', 'ok bye', 'got it thanks', 'that is all', "that's all",
-                 'no thanks', 'nothing else', 'all good', 'im done', "i'm done")
-    if any(w in msg_lower for w in bye_words):
-        bye_replies = [
-            "Take care! 👋 Come back anytime you need help.",
-            "Goodbye! Have a productive day! 😊",
-            "See you soon! 🙏 Stay on top of those petitions!",
-            "Bye for now! 👋 I'll be right here whenever you need me.",
-            "Until next time! 😊 Keep up the great work!",
-        ]
-        return jsonify({'type': 'text', 'text': _random.choice(bye_replies)})
-
-    # ---- How are you / general small talk ----
-    if any(w in msg_lower for w in ('how are you', 'how r u', 'how do you do', 'whats up',
-                                     "what's up", 'hows it going', "how's it going", 'all good')):
-        how_replies = [
-            "Doing great, thanks for asking! 😄 Ready to help you with petitions. What do you need?",
-            "All systems go! 🚀 What can I assist you with today?",
-            "Running at full speed! ⚡ What's on your plate today?",
-            "I'm doing well! 😊 Always happy to help. What do you need?",
-        ]
-        return jsonify({'type': 'text', 'text': _random.choice(how_replies)})
-
-    # ---- Who are you / intro ----
-    if any(w in msg_lower for w in ('who are you', 'what are you', 'who r u',
-                                     'introduce yourself', 'tell me about yourself', 'your name')):
-        return jsonify({'type': 'text', 'text': (
-            f"I'm **Nigaa** 🤖 — your smart petition assistant!\n\n"
-            "I help officers manage and track petitions right from this chat window. "
-            "You can search petitions, check pending work, view stats, and get role-specific workflow guidance — "
-            "all without leaving this page.\n\n"
-            "Think of me as your digital sidekick! 🦸 Type _\"help\"_ to see everything I can do."
-        )})
-
-    # ---- Frustration / Problem ----
-    frustration_words = ('not working', "doesn't work", 'doesnt work', 'broken', 'problem',
-                         'issue', 'fail', 'failed', 'wrong', 'useless', 'bad bot',
-                         'frustrated', 'stuck', 'confused', 'lost', 'no idea', 'dont understand',
-                         "don't understand", 'not helpful', 'bad', 'terrible', 'hate this')
-    if any(w in msg_lower for w in frustration_words):
-        empathy_replies = [
-            f"I'm sorry you're having trouble, {user_name}. 😔 Let me help — type _\"help\"_ to see all available commands.",
-            f"That sounds frustrating. I'm here to help! 🤝 Type _\"help\"_ to see what I can do for you.",
-            f"Don't worry, {user_name}! 😊 Let's sort this out. What exactly do you need?",
-            f"I hear you! Let me try to make this easier. 🙏 What were you looking for?",
-        ]
-        return jsonify({'type': 'text', 'text': _random.choice(empathy_replies)})
 
-    # ---- Help ----
-    if msg_lower in ('help', '?', 'help me', 'commands', 'what can you do', 'options', 'menu'):
-        return jsonify({'type': 'help'})
+def get_chatbot_snapshot_cached(user_id, user_role, cvo_office):
+    """Per-(user, role, office) chatbot snapshot in models.CACHE for CHATBOT_SNAPSHOT_TTL_SECONDS.
 
-    # ---- Role / Responsibility info ----
-    _ROLE_WORDS = ('my role', 'my responsibility', 'my responsibilities', 'my duties',
-                   'my job', 'what is my role', 'what should i do', 'role info',
-                   'what is my job', 'my work', 'who am i', 'what do i do',
-                   'officer duty', 'my function', 'my task', 'my designation')
-    _ROLE_DESCRIPTIONS = {
-        'inspector': {
-            'title': 'Field Inspector',
-            'badge': '🔍',
-            'color': '#06b6d4',
-            'summary': 'You conduct field investigations on petitions assigned to you and submit enquiry reports.',
-            'responsibilities': [
-                '📥 Check petitions assigned to you under the Assigned tab',
-                '🔍 Conduct on-site field investigations and gather evidence',
-                '📝 Submit detailed enquiry reports with findings',
-                '🔁 Re-investigate cases sent back for re-enquiry promptly',
-                '📊 Keep petition status updated as you progress',
-            ],
-            'key_link': '/petitions?status=assigned_to_inspector',
-        },
-        'cvo_apspdcl': {
-            'title': 'Chief Vigilance Officer (APSPDCL)',
-            'badge': '🛡️',
-            'color': '#8b5cf6',
-            'summary': 'You oversee all petitions under your CVO jurisdiction, assign inspectors, and ensure timely resolution.',
-            'responsibilities': [
-                '📥 Review all petitions received in your CVO office',
-                '👨‍💼 Assign petitions to appropriate field inspectors',
-                '🔐 Request permission for sensitive/complex cases',
-                '📊 Monitor inspector progress and SLA compliance',
-                '⚠️ Escalate overdue cases to the Petitions Officer',
-            ],
-            'key_link': '/petitions',
-        },
-        'po': {
-            'title': 'Petitions Officer',
-            'badge': '⚖️',
-            'color': '#6366f1',
-            'summary': 'You oversee the entire petition lifecycle, approve/reject permissions, and issue action instructions.',
-            'responsibilities': [
-                '📥 Review petitions forwarded to you for action',
-                '✅ Approve or reject CVO permission requests',
-                '📣 Issue action instructions to CMD/CGM officers',
-                '📊 Monitor SLA compliance across all CVOs',
-                '⚠️ Escalate and resolve overdue petitions',
+    Tagged like the user's petition list (petitions, scope:<office>, user:<id>), so workflow
+    writes drop it in every process, for the acting officer and for whoever's queue changed.
+    """
+    def load():
+        return models.get_chatbot_snapshot(user_id, user_role, cvo_office, limit=CHATBOT_SNAPSHOT_LIMIT)
+
+    ttl = max(0, int(config.CHATBOT_SNAPSHOT_TTL_SECONDS))
+    if not ttl:
+        return load()
+    tags = models.petition_scope_cache_tags({'user_role': user_role, 'user_id': user_id})
+    return models.CACHE.get_or_set(
+        f'chatbot_snapshot:{user_id}:{user_role}:{cvo_office or ""}', load, ttl, tags + [f'user:{user_id}']
+    )
+
+
+class _ChatbotContext:
+    __slots__ = ('user_id', 'user_role', 'cvo_office', 'user_name', 'message', 'msg_lower')
+
+    def __init__(self, user_id, user_role, cvo_office, user_name, message, msg_lower):
+        self.user_id = user_id
+        self.user_role = user_role
+        self.cvo_office = cvo_office
+        self.user_name = user_name
+        self.message = message
+        self.msg_lower = msg_lower
+
+    def snapshot(self):
+        return get_chatbot_snapshot_cached(self.user_id, self.user_role, self.cvo_office)
+
+
+def _chatbot_greet(ctx, _match):
+    user_name = ctx.user_name
+    greet_replies = [
+        f"Hey {user_name}! 👋 Great to see you. What can I help you with today?",
+        f"Hello {user_name}! 😊 I'm Nigaa, your petition assistant. What do you need?",
+        f"Hi there, {user_name}! 👋 Ready to help — try _\"pending\"_, _\"stats\"_, or _\"guide\"_.",
+        f"Namaste, {user_name}! 🙏 How can I assist you today?",
+        f"Hey! Good to have you here, {user_name}. 😄 What's on your mind?",
+    ]
+    return jsonify({
+        'type': 'text',
+        'text': random.choice(greet_replies) + (
+            "\n\n**Quick options:**\n"
+            "• ⏳ _\"pending\"_ — petitions needing action\n"
+            "• 🔔 _\"updates\"_ — recent activity\n"
+            "• 📊 _\"stats\"_ — petition counts\n"
+            "• 📋 _\"guide\"_ — workflow steps for your role"
+        )
+    })
+
+
+def _chatbot_thanks(_ctx, _match):
+    thanks_replies = [
+        "Happy to help! 😊 Anything else you need?",
+        "Glad I could assist! 🙌 Let me know if there's anything more.",
+        "You're welcome! 😄 I'm always here when you need me.",
+        "Anytime! 🤝 That's what I'm here for. Just ask!",
+        "Sure thing! 👍 Feel free to ask anything else.",
+        "Always a pleasure! 😊 Need anything else?",
+    ]
+    return jsonify({'type': 'text', 'text': random.choice(thanks_replies)})
+
+
+def _chatbot_bye(_ctx, _match):
+    bye_replies = [
+        "Take care! 👋 Come back anytime you need help.",
+        "Goodbye! Have a productive day! 😊",
+        "See you soon! 🙏 Stay on top of those petitions!",
+        "Bye for now! 👋 I'll be right here whenever you need me.",
+        "Until next time! 😊 Keep up the great work!",
+    ]
+    return jsonify({'type': 'text', 'text': random.choice(bye_replies)})
+
+
+def _chatbot_how_are_you(_ctx, _match):
+    how_replies = [
+        "Doing great, thanks for asking! 😄 Ready to help you with petitions. What do you need?",
+        "All systems go! 🚀 What can I assist you with today?",
+        "Running at full speed! ⚡ What's on your plate today?",
+        "I'm doing well! 😊 Always happy to help. What do you need?",
+    ]
+    return jsonify({'type': 'text', 'text': random.choice(how_replies)})
+
+
+def _chatbot_who_are_you(_ctx, _match):
+    return jsonify({'type': 'text', 'text': (
+        f"I'm **Nigaa** 🤖 — your smart petition assistant!\n\n"
+        "I help officers manage and track petitions right from this chat window. "
+        "You can search petitions, check pending work, view stats, and get role-specific workflow guidance — "
+        "all without leaving this page.\n\n"
+        "Think of me as your digital sidekick! 🦸 Type _\"help\"_ to see everything I can do."
+    )})
+
+
+def _chatbot_frustration(ctx, _match):
+    user_name = ctx.user_name
+    empathy_replies = [
+        f"I'm sorry you're having trouble, {user_name}. 😔 Let me help — type _\"help\"_ to see all available commands.",
+        f"That sounds frustrating. I'm here to help! 🤝 Type _\"help\"_ to see what I can do for you.",
+        f"Don't worry, {user_name}! 😊 Let's sort this out. What exactly do you need?",
+        f"I hear you! Let me try to make this easier. 🙏 What were you looking for?",
+    ]
+    return jsonify({'type': 'text', 'text': random.choice(empathy_replies)})
+
+
+def _chatbot_help(_ctx, _match):
+    return jsonify({'type': 'help'})
+
+
+def _chatbot_role_info(ctx, _match):
+    role_data = _CHATBOT_ROLE_DESCRIPTIONS.get(ctx.user_role)
+    if role_data:
+        return jsonify({
+            'type': 'role_info',
+            'role': ctx.user_role,
+            'role_data': role_data,
+            'user_name': ctx.user_name,
+            'suggestions': [
+                {'label': '📋 Guide', 'msg': 'guide'},
+                {'label': '⏳ Pending', 'msg': 'pending'},
+                {'label': '💡 What Next', 'msg': 'what next'},
             ],
-            'key_link': '/petitions?status=forwarded_to_po',
-        },
-        'data_entry': {
-            'title': 'Data Entry Officer',
-            'badge': '📋',
-            'color': '#f59e0b',
-            'summary': 'You register new petitions, upload documents, and route them to the correct CVO office.',
-            'responsibilities': [
-                '➕ Register new petitions with complete petitioner details',
-                '📎 Upload scanned E-Receipts and supporting documents',
-                '🏢 Route petitions to the correct CVO based on jurisdiction',
-                '🔍 Track and verify petition status after submission',
-                '✅ Ensure data accuracy and completeness at entry',
+        })
+    return jsonify({'type': 'text', 'text': (
+        f"You are logged in as **{ctx.user_role.replace('_', ' ').title()}**, {ctx.user_name}. "
+        "Contact your administrator for role-specific guidance."
+    )})
+
+
+def _chatbot_pending(ctx, _match):
+    try:
+        petitions = ctx.snapshot()['pending'][:8]
+        return jsonify({
+            'type': 'pending',
+            'petitions': _chatbot_format_petitions(petitions),
+            'role': ctx.user_role,
+            'suggestions': [
+                {'label': '💡 What Next', 'msg': 'what next'},
+                {'label': '📊 Stats', 'msg': 'stats'},
+                {'label': '📋 Guide', 'msg': 'guide'},
             ],
-            'key_link': '/petitions/new',
-        },
-        'super_admin': {
-            'title': 'Super Administrator',
-            'badge': '👑',
-            'color': '#ef4444',
-            'summary': 'You have full system access — manage users, monitor all petitions, and ensure system-wide compliance.',
-            'responsibilities': [
-                '👥 Create and manage officer accounts and role assignments',
-                '📊 Monitor all petitions and SLA compliance system-wide',
-                '⚠️ Review and escalate overdue petitions across all CVOs',
-                '📂 Generate reports and review audit activity',
-                '🔧 Configure system settings and help resources',
+        })
+    except Exception:
+        app.logger.exception('Chatbot pending error')
+        return jsonify({'type': 'text', 'text': 'Hmm, I had trouble fetching pending petitions just now. Mind trying again? 🔄'})
+
+
+def _chatbot_updates(ctx, _match):
+    try:
+        petitions = ctx.snapshot()['updates'][:8]
+        return jsonify({
+            'type': 'updates',
+            'petitions': _chatbot_format_petitions_with_date(petitions),
+            'role': ctx.user_role,
+            'suggestions': [
+                {'label': '⏳ Pending', 'msg': 'pending'},
+                {'label': '📊 Stats', 'msg': 'stats'},
+                {'label': '📈 Report', 'msg': 'report'},
             ],
-            'key_link': '/users',
-        },
-    }
-    _ROLE_DESCRIPTIONS['cvo_apepdcl'] = dict(_ROLE_DESCRIPTIONS['cvo_apspdcl'], title='Chief Vigilance Officer (APEPDCL)')
-    _ROLE_DESCRIPTIONS['cvo_apcpdcl'] = dict(_ROLE_DESCRIPTIONS['cvo_apspdcl'], title='Chief Vigilance Officer (APCPDCL)')
-    _ROLE_DESCRIPTIONS['dsp'] = dict(_ROLE_DESCRIPTIONS['cvo_apspdcl'], title='DSP Officer', badge='🔒')
-    _ROLE_DESCRIPTIONS['cmd_apspdcl'] = {
-        'title': 'CMD / CGM Officer',
-        'badge': '🏛️',
-        'color': '#10b981',
-        'summary': 'You execute action instructions issued by the Petitions Officer and report back with actions taken.',
-        'responsibilities': [
-            '📥 Check action instructions assigned to you',
-            '✅ Execute required corrective or disciplinary action',
-            '📤 Submit action-taken report with supporting evidence',
-            '📊 Track closed cases for compliance records',
+        })
+    except Exception:
+        app.logger.exception('Chatbot updates error')
+        return jsonify({'type': 'text', 'text': "Oops! Couldn't load updates right now. Please try again in a moment. 😔"})
+
+
+def _chatbot_guide(ctx, _match):
+    return jsonify({
+        'type': 'action_guide',
+        'role': ctx.user_role,
+        'suggestions': [
+            {'label': '⏳ Pending', 'msg': 'pending'},
+            {'label': '💡 What Next', 'msg': 'what next'},
         ],
-        'key_link': '/petitions?status=action_instructed',
-    }
-    for _r in ('cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco'):
-        _ROLE_DESCRIPTIONS[_r] = _ROLE_DESCRIPTIONS['cmd_apspdcl']
-
-    if any(phrase in msg_lower for phrase in _ROLE_WORDS):
-        role_data = _ROLE_DESCRIPTIONS.get(user_role)
-        if role_data:
-            return jsonify({
-                'type': 'role_info',
-                'role': user_role,
-                'role_data': role_data,
-                'user_name': user_name,
-                'suggestions': [
-                    {'label': '📋 Guide', 'msg': 'guide'},
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '💡 What Next', 'msg': 'what next'},
-                ],
-            })
-        return jsonify({'type': 'text', 'text': (
-            f"You are logged in as **{user_role.replace('_', ' ').title()}**, {user_name}. "
-            "Contact your administrator for role-specific guidance."
-        )})
-
-    # ---- Keyword sets for main intents ----
-    _PENDING_WORDS = ('pending', 'overdue', 'waiting', 'my work', 'action needed',
-                      'not closed', 'todo', 'to do', 'due', 'my petitions',
-                      'assigned to me', 'open petition', 'outstanding', 'unresolved',
-                      'backlog', 'incomplete', 'need to act', 'not done', 'left')
-    _UPDATE_WORDS = ('update', 'updates', 'recent', 'activity', 'latest',
-                     "what's new", 'whats new', 'notification', 'changes',
-                     'modified', 'changed', 'progress', 'moved', 'feed', 'history')
-    _GUIDE_WORDS = ('guide', 'how to', 'take action', 'workflow', 'process',
-                    'next step', 'what should i do', 'instructions', 'steps',
-                    'procedure', 'help me do', 'walkthrough', 'how do i', 'what do i do')
-    _STATS_WORDS = ('stats', 'statistics', 'count', 'total', 'summary', 'how many',
-                    'petition count', 'numbers', 'overview', 'breakdown', 'tally', 'figure')
-
-    # ---- Pending petitions ----
-    if any(w in msg_lower for w in _PENDING_WORDS):
-        try:
-            petitions = models.get_pending_petitions_for_chatbot(user_id, user_role, cvo_office)
-            return jsonify({
-                'type': 'pending',
-                'petitions': _chatbot_format_petitions(petitions),
-                'role': user_role,
-                'suggestions': [
-                    {'label': '💡 What Next', 'msg': 'what next'},
-                    {'label': '📊 Stats', 'msg': 'stats'},
-                    {'label': '📋 Guide', 'msg': 'guide'},
-                ],
-            })
-        except Exception:
-            app.logger.exception('Chatbot pending error')
-            return jsonify({'type': 'text', 'text': 'Hmm, I had trouble fetching pending petitions just now. Mind trying again? 🔄'})
+    })
 
-    # ---- Recent updates ----
-    if any(w in msg_lower for w in _UPDATE_WORDS):
-        try:
-            petitions = models.get_recent_updates_for_chatbot(user_id, user_role, cvo_office)
-            return jsonify({
-                'type': 'updates',
-                'petitions': _chatbot_format_petitions_with_date(petitions),
-                'role': user_role,
-                'suggestions': [
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '📊 Stats', 'msg': 'stats'},
-                    {'label': '📈 Report', 'msg': 'report'},
-                ],
-            })
-        except Exception:
-            app.logger.exception('Chatbot updates error')
-            return jsonify({'type': 'text', 'text': "Oops! Couldn't load updates right now. Please try again in a moment. 😔"})
 
-    # ---- Action / workflow guide ----
-    if any(w in msg_lower for w in _GUIDE_WORDS):
+def _chatbot_stats(ctx, _match):
+    try:
+        stats = ctx.snapshot()['stats']
         return jsonify({
-            'type': 'action_guide',
-            'role': user_role,
+            'type': 'stats',
+            'stats': {k: int(v) for k, v in stats.items()},
             'suggestions': [
                 {'label': '⏳ Pending', 'msg': 'pending'},
-                {'label': '💡 What Next', 'msg': 'what next'},
+                {'label': '🔔 Updates', 'msg': 'updates'},
+                {'label': '📈 Report', 'msg': 'report'},
             ],
         })
+    except Exception:
+        app.logger.exception('Chatbot stats error')
+        return jsonify({'type': 'text', 'text': 'Stats are taking a moment to load. Give it another shot! 🔄'})
+
+
+def _chatbot_download(_ctx, _match):
+    return jsonify({
+        'type': 'download',
+        'text': 'Access the full petition analysis with charts, trends, status breakdowns, and export options.',
+        'url': '/analysis-report',
+        'suggestions': [
+            {'label': '📊 Stats', 'msg': 'stats'},
+            {'label': '⏳ Pending', 'msg': 'pending'},
+        ],
+    })
 
-    # ---- Stats ----
-    if any(w in msg_lower for w in _STATS_WORDS):
-        try:
-            stats = models.get_petition_stats_for_chatbot(user_id, user_role, cvo_office)
-            return jsonify({
-                'type': 'stats',
-                'stats': {k: int(v) for k, v in stats.items()},
-                'suggestions': [
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '🔔 Updates', 'msg': 'updates'},
-                    {'label': '📈 Report', 'msg': 'report'},
-                ],
-            })
-        except Exception:
-            app.logger.exception('Chatbot stats error')
-            return jsonify({'type': 'text', 'text': 'Stats are taking a moment to load. Give it another shot! 🔄'})
-
-    # ---- Analysis Report / Download ----
-    _DOWNLOAD_WORDS = ('download', 'report', 'analysis', 'export', 'analysis report',
-                       'download report', 'generate report', 'view report',
-                       'excel', 'pdf report', 'csv report', 'see report')
-    if any(w in msg_lower for w in _DOWNLOAD_WORDS):
+
+def _chatbot_urgent(ctx, _match):
+    if ctx.user_role in ('po', 'super_admin'):
         return jsonify({
-            'type': 'download',
-            'text': 'Access the full petition analysis with charts, trends, status breakdowns, and export options.',
-            'url': '/analysis-report',
+            'type': 'urgent',
+            'message': 'Petitions beyond SLA threshold are flagged for escalation. Review them below.',
+            'url': '/petitions?status=beyond_sla',
+            'sla_url': '/sla_dashboard',
             'suggestions': [
-                {'label': '📊 Stats', 'msg': 'stats'},
                 {'label': '⏳ Pending', 'msg': 'pending'},
+                {'label': '📊 Stats', 'msg': 'stats'},
+                {'label': '📈 Report', 'msg': 'report'},
             ],
         })
+    return jsonify({
+        'type': 'text',
+        'text': (
+            "For SLA breach and overdue escalation details, check with your **Petitions Officer** "
+            "or visit the **SLA Dashboard**.\n\n"
+            "Your immediate pending items can be found by asking for _\"pending\"_."
+        ),
+        'suggestions': [
+            {'label': '⏳ Pending', 'msg': 'pending'},
+            {'label': '📋 Guide', 'msg': 'guide'},
+        ],
+    })
 
-    # ---- Urgent / Overdue / SLA ----
-    _URGENT_WORDS = ('urgent', 'overdue', 'sla breach', 'beyond sla', 'critical',
-                      'escalate', 'delayed', 'late', 'sla', 'priority cases',
-                      'breach', 'violation', 'missed deadline')
-    if any(w in msg_lower for w in _URGENT_WORDS):
-        if user_role in ('po', 'super_admin'):
-            return jsonify({
-                'type': 'urgent',
-                'message': 'Petitions beyond SLA threshold are flagged for escalation. Review them below.',
-                'url': '/petitions?status=beyond_sla',
-                'sla_url': '/sla_dashboard',
-                'suggestions': [
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '📊 Stats', 'msg': 'stats'},
-                    {'label': '📈 Report', 'msg': 'report'},
-                ],
-            })
+
+def _chatbot_summary(ctx, _match):
+    user_name = ctx.user_name
+    try:
+        snapshot = ctx.snapshot()
+        _stats = snapshot['stats']
+        _pending = snapshot['pending']
+        _updates = snapshot['updates']
+        _pc = len(_pending)
+        _uc = len(_updates)
+        if _pc > 0:
+            _day_msg = (f"You have **{_pc} pending** item{'s' if _pc != 1 else ''} and "
+                        f"**{_uc} update{'s' if _uc != 1 else ''}** today, {user_name}.")
         else:
-            return jsonify({
-                'type': 'text',
-                'text': (
-                    "For SLA breach and overdue escalation details, check with your **Petitions Officer** "
-                    "or visit the **SLA Dashboard**.\n\n"
-                    "Your immediate pending items can be found by asking for _\"pending\"_."
-                ),
-                'suggestions': [
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '📋 Guide', 'msg': 'guide'},
-                ],
-            })
+            _day_msg = (f"Great work, {user_name}! No pending items today. "
+                        f"{_uc} update{'s' if _uc != 1 else ''} in your scope.")
+        return jsonify({
+            'type': 'summary',
+            'stats': {k: int(v) for k, v in _stats.items()},
+            'pending_count': _pc,
+            'updates_count': _uc,
+            'message': _day_msg,
+            'suggestions': [
+                {'label': '⏳ Pending', 'msg': 'pending'},
+                {'label': '🔔 Updates', 'msg': 'updates'},
+                {'label': '💡 What Next', 'msg': 'what next'},
+            ],
+        })
+    except Exception:
+        app.logger.exception('Chatbot summary error')
+        return jsonify({'type': 'text', 'text': 'Could not load your daily summary right now. Try again! 🔄'})
 
-    # ---- Daily Summary ----
-    _SUMMARY_WORDS = ('today', 'daily', 'my day', 'daily report', 'today summary',
-                       'day summary', 'what happened today', 'daily summary', 'todays update')
-    if any(w in msg_lower for w in _SUMMARY_WORDS):
-        try:
-            _stats = models.get_petition_stats_for_chatbot(user_id, user_role, cvo_office)
-            _pending = models.get_pending_petitions_for_chatbot(user_id, user_role, cvo_office, limit=20)
-            _updates = models.get_recent_updates_for_chatbot(user_id, user_role, cvo_office, limit=20)
-            _pc = len(_pending)
-            _uc = len(_updates)
-            if _pc > 0:
-                _day_msg = (f"You have **{_pc} pending** item{'s' if _pc != 1 else ''} and "
-                            f"**{_uc} update{'s' if _uc != 1 else ''}** today, {user_name}.")
-            else:
-                _day_msg = (f"Great work, {user_name}! No pending items today. "
-                            f"{_uc} update{'s' if _uc != 1 else ''} in your scope.")
-            return jsonify({
-                'type': 'summary',
-                'stats': {k: int(v) for k, v in _stats.items()},
-                'pending_count': _pc,
-                'updates_count': _uc,
-                'message': _day_msg,
-                'suggestions': [
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '🔔 Updates', 'msg': 'updates'},
-                    {'label': '💡 What Next', 'msg': 'what next'},
-                ],
-            })
-        except Exception:
-            app.logger.exception('Chatbot summary error')
-            return jsonify({'type': 'text', 'text': 'Could not load your daily summary right now. Try again! 🔄'})
-
-    # ---- What Next / Smart Suggestions ----
-    _SUGGEST_WORDS = ('what next', 'suggest', 'recommendation', 'next action',
-                       'what should i work on', 'help me prioritize', 'what to do next',
-                       'prioritize', 'my priority', 'next steps', 'suggest me', 'advise me')
-    if any(w in msg_lower for w in _SUGGEST_WORDS):
-        try:
-            _pending_list = models.get_pending_petitions_for_chatbot(user_id, user_role, cvo_office)
-            _pc2 = len(_pending_list)
-            _rd2 = _ROLE_DESCRIPTIONS.get(user_role, {})
-            _key_link2 = _rd2.get('key_link', '/petitions')
-            _actions2 = []
-            if _pc2 > 0:
-                _actions2.append({
-                    'priority': 'high', 'icon': '🔴',
-                    'title': f'{_pc2} Pending Petition{"s" if _pc2 != 1 else ""}',
-                    'desc': f'{"These petitions require" if _pc2 > 1 else "This petition requires"} your immediate attention.',
-                    'link': _key_link2, 'link_label': 'View Pending →',
-                })
-            if user_role == 'inspector':
-                _actions2 += [
-                    {'priority': 'medium', 'icon': '📝', 'title': 'Submit Pending Reports',
-                     'desc': 'Complete and submit enquiry reports for in-progress petitions.',
-                     'link': '/petitions?status=enquiry_in_progress', 'link_label': 'View In Progress →'},
-                    {'priority': 'low', 'icon': '🔁', 'title': 'Check Re-enquiry Cases',
-                     'desc': 'Review petitions sent back for re-investigation.',
-                     'link': '/petitions?status=sent_back_for_reenquiry', 'link_label': 'View →'},
-                ]
-            elif user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
-                _actions2 += [
-                    {'priority': 'medium', 'icon': '👨\u200d💼', 'title': 'Assign Uninspected Petitions',
-                     'desc': 'Route unassigned petitions to appropriate field inspectors.',
-                     'link': '/petitions?status=forwarded_to_cvo', 'link_label': 'View →'},
-                    {'priority': 'low', 'icon': '📊', 'title': 'Review SLA Compliance',
-                     'desc': 'Check enquiry progress and monitor SLA status.',
-                     'link': '/sla_dashboard', 'link_label': 'SLA Dashboard →'},
-                ]
-            elif user_role == 'po':
-                _actions2 += [
-                    {'priority': 'medium', 'icon': '✅', 'title': 'Approve/Reject Permissions',
-                     'desc': 'CVOs are waiting for your decision on permission requests.',
-                     'link': '/petitions?status=sent_for_permission', 'link_label': 'Review →'},
-                    {'priority': 'medium', 'icon': '📣', 'title': 'Issue Action Instructions',
-                     'desc': 'Petitions ready for action instruction to CMD/CGM.',
-                     'link': '/petitions?status=forwarded_to_po', 'link_label': 'View →'},
-                    {'priority': 'low', 'icon': '⚠️', 'title': 'SLA Overdue Review',
-                     'desc': 'Check petitions beyond SLA and escalate as needed.',
-                     'link': '/petitions?status=beyond_sla', 'link_label': 'View Overdue →'},
-                ]
-            elif user_role == 'data_entry':
-                _actions2 += [
-                    {'priority': 'medium', 'icon': '➕', 'title': 'Register New Petitions',
-                     'desc': 'Enter any unregistered petitions into the system.',
-                     'link': '/petitions/new', 'link_label': 'Add Petition →'},
-                    {'priority': 'low', 'icon': '🔍', 'title': 'Verify Data Accuracy',
-                     'desc': 'Review recently registered petitions for completeness.',
-                     'link': '/petitions', 'link_label': 'View All →'},
-                ]
-            elif user_role == 'super_admin':
-                _actions2 += [
-                    {'priority': 'medium', 'icon': '📊', 'title': 'Review System Analytics',
-                     'desc': 'Check overall system performance and compliance metrics.',
-                     'link': '/analysis-report', 'link_label': 'View Report →'},
-                    {'priority': 'low', 'icon': '👥', 'title': 'User Management',
-                     'desc': 'Review pending account requests and role assignments.',
-                     'link': '/users', 'link_label': 'Manage Users →'},
-                ]
-            elif user_role in ('cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco'):
-                _actions2 += [
-                    {'priority': 'medium', 'icon': '📤', 'title': 'Submit Action Reports',
-                     'desc': 'Report back on actions taken for instructed petitions.',
-                     'link': '/petitions?status=action_instructed', 'link_label': 'View →'},
-                ]
-            if not _actions2:
-                _actions2.append({
-                    'priority': 'low', 'icon': '✅', 'title': 'All Caught Up!',
-                    'desc': 'No immediate actions required. Monitor your dashboard for new items.',
-                    'link': '/', 'link_label': 'Go to Dashboard →',
-                })
-            return jsonify({
-                'type': 'suggest',
-                'actions': _actions2,
-                'user_name': user_name,
-                'suggestions': [
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '📊 Stats', 'msg': 'stats'},
-                    {'label': '📋 Guide', 'msg': 'guide'},
-                ],
+
+def _chatbot_suggest(ctx, _match):
+    user_role, user_name = ctx.user_role, ctx.user_name
+    try:
+        _pending_list = ctx.snapshot()['pending']
+        _pc2 = len(_pending_list)
+        _rd2 = _CHATBOT_ROLE_DESCRIPTIONS.get(user_role, {})
+        _key_link2 = _rd2.get('key_link', '/petitions')
+        _actions2 = []
+        if _pc2 > 0:
+            _actions2.append({
+                'priority': 'high', 'icon': '🔴',
+                'title': f'{_pc2} Pending Petition{"s" if _pc2 != 1 else ""}',
+                'desc': f'{"These petitions require" if _pc2 > 1 else "This petition requires"} your immediate attention.',
+                'link': _key_link2, 'link_label': 'View Pending →',
             })
-        except Exception:
-            app.logger.exception('Chatbot suggest error')
-            return jsonify({'type': 'action_guide', 'role': user_role})
-
-    # ---- Search by petitioner name ----
-    name_match = _re.search(r'(?:search|find|name|petitioner)[:\s]+(.+)', msg_lower)
-    if name_match:
-        query = name_match.group(1).strip()
-        if len(query) < 2:
-            return jsonify({'type': 'text', 'text': 'Could you give me at least 2 characters to search by name? 🔍'})
-        try:
-            results = models.search_petitions(user_id, user_role, cvo_office, query, search_type='name')
-            # If name search finds nothing, automatically try all fields (covers e-office/e-receipt typed after "search")
-            if not results:
-                results = models.search_petitions(user_id, user_role, cvo_office, query, search_type='all')
-            return jsonify({
-                'type': 'petitions',
-                'petitions': _chatbot_format_petitions(results),
-                'query': query,
-                'search_type': 'name',
-                'suggestions': [
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '📊 Stats', 'msg': 'stats'},
-                ],
+        if user_role == 'inspector':
+            _actions2 += [
+                {'priority': 'medium', 'icon': '📝', 'title': 'Submit Pending Reports',
+                 'desc': 'Complete and submit enquiry reports for in-progress petitions.',
+                 'link': '/petitions?status=enquiry_in_progress', 'link_label': 'View In Progress →'},
+                {'priority': 'low', 'icon': '🔁', 'title': 'Check Re-enquiry Cases',
+                 'desc': 'Review petitions sent back for re-investigation.',
+                 'link': '/petitions?status=sent_back_for_reenquiry', 'link_label': 'View →'},
+            ]
+        elif user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
+            _actions2 += [
+                {'priority': 'medium', 'icon': '👨\u200d💼', 'title': 'Assign Uninspected Petitions',
+                 'desc': 'Route unassigned petitions to appropriate field inspectors.',
+                 'link': '/petitions?status=forwarded_to_cvo', 'link_label': 'View →'},
+                {'priority': 'low', 'icon': '📊', 'title': 'Review SLA Compliance',
+                 'desc': 'Check enquiry progress and monitor SLA status.',
+                 'link': '/sla_dashboard', 'link_label': 'SLA Dashboard →'},
+            ]
+        elif user_role == 'po':
+            _actions2 += [
+                {'priority': 'medium', 'icon': '✅', 'title': 'Approve/Reject Permissions',
+                 'desc': 'CVOs are waiting for your decision on permission requests.',
+                 'link': '/petitions?status=sent_for_permission', 'link_label': 'Review →'},
+                {'priority': 'medium', 'icon': '📣', 'title': 'Issue Action Instructions',
+                 'desc': 'Petitions ready for action instruction to CMD/CGM.',
+                 'link': '/petitions?status=forwarded_to_po', 'link_label': 'View →'},
+                {'priority': 'low', 'icon': '⚠️', 'title': 'SLA Overdue Review',
+                 'desc': 'Check petitions beyond SLA and escalate as needed.',
+                 'link': '/petitions?status=beyond_sla', 'link_label': 'View Overdue →'},
+            ]
+        elif user_role == 'data_entry':
+            _actions2 += [
+                {'priority': 'medium', 'icon': '➕', 'title': 'Register New Petitions',
+                 'desc': 'Enter any unregistered petitions into the system.',
+                 'link': '/petitions/new', 'link_label': 'Add Petition →'},
+                {'priority': 'low', 'icon': '🔍', 'title': 'Verify Data Accuracy',
+                 'desc': 'Review recently registered petitions for completeness.',
+                 'link': '/petitions', 'link_label': 'View All →'},
+            ]
+        elif user_role == 'super_admin':
+            _actions2 += [
+                {'priority': 'medium', 'icon': '📊', 'title': 'Review System Analytics',
+                 'desc': 'Check overall system performance and compliance metrics.',
+                 'link': '/analysis-report', 'link_label': 'View Report →'},
+                {'priority': 'low', 'icon': '👥', 'title': 'User Management',
+                 'desc': 'Review pending account requests and role assignments.',
+                 'link': '/users', 'link_label': 'Manage Users →'},
+            ]
+        elif user_role in ('cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco'):
+            _actions2 += [
+                {'priority': 'medium', 'icon': '📤', 'title': 'Submit Action Reports',
+                 'desc': 'Report back on actions taken for instructed petitions.',
+                 'link': '/petitions?status=action_instructed', 'link_label': 'View →'},
+            ]
+        if not _actions2:
+            _actions2.append({
+                'priority': 'low', 'icon': '✅', 'title': 'All Caught Up!',
+                'desc': 'No immediate actions required. Monitor your dashboard for new items.',
+                'link': '/', 'link_label': 'Go to Dashboard →',
             })
-        except Exception:
-            app.logger.exception('Chatbot search error')
-            return jsonify({'type': 'text', 'text': 'Search hit a snag — please try again! 🔄'})
+        return jsonify({
+            'type': 'suggest',
+            'actions': _actions2,
+            'user_name': user_name,
+            'suggestions': [
+                {'label': '⏳ Pending', 'msg': 'pending'},
+                {'label': '📊 Stats', 'msg': 'stats'},
+                {'label': '📋 Guide', 'msg': 'guide'},
+            ],
+        })
+    except Exception:
+        app.logger.exception('Chatbot suggest error')
+        return jsonify({'type': 'action_guide', 'role': user_role})
 
-    # ---- Search by E-Office / efile number (keyword prefix) ----
-    efile_match = _re.search(r'(?:eoffice|efile|e-office|e-file|file\s*no)[:\s#]*([A-Za-z0-9/_\-\.]+)', msg_lower)
-    if efile_match:
-        query = efile_match.group(1).strip()
-        try:
-            results = models.search_petitions(user_id, user_role, cvo_office, query, search_type='efile')
-            return jsonify({
-                'type': 'petitions',
-                'petitions': _chatbot_format_petitions(results),
-                'query': query,
-                'search_type': 'efile',
-                'suggestions': [
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '📊 Stats', 'msg': 'stats'},
-                ],
-            })
-        except Exception:
-            return jsonify({'type': 'text', 'text': 'Search failed. Please try again! 🔄'})
 
-    # ---- Search by E-Receipt number (keyword prefix) ----
-    ereceipt_match = _re.search(r'(?:ereceipt|e-receipt|receipt)[:\s#]*([A-Za-z0-9/_\-\.]+)', msg_lower)
-    if ereceipt_match:
-        query = ereceipt_match.group(1).strip()
-        try:
-            results = models.search_petitions(user_id, user_role, cvo_office, query, search_type='ereceipt')
-            return jsonify({
-                'type': 'petitions',
-                'petitions': _chatbot_format_petitions(results),
-                'query': query,
-                'search_type': 'ereceipt',
-                'suggestions': [
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '📊 Stats', 'msg': 'stats'},
-                ],
-            })
-        except Exception:
-            return jsonify({'type': 'text', 'text': 'Search failed. Please try again! 🔄'})
+def _chatbot_search_reply(ctx, query, search_type, fallback_all=False, suggestions=True):
+    results = models.search_petitions(ctx.user_id, ctx.user_role, ctx.cvo_office, query, search_type=search_type)
+    if not results and fallback_all:
+        results = models.search_petitions(ctx.user_id, ctx.user_role, ctx.cvo_office, query, search_type='all')
+    payload = {
+        'type': 'petitions',
+        'petitions': _chatbot_format_petitions(results),
+        'query': query,
+        'search_type': search_type,
+    }
+    if suggestions:
+        payload['suggestions'] = [
+            {'label': '⏳ Pending', 'msg': 'pending'},
+            {'label': '📊 Stats', 'msg': 'stats'},
+        ]
+    return jsonify(payload)
 
-    # ---- Search by SNO ----
-    sno_match = _re.search(r'(?:sno|serial|vig)[:\s#]*([A-Za-z0-9/_\-]+)', msg_lower)
-    if sno_match:
-        query = sno_match.group(1).strip()
-        try:
-            results = models.search_petitions(user_id, user_role, cvo_office, query, search_type='sno')
-            return jsonify({
-                'type': 'petitions',
-                'petitions': _chatbot_format_petitions(results),
-                'query': query,
-                'search_type': 'sno',
-                'suggestions': [
-                    {'label': '⏳ Pending', 'msg': 'pending'},
-                    {'label': '📊 Stats', 'msg': 'stats'},
-                ],
-            })
-        except Exception:
-            return jsonify({'type': 'text', 'text': 'Search failed. Please try again! 🔄'})
 
-    # ---- Smart bare-number detection (no keyword prefix needed) ----
-    # E-Receipt: starts with 2+ letters then digits/slash  e.g. "ER2024001", "ER/2024/001"
-    bare_ereceipt = _re.match(r'^[a-z]{1,4}[\-/]?\d{4,}', msg_lower)
-    # E-Office: slash-separated path  e.g. "VIG/HQ/2024/01", "vig/cor/2025/100"
-    bare_efile = _re.match(r'^[a-z0-9]+(?:/[a-z0-9]+){2,}', msg_lower)
+def _chatbot_search_name(ctx, match):
+    query = match.group(1).strip()
+    if len(query) < 2:
+        return jsonify({'type': 'text', 'text': 'Could you give me at least 2 characters to search by name? 🔍'})
+    try:
+        # If name search finds nothing, try all fields (covers e-office/e-receipt typed after "search").
+        return _chatbot_search_reply(ctx, query, 'name', fallback_all=True)
+    except Exception:
+        app.logger.exception('Chatbot search error')
+        return jsonify({'type': 'text', 'text': 'Search hit a snag — please try again! 🔄'})
+
 
-    if bare_ereceipt and not bare_efile:
-        query = message.strip()
+def _chatbot_prefixed_search(search_type):
+    def handler(ctx, match):
         try:
-            results = models.search_petitions(user_id, user_role, cvo_office, query, search_type='ereceipt')
-            if not results:
-                results = models.search_petitions(user_id, user_role, cvo_office, query, search_type='all')
-            return jsonify({'type': 'petitions', 'petitions': _chatbot_format_petitions(results),
-                            'query': query, 'search_type': 'ereceipt'})
+            return _chatbot_search_reply(ctx, match.group(1).strip(), search_type)
         except Exception:
             return jsonify({'type': 'text', 'text': 'Search failed. Please try again! 🔄'})
+    return handler
 
-    if bare_efile:
-        query = message.strip()
+
+def _chatbot_bare_search(search_type):
+    def handler(ctx, _match):
         try:
-            results = models.search_petitions(user_id, user_role, cvo_office, query, search_type='efile')
-            if not results:
-                results = models.search_petitions(user_id, user_role, cvo_office, query, search_type='all')
-            return jsonify({'type': 'petitions', 'petitions': _chatbot_format_petitions(results),
-                            'query': query, 'search_type': 'efile'})
+            return _chatbot_search_reply(ctx, ctx.message.strip(), search_type, fallback_all=True, suggestions=False)
         except Exception:
             return jsonify({'type': 'text', 'text': 'Search failed. Please try again! 🔄'})
+    return handler
+
+
+_CHATBOT_INTENT_HANDLERS = {
+    'greet': _chatbot_greet,
+    'thanks': _chatbot_thanks,
+    'bye': _chatbot_bye,
+    'how_are_you': _chatbot_how_are_you,
+    'who_are_you': _chatbot_who_are_you,
+    'frustration': _chatbot_frustration,
+    'help': _chatbot_help,
+    'role_info': _chatbot_role_info,
+    'pending': _chatbot_pending,
+    'updates': _chatbot_updates,
+    'guide': _chatbot_guide,
+    'stats': _chatbot_stats,
+    'download': _chatbot_download,
+    'urgent': _chatbot_urgent,
+    'summary': _chatbot_summary,
+    'suggest': _chatbot_suggest,
+    'search_name': _chatbot_search_name,
+    'search_efile': _chatbot_prefixed_search('efile'),
+    'search_ereceipt': _chatbot_prefixed_search('ereceipt'),
+    'search_sno': _chatbot_prefixed_search('sno'),
+    'bare_efile': _chatbot_bare_search('efile'),
+    'bare_ereceipt': _chatbot_bare_search('ereceipt'),
+}
 
-    # ---- Fuzzy intent matching (rapidfuzz) — catches typos like "pendin", "stas", "updtes" ----
-    if _HAS_FUZZ:
-        _FUZZY_MAP = [
-            ('pending', _PENDING_WORDS),
-            ('updates', _UPDATE_WORDS),
-            ('guide',   _GUIDE_WORDS),
-            ('stats',   _STATS_WORDS),
-        ]
-        best_intent_name = None
-        best_score = 0
-        for word in msg_lower.split():
-            for intent_name, keywords in _FUZZY_MAP:
-                for kw in keywords:
-                    if ' ' not in kw:  # single-word keywords only
-                        score = _fuzz.ratio(word, kw)
-                        if score > best_score:
-                            best_score = score
-                            best_intent_name = intent_name
-        if best_score >= 78 and best_intent_name:
-            if best_intent_name == 'pending':
-                try:
-                    petitions = models.get_pending_petitions_for_chatbot(user_id, user_role, cvo_office)
-                    return jsonify({'type': 'pending', 'petitions': _chatbot_format_petitions(petitions), 'role': user_role})
-                except Exception:
-                    pass
-            elif best_intent_name == 'updates':
-                try:
-                    petitions = models.get_recent_updates_for_chatbot(user_id, user_role, cvo_office)
-                    return jsonify({'type': 'updates', 'petitions': _chatbot_format_petitions_with_date(petitions), 'role': user_role})
-                except Exception:
-                    pass
-            elif best_intent_name == 'guide':
-                return jsonify({'type': 'action_guide', 'role': user_role})
-            elif best_intent_name == 'stats':
-                try:
-                    stats = models.get_petition_stats_for_chatbot(user_id, user_role, cvo_office)
-                    return jsonify({'type': 'stats', 'stats': {k: int(v) for k, v in stats.items()}})
-                except Exception:
-                    pass
 
-    # ---- Generic fallback: try full-text search ----
-    if len(message) >= 3:
+def _chatbot_fallback(ctx):
+    # Generic fallback: try full-text search before the conversational reply.
+    if len(ctx.message) >= 3:
         try:
-            results = models.search_petitions(user_id, user_role, cvo_office, message, search_type='all')
+            results = models.search_petitions(ctx.user_id, ctx.user_role, ctx.cvo_office, ctx.message, search_type='all')
             if results:
                 return jsonify({'type': 'petitions', 'petitions': _chatbot_format_petitions(results),
-                                'query': message, 'search_type': 'all'})
+                                'query': ctx.message, 'search_type': 'all'})
         except Exception:
             pass
 
-    # ---- Final conversational fallback ----
+    user_name = ctx.user_name
     fallback_replies = [
         (
             f"Hmm, I'm not quite sure what you meant, {user_name}. 🤔\n\n"
@@ -7682,12 +8943,232 @@ def chatbot_api():
             "Try **\"help\"** to see everything I can do, or ask me to search a petition by name."
         ),
     ]
-    return jsonify({'type': 'text', 'text': _random.choice(fallback_replies)})
+    return jsonify({'type': 'text', 'text': random.choice(fallback_replies)})
+
+
+@app.route('/api/chatbot', methods=['POST'])
+@login_required
+def chatbot_api():
+    data = request.get_json(silent=True) or {}
+    message = (data.get('message') or '').strip()
+    if not message:
+        return jsonify({'type': 'text', 'text': 'Go ahead, type something! I\'m all ears. 😊'})
+
+    ctx = _ChatbotContext(
+        user_id=session['user_id'],
+        user_role=session.get('user_role', ''),
+        cvo_office=session.get('cvo_office'),
+        user_name=session.get('full_name') or session.get('user_name') or 'Officer',
+        message=message,
+        msg_lower=message.lower().strip(),
+    )
+    intent, match = _classify_chatbot_intent(ctx.msg_lower)
+    if intent:
+        return _CHATBOT_INTENT_HANDLERS[intent](ctx, match)
+    return _chatbot_fallback(ctx)
+
+
+# ========================================
+# BACKGROUND JOBS
+# ========================================
+
+def _run_petition_import_job(payload):
+    result = _import_petition_rows(payload.get('rows') or [], int(payload['actor_user_id']))
+    if config.ANALYTICS_ROLLUPS_ENABLED and result.get('received_days'):
+        try:
+            models.refresh_petition_rollups(days=[date.fromisoformat(d) for d in result['received_days']])
+        except Exception:
+            # The import itself succeeded; the next full rebuild picks these days up.
+            app.logger.exception('Petition rollup refresh after import failed')
+    if config.REPORT_SNAPSHOTS_ENABLED:
+        models.bump_petition_data_version()
+    return result
+
+
+def _run_petition_rollup_refresh_job(payload):
+    if payload.get('petition_ids') is not None:
+        result = models.refresh_petition_rollups(petition_ids=[int(pid) for pid in payload['petition_ids']])
+    else:
+        result = models.refresh_petition_rollups(days=[date.fromisoformat(d) for d in payload.get('days') or []])
+    if config.REPORT_SNAPSHOTS_ENABLED:
+        models.bump_petition_data_version()
+    return result
+
+
+def _queue_petition_rollup_refresh(petition_ids=None, days=None):
+    """Refresh rollups for the given petitions or received days on worker.py, or inline when jobs are off."""
+    if petition_ids is not None:
+        payload = {'petition_ids': [int(pid) for pid in petition_ids]}
+    else:
+        payload = {'days': [d.isoformat() for d in days or []]}
+    if _enqueue_background_job('petition_rollup_refresh', payload) is not None:
+        return
+    if petition_ids is not None:
+        models.refresh_petition_rollups(petition_ids=payload['petition_ids'])
+    else:
+        models.refresh_petition_rollups(days=list(days or []))
+
+
+def _run_users_upload_job(payload):
+    return _create_users_from_rows(payload.get('rows') or [])
+
+
+def _run_analysis_report_snapshot_job(payload):
+    _generate_analysis_report_snapshot(
+        payload['snapshot_key'],
+        payload.get('user_id'),
+        payload['user_role'],
+        payload.get('cvo_office'),
+        payload.get('filters') or {},
+    )
+    return {'snapshot_key': payload['snapshot_key']}
+
+
+def refresh_stale_report_snapshots(limit=50):
+    """Rebuild recently viewed report snapshots that are out of date (worker.py schedule)."""
+    rebuilt = 0
+    for row in models.get_stale_report_snapshots(
+        config.REPORT_SNAPSHOT_MAX_AGE_SECONDS,
+        retention_days=config.REPORT_SNAPSHOT_RETENTION_DAYS,
+        limit=limit,
+    ):
+        if not models.claim_report_snapshot_refresh(
+            row['snapshot_key'], row['scope_key'], row['user_id'], row['user_role'], row['cvo_office'],
+            row['filters'], lease_seconds=config.REPORT_SNAPSHOT_BUILD_LEASE_SECONDS,
+        ):
+            continue
+        try:
+            with app.app_context():
+                _generate_analysis_report_snapshot(
+                    row['snapshot_key'], row['user_id'], row['user_role'], row['cvo_office'], row['filters']
+                )
+            rebuilt += 1
+        except Exception:
+            app.logger.exception('Analysis report snapshot %s failed', row['snapshot_key'])
+    return {'rebuilt': rebuilt, 'purged': models.purge_report_snapshots(config.REPORT_SNAPSHOT_RETENTION_DAYS)}
+
+
+BACKGROUND_JOB_HANDLERS = {
+    'petition_import': _run_petition_import_job,
+    'users_upload': _run_users_upload_job,
+    'analysis_report_snapshot': _run_analysis_report_snapshot_job,
+    'petition_rollup_refresh': _run_petition_rollup_refresh_job,
+}
+# Petition import is not idempotent (a re-run after a partial pass would create duplicates),
+# so it gets a single attempt. Bulk user creation is safe to retry: existing usernames are skipped.
+BACKGROUND_JOB_MAX_ATTEMPTS = {
+    'petition_import': 1,
+    # A failed snapshot releases its claim; the next viewer queues a fresh attempt.
+    'analysis_report_snapshot': 1,
+}
+
+
+def _enqueue_background_job(job_type, payload):
+    """Queue work for worker.py; returns None when jobs are disabled so callers run inline."""
+    if not config.BACKGROUND_JOBS_ENABLED or not hasattr(models, 'enqueue_job'):
+        return None
+    try:
+        return models.enqueue_job(
+            job_type,
+            payload,
+            created_by=session.get('user_id'),
+            max_attempts=BACKGROUND_JOB_MAX_ATTEMPTS.get(job_type, config.JOB_MAX_ATTEMPTS),
+        )
+    except Exception:
+        app.logger.exception('Unable to enqueue %s job; processing inline', job_type)
+        return None
+
+
+def _job_retry_delay_seconds(attempts):
+    base = max(1, config.JOB_RETRY_BASE_SECONDS)
+    return min(config.JOB_RETRY_MAX_SECONDS, base * (2 ** max(0, int(attempts or 1) - 1)))
+
+
+def process_next_background_job(worker_id):
+    """Claim and run one queued job. Returns False when nothing is runnable."""
+    job = models.claim_next_job(
+        worker_id,
+        job_types=list(BACKGROUND_JOB_HANDLERS),
+        lease_seconds=config.JOB_LEASE_SECONDS,
+    )
+    if not job:
+        return False
+    handler = BACKGROUND_JOB_HANDLERS[job['job_type']]
+    try:
+        with app.app_context():
+            result = handler(job.get('payload') or {})
+        models.complete_job(job['id'], result)
+    except Exception as e:
+        app.logger.exception(
+            'Background job %s (%s) failed on attempt %s', job['id'], job['job_type'], job.get('attempts')
+        )
+        models.fail_job(
+            job['id'],
+            f'{type(e).__name__}: {e}',
+            retry_delay_seconds=_job_retry_delay_seconds(job.get('attempts')),
+        )
+    return True
+
+
+def _serialize_job(job, include_error=False):
+    def _ts(value):
+        return value.isoformat() if hasattr(value, 'isoformat') else value
+
+    payload = {
+        'id': job.get('id'),
+        'job_type': job.get('job_type'),
+        'status': job.get('status'),
+        'attempts': job.get('attempts'),
+        'max_attempts': job.get('max_attempts'),
+        'created_at': _ts(job.get('created_at')),
+        'started_at': _ts(job.get('started_at')),
+        'finished_at': _ts(job.get('finished_at')),
+        'next_run_at': _ts(job.get('run_after')) if job.get('status') == 'queued' else None,
+    }
+    if 'result' in job:
+        payload['result'] = job.get('result')
+    if include_error:
+        payload['last_error'] = job.get('last_error')
+    return payload
+
+
+@app.route('/api/admin/template-metrics')
+@login_required
+def api_template_metrics():
+    if session.get('user_role') != 'super_admin':
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.args.get('reset') == '1':
+        TEMPLATE_RENDER_STATS.reset()
+    return jsonify({'templates': TEMPLATE_RENDER_STATS.snapshot()})
+
+
+@app.route('/api/jobs')
+@login_required
+def api_jobs():
+    is_admin = session.get('user_role') == 'super_admin'
+    status = (request.args.get('status') or '').strip() or None
+    if status and status not in ('queued', 'running', 'succeeded', 'failed'):
+        return jsonify({'error': 'Invalid status filter.'}), 400
+    jobs = models.list_jobs(created_by=None if is_admin else session['user_id'], status=status, limit=50)
+    return jsonify({'jobs': [_serialize_job(j, include_error=is_admin) for j in jobs]})
+
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def api_job_status(job_id):
+    is_admin = session.get('user_role') == 'super_admin'
+    job = models.get_job(job_id)
+    if not job or (not is_admin and int(job.get('created_by') or 0) != int(session['user_id'])):
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify(_serialize_job(job, include_error=is_admin))
 
 
 # ========================================
 # RUN
 # ========================================
 
+if config.TEMPLATE_PRECOMPILE:
+    precompile_templates()
+
 if __name__ == '__main__':
     app.run(debug=config.DEBUG, host=config.HOST, port=config.PORT)
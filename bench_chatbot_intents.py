@@ -0,0 +1,72 @@
+"""
+Chatbot Intent Benchmark
+Times intent classification per message, before and after the compiled phrase matcher:
+    python bench_chatbot_intents.py
+    python bench_chatbot_intents.py --repeat 200
+"Before" is the old chatbot_api loop: the phrase tables rebuilt on every request, then one
+any() substring scan per intent in priority order. "After" is app._classify_chatbot_intent,
+which walks each message once through the precompiled phrase automaton. Both classify the
+same corpus and must agree on every message the old scan recognised. No database is used
+(schema updates are skipped on import).
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('SKIP_SCHEMA_UPDATES', '1')
+
+import app  # noqa: E402
+
+CORPUS = (
+    "show me my pending petitions", "any updates since yesterday", "how many petitions in total",
+    "guide me through the workflow", "petitions beyond sla", "who are you", "vig/hq/2024/01",
+    "search ravi kumar", "what next", "please export the analysis report", "lineman bribe case",
+    "transformer complaint in nellore rural", "i am stuck with this screen", "daily summary please",
+    "hi", "thanks a lot", "what is my role here", "list overdue cases for my office",
+    "find petition from srinivas about meter tampering at gudur substation", "bye",
+)
+
+
+def linear_classify(msg_lower):
+    tables = [(name, tuple(words)) for name, words in app._CHATBOT_PHRASE_INTENTS]
+    for name, words in tables:
+        if any(word in msg_lower for word in words):
+            return name
+    return None
+
+
+def _per_message_us(classify, messages, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for msg in messages:
+            classify(msg)
+    return (time.perf_counter() - started) * 1e6 / (repeat * len(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark chatbot intent classification.')
+    parser.add_argument('--repeat', type=int, default=100, help='Passes over the message corpus.')
+    args = parser.parse_args()
+    repeat = max(1, args.repeat)
+
+    mismatches = []
+    for msg in CORPUS:
+        before = linear_classify(msg)
+        after = app._classify_chatbot_intent(msg)[0]
+        special = msg in app._CHATBOT_HELP_MESSAGES or app._CHATBOT_GREET_RE.match(msg)
+        if before is not None and not special and before != after:
+            mismatches.append((msg, before, after))
+
+    before_us = _per_message_us(linear_classify, CORPUS, repeat)
+    after_us = _per_message_us(lambda msg: app._classify_chatbot_intent(msg), CORPUS, repeat)
+    print(f"Messages: {len(CORPUS)} x {repeat} passes")
+    print(f"Before (rebuilt tables + linear any() scans): {before_us:8.2f} us/message")
+    print(f"After  (compiled phrase matcher):             {after_us:8.2f} us/message")
+    print(f"Speed-up: {before_us / after_us:.1f}x" if after_us else "Speed-up: n/a")
+    for msg, before, after in mismatches:
+        print(f"MISMATCH {msg!r}: before={before} after={after}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
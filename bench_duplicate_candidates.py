@@ -0,0 +1,100 @@
+"""
+Duplicate Candidate Benchmark
+Times the intake duplicate check against the configured database (read-only):
+    python bench_duplicate_candidates.py              # 50 lookups keyed from sampled petitions
+    python bench_duplicate_candidates.py --samples 200
+    python bench_duplicate_candidates.py --scoring-only   # no database: score one full block
+Point DB_* at a copy with a production-sized petitions table (about 200k rows) to check that
+the blocking indexes keep each lookup small: every lookup runs the blocking query and scores
+at most DUPLICATE_BLOCK_LIMIT candidates, however many petitions exist.
+"""
+import argparse
+import random
+import statistics
+import time
+
+import models
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def _report(label, timings_ms):
+    print(f"{label}: n={len(timings_ms)} median={statistics.median(timings_ms):.1f}ms "
+          f"p95={_percentile(timings_ms, 95):.1f}ms max={max(timings_ms):.1f}ms")
+
+
+def bench_database(samples):
+    conn = models.get_db()
+    try:
+        cur = models.dict_cursor(conn)
+        cur.execute("SELECT COUNT(*) AS n FROM petitions")
+        total = cur.fetchone()['n']
+        cur.execute("""
+            SELECT id, subject, petitioner_name, contact, place, received_date
+            FROM petitions
+            ORDER BY random()
+            LIMIT %s
+        """, (samples,))
+        rows = [dict(r) for r in cur.fetchall()]
+    finally:
+        conn.close()
+    if not rows:
+        print('No petitions to sample.')
+        return
+    timings = []
+    for row in rows:
+        started = time.perf_counter()
+        models.find_duplicate_petition_candidates(
+            row['subject'] or '',
+            petitioner_name=row['petitioner_name'],
+            contact=row['contact'],
+            place=row['place'],
+            received_date=row['received_date'],
+            exclude_petition_id=row['id'],
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"Petitions in table: {total}; block limit: {models.DUPLICATE_BLOCK_LIMIT}")
+    _report('Blocking query + scoring per lookup', timings)
+
+
+def bench_scoring(runs):
+    if models._fuzz_process is None:
+        print('rapidfuzz is not installed; candidates are returned unscored.')
+        return
+    rng = random.Random(32)
+    words = ("bribe lineman transformer meter bill theft connection demand officer village "
+             "supply feeder pole shock accident survey ae ade sub-station complaint").split()
+    block = [
+        {
+            "id": pid,
+            "subject": " ".join(rng.choice(words) for _ in range(8)),
+            "petitioner_name_key": f"petitioner {pid % 40}",
+            "contact_digits": "",
+        }
+        for pid in range(1, models.DUPLICATE_BLOCK_LIMIT + 1)
+    ]
+    keys = {"name_key": "petitioner 7", "contact_digits": ""}
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        models.score_duplicate_candidates("lineman demanding bribe for new service connection", block, keys)
+        timings.append((time.perf_counter() - started) * 1000)
+    _report(f'Scoring one full block ({len(block)} candidates)', timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the petition duplicate check.')
+    parser.add_argument('--samples', type=int, default=50, help='Petitions to use as lookup keys.')
+    parser.add_argument('--scoring-only', action='store_true', help='Time scoring only; no database.')
+    args = parser.parse_args()
+    if args.scoring_only:
+        bench_scoring(max(1, args.samples))
+    else:
+        bench_database(max(1, args.samples))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Fragment Cache Benchmark
+Renders the pages with cached fragments for one user against the configured database
+(read-only), first with the fragment cache off and then warm, and prints the median time
+and database connections per request:
+    python bench_fragment_cache.py --username po_user
+    python bench_fragment_cache.py --username po_user --petition-id 42 --repeat 20
+    python bench_fragment_cache.py --username po_user --cache postgres   # include the L2 tier
+"""
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault('SKIP_SCHEMA_UPDATES', '1')
+
+import app  # noqa: E402
+import models  # noqa: E402
+
+_connections = [0]
+_get_db = models.get_db
+
+
+def _counting_get_db():
+    _connections[0] += 1
+    return _get_db()
+
+
+def _sign_in(client, user):
+    now_ts = int(time.time())
+    with client.session_transaction() as sess:
+        sess['user_id'] = user['id']
+        sess['user_role'] = user['role']
+        sess['username'] = user['username']
+        sess['full_name'] = user.get('full_name') or user['username']
+        sess['cvo_office'] = user.get('cvo_office')
+        sess['session_version'] = user.get('session_version') or 1
+        sess['auth_issued_at'] = now_ts
+        sess['auth_last_seen_at'] = now_ts
+
+
+def _measure(client, path, repeat):
+    client.get(path)  # warm-up: fills the fragment cache when it is on
+    timings = []
+    connections = []
+    for _ in range(repeat):
+        _connections[0] = 0
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append((time.perf_counter() - started) * 1000)
+        connections.append(_connections[0])
+    return response.status_code, statistics.median(timings), statistics.median(connections)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pages with cached fragments, cache off vs warm.')
+    parser.add_argument('--username', required=True, help='User whose pages are rendered.')
+    parser.add_argument('--petition-id', type=int, help='Also render this petition (tracking timeline).')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed requests per page and mode.')
+    parser.add_argument('--cache', choices=('local', 'postgres'), default='local', help='Cache backend when on.')
+    args = parser.parse_args()
+
+    user = models.get_user_by_username(args.username)
+    if not user:
+        print(f'No user named {args.username}.')
+        return 1
+    paths = ['/dashboard', '/sla-dashboard']
+    if args.petition_id:
+        paths.append(f'/petitions/{args.petition_id}')
+
+    models.get_db = _counting_get_db
+    results = {}
+    for mode in ('off', 'warm'):
+        app.config.FRAGMENT_CACHE_ENABLED = models.config.FRAGMENT_CACHE_ENABLED = mode == 'warm'
+        models.CACHE = models.build_cache_backend(args.cache if mode == 'warm' else 'none')
+        with app.app.test_client() as client:
+            _sign_in(client, user)
+            for path in paths:
+                results[(mode, path)] = _measure(client, path, max(1, args.repeat))
+
+    print(f"{'page':<24} {'cache off':>20} {'cache warm':>20}")
+    for path in paths:
+        cells = []
+        for mode in ('off', 'warm'):
+            status, median_ms, connections = results[(mode, path)]
+            cells.append(f'{median_ms:7.1f} ms {connections:3.0f} db' + ('' if status == 200 else f' ({status})'))
+        print(f'{path:<24} {cells[0]:>20} {cells[1]:>20}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,70 @@
+"""
+Static Asset Build
+Writes fingerprinted, precompressed copies of the CSS, JS, i18n and SVG files under
+static/ to static/dist/ and records them in static/dist/manifest.json:
+    python build_static.py
+The web app serves static/dist/ at /assets/ with immutable caching, picking the
+.br (when the Brotli package is installed) or .gz copy the browser accepts, and
+asset_url() in templates points at the fingerprinted names. Run it on every deploy;
+without a manifest the app falls back to plain /static/ URLs.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIRNAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+FINGERPRINT_EXTENSIONS = ('.css', '.js', '.json', '.svg')
+FINGERPRINT_LENGTH = 12
+
+
+def fingerprinted_name(relative_path, content):
+    stem, ext = os.path.splitext(relative_path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:FINGERPRINT_LENGTH]}{ext}"
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as fh:
+        fh.write(content)
+
+
+def build_static_assets(static_dir=STATIC_DIR):
+    """Rebuild static_dir/dist and return the manifest {source path: fingerprinted path}."""
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist_dir)
+        for filename in sorted(files):
+            if not filename.endswith(FINGERPRINT_EXTENSIONS):
+                continue
+            source = os.path.join(root, filename)
+            relative_path = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as fh:
+                content = fh.read()
+            target_name = fingerprinted_name(relative_path, content)
+            target = os.path.join(dist_dir, *target_name.split('/'))
+            _write(target, content)
+            _write(target + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write(target + '.br', brotli.compress(content, quality=11))
+            manifest[relative_path] = target_name
+    _write(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+if __name__ == '__main__':
+    built = build_static_assets()
+    print(f"Built {len(built)} assets into {os.path.join(STATIC_DIR, DIST_DIRNAME)}"
+          f"{'' if brotli is not None else ' (gzip only; install Brotli for .br files)'}")
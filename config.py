@@ -54,6 +54,24 @@ class Config:
         # App runtime configuration
         self.HOST = os.environ.get('HOST', '0.0.0.0')
         self.PORT = int(os.environ.get('PORT', '5000'))
+        self.WAITRESS_THREADS = int(os.environ.get('WAITRESS_THREADS', '8'))
+        # gzip (brotli when the Brotli package is installed) for HTML/JSON/CSS/JS responses of at
+        # least COMPRESSION_MIN_BYTES. Fingerprinted static files from build_static.py are precompressed.
+        self.COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+        self.COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+        self.COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+        # Templates: in production they are not re-checked for edits on every render, compiled
+        # code is kept in TEMPLATE_BYTECODE_CACHE_DIR across restarts, and every template is
+        # compiled at startup. Renders slower than TEMPLATE_SLOW_RENDER_MS are logged.
+        self.TEMPLATE_AUTO_RELOAD = os.environ.get('TEMPLATE_AUTO_RELOAD', '0' if self.IS_PRODUCTION else '1') == '1'
+        # Production keeps bytecode in instance/jinja_cache; set TEMPLATE_BYTECODE_CACHE_DIR= (empty) to disable.
+        default_bytecode_dir = (
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'jinja_cache')
+            if self.IS_PRODUCTION else ''
+        )
+        self.TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR', default_bytecode_dir).strip()
+        self.TEMPLATE_PRECOMPILE = os.environ.get('TEMPLATE_PRECOMPILE', '1' if self.IS_PRODUCTION else '0') == '1'
+        self.TEMPLATE_SLOW_RENDER_MS = int(os.environ.get('TEMPLATE_SLOW_RENDER_MS', '500'))
         self.DEBUG = os.environ.get('FLASK_DEBUG', '0') == '1' and not self.IS_PRODUCTION
         self.BRAND_NAME = os.environ.get('BRAND_NAME', 'Nigaa').strip() or 'Nigaa'
         self.BRAND_SUBTITLE = os.environ.get('BRAND_SUBTITLE', 'Petition Tracker').strip() or 'Petition Tracker'
@@ -86,6 +104,74 @@ class Config:
         self.PETITION_IP_RATE_LIMIT_MAX_SUBMISSIONS = int(os.environ.get('PETITION_IP_RATE_LIMIT_MAX_SUBMISSIONS', '60'))
         self.PETITION_IP_RATE_LIMIT_BLOCK_SECONDS = int(os.environ.get('PETITION_IP_RATE_LIMIT_BLOCK_SECONDS', '180'))
 
+        # Background job queue (bulk imports, bulk user creation). Requires `python worker.py` to be running.
+        self.BACKGROUND_JOBS_ENABLED = os.environ.get('BACKGROUND_JOBS_ENABLED', '0') == '1'
+        self.JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', '2'))
+        self.JOB_POLL_INTERVAL_SECONDS = int(os.environ.get('JOB_POLL_INTERVAL_SECONDS', '5'))
+        self.JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+        self.JOB_RETRY_BASE_SECONDS = int(os.environ.get('JOB_RETRY_BASE_SECONDS', '30'))
+        self.JOB_RETRY_MAX_SECONDS = int(os.environ.get('JOB_RETRY_MAX_SECONDS', '3600'))
+        self.JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '900'))
+        # Finished jobs (their results and errors) are deleted after this many days.
+        self.JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', '14'))
+
+        # Overdue escalation sweeper (run by worker.py). When enabled the beyond-SLA tab reads the stored flag.
+        self.SLA_ESCALATION_SWEEP_ENABLED = os.environ.get('SLA_ESCALATION_SWEEP_ENABLED', '0') == '1'
+        self.SLA_SWEEP_INTERVAL_SECONDS = int(os.environ.get('SLA_SWEEP_INTERVAL_SECONDS', '900'))
+        self.SLA_SWEEP_BATCH_SIZE = int(os.environ.get('SLA_SWEEP_BATCH_SIZE', '500'))
+
+        # Daily analytics rollups (petition_daily_rollups) for dashboard charts and the analysis report.
+        # Rebuilt by worker.py every ANALYTICS_ROLLUP_REFRESH_SECONDS; touched days refresh on each action.
+        self.ANALYTICS_ROLLUPS_ENABLED = os.environ.get('ANALYTICS_ROLLUPS_ENABLED', '0') == '1'
+        self.ANALYTICS_ROLLUP_REFRESH_SECONDS = int(os.environ.get('ANALYTICS_ROLLUP_REFRESH_SECONDS', '900'))
+
+        # Cached analysis report snapshots (analysis_report_snapshots), keyed by scope, filters and
+        # petition data version. Built by worker.py when BACKGROUND_JOBS_ENABLED=1, inline otherwise.
+        self.REPORT_SNAPSHOTS_ENABLED = os.environ.get('REPORT_SNAPSHOTS_ENABLED', '0') == '1'
+        self.REPORT_SNAPSHOT_MAX_AGE_SECONDS = int(os.environ.get('REPORT_SNAPSHOT_MAX_AGE_SECONDS', '3600'))
+        self.REPORT_SNAPSHOT_BUILD_LEASE_SECONDS = int(os.environ.get('REPORT_SNAPSHOT_BUILD_LEASE_SECONDS', '300'))
+        self.REPORT_SNAPSHOT_REFRESH_SECONDS = int(os.environ.get('REPORT_SNAPSHOT_REFRESH_SECONDS', '600'))
+        self.REPORT_SNAPSHOT_RETENTION_DAYS = int(os.environ.get('REPORT_SNAPSHOT_RETENTION_DAYS', '7'))
+
+        # Process-wide cache of form configs, system settings, active help resources and CVO/CMD/inspector
+        # lists, invalidated across processes with LISTEN/NOTIFY. Needs a session-mode (not pgbouncer
+        # transaction-mode) connection for the listener; the TTL only bounds staleness if a notify is missed.
+        self.REFERENCE_CACHE_ENABLED = os.environ.get('REFERENCE_CACHE_ENABLED', '0') == '1'
+        self.REFERENCE_CACHE_TTL_SECONDS = int(os.environ.get('REFERENCE_CACHE_TTL_SECONDS', '300'))
+
+        # Shared cache for computed results: none (default), local (in-process LRU) or postgres (LRU in
+        # front of the UNLOGGED cache_entries table, shared by every process). L1 entries live at most
+        # CACHE_L1_TTL_SECONDS; worker.py purges expired rows every CACHE_PURGE_INTERVAL_SECONDS.
+        self.CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'none').strip().lower() or 'none'
+        self.CACHE_DEFAULT_TTL_SECONDS = int(os.environ.get('CACHE_DEFAULT_TTL_SECONDS', '300'))
+        self.CACHE_L1_MAX_ENTRIES = int(os.environ.get('CACHE_L1_MAX_ENTRIES', '2000'))
+        self.CACHE_L1_TTL_SECONDS = int(os.environ.get('CACHE_L1_TTL_SECONDS', '60'))
+        self.CACHE_LOCK_WAIT_SECONDS = float(os.environ.get('CACHE_LOCK_WAIT_SECONDS', '10'))
+        self.CACHE_PURGE_INTERVAL_SECONDS = int(os.environ.get('CACHE_PURGE_INTERVAL_SECONDS', '600'))
+        # Cache petition list, tracking, enquiry report and SLA dashboard reads in CACHE (needs a
+        # CACHE_BACKEND); petition workflow writes invalidate the affected petition/scope/user tags.
+        self.QUERY_CACHE_ENABLED = os.environ.get('QUERY_CACHE_ENABLED', '0') == '1'
+        # Cache rendered {% cache %} template fragments (petition timeline, dashboard stat cards,
+        # SLA dashboard body) in CACHE, keyed by petition or user scope and dropped by tag.
+        self.FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', '0') == '1'
+        self.FRAGMENT_CACHE_TTL_SECONDS = int(os.environ.get('FRAGMENT_CACHE_TTL_SECONDS', '300'))
+
+        # Read the notification bell, /api/inbox and handler chatbot queues from the inbox table
+        # (one row per open petition for its current handler, maintained by workflow writes).
+        self.INBOX_ENABLED = os.environ.get('INBOX_ENABLED', '0') == '1'
+
+        # Server-sent events (/api/events) pushing bell counts and "moved to you" notices from inbox
+        # changes. Each open stream holds a server thread, so keep EVENTS_MAX_STREAMS (per process)
+        # well below WAITRESS_THREADS; streams end after EVENTS_STREAM_MAX_SECONDS and the browser reconnects.
+        self.EVENTS_ENABLED = os.environ.get('EVENTS_ENABLED', '0') == '1'
+        self.EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', '4'))
+        self.EVENTS_STREAM_MAX_SECONDS = int(os.environ.get('EVENTS_STREAM_MAX_SECONDS', '300'))
+        self.EVENTS_HEARTBEAT_SECONDS = int(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '20'))
+
+        # Per-user chatbot snapshot (stats, pending, today's updates) kept in CACHE (needs a CACHE_BACKEND)
+        # and dropped by the same workflow write tags as cached petition lists. 0 disables.
+        self.CHATBOT_SNAPSHOT_TTL_SECONDS = int(os.environ.get('CHATBOT_SNAPSHOT_TTL_SECONDS', '30'))
+
         if self.IS_PRODUCTION:
             self._validate_production_settings()
 
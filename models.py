@@ -2,21 +2,48 @@ import psycopg2
 import psycopg2.extras
 from config import Config
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, date, timezone
+from datetime import datetime, date, timedelta, timezone
+import functools
+import hashlib
+import inspect
 import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+import uuid
+from decimal import Decimal
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
+
+try:
+    from rapidfuzz import fuzz as _fuzz, process as _fuzz_process, utils as _fuzz_utils
+except ImportError:
+    _fuzz = _fuzz_process = _fuzz_utils = None
 
 config = Config()
+logger = logging.getLogger(__name__)
+
+
+# SPDCL CVO handles both APSPDCL and APCPDCL.
+_CVO_ROLE_BY_TARGET = {
+    'apspdcl': 'cvo_apspdcl',
+    'apepdcl': 'cvo_apepdcl',
+    'apcpdcl': 'cvo_apspdcl',
+    'headquarters': 'dsp',
+}
+_CMD_ROLE_BY_TARGET = {
+    'apspdcl': 'cmd_apspdcl',
+    'apepdcl': 'cmd_apepdcl',
+    'apcpdcl': 'cmd_apcpdcl',
+    'headquarters': 'cgm_hr_transco',
+}
 
 
 def _cvo_role_for_target(target_cvo):
-    # SPDCL CVO handles both APSPDCL and APCPDCL.
-    role_map = {
-        'apspdcl': 'cvo_apspdcl',
-        'apepdcl': 'cvo_apepdcl',
-        'apcpdcl': 'cvo_apspdcl',
-        'headquarters': 'dsp',
-    }
-    return role_map.get((target_cvo or '').strip())
+    return _CVO_ROLE_BY_TARGET.get((target_cvo or '').strip())
 
 
 def _target_cvos_for_cvo_role(user_role):
@@ -30,6 +57,107 @@ def _target_cvos_for_cvo_role(user_role):
     return role_targets.get((user_role or '').strip(), [])
 
 
+# Stable codes stored in petition_tracking.action_code. `action` stays as the display text;
+# queries that count or classify workflow steps should filter on the code instead.
+TRACKING_ACTION_CODES = {
+    'Petition Created': 'created',
+    'Forwarded to CVO': 'forwarded_to_cvo',
+    'Sent for Permission to PO': 'sent_for_permission',
+    'Receipt Sent to PO for Permission': 'receipt_sent_for_permission',
+    'Bulk Petition Import Sync': 'bulk_import_sync',
+    'Direct Enquiry Confirmed by CVO': 'direct_enquiry_confirmed',
+    'Permission Approved - Sent to CVO': 'permission_approved',
+    'Beyond SLA Permission Copy Uploaded - Sent to CVO': 'beyond_sla_permission_copy',
+    'Permission Rejected': 'permission_rejected',
+    'Assigned to Inspector': 'assigned_to_inspector',
+    'Direct Enquiry Acknowledgement Sent to PO (for E-Office File No)': 'direct_enquiry_ack_to_po',
+    'E-Receipt Updated': 'ereceipt_updated',
+    'Enquiry Report Submitted': 'enquiry_report_submitted',
+    'Inspector Requested Detailed Enquiry Permission': 'inspector_requested_detailed_enquiry',
+    'CVO Comments Added - Forwarded to PO': 'cvo_forwarded_to_po',
+    'Returned to Field Level for Re-enquiry by CVO/DSP': 'cvo_returned_for_reenquiry',
+    'Returned to CVO/DSP for Re-enquiry': 'po_returned_for_reenquiry',
+    'Preliminary Enquiry Completed - Requested PO Permission for Detailed Enquiry': 'cvo_requested_detailed_enquiry',
+    'CVO/DSP Consolidated Report Uploaded': 'consolidated_report_uploaded',
+    'Final Conclusion Given - Petition Closed': 'final_conclusion_closed',
+    'Action Taken - Copy Sent to PO for Closure': 'action_taken_copy_to_po',
+    'Lodged by PO': 'lodged_by_po',
+    'PO Updated E-Office File No': 'efile_updated_by_po',
+    'Direct Lodged by PO (No Enquiry/No Action Required)': 'direct_lodged_by_po',
+    'Direct Lodged by CVO (Media Source)': 'direct_lodged_by_cvo',
+    'Action Taken': 'action_taken',
+    'Petition Closed': 'closed',
+    'E-Office File Number Updated': 'efile_updated',
+}
+
+
+def _backfill_tracking_action_codes(cur):
+    cur.execute("""
+        UPDATE petition_tracking pt
+        SET action_code = m.code
+        FROM unnest(%s::text[], %s::text[]) AS m(action, code)
+        WHERE pt.action_code IS NULL AND pt.action = m.action
+    """, (list(TRACKING_ACTION_CODES.keys()), list(TRACKING_ACTION_CODES.values())))
+    cur.execute("""
+        UPDATE petition_tracking
+        SET action_code = 'forwarded_for_action'
+        WHERE action_code IS NULL AND action LIKE 'Forwarded to % for Action'
+    """)
+    # Older wording of the detailed-enquiry permission requests, previously matched by text in SLA queries.
+    cur.execute("""
+        UPDATE petition_tracking
+        SET action_code = 'detailed_enquiry_permission'
+        WHERE action_code IS NULL
+          AND LOWER(action) LIKE '%detailed enquiry%'
+          AND LOWER(action) LIKE '%permission%'
+    """)
+
+
+# Mirrors app._normalize_petitioner_name (collapse whitespace, trim) plus case folding.
+PETITIONER_NAME_KEY_SQL = "LOWER(BTRIM(REGEXP_REPLACE(COALESCE(petitioner_name, ''), '\\s+', ' ', 'g')))"
+# Placeholder names that are not real petitioners and stay out of the directory.
+PETITIONER_EXCLUDED_KEYS = ('', 'anonymous', '-')
+
+
+def _refresh_petitioner_directory(cur, petition_id=None):
+    """Recompute directory rows from petitions: all of them, or the key of one petition."""
+    key_filter = ""
+    params = [list(PETITIONER_EXCLUDED_KEYS)]
+    if petition_id is not None:
+        key_filter = "AND p.petitioner_name_key = (SELECT petitioner_name_key FROM petitions WHERE id = %s)"
+        params.append(petition_id)
+    cur.execute(f"""
+        INSERT INTO petitioner_directory (
+            name_key, display_name, petition_count,
+            first_received_date, last_received_date, first_seen_at, last_seen_at, updated_at
+        )
+        SELECT
+            p.petitioner_name_key,
+            (ARRAY_AGG(
+                BTRIM(REGEXP_REPLACE(p.petitioner_name, '\\s+', ' ', 'g'))
+                ORDER BY p.created_at DESC, p.id DESC
+            ))[1],
+            COUNT(*),
+            MIN(p.received_date),
+            MAX(p.received_date),
+            MIN(p.created_at),
+            MAX(p.created_at),
+            CURRENT_TIMESTAMP
+        FROM petitions p
+        WHERE NOT (p.petitioner_name_key = ANY(%s))
+          {key_filter}
+        GROUP BY p.petitioner_name_key
+        ON CONFLICT (name_key) DO UPDATE SET
+            display_name = EXCLUDED.display_name,
+            petition_count = EXCLUDED.petition_count,
+            first_received_date = EXCLUDED.first_received_date,
+            last_received_date = EXCLUDED.last_received_date,
+            first_seen_at = EXCLUDED.first_seen_at,
+            last_seen_at = EXCLUDED.last_seen_at,
+            updated_at = CURRENT_TIMESTAMP
+    """, tuple(params))
+
+
 def ensure_schema_updates():
     """Apply minimal runtime-safe schema updates required by newer workflow."""
     conn = psycopg2.connect(**config.get_psycopg2_kwargs())
@@ -77,6 +205,14 @@ def ensure_schema_updates():
             ALTER TABLE petitions
             ADD COLUMN IF NOT EXISTS is_overdue_escalated BOOLEAN NOT NULL DEFAULT FALSE
         """)
+        cur.execute("""
+            ALTER TABLE petitions
+            ADD COLUMN IF NOT EXISTS is_sla_escalated BOOLEAN NOT NULL DEFAULT FALSE
+        """)
+        cur.execute("""
+            ALTER TABLE petitions
+            ADD COLUMN IF NOT EXISTS sla_escalated_at TIMESTAMP
+        """)
         cur.execute("""
             ALTER TABLE enquiry_reports
             ADD COLUMN IF NOT EXISTS cmd_action_report_file VARCHAR(255)
@@ -198,6 +334,14 @@ def ensure_schema_updates():
             ALTER TABLE petition_tracking
             ADD COLUMN IF NOT EXISTS attachment_file VARCHAR(255)
         """)
+        cur.execute("""
+            ALTER TABLE petition_tracking
+            ADD COLUMN IF NOT EXISTS action_code VARCHAR(40)
+        """)
+        cur.execute("""
+            ALTER TABLE petitions
+            ADD COLUMN IF NOT EXISTS latest_enquiry_report_id INTEGER REFERENCES enquiry_reports(id) ON DELETE SET NULL
+        """)
         # Password-reset module: first-login forced change flag
         cur.execute("""
             ALTER TABLE users
@@ -234,6 +378,33 @@ def ensure_schema_updates():
                 "INSERT INTO schema_migrations (name) VALUES ('set_default_passwords_v1')"
             )
 
+        cur.execute(
+            "SELECT 1 FROM schema_migrations WHERE name = 'petition_tracking_action_code_v1'"
+        )
+        if not cur.fetchone():
+            _backfill_tracking_action_codes(cur)
+            cur.execute(
+                "INSERT INTO schema_migrations (name) VALUES ('petition_tracking_action_code_v1')"
+            )
+
+        cur.execute(
+            "SELECT 1 FROM schema_migrations WHERE name = 'petitions_latest_enquiry_report_v1'"
+        )
+        if not cur.fetchone():
+            cur.execute("""
+                UPDATE petitions p
+                SET latest_enquiry_report_id = latest.id
+                FROM (
+                    SELECT DISTINCT ON (er.petition_id) er.petition_id, er.id
+                    FROM enquiry_reports er
+                    ORDER BY er.petition_id, er.submitted_at DESC, er.id DESC
+                ) latest
+                WHERE latest.petition_id = p.id
+            """)
+            cur.execute(
+                "INSERT INTO schema_migrations (name) VALUES ('petitions_latest_enquiry_report_v1')"
+            )
+
         # Dashboard / listing performance indexes
         cur.execute("CREATE INDEX IF NOT EXISTS idx_petitions_status ON petitions(status)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_petitions_received_date ON petitions(received_date DESC)")
@@ -243,6 +414,28 @@ def ensure_schema_updates():
         cur.execute("CREATE INDEX IF NOT EXISTS idx_petitions_current_handler ON petitions(current_handler_id)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_petitions_type_source ON petitions(petition_type, source_of_petition)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_petitions_requires_permission ON petitions(requires_permission)")
+        # Delta sync (get_petition_changes) walks petitions in (updated_at, id) order from a cursor.
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_petitions_updated_at_id ON petitions(updated_at, id)")
+        # Tracking aggregates (assigned/closed timestamps per petition, PO permission counts) read only these columns.
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petition_tracking_petition_status_created
+            ON petition_tracking (petition_id, status_after, created_at, action_code)
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petition_tracking_from_user_action_code
+            ON petition_tracking (from_user_id, action_code, petition_id)
+        """)
+        # SLA escalation sweeper: pending candidates are walked by id; flagged rows back the beyond_sla tab.
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petitions_sla_sweep_pending
+            ON petitions (id)
+            WHERE is_sla_escalated = FALSE AND status <> 'closed'
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petitions_sla_escalated
+            ON petitions (sla_escalated_at DESC)
+            WHERE is_sla_escalated = TRUE
+        """)
         cur.execute("""
             CREATE TABLE IF NOT EXISTS rate_limit_counters (
                 event_name VARCHAR(80) NOT NULL,
@@ -284,6 +477,203 @@ def ensure_schema_updates():
             CREATE INDEX IF NOT EXISTS idx_server_sessions_expires_at
             ON server_sessions (expires_at)
         """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                job_type VARCHAR(60) NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                payload_json TEXT NOT NULL DEFAULT '{}',
+                result_json TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 5,
+                last_error TEXT,
+                run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                locked_by VARCHAR(120),
+                locked_at TIMESTAMP,
+                created_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after
+            ON jobs (status, run_after, id)
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_created_by
+            ON jobs (created_by, created_at DESC)
+        """)
+        # Petitioner directory: normalized name key on petitions plus one summary row per petitioner.
+        cur.execute(f"""
+            ALTER TABLE petitions
+            ADD COLUMN IF NOT EXISTS petitioner_name_key VARCHAR(255)
+            GENERATED ALWAYS AS ({PETITIONER_NAME_KEY_SQL}) STORED
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS petitioner_directory (
+                name_key VARCHAR(255) PRIMARY KEY,
+                display_name VARCHAR(255) NOT NULL,
+                petition_count INTEGER NOT NULL DEFAULT 0,
+                first_received_date DATE,
+                last_received_date DATE,
+                first_seen_at TIMESTAMP,
+                last_seen_at TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petitions_petitioner_name_key
+            ON petitions (petitioner_name_key text_pattern_ops)
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petitioner_directory_key_prefix
+            ON petitioner_directory (name_key text_pattern_ops)
+        """)
+        # Duplicate detection blocking keys: phone digits, and place within a received-date window.
+        cur.execute("""
+            ALTER TABLE petitions
+            ADD COLUMN IF NOT EXISTS contact_digits VARCHAR(20)
+            GENERATED ALWAYS AS (RIGHT(REGEXP_REPLACE(COALESCE(contact, ''), '[^0-9]', '', 'g'), 10)) STORED
+        """)
+        cur.execute("""
+            ALTER TABLE petitions
+            ADD COLUMN IF NOT EXISTS place_key VARCHAR(255)
+            GENERATED ALWAYS AS (LOWER(BTRIM(REGEXP_REPLACE(COALESCE(place, ''), '\\s+', ' ', 'g')))) STORED
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petitions_contact_digits
+            ON petitions (contact_digits)
+            WHERE contact_digits <> ''
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petitions_place_key_received
+            ON petitions (place_key, received_date)
+            WHERE place_key <> ''
+        """)
+        try:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_petitions_petitioner_name_key_trgm
+                ON petitions USING gin (petitioner_name_key gin_trgm_ops)
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_petitioner_directory_key_trgm
+                ON petitioner_directory USING gin (name_key gin_trgm_ops)
+            """)
+        except psycopg2.Error:
+            # Without pg_trgm (no privilege to create it) substring lookups fall back to the prefix indexes.
+            pass
+        # Daily analytics rollups, rebuilt by refresh_petition_rollups (worker or cron).
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS petition_daily_rollups (
+                received_day DATE,
+                target_cvo VARCHAR(50),
+                received_at VARCHAR(50),
+                petition_type VARCHAR(60),
+                source_of_petition VARCHAR(50),
+                status VARCHAR(50),
+                officer_id INTEGER,
+                requires_permission BOOLEAN NOT NULL DEFAULT FALSE,
+                enquiry_type VARCHAR(20),
+                is_overdue_escalated BOOLEAN NOT NULL DEFAULT FALSE,
+                sla_bucket VARCHAR(10) NOT NULL DEFAULT '',
+                petition_count INTEGER NOT NULL,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petition_daily_rollups_day
+            ON petition_daily_rollups (received_day)
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petition_daily_rollups_cvo_day
+            ON petition_daily_rollups (target_cvo, received_day)
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_petition_daily_rollups_officer_day
+            ON petition_daily_rollups (officer_id, received_day)
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS petition_rollup_state (
+                id SMALLINT PRIMARY KEY,
+                rebuilt_at TIMESTAMP NOT NULL
+            )
+        """)
+        # Cached analysis reports, keyed by visibility scope + filters and stamped with the
+        # petition data version they were built from (see bump_petition_data_version).
+        cur.execute("CREATE SEQUENCE IF NOT EXISTS petition_data_version_seq")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_report_snapshots (
+                snapshot_key VARCHAR(64) PRIMARY KEY,
+                scope_key VARCHAR(80) NOT NULL,
+                user_id INTEGER,
+                user_role VARCHAR(50) NOT NULL,
+                cvo_office VARCHAR(50),
+                filters_json TEXT NOT NULL DEFAULT '{}',
+                data_version BIGINT,
+                report_json TEXT,
+                generated_at TIMESTAMP,
+                refresh_requested_at TIMESTAMP,
+                last_error TEXT,
+                viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_analysis_report_snapshots_viewed
+            ON analysis_report_snapshots (viewed_at)
+        """)
+        # Shared cache (CACHE_BACKEND=postgres). UNLOGGED: no WAL, emptied after a crash.
+        cur.execute("""
+            CREATE UNLOGGED TABLE IF NOT EXISTS cache_entries (
+                cache_key TEXT PRIMARY KEY,
+                value_json TEXT NOT NULL,
+                tags TEXT[] NOT NULL DEFAULT '{}',
+                expires_at TIMESTAMP NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_tags ON cache_entries USING GIN (tags)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (expires_at)")
+        cur.execute("""
+            CREATE UNLOGGED TABLE IF NOT EXISTS cache_tag_invalidations (
+                tag TEXT PRIMARY KEY,
+                invalidated_at TIMESTAMP NOT NULL
+            )
+        """)
+        # Per-user work queue: one row per open petition for its current handler, kept in step by
+        # the workflow writes (see _INBOX_UPSERT_SQL) so queue reads are an index range scan.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS inbox (
+                petition_id INTEGER PRIMARY KEY REFERENCES petitions(id) ON DELETE CASCADE,
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                status VARCHAR(50) NOT NULL,
+                since TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                due_at DATE
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_inbox_user_since ON inbox (user_id, since DESC, petition_id DESC)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_inbox_user_status ON inbox (user_id, status)")
+        cur.execute(
+            "SELECT 1 FROM schema_migrations WHERE name = 'inbox_v1'"
+        )
+        if not cur.fetchone():
+            cur.execute(_INBOX_UPSERT_SQL.format(
+                source='petitions', since='COALESCE(p.updated_at, p.created_at, CURRENT_TIMESTAMP)', where='',
+            ))
+            cur.execute(
+                "INSERT INTO schema_migrations (name) VALUES ('inbox_v1')"
+            )
+        cur.execute(
+            "SELECT 1 FROM schema_migrations WHERE name = 'petitioner_directory_v1'"
+        )
+        if not cur.fetchone():
+            _refresh_petitioner_directory(cur)
+            cur.execute(
+                "INSERT INTO schema_migrations (name) VALUES ('petitioner_directory_v1')"
+            )
     except Exception:
         raise
     finally:
@@ -299,6 +689,48 @@ def dict_cursor(conn):
     return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
 
+def named_dict_cursor(conn, itersize=2000):
+    """Server-side RealDictCursor: iterating fetches itersize rows per round trip instead of all at once."""
+    cur = conn.cursor(name=f'stream_{uuid.uuid4().hex[:12]}', cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.itersize = max(1, int(itersize))
+    return cur
+
+
+class CompactRow(Mapping):
+    """Read-only row: a tuple of values plus a column index shared by every row of one result.
+
+    Reads like a dict (row['id'], row.get('id'), dict(row), p.subject in templates) at a
+    fraction of the per-row size. Copy with dict(row) before changing values.
+    """
+
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return f"CompactRow({dict(self)!r})"
+
+
+def iter_compact_rows(cur):
+    """Yield CompactRow objects from an executed dict cursor, building the column index once."""
+    index = None
+    for row in cur:
+        if index is None:
+            index = {key: pos for pos, key in enumerate(row)}
+        yield CompactRow(index, tuple(row.values()))
+
+
 def consume_rate_limit(event_name, scope_entries):
     """Atomically check and consume a rate-limit slot for each provided scope."""
     conn = get_db()
@@ -411,6 +843,836 @@ def consume_rate_limit(event_name, scope_entries):
     finally:
         conn.close()
 
+# ========================================
+# CHANGE NOTIFICATIONS
+# ========================================
+
+class ChangeListener:
+    """One LISTEN connection per process, shared by the in-process caches.
+
+    Subscribers give a channel, a callback that receives the set of payloads delivered together,
+    and an optional on_reset callback. on_reset runs whenever the connection comes up or drops,
+    because notifications sent while it was down are lost. Caches only serve entries while
+    listening is True.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers = {}
+        self._reset_handlers = []
+        self._pid = None
+        self._thread = None
+        self._listening = False
+        self._stop_event = threading.Event()
+
+    @property
+    def listening(self):
+        return self._listening
+
+    def subscribe(self, channel, on_notify, on_reset=None):
+        with self._lock:
+            self._handlers.setdefault(channel, []).append(on_notify)
+            if on_reset is not None:
+                self._reset_handlers.append(on_reset)
+
+    def ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None:
+                return
+            # Threads do not survive fork: each pre-forked web worker starts its own listener.
+            self._pid = pid
+            self._listening = False
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._listen, args=(self._stop_event,), name='change-listener', daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _set_listening(self, listening):
+        with self._lock:
+            self._listening = listening
+            reset_handlers = list(self._reset_handlers)
+        for handler in reset_handlers:
+            handler()
+
+    def _dispatch(self, notifies):
+        payloads = {}
+        while notifies:
+            notify = notifies.pop(0)
+            payloads.setdefault(notify.channel, set()).add(notify.payload)
+        for channel, items in payloads.items():
+            with self._lock:
+                handlers = list(self._handlers.get(channel, ()))
+            for handler in handlers:
+                try:
+                    handler(items)
+                except Exception:
+                    logger.exception('Change listener handler for %s failed', channel)
+
+    def _listen(self, stop_event):
+        retry_seconds = 1
+        while not stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**config.get_psycopg2_kwargs())
+                conn.autocommit = True
+                cur = conn.cursor()
+                listened = set()
+                while not stop_event.is_set():
+                    with self._lock:
+                        new_channels = sorted(set(self._handlers) - listened)
+                    for channel in new_channels:
+                        cur.execute(f'LISTEN {channel}')
+                        listened.add(channel)
+                    if new_channels:
+                        self._set_listening(True)
+                        retry_seconds = 1
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    self._dispatch(conn.notifies)
+            except Exception:
+                self._set_listening(False)
+                logger.warning('Change listener lost its connection; retrying in %ss', retry_seconds)
+                stop_event.wait(retry_seconds)
+                retry_seconds = min(60, retry_seconds * 2)
+            finally:
+                if self._listening:
+                    self._set_listening(False)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+CHANGE_LISTENER = ChangeListener()
+
+
+# Work-queue changes for /api/events. Workflow writes publish one JSON payload per moved petition
+# on INBOX_EVENTS_CHANNEL; CHANGE_LISTENER delivers them after commit and INBOX_EVENTS hands them
+# to the open streams of the users who gained or lost the petition.
+INBOX_EVENTS_CHANNEL = 'inbox_changed'
+
+
+def notify_inbox_changes(cur, changes):
+    """Queue (petition_id, from_user_id, to_user_id, status) events; sent when cur's transaction commits."""
+    if not config.EVENTS_ENABLED:
+        return
+    payloads = [
+        json.dumps({'petition_id': pid, 'from_user_id': from_user, 'to_user_id': to_user, 'status': status})
+        for pid, from_user, to_user, status in changes
+        if from_user or to_user
+    ]
+    if payloads:
+        cur.execute(
+            "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+            (INBOX_EVENTS_CHANNEL, payloads),
+        )
+
+
+class InboxEventHub:
+    """Fans inbox notifications out to the per-user queues of open event streams.
+
+    open_stream() refuses new streams beyond EVENTS_MAX_STREAMS per process, since each open
+    stream holds a server thread. A listener reconnect queues a 'resync' for every stream,
+    because notifications sent while it was down are lost.
+    """
+
+    def __init__(self, listener):
+        self._lock = threading.Lock()
+        self._streams = {}
+        self._listener = listener
+        listener.subscribe(INBOX_EVENTS_CHANNEL, self._on_notify, self._on_reset)
+
+    @property
+    def stream_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._streams.values())
+
+    def open_stream(self, user_id):
+        """A queue of events for user_id, or None when this process is at its stream limit."""
+        self._listener.ensure_started()
+        with self._lock:
+            if sum(len(queues) for queues in self._streams.values()) >= max(0, int(config.EVENTS_MAX_STREAMS)):
+                return None
+            events = queue.SimpleQueue()
+            self._streams.setdefault(user_id, []).append(events)
+            return events
+
+    def close_stream(self, user_id, events):
+        with self._lock:
+            queues = self._streams.get(user_id) or []
+            if events in queues:
+                queues.remove(events)
+            if not queues:
+                self._streams.pop(user_id, None)
+
+    def publish(self, user_id, event):
+        with self._lock:
+            queues = list(self._streams.get(user_id) or ())
+        for events in queues:
+            events.put(event)
+
+    def _on_notify(self, payloads):
+        for payload in payloads:
+            try:
+                change = json.loads(payload)
+            except ValueError:
+                continue
+            for key in ('from_user_id', 'to_user_id'):
+                if change.get(key):
+                    self.publish(change[key], change)
+
+    def _on_reset(self):
+        with self._lock:
+            queues = [events for user_queues in self._streams.values() for events in user_queues]
+        for events in queues:
+            events.put({'resync': True})
+
+
+INBOX_EVENTS = InboxEventHub(CHANGE_LISTENER)
+
+
+# ========================================
+# REFERENCE DATA CACHE
+# ========================================
+# Form configs, system settings, active help resources and the CVO/CMD/inspector user lists
+# change a few times a month but are read on most requests. With REFERENCE_CACHE_ENABLED each
+# process keeps one frozen copy per (dataset, variant). Writers publish the dataset name on
+# REFERENCE_CACHE_CHANNEL inside their transaction, so Postgres delivers it on commit to
+# CHANGE_LISTENER in every process. REFERENCE_CACHE_TTL_SECONDS bounds staleness if a
+# notification is ever missed.
+
+REFERENCE_CACHE_CHANNEL = 'reference_data_changed'
+REFERENCE_DATASETS = ('form_field_configs', 'system_settings', 'help_resources', 'users')
+
+
+class ReadOnlyDict(dict):
+    """dict that refuses in-place changes; copies (dict(x), copy.copy, deepcopy) are plain dicts."""
+
+    def _readonly(self, *_args, **_kwargs):
+        raise TypeError('cached reference data is read-only; copy it with dict() first')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+def freeze_reference_data(value):
+    """Recursively turn dicts into ReadOnlyDict and lists into tuples."""
+    if isinstance(value, Mapping):
+        return ReadOnlyDict((key, freeze_reference_data(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_reference_data(item) for item in value)
+    return value
+
+
+class ReferenceCache:
+    def __init__(self, listener):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generations = Counter()
+        self._listener = listener
+        listener.subscribe(REFERENCE_CACHE_CHANNEL, lambda names: self.invalidate(*names), self.invalidate)
+
+    def get(self, dataset, variant, loader):
+        """Frozen loader() result for (dataset, variant), loading it on a miss."""
+        if not config.REFERENCE_CACHE_ENABLED:
+            return loader()
+        self._listener.ensure_started()
+        if not self._listener.listening:
+            return freeze_reference_data(loader())
+        key = (dataset, variant)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self._generations[dataset]
+        if entry and entry[1] > now:
+            return entry[0]
+        value = freeze_reference_data(loader())
+        with self._lock:
+            # An invalidation that landed while loading means the value may already be stale.
+            if self._listener.listening and self._generations[dataset] == generation:
+                self._entries[key] = (value, now + max(1, int(config.REFERENCE_CACHE_TTL_SECONDS)))
+        return value
+
+    def invalidate(self, *datasets):
+        """Drop the given datasets (all of them when none are named)."""
+        with self._lock:
+            names = set(datasets) or set(REFERENCE_DATASETS) | {key[0] for key in self._entries}
+            for name in names:
+                self._generations[name] += 1
+            for key in [k for k in self._entries if k[0] in names]:
+                self._entries.pop(key, None)
+
+
+REFERENCE_CACHE = ReferenceCache(CHANGE_LISTENER)
+
+
+def notify_reference_change(cur, dataset):
+    """Queue a cross-process invalidation for dataset; Postgres sends it when the transaction commits."""
+    if config.REFERENCE_CACHE_ENABLED:
+        cur.execute('SELECT pg_notify(%s, %s)', (REFERENCE_CACHE_CHANNEL, dataset))
+
+
+# ========================================
+# SHARED CACHE
+# ========================================
+# Computed results (dashboards, analytics, SLA figures) cached once per cluster instead of once
+# per process. CACHE_BACKEND picks the backend: 'none' (NullCacheBackend, the default and what
+# tests use), 'local' (in-process LRU) or 'postgres' (the LRU as L1 in front of the UNLOGGED
+# cache_entries table as L2). Values are stored as JSON, so every hit is a fresh copy the caller
+# may change. delete_by_tag() also publishes the tags on CACHE_TAG_CHANNEL so every process
+# drops its L1 copies.
+
+CACHE_TAG_CHANNEL = 'cache_tags_invalidated'
+CACHE_MISS = object()
+_CACHE_LOCK_STRIPES = 64
+_CACHE_NOTIFY_PAYLOAD_LIMIT = 7000
+
+
+def _cache_json_default(value):
+    if isinstance(value, datetime):
+        return {'__cache_dt__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__cache_date__': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'__cache_decimal__': str(value)}
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    raise TypeError(f'{type(value).__name__} values cannot be cached')
+
+
+def _cache_json_object_hook(obj):
+    if len(obj) == 1:
+        if '__cache_dt__' in obj:
+            return datetime.fromisoformat(obj['__cache_dt__'])
+        if '__cache_date__' in obj:
+            return date.fromisoformat(obj['__cache_date__'])
+        if '__cache_decimal__' in obj:
+            return Decimal(obj['__cache_decimal__'])
+    return obj
+
+
+def encode_cache_value(value):
+    return json.dumps(value, default=_cache_json_default, separators=(',', ':'))
+
+
+def decode_cache_value(raw):
+    return json.loads(raw, object_hook=_cache_json_object_hook)
+
+
+def _cache_ttl(ttl_seconds):
+    return max(1, int(ttl_seconds if ttl_seconds is not None else config.CACHE_DEFAULT_TTL_SECONDS))
+
+
+def _publish_cache_tags(cur, tags):
+    """pg_notify the tags in chunks that fit a NOTIFY payload; delivered when cur's transaction commits."""
+    chunk = []
+    for tag in sorted(set(tags)):
+        if chunk and len('\n'.join(chunk + [tag])) > _CACHE_NOTIFY_PAYLOAD_LIMIT:
+            cur.execute('SELECT pg_notify(%s, %s)', (CACHE_TAG_CHANNEL, '\n'.join(chunk)))
+            chunk = []
+        chunk.append(tag)
+    if chunk:
+        cur.execute('SELECT pg_notify(%s, %s)', (CACHE_TAG_CHANNEL, '\n'.join(chunk)))
+
+
+class CacheBackend:
+    """get/set/delete_by_tag plus get_or_set, which runs loader once per key while concurrent
+    callers for the same key wait for its result (single flight). get returns CACHE_MISS when
+    the key is absent or expired. delete_by_tag accepts the caller's cursor so the invalidation
+    commits, and is broadcast, together with the write that caused it."""
+
+    def get(self, key):
+        return CACHE_MISS
+
+    def set(self, key, value, ttl_seconds=None, tags=()):
+        return None
+
+    def delete_by_tag(self, *tags, cur=None):
+        return None
+
+    def get_or_set(self, key, loader, ttl_seconds=None, tags=()):
+        return loader()
+
+
+class NullCacheBackend(CacheBackend):
+    """Caches nothing. Used with CACHE_BACKEND=none and in tests."""
+
+
+class LocalCacheBackend(CacheBackend):
+    """In-process LRU holding encoded values. Serves hits only while the change listener is up."""
+
+    def __init__(self, listener, max_entries=None, ttl_seconds=None):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stripes = [threading.Lock() for _ in range(_CACHE_LOCK_STRIPES)]
+        self._epoch = 0
+        self._floor = 0
+        self._tag_epochs = {}
+        self._listener = listener
+        self.max_entries = max(1, int(max_entries if max_entries is not None else config.CACHE_L1_MAX_ENTRIES))
+        self.ttl_seconds = _cache_ttl(ttl_seconds if ttl_seconds is not None else config.CACHE_L1_TTL_SECONDS)
+        listener.subscribe(CACHE_TAG_CHANNEL, self._on_tags_notified, self.clear)
+
+    @property
+    def available(self):
+        self._listener.ensure_started()
+        return self._listener.listening
+
+    def key_lock(self, key):
+        return self._stripes[hash(key) % _CACHE_LOCK_STRIPES]
+
+    def begin_load(self):
+        """Epoch to pass to set_raw, so a load that overlaps an invalidation is not stored."""
+        with self._lock:
+            return self._epoch
+
+    def get_raw(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set_raw(self, key, raw, ttl_seconds=None, tags=(), started_epoch=None):
+        ttl = min(_cache_ttl(ttl_seconds), self.ttl_seconds)
+        with self._lock:
+            if started_epoch is not None and (
+                started_epoch < self._floor
+                or any(self._tag_epochs.get(tag, -1) > started_epoch for tag in tags)
+            ):
+                return
+            self._entries[key] = (raw, time.monotonic() + ttl, frozenset(tags))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        if not self.available:
+            return CACHE_MISS
+        raw = self.get_raw(key)
+        return CACHE_MISS if raw is None else decode_cache_value(raw)
+
+    def set(self, key, value, ttl_seconds=None, tags=()):
+        if self.available:
+            self.set_raw(key, encode_cache_value(value), ttl_seconds, tags)
+
+    def forget_tags(self, tags):
+        tags = set(tags)
+        with self._lock:
+            self._epoch += 1
+            if len(self._tag_epochs) > 10 * self.max_entries:
+                # Forget old invalidations; loads that started before now are simply not stored.
+                self._tag_epochs.clear()
+                self._floor = self._epoch
+            for tag in tags:
+                self._tag_epochs[tag] = self._epoch
+            for key in [k for k, entry in self._entries.items() if entry[2] & tags]:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._floor = self._epoch
+            self._tag_epochs.clear()
+            self._entries.clear()
+
+    def _on_tags_notified(self, payloads):
+        self.forget_tags(tag for payload in payloads for tag in payload.split('\n') if tag)
+
+    def delete_by_tag(self, *tags, cur=None):
+        if not tags:
+            return
+        self.forget_tags(tags)
+        if cur is not None:
+            _publish_cache_tags(cur, tags)
+            return
+        conn = get_db()
+        try:
+            _publish_cache_tags(dict_cursor(conn), tags)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            conn.close()
+
+    def get_or_set(self, key, loader, ttl_seconds=None, tags=()):
+        if not self.available:
+            return loader()
+        raw = self.get_raw(key)
+        if raw is not None:
+            return decode_cache_value(raw)
+        with self.key_lock(key):
+            raw = self.get_raw(key)
+            if raw is not None:
+                return decode_cache_value(raw)
+            started = self.begin_load()
+            value = loader()
+            try:
+                self.set_raw(key, encode_cache_value(value), ttl_seconds, tags, started)
+            except (TypeError, ValueError):
+                logger.warning('Cache value for %s is not JSON serialisable; not cached', key)
+        return value
+
+
+class PostgresCacheBackend(CacheBackend):
+    """Shared cache in the UNLOGGED cache_entries table (emptied by a Postgres crash, never replicated)."""
+
+    def get_raw(self, key, cur=None):
+        """(encoded value, seconds left) or None."""
+        if cur is None:
+            conn = get_db()
+            try:
+                return self.get_raw(key, dict_cursor(conn))
+            finally:
+                conn.close()
+        cur.execute("""
+            SELECT value_json, EXTRACT(EPOCH FROM expires_at - clock_timestamp()) AS ttl_left
+            FROM cache_entries
+            WHERE cache_key = %s AND expires_at > clock_timestamp()
+        """, (key,))
+        row = cur.fetchone()
+        return (row['value_json'], float(row['ttl_left'])) if row else None
+
+    def set_raw(self, key, raw, ttl_seconds=None, tags=(), not_invalidated_since=None, cur=None):
+        if cur is None:
+            conn = get_db()
+            try:
+                self.set_raw(key, raw, ttl_seconds, tags, not_invalidated_since, dict_cursor(conn))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+            finally:
+                conn.close()
+            return
+        # A load that started before one of its tags was invalidated must not be stored.
+        cur.execute("""
+            INSERT INTO cache_entries (cache_key, value_json, tags, expires_at)
+            SELECT %s, %s, %s::text[], clock_timestamp() + make_interval(secs => %s)
+            WHERE %s::timestamp IS NULL OR NOT EXISTS (
+                SELECT 1 FROM cache_tag_invalidations
+                WHERE tag = ANY(%s::text[]) AND invalidated_at >= %s::timestamp
+            )
+            ON CONFLICT (cache_key) DO UPDATE SET
+                value_json = EXCLUDED.value_json,
+                tags = EXCLUDED.tags,
+                expires_at = EXCLUDED.expires_at,
+                created_at = clock_timestamp()
+        """, (key, raw, list(tags), _cache_ttl(ttl_seconds), not_invalidated_since, list(tags), not_invalidated_since))
+
+    def get(self, key):
+        found = self.get_raw(key)
+        return CACHE_MISS if found is None else decode_cache_value(found[0])
+
+    def set(self, key, value, ttl_seconds=None, tags=()):
+        self.set_raw(key, encode_cache_value(value), ttl_seconds, tags)
+
+    def delete_by_tag(self, *tags, cur=None):
+        if not tags:
+            return
+        if cur is None:
+            conn = get_db()
+            try:
+                self.delete_by_tag(*tags, cur=dict_cursor(conn))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+            finally:
+                conn.close()
+            return
+        tag_list = sorted(set(tags))
+        cur.execute("DELETE FROM cache_entries WHERE tags && %s::text[]", (tag_list,))
+        cur.execute("""
+            INSERT INTO cache_tag_invalidations (tag, invalidated_at)
+            SELECT tag, clock_timestamp() FROM unnest(%s::text[]) AS tag
+            ON CONFLICT (tag) DO UPDATE SET invalidated_at = EXCLUDED.invalidated_at
+        """, (tag_list,))
+
+    def load_once(self, key, loader, ttl_seconds=None, tags=()):
+        """Run loader under a cluster-wide advisory lock on key; returns (value, encoded or None).
+
+        Callers that waited on the lock read the entry the first caller stored. After
+        CACHE_LOCK_WAIT_SECONDS a waiter gives up and loads on its own.
+        """
+        conn = get_db()
+        conn.autocommit = True
+        locked = False
+        try:
+            cur = dict_cursor(conn)
+            try:
+                cur.execute(f"SET lock_timeout = '{max(1, int(config.CACHE_LOCK_WAIT_SECONDS * 1000))}ms'")
+                cur.execute("SELECT pg_advisory_lock(hashtextextended(%s, 0))", (key,))
+                locked = True
+            except psycopg2.Error:
+                logger.warning('Timed out waiting for the cache fill lock on %s; loading without it', key)
+            if locked:
+                found = self.get_raw(key, cur)
+                if found is not None:
+                    return decode_cache_value(found[0]), found[0]
+            cur.execute("SELECT clock_timestamp()::timestamp AS started_at")
+            started_at = cur.fetchone()['started_at']
+            value = loader()
+            try:
+                raw = encode_cache_value(value)
+            except (TypeError, ValueError):
+                logger.warning('Cache value for %s is not JSON serialisable; not cached', key)
+                return value, None
+            self.set_raw(key, raw, ttl_seconds, tags, started_at, cur)
+            return value, raw
+        finally:
+            if locked:
+                try:
+                    cur.execute("SELECT pg_advisory_unlock(hashtextextended(%s, 0))", (key,))
+                except Exception:
+                    pass
+            conn.close()
+
+    def get_or_set(self, key, loader, ttl_seconds=None, tags=()):
+        found = self.get_raw(key)
+        if found is not None:
+            return decode_cache_value(found[0])
+        return self.load_once(key, loader, ttl_seconds, tags)[0]
+
+
+class TieredCacheBackend(CacheBackend):
+    """LocalCacheBackend (L1) in front of PostgresCacheBackend (L2)."""
+
+    def __init__(self, l1, l2):
+        self.l1 = l1
+        self.l2 = l2
+
+    def get(self, key):
+        value = self.l1.get(key)
+        return value if value is not CACHE_MISS else self.l2.get(key)
+
+    def set(self, key, value, ttl_seconds=None, tags=()):
+        raw = encode_cache_value(value)
+        self.l2.set_raw(key, raw, ttl_seconds, tags)
+        if self.l1.available:
+            self.l1.set_raw(key, raw, ttl_seconds, tags)
+
+    def delete_by_tag(self, *tags, cur=None):
+        if not tags:
+            return
+        if cur is None:
+            conn = get_db()
+            try:
+                self.delete_by_tag(*tags, cur=dict_cursor(conn))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+            finally:
+                conn.close()
+            return
+        self.l2.delete_by_tag(*tags, cur=cur)
+        self.l1.delete_by_tag(*tags, cur=cur)
+
+    def get_or_set(self, key, loader, ttl_seconds=None, tags=()):
+        if not self.l1.available:
+            return self.l2.get_or_set(key, loader, ttl_seconds, tags)
+        raw = self.l1.get_raw(key)
+        if raw is not None:
+            return decode_cache_value(raw)
+        # One thread per process goes to L2; the advisory lock makes it one process per cluster.
+        with self.l1.key_lock(key):
+            raw = self.l1.get_raw(key)
+            if raw is not None:
+                return decode_cache_value(raw)
+            started = self.l1.begin_load()
+            found = self.l2.get_raw(key)
+            if found is not None:
+                self.l1.set_raw(key, found[0], found[1], tags, started)
+                return decode_cache_value(found[0])
+            value, raw = self.l2.load_once(key, loader, ttl_seconds, tags)
+            if raw is not None:
+                self.l1.set_raw(key, raw, ttl_seconds, tags, started)
+            return value
+
+
+def build_cache_backend(kind=None):
+    kind = (kind or config.CACHE_BACKEND or 'none').strip().lower()
+    if kind == 'local':
+        return LocalCacheBackend(CHANGE_LISTENER)
+    if kind == 'postgres':
+        return TieredCacheBackend(LocalCacheBackend(CHANGE_LISTENER), PostgresCacheBackend())
+    return NullCacheBackend()
+
+
+CACHE = build_cache_backend()
+
+
+def purge_cache_entries():
+    """Delete expired cache_entries and invalidation markers older than any possible load."""
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("DELETE FROM cache_entries WHERE expires_at <= clock_timestamp()")
+        expired = cur.rowcount
+        cur.execute("DELETE FROM cache_tag_invalidations WHERE invalidated_at < clock_timestamp() - INTERVAL '1 day'")
+        conn.commit()
+        return {'expired': expired, 'markers': cur.rowcount}
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+# ========================================
+# QUERY CACHE
+# ========================================
+# With QUERY_CACHE_ENABLED and a CACHE_BACKEND other than none, read functions decorated with
+# cached_query keep their results in CACHE, keyed by name and arguments and tagged by what they
+# depend on: petition:{id}, scope:{target_cvo} (scope:all for PO/admin/data entry views),
+# user:{id} for inspector and CMD queues, and petitions for every list. Petition writes are
+# decorated with invalidates_petition, which drops the tags of the petition's state before and
+# after the write once it has committed, so the acting officer's next read is fresh.
+
+_CMD_SCOPE_OFFICES = {'cmd_apspdcl': 'apspdcl', 'cmd_apepdcl': 'apepdcl', 'cmd_apcpdcl': 'apcpdcl', 'cgm_hr_transco': 'headquarters'}
+
+
+def query_cache_active():
+    return config.QUERY_CACHE_ENABLED and not isinstance(CACHE, NullCacheBackend)
+
+
+def fragment_cache_active():
+    """Rendered template fragments ({% cache %} in app.py) are kept in CACHE under the same tags."""
+    return config.FRAGMENT_CACHE_ENABLED and not isinstance(CACHE, NullCacheBackend)
+
+
+def cache_invalidation_active():
+    # Any shared cache can hold petition-derived entries (query results, fragments, chatbot snapshots).
+    return not isinstance(CACHE, NullCacheBackend)
+
+
+def cached_query(tags, ttl_seconds=None):
+    """Cache the decorated read in CACHE. tags is a tuple of format strings filled from the
+    arguments ('petition:{petition_id}') or a callable taking the arguments dict. The original
+    function stays available as .uncached."""
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not query_cache_active():
+                return fn(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            entry_tags = tags(arguments) if callable(tags) else [tag.format(**arguments) for tag in tags]
+            digest = hashlib.sha1(encode_cache_value(sorted(arguments.items())).encode('utf-8')).hexdigest()
+            key = f'query:{fn.__name__}:{digest}'
+            return CACHE.get_or_set(key, lambda: fn(*args, **kwargs), ttl_seconds, entry_tags)
+
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+
+def petition_scope_cache_tags(arguments):
+    """Tags for a petition list read by arguments['user_role'] / arguments['user_id']."""
+    user_role = arguments.get('user_role')
+    user_id = arguments.get('user_id')
+    tags = ['petitions']
+    if user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
+        tags.extend(f'scope:{target}' for target in _target_cvos_for_cvo_role(user_role))
+    elif user_role in _CMD_SCOPE_OFFICES:
+        tags.extend([f'scope:{_CMD_SCOPE_OFFICES[user_role]}', f'user:{user_id}'])
+    elif user_role == 'inspector':
+        tags.append(f'user:{user_id}')
+    else:
+        tags.append('scope:all')
+    return tags
+
+
+def _petition_cache_tags(petition_id):
+    """Tags of every cached read that can include the petition in its current state."""
+    tags = {f'petition:{int(petition_id)}', 'scope:all'}
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("""
+            SELECT target_cvo, assigned_inspector_id, current_handler_id
+            FROM petitions
+            WHERE id = %s
+        """, (petition_id,))
+        row = cur.fetchone()
+        if row:
+            tags.add(f"scope:{row.get('target_cvo') or 'none'}")
+            for column in ('assigned_inspector_id', 'current_handler_id'):
+                if row.get(column):
+                    tags.add(f'user:{int(row[column])}')
+        return tags
+    finally:
+        conn.close()
+
+
+def _drop_cache_tags(tags):
+    try:
+        CACHE.delete_by_tag(*sorted(tags))
+    except Exception:
+        # The write has committed; a failed invalidation leaves entries to expire on their TTL.
+        logger.exception('Query cache invalidation failed for %s', sorted(tags))
+
+
+def invalidates_petition(fn):
+    """For writes taking petition_id first: drop cached reads of the petition's old and new scope."""
+    @functools.wraps(fn)
+    def wrapper(petition_id, *args, **kwargs):
+        if not cache_invalidation_active():
+            return fn(petition_id, *args, **kwargs)
+        before = _petition_cache_tags(petition_id)
+        result = fn(petition_id, *args, **kwargs)
+        _drop_cache_tags(before | _petition_cache_tags(petition_id))
+        return result
+    return wrapper
+
+
+def invalidates_petitions(fn):
+    """For batch writes taking petition_ids first and returning {petition_id: error or None}."""
+    @functools.wraps(fn)
+    def wrapper(petition_ids, *args, **kwargs):
+        result = fn(petition_ids, *args, **kwargs)
+        if cache_invalidation_active():
+            changed = {f'petition:{pid}' for pid, error in result.items() if error is None}
+            if changed:
+                _drop_cache_tags(changed | {'petitions'})
+        return result
+    return wrapper
+
+
+def invalidates_petition_lists(fn):
+    """For writes that add or flag petitions in bulk: drop every cached petition list."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        result = fn(*args, **kwargs)
+        if cache_invalidation_active() and not (isinstance(result, dict) and result.get('skipped')):
+            _drop_cache_tags({'petitions'})
+        return result
+    return wrapper
+
+
 # ========================================
 # USER OPERATIONS
 # ========================================
@@ -426,7 +1688,9 @@ def create_user(username, password, full_name, role, cvo_office=None, assigned_c
             RETURNING id
         """, (username, password_hash, full_name, role, cvo_office, assigned_cvo_id, phone, email, must_change_password))
         user_id = cur.fetchone()['id']
+        notify_reference_change(cur, 'users')
         conn.commit()
+        REFERENCE_CACHE.invalidate('users')
         return user_id
     except Exception as e:
         conn.rollback()
@@ -501,7 +1765,9 @@ def approve_signup_request(request_id, reviewer_id):
             SET status = 'approved', reviewed_by = %s, reviewed_at = CURRENT_TIMESTAMP
             WHERE id = %s
         """, (reviewer_id, request_id))
+        notify_reference_change(cur, 'users')
         conn.commit()
+        REFERENCE_CACHE.invalidate('users')
         return user_id
     except Exception as e:
         conn.rollback()
@@ -693,6 +1959,10 @@ def get_users_by_role(role, cvo_office=None):
         conn.close()
 
 def get_inspectors_by_cvo(cvo_user_id):
+    return REFERENCE_CACHE.get('users', ('inspectors_by_cvo', int(cvo_user_id)), lambda: _load_inspectors_by_cvo(cvo_user_id))
+
+
+def _load_inspectors_by_cvo(cvo_user_id):
     conn = get_db()
     try:
         cur = dict_cursor(conn)
@@ -753,6 +2023,10 @@ def get_inspectors_by_cvo(cvo_user_id):
         conn.close()
 
 def get_cvo_users():
+    return REFERENCE_CACHE.get('users', 'cvo_users', _load_cvo_users)
+
+
+def _load_cvo_users():
     conn = get_db()
     try:
         cur = dict_cursor(conn)
@@ -762,6 +2036,10 @@ def get_cvo_users():
         conn.close()
 
 def get_cmd_cgm_users():
+    return REFERENCE_CACHE.get('users', 'cmd_cgm_users', _load_cmd_cgm_users)
+
+
+def _load_cmd_cgm_users():
     conn = get_db()
     try:
         cur = dict_cursor(conn)
@@ -781,7 +2059,9 @@ def toggle_user_status(user_id):
     try:
         cur = dict_cursor(conn)
         cur.execute("UPDATE users SET is_active = NOT is_active, updated_at = CURRENT_TIMESTAMP WHERE id = %s", (user_id,))
+        notify_reference_change(cur, 'users')
         conn.commit()
+        REFERENCE_CACHE.invalidate('users')
     except Exception as e:
         conn.rollback()
         raise e
@@ -803,7 +2083,9 @@ def update_user(user_id, full_name, role, cvo_office=None, assigned_cvo_id=None,
                 UPDATE users SET full_name=%s, role=%s, cvo_office=%s, assigned_cvo_id=%s, 
                 phone=%s, email=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s
             """, (full_name, role, cvo_office, assigned_cvo_id, phone, email, user_id))
+        notify_reference_change(cur, 'users')
         conn.commit()
+        REFERENCE_CACHE.invalidate('users')
     except Exception as e:
         conn.rollback()
         raise e
@@ -921,7 +2203,9 @@ def set_username(user_id, new_username):
             "UPDATE users SET username = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
             (new_username, user_id)
         )
+        notify_reference_change(cur, 'users')
         conn.commit()
+        REFERENCE_CACHE.invalidate('users')
     except Exception as e:
         conn.rollback()
         raise e
@@ -937,7 +2221,9 @@ def update_user_full_name(user_id, full_name):
             "UPDATE users SET full_name = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
             (full_name, user_id)
         )
+        notify_reference_change(cur, 'users')
         conn.commit()
+        REFERENCE_CACHE.invalidate('users')
     except Exception as e:
         conn.rollback()
         raise e
@@ -960,7 +2246,9 @@ def update_user_profile_info(user_id, full_name, phone=None, email=None):
             """,
             (full_name, phone, email, user_id)
         )
+        notify_reference_change(cur, 'users')
         conn.commit()
+        REFERENCE_CACHE.invalidate('users')
     except Exception as e:
         conn.rollback()
         raise e
@@ -981,7 +2269,9 @@ def set_user_profile_photo(user_id, profile_photo):
             """,
             (profile_photo, user_id)
         )
+        notify_reference_change(cur, 'users')
         conn.commit()
+        REFERENCE_CACHE.invalidate('users')
     except Exception as e:
         conn.rollback()
         raise e
@@ -989,6 +2279,10 @@ def set_user_profile_photo(user_id, profile_photo):
         conn.close()
 
 def get_inspector_mappings():
+    return REFERENCE_CACHE.get('users', 'inspector_mappings', _load_inspector_mappings)
+
+
+def _load_inspector_mappings():
     conn = get_db()
     try:
         cur = dict_cursor(conn)
@@ -1013,7 +2307,9 @@ def map_inspector_to_cvo(inspector_id, cvo_id):
             SET assigned_cvo_id = %s, updated_at = CURRENT_TIMESTAMP
             WHERE id = %s AND role = 'inspector'
         """, (cvo_id, inspector_id))
+        notify_reference_change(cur, 'users')
         conn.commit()
+        REFERENCE_CACHE.invalidate('users')
     except Exception as e:
         conn.rollback()
         raise e
@@ -1068,7 +2364,9 @@ def upsert_form_field_config(form_key, field_key, label, field_type, is_required
                 updated_by = EXCLUDED.updated_by,
                 updated_at = CURRENT_TIMESTAMP
         """, (form_key, field_key, label, field_type, is_required, options_json, updated_by))
+        notify_reference_change(cur, 'form_field_configs')
         conn.commit()
+        REFERENCE_CACHE.invalidate('form_field_configs')
     except Exception as e:
         conn.rollback()
         raise e
@@ -1110,7 +2408,9 @@ def upsert_system_settings(settings, updated_by):
                     updated_by = EXCLUDED.updated_by,
                     updated_at = CURRENT_TIMESTAMP
             """, (str(key), str(value), updated_by))
+        notify_reference_change(cur, 'system_settings')
         conn.commit()
+        REFERENCE_CACHE.invalidate('system_settings')
     except Exception as e:
         conn.rollback()
         raise e
@@ -1240,6 +2540,7 @@ def generate_sno(received_at):
     finally:
         conn.close()
 
+@invalidates_petition_lists
 def create_petition(data, created_by):
     conn = get_db()
     try:
@@ -1267,13 +2568,15 @@ def create_petition(data, created_by):
             data.get('ereceipt_file')
         ))
         result = cur.fetchone()
+        _refresh_petitioner_directory(cur, result['id'])
         
         # Log the creation
         cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, status_after, comments)
-            VALUES (%s, %s, (SELECT role FROM users WHERE id = %s), 'Petition Created', 'received', %s)
+            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, action_code, status_after, comments)
+            VALUES (%s, %s, (SELECT role FROM users WHERE id = %s), 'Petition Created', 'created', 'received', %s)
         """, (result['id'], created_by, created_by, f"Petition {sno} created"))
-        
+        _sync_inbox(cur, [result['id']])
+
         conn.commit()
         return dict(result)
     except Exception as e:
@@ -1360,135 +2663,126 @@ def search_petitions(user_id, user_role, cvo_office, query, search_type='all', l
         conn.close()
 
 
-def get_petition_stats_for_chatbot(user_id, user_role, cvo_office):
-    """Get petition count summary for chatbot."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        if user_role in ('super_admin', 'po'):
-            cur.execute("""
-                SELECT COUNT(*) as total,
-                       COUNT(*) FILTER (WHERE status = 'received') as received,
-                       COUNT(*) FILTER (WHERE status IN ('closed','lodged')) as closed,
-                       COUNT(*) FILTER (WHERE status NOT IN ('closed','lodged')) as open
-                FROM petitions
-            """)
-        elif user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
-            cur.execute("""
-                SELECT COUNT(*) as total,
-                       COUNT(*) FILTER (WHERE status = 'received') as received,
-                       COUNT(*) FILTER (WHERE status IN ('closed','lodged')) as closed,
-                       COUNT(*) FILTER (WHERE status NOT IN ('closed','lodged')) as open
-                FROM petitions WHERE target_cvo = %s
-            """, (cvo_office,))
-        elif user_role == 'inspector':
-            cur.execute("""
-                SELECT COUNT(*) as total,
-                       COUNT(*) FILTER (WHERE status = 'received') as received,
-                       COUNT(*) FILTER (WHERE status IN ('closed','lodged')) as closed,
-                       COUNT(*) FILTER (WHERE status NOT IN ('closed','lodged')) as open
-                FROM petitions WHERE assigned_inspector_id = %s
-            """, (user_id,))
-        else:
-            cur.execute("""
-                SELECT COUNT(*) as total,
-                       COUNT(*) FILTER (WHERE status = 'received') as received,
-                       COUNT(*) FILTER (WHERE status IN ('closed','lodged')) as closed,
-                       COUNT(*) FILTER (WHERE status NOT IN ('closed','lodged')) as open
-                FROM petitions WHERE current_handler_id = %s
-            """, (user_id,))
-        row = cur.fetchone()
-        return dict(row) if row else {'total': 0, 'received': 0, 'closed': 0, 'open': 0}
-    finally:
-        conn.close()
+_CHATBOT_PETITION_COLUMNS = """
+    p.id, p.sno, p.petitioner_name, p.efile_no, p.ereceipt_no,
+    p.subject, p.petition_type, p.status, p.received_date,
+    p.target_cvo, p.place,
+    p.updated_at
+"""
+_CHATBOT_STATS_COLUMNS = """
+    COUNT(*) as total,
+    COUNT(*) FILTER (WHERE status = 'received') as received,
+    COUNT(*) FILTER (WHERE status IN ('closed','lodged')) as closed,
+    COUNT(*) FILTER (WHERE status NOT IN ('closed','lodged')) as open
+"""
 
 
-def get_pending_petitions_for_chatbot(user_id, user_role, cvo_office, limit=8):
-    """Return open/pending petitions that need action, role-scoped."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
+def _chatbot_stats_scope(user_id, user_role, cvo_office):
+    if user_role in ('super_admin', 'po'):
+        return 'TRUE', []
+    if user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
+        return 'target_cvo = %s', [cvo_office]
+    if user_role == 'inspector':
+        return 'assigned_inspector_id = %s', [user_id]
+    return 'current_handler_id = %s', [user_id]
 
-        if user_role == 'super_admin':
-            access_filter = "p.status NOT IN ('closed','lodged','action_taken')"
-            access_params = []
-        elif user_role == 'po':
-            access_filter = "p.status IN ('forwarded_to_po','forwarded_to_jmd','sent_for_permission')"
-            access_params = []
-        elif user_role in ('cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco'):
-            access_filter = "p.status = 'action_instructed' AND p.current_handler_id = %s"
-            access_params = [user_id]
-        elif user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
-            access_filter = "p.target_cvo = %s AND p.status NOT IN ('closed','lodged','action_taken')"
-            access_params = [cvo_office]
-        elif user_role == 'inspector':
-            access_filter = "p.assigned_inspector_id = %s AND p.status IN ('assigned_to_inspector','enquiry_in_progress','sent_back_for_reenquiry')"
-            access_params = [user_id]
-        elif user_role == 'data_entry':
-            access_filter = "p.created_by = %s AND p.status NOT IN ('closed','lodged')"
-            access_params = [user_id]
-        else:
-            access_filter = "p.current_handler_id = %s AND p.status NOT IN ('closed','lodged')"
-            access_params = [user_id]
 
-        cur.execute(f"""
-            SELECT p.id, p.sno, p.petitioner_name, p.efile_no, p.ereceipt_no,
-                   p.subject, p.petition_type, p.status, p.received_date,
-                   p.target_cvo, p.place,
-                   p.updated_at
-            FROM petitions p
-            WHERE {access_filter}
-            ORDER BY p.received_date ASC NULLS LAST
-            LIMIT %s
-        """, access_params + [limit])
-        return [dict(row) for row in cur.fetchall()]
-    finally:
-        conn.close()
+def _chatbot_pending_scope(user_id, user_role, cvo_office):
+    if user_role == 'super_admin':
+        return "p.status NOT IN ('closed','lodged','action_taken')", []
+    if user_role == 'po':
+        return "p.status IN ('forwarded_to_po','forwarded_to_jmd','sent_for_permission')", []
+    if user_role in ('cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco'):
+        if config.INBOX_ENABLED:
+            return "p.id IN (SELECT petition_id FROM inbox WHERE user_id = %s AND status = 'action_instructed')", [user_id]
+        return "p.status = 'action_instructed' AND p.current_handler_id = %s", [user_id]
+    if user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
+        return "p.target_cvo = %s AND p.status NOT IN ('closed','lodged','action_taken')", [cvo_office]
+    if user_role == 'inspector':
+        return "p.assigned_inspector_id = %s AND p.status IN ('assigned_to_inspector','enquiry_in_progress','sent_back_for_reenquiry')", [user_id]
+    if user_role == 'data_entry':
+        return "p.created_by = %s AND p.status NOT IN ('closed','lodged')", [user_id]
+    if config.INBOX_ENABLED:
+        return "p.id IN (SELECT petition_id FROM inbox WHERE user_id = %s AND status <> 'lodged')", [user_id]
+    return "p.current_handler_id = %s AND p.status NOT IN ('closed','lodged')", [user_id]
+
+
+def _chatbot_updates_scope(user_id, user_role, cvo_office):
+    if user_role in ('super_admin', 'po'):
+        access_filter, access_params = 'TRUE', []
+    elif user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
+        access_filter, access_params = 'p.target_cvo = %s', [cvo_office]
+    elif user_role == 'inspector':
+        access_filter, access_params = 'p.assigned_inspector_id = %s', [user_id]
+    elif user_role == 'data_entry':
+        access_filter, access_params = 'p.created_by = %s', [user_id]
+    else:
+        access_filter, access_params = 'p.current_handler_id = %s', [user_id]
+    return (
+        f"{access_filter} AND p.updated_at IS NOT NULL AND p.updated_at::date = CURRENT_DATE",
+        access_params,
+    )
+
 
+def get_chatbot_snapshot(user_id, user_role, cvo_office, limit=20):
+    """Stats, pending and today's updates for the chatbot in a single round trip.
 
-def get_recent_updates_for_chatbot(user_id, user_role, cvo_office, limit=8):
-    """Return petitions most recently updated/changed in status, role-scoped."""
+    The stats CTE always yields one row; pending/update rows are LEFT JOINed onto it and
+    told apart by their kind column.
+    """
+    stats_sql, stats_params = _chatbot_stats_scope(user_id, user_role, cvo_office)
+    pending_sql, pending_params = _chatbot_pending_scope(user_id, user_role, cvo_office)
+    updates_sql, updates_params = _chatbot_updates_scope(user_id, user_role, cvo_office)
     conn = get_db()
     try:
         cur = dict_cursor(conn)
-
-        if user_role == 'super_admin':
-            access_filter = "TRUE"
-            access_params = []
-        elif user_role == 'po':
-            access_filter = "TRUE"
-            access_params = []
-        elif user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
-            access_filter = "p.target_cvo = %s"
-            access_params = [cvo_office]
-        elif user_role == 'inspector':
-            access_filter = "p.assigned_inspector_id = %s"
-            access_params = [user_id]
-        elif user_role == 'data_entry':
-            access_filter = "p.created_by = %s"
-            access_params = [user_id]
-        else:
-            access_filter = "p.current_handler_id = %s"
-            access_params = [user_id]
-
         cur.execute(f"""
-            SELECT p.id, p.sno, p.petitioner_name, p.efile_no, p.ereceipt_no,
-                   p.subject, p.petition_type, p.status, p.received_date,
-                   p.target_cvo, p.place,
-                   p.updated_at
-            FROM petitions p
-            WHERE {access_filter}
-              AND p.updated_at IS NOT NULL
-              AND p.updated_at::date = CURRENT_DATE
-            ORDER BY p.updated_at DESC NULLS LAST
-            LIMIT %s
-        """, access_params + [limit])
-        return [dict(row) for row in cur.fetchall()]
+            WITH stats AS (
+                SELECT {_CHATBOT_STATS_COLUMNS} FROM petitions WHERE {stats_sql}
+            ),
+            pending AS (
+                SELECT 'pending' AS kind, {_CHATBOT_PETITION_COLUMNS}
+                FROM petitions p
+                WHERE {pending_sql}
+                ORDER BY p.received_date ASC NULLS LAST
+                LIMIT %s
+            ),
+            updates AS (
+                SELECT 'updates' AS kind, {_CHATBOT_PETITION_COLUMNS}
+                FROM petitions p
+                WHERE {updates_sql}
+                ORDER BY p.updated_at DESC NULLS LAST
+                LIMIT %s
+            )
+            SELECT s.total AS stat_total, s.received AS stat_received,
+                   s.closed AS stat_closed, s.open AS stat_open, r.*
+            FROM stats s
+            LEFT JOIN (SELECT * FROM pending UNION ALL SELECT * FROM updates) r ON TRUE
+            ORDER BY r.kind,
+                     CASE WHEN r.kind = 'pending' THEN r.received_date END ASC NULLS LAST,
+                     CASE WHEN r.kind = 'updates' THEN r.updated_at END DESC NULLS LAST
+        """, stats_params + pending_params + [limit] + updates_params + [limit])
+        rows = cur.fetchall()
     finally:
         conn.close()
 
+    snapshot = {'stats': {'total': 0, 'received': 0, 'closed': 0, 'open': 0}, 'pending': [], 'updates': []}
+    for raw in rows:
+        row = dict(raw)
+        snapshot['stats'] = {key: int(row.pop(f'stat_{key}') or 0) for key in ('total', 'received', 'closed', 'open')}
+        kind = row.pop('kind', None)
+        if kind in ('pending', 'updates'):
+            snapshot[kind].append(row)
+    return snapshot
+
 
 def list_help_resources(active_only=False):
+    if active_only:
+        return REFERENCE_CACHE.get('help_resources', 'active', lambda: _load_help_resources(True))
+    return _load_help_resources(False)
+
+
+def _load_help_resources(active_only):
     conn = get_db()
     try:
         cur = dict_cursor(conn)
@@ -1576,7 +2870,9 @@ def create_help_resource(title, resource_type, storage_kind, file_name=None, ext
             RETURNING id
         """, (title, resource_type, storage_kind, file_name, external_url, mime_type, display_order, uploaded_by))
         row = cur.fetchone()
+        notify_reference_change(cur, 'help_resources')
         conn.commit()
+        REFERENCE_CACHE.invalidate('help_resources')
         return row['id'] if row else None
     except Exception as e:
         conn.rollback()
@@ -1609,7 +2905,9 @@ def ensure_help_resource(title, resource_type, storage_kind, file_name=None, ext
                     updated_at = CURRENT_TIMESTAMP
                 WHERE id = %s
             """, (mime_type, display_order, existing['id']))
+            notify_reference_change(cur, 'help_resources')
             conn.commit()
+            REFERENCE_CACHE.invalidate('help_resources')
             return existing['id']
         cur.execute("""
             INSERT INTO help_resources
@@ -1618,7 +2916,9 @@ def ensure_help_resource(title, resource_type, storage_kind, file_name=None, ext
             RETURNING id
         """, (title, resource_type, storage_kind, file_name, external_url, mime_type, display_order, uploaded_by))
         row = cur.fetchone()
+        notify_reference_change(cur, 'help_resources')
         conn.commit()
+        REFERENCE_CACHE.invalidate('help_resources')
         return row['id'] if row else None
     except Exception as e:
         conn.rollback()
@@ -1637,7 +2937,9 @@ def set_help_resource_active(resource_id, is_active):
                 updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
         """, (bool(is_active), resource_id))
+        notify_reference_change(cur, 'help_resources')
         conn.commit()
+        REFERENCE_CACHE.invalidate('help_resources')
     except Exception as e:
         conn.rollback()
         raise e
@@ -1706,14 +3008,67 @@ def find_petition_id_by_filename(filename):
         conn.close()
 
 
+def _petition_scope_conditions(user_id, user_role, include_all_for_po=False):
+    """Return (conditions, params) restricting aliased `petitions p` to what user_role may see."""
+    conditions = []
+    params = []
+    if user_role == 'super_admin':
+        pass  # See all
+    elif user_role == 'data_entry':
+        pass  # Data entry sees all petitions for assignment tracking
+    elif user_role == 'po' and not include_all_for_po:
+        conditions.append("(p.status IN ('forwarded_to_po', 'forwarded_to_jmd', 'sent_for_permission', 'action_taken', 'lodged', 'sent_back_for_reenquiry') OR p.current_handler_id = %s OR p.requires_permission = FALSE)")
+        params.append(user_id)
+    elif user_role in ('cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco'):
+        cmd_office_map = {'cmd_apspdcl': 'apspdcl', 'cmd_apepdcl': 'apepdcl', 'cmd_apcpdcl': 'apcpdcl', 'cgm_hr_transco': 'headquarters'}
+        # PO can assign action to any CMD/CGM user; always include explicitly assigned handler queue.
+        # Keep target_cvo office visibility as fallback for legacy rows where current handler might be missing.
+        conditions.append(
+            "p.status IN ('action_instructed', 'action_taken') AND (p.current_handler_id = %s OR p.target_cvo = %s)"
+        )
+        params.extend([user_id, cmd_office_map[user_role]])
+    elif user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
+        targets = _target_cvos_for_cvo_role(user_role)
+        if not targets:
+            conditions.append("1 = 0")
+        elif len(targets) == 1:
+            conditions.append("p.target_cvo = %s")
+            params.append(targets[0])
+        else:
+            placeholders = ', '.join(['%s'] * len(targets))
+            conditions.append(f"p.target_cvo IN ({placeholders})")
+            params.extend(targets)
+    elif user_role == 'inspector':
+        conditions.append("p.assigned_inspector_id = %s")
+        params.append(user_id)
+    return conditions, params
+
+
+# Columns the list, dashboard, SLA and analytics views read from petition lists. Remarks, file
+# names and derived keys are left to get_petition_by_id; the subject is cut to what lists show.
+PETITION_LIST_COLUMNS_SQL = """
+    p.id, p.sno, p.efile_no, p.petitioner_name, p.place, LEFT(p.subject, 300) AS subject,
+    p.petition_type, p.source_of_petition, p.received_at, p.target_cvo, p.requires_permission,
+    p.received_date, p.permission_status, p.enquiry_type, p.status, p.created_by, p.current_handler_id,
+    p.assigned_inspector_id, p.ereceipt_no, p.is_overdue_escalated, p.is_sla_escalated,
+    p.latest_enquiry_report_id, p.created_at, p.updated_at
+"""
+PETITION_LIST_ITERSIZE = 5000
+
+
+@cached_query(petition_scope_cache_tags)
 def get_petitions_for_user(user_id, user_role, cvo_office=None, status_filter=None, enquiry_mode='all'):
+    """Petitions visible to user_role as CompactRow objects (PETITION_LIST_COLUMNS_SQL only)."""
     conn = get_db()
     try:
-        cur = dict_cursor(conn)
+        cur = named_dict_cursor(conn, PETITION_LIST_ITERSIZE)
         is_beyond_sla_filter = status_filter == 'beyond_sla'
         is_overdue_tagged_filter = status_filter == 'overdue_tagged'
-        base_query = """
-            SELECT p.*, 
+        use_sla_escalation_flag = is_beyond_sla_filter and config.SLA_ESCALATION_SWEEP_ENABLED
+        if use_sla_escalation_flag and user_role not in ('po', 'super_admin'):
+            return []
+        base_query = f"""
+            SELECT {PETITION_LIST_COLUMNS_SQL},
                 u1.full_name as created_by_name,
                 u2.full_name as inspector_name,
                 u3.full_name as handler_name
@@ -1722,38 +3077,7 @@ def get_petitions_for_user(user_id, user_role, cvo_office=None, status_filter=No
             LEFT JOIN users u2 ON p.assigned_inspector_id = u2.id
             LEFT JOIN users u3 ON p.current_handler_id = u3.id
         """
-        conditions = []
-        params = []
-        
-        if user_role == 'super_admin':
-            pass  # See all
-        elif user_role == 'data_entry':
-            pass  # Data entry sees all petitions for assignment tracking
-        elif user_role == 'po' and not is_beyond_sla_filter:
-            conditions.append("(p.status IN ('forwarded_to_po', 'forwarded_to_jmd', 'sent_for_permission', 'action_taken', 'lodged', 'sent_back_for_reenquiry') OR p.current_handler_id = %s OR p.requires_permission = FALSE)")
-            params.append(user_id)
-        elif user_role in ('cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco'):
-            cmd_office_map = {'cmd_apspdcl': 'apspdcl', 'cmd_apepdcl': 'apepdcl', 'cmd_apcpdcl': 'apcpdcl', 'cgm_hr_transco': 'headquarters'}
-            # PO can assign action to any CMD/CGM user; always include explicitly assigned handler queue.
-            # Keep target_cvo office visibility as fallback for legacy rows where current handler might be missing.
-            conditions.append(
-                "p.status IN ('action_instructed', 'action_taken') AND (p.current_handler_id = %s OR p.target_cvo = %s)"
-            )
-            params.extend([user_id, cmd_office_map[user_role]])
-        elif user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
-            targets = _target_cvos_for_cvo_role(user_role)
-            if not targets:
-                conditions.append("1 = 0")
-            elif len(targets) == 1:
-                conditions.append("p.target_cvo = %s")
-                params.append(targets[0])
-            else:
-                placeholders = ', '.join(['%s'] * len(targets))
-                conditions.append(f"p.target_cvo IN ({placeholders})")
-                params.extend(targets)
-        elif user_role == 'inspector':
-            conditions.append("p.assigned_inspector_id = %s")
-            params.append(user_id)
+        conditions, params = _petition_scope_conditions(user_id, user_role, include_all_for_po=is_beyond_sla_filter)
         
         if enquiry_mode == 'direct':
             conditions.append("p.requires_permission = FALSE")
@@ -1762,6 +3086,8 @@ def get_petitions_for_user(user_id, user_role, cvo_office=None, status_filter=No
 
         if is_overdue_tagged_filter:
             conditions.append("COALESCE(p.is_overdue_escalated, FALSE) = TRUE")
+        elif use_sla_escalation_flag:
+            conditions.append("p.is_sla_escalated = TRUE")
         elif status_filter and status_filter not in ('all', 'beyond_sla'):
             conditions.append("p.status = %s")
             params.append(status_filter)
@@ -1772,8 +3098,8 @@ def get_petitions_for_user(user_id, user_role, cvo_office=None, status_filter=No
         base_query += " ORDER BY p.created_at DESC"
         
         cur.execute(base_query, params)
-        rows = [dict(row) for row in cur.fetchall()]
-        if is_beyond_sla_filter:
+        rows = list(iter_compact_rows(cur))
+        if is_beyond_sla_filter and not use_sla_escalation_flag:
             if user_role not in ('po', 'super_admin'):
                 return []
             allowed_ids = set(get_po_beyond_sla_petition_ids(rows))
@@ -1782,14 +3108,17 @@ def get_petitions_for_user(user_id, user_role, cvo_office=None, status_filter=No
     finally:
         conn.close()
 
+@cached_query(('petitions', 'scope:all'))
 def get_all_petitions(status_filter=None, enquiry_mode='all'):
+    """Every petition as CompactRow objects (PETITION_LIST_COLUMNS_SQL only)."""
     conn = get_db()
     try:
-        cur = dict_cursor(conn)
+        cur = named_dict_cursor(conn, PETITION_LIST_ITERSIZE)
         is_beyond_sla_filter = status_filter == 'beyond_sla'
         is_overdue_tagged_filter = status_filter == 'overdue_tagged'
-        query = """
-            SELECT p.*, 
+        use_sla_escalation_flag = is_beyond_sla_filter and config.SLA_ESCALATION_SWEEP_ENABLED
+        query = f"""
+            SELECT {PETITION_LIST_COLUMNS_SQL},
                 u1.full_name as created_by_name,
                 u2.full_name as inspector_name,
                 u3.full_name as handler_name
@@ -1807,6 +3136,8 @@ def get_all_petitions(status_filter=None, enquiry_mode='all'):
 
         if is_overdue_tagged_filter:
             conditions.append("COALESCE(p.is_overdue_escalated, FALSE) = TRUE")
+        elif use_sla_escalation_flag:
+            conditions.append("p.is_sla_escalated = TRUE")
         elif status_filter and status_filter not in ('all', 'beyond_sla'):
             conditions.append("p.status = %s")
             params.append(status_filter)
@@ -1817,130 +3148,628 @@ def get_all_petitions(status_filter=None, enquiry_mode='all'):
         else:
             query += " ORDER BY p.created_at DESC"
             cur.execute(query)
-        rows = [dict(row) for row in cur.fetchall()]
-        if is_beyond_sla_filter:
+        rows = list(iter_compact_rows(cur))
+        if is_beyond_sla_filter and not use_sla_escalation_flag:
             allowed_ids = set(get_po_beyond_sla_petition_ids(rows))
             return [row for row in rows if int(row.get('id') or 0) in allowed_ids]
         return rows
     finally:
         conn.close()
 
+# Fields a delta sync client may ask for; id and updated_at are always returned.
+PETITION_CHANGE_FIELDS = (
+    'sno', 'efile_no', 'petitioner_name', 'place', 'subject', 'petition_type', 'source_of_petition',
+    'received_at', 'target_cvo', 'requires_permission', 'received_date', 'permission_status',
+    'enquiry_type', 'status', 'created_by', 'current_handler_id', 'assigned_inspector_id',
+    'is_sla_escalated', 'created_at',
+)
+PETITION_CHANGE_DEFAULT_FIELDS = ('sno', 'status', 'target_cvo', 'current_handler_id', 'assigned_inspector_id')
+PETITION_CHANGES_PAGE_MAX = 1000
+# updated_at is the writing transaction's start time, so rows newer than this may still have
+# uncommitted neighbours with earlier stamps; they are left for the next poll.
+PETITION_CHANGES_SETTLE_SECONDS = 5
+
+
+def get_petition_changes(user_id, user_role, since=None, limit=500, fields=None):
+    """Petitions and tracking entries changed after the cursor `since`, scoped to user_role.
+
+    The cursor is (updated_at, petition_id, tracking_id) of the last rows already seen, or None
+    for a first full pull. Returns petitions, tracking, the next cursor and has_more; callers
+    keep polling with the returned cursor until has_more is False.
+    """
+    limit = max(1, min(int(limit or 500), PETITION_CHANGES_PAGE_MAX))
+    fields = [f for f in (fields or PETITION_CHANGE_DEFAULT_FIELDS) if f in PETITION_CHANGE_FIELDS]
+    columns = ', '.join(f"p.{f}" for f in ['id', 'updated_at'] + fields)
+    since_updated_at, since_petition_id, since_tracking_id = since or (None, 0, 0)
+    scope_conditions, scope_params = _petition_scope_conditions(user_id, user_role)
+
+    petition_conditions = ["p.updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s)"]
+    petition_params = [PETITION_CHANGES_SETTLE_SECONDS]
+    if since_updated_at is not None:
+        petition_conditions.append("(p.updated_at, p.id) > (%s, %s)")
+        petition_params.extend([since_updated_at, int(since_petition_id)])
+    tracking_conditions = [
+        "pt.id > %s",
+        "pt.created_at < CURRENT_TIMESTAMP - make_interval(secs => %s)",
+    ]
+    tracking_params = [int(since_tracking_id or 0), PETITION_CHANGES_SETTLE_SECONDS]
+
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute(f"""
+            SELECT {columns}
+            FROM petitions p
+            WHERE {' AND '.join(petition_conditions + scope_conditions)}
+            ORDER BY p.updated_at, p.id
+            LIMIT %s
+        """, petition_params + scope_params + [limit + 1])
+        petitions = [dict(r) for r in cur.fetchall()]
+        cur.execute(f"""
+            SELECT pt.id, pt.petition_id, pt.action_code, pt.status_before, pt.status_after,
+                pt.from_user_id, pt.to_user_id, pt.created_at
+            FROM petition_tracking pt
+            JOIN petitions p ON p.id = pt.petition_id
+            WHERE {' AND '.join(tracking_conditions + scope_conditions)}
+            ORDER BY pt.id
+            LIMIT %s
+        """, tracking_params + scope_params + [limit + 1])
+        tracking = [dict(r) for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+    has_more = len(petitions) > limit or len(tracking) > limit
+    petitions, tracking = petitions[:limit], tracking[:limit]
+    if petitions:
+        since_updated_at, since_petition_id = petitions[-1]['updated_at'], petitions[-1]['id']
+    if tracking:
+        since_tracking_id = tracking[-1]['id']
+    return {
+        'petitions': petitions,
+        'tracking': tracking,
+        'cursor': (since_updated_at, since_petition_id, since_tracking_id),
+        'has_more': has_more,
+    }
+
+
 # ========================================
 # WORKFLOW OPERATIONS
 # ========================================
 
-def forward_petition_to_cvo(petition_id, from_user_id, target_cvo, comments=None):
-    """Forward petition to respective CVO from current handler"""
+# Every officer action is one row in WORKFLOW_TRANSITIONS, keyed by the action_code it writes to
+# petition_tracking. run_workflow_transition() turns a row into a single data-modifying CTE:
+# lock the petition, resolve the next handler, UPDATE it only if the status guard still holds,
+# touch the latest enquiry report, append the tracking entries and move the petition's inbox
+# row, all in one round trip.
+#
+# Spec keys:
+#   action          tracking label (callers may override it, e.g. the beyond-SLA copy)
+#   from_statuses   statuses the petition must be in; the UPDATE matches no row otherwise
+#   to_status       new status (None keeps it); to_status_sql for a computed status
+#   handler         None keeps current_handler_id; 'actor', 'user' (handler_id argument),
+#                   'po', 'cvo' or 'cmd' resolve the first active user of that role
+#   from_role       fixed from_role for the tracking row (defaults to the actor's role)
+#   to_role         tracking to_role; 'handler' uses the resolved handler's role
+#   set             extra SET fragments on petitions (aliased p)
+#   report_set      SET fragments on the latest enquiry_reports row (aliased er)
+#   also_track      an extra tracking row written when its `when` condition holds
+#   handler_errors  makes the handler mandatory; messages for 'no_role', 'no_user', 'invalid'
+
+WORKFLOW_OPEN_STATUSES = (
+    'received',
+    'forwarded_to_cvo',
+    'sent_for_permission',
+    'permission_approved',
+    'permission_rejected',
+    'assigned_to_inspector',
+    'sent_back_for_reenquiry',
+    'enquiry_in_progress',
+    'enquiry_report_submitted',
+    'forwarded_to_jmd',
+    'forwarded_to_po',
+    'action_instructed',
+    'action_taken',
+)
+_PO_REVIEW_STATUSES = ('forwarded_to_po', 'forwarded_to_jmd')
+CMD_ROLES = ('cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco')
+
+_SET_ENQUIRY_TYPE = (
+    "enquiry_type = CASE WHEN %(enquiry_type)s IN ('detailed', 'preliminary') "
+    "THEN %(enquiry_type)s ELSE p.enquiry_type END"
+)
+# Permission-route petitions keep the enquiry type the PO decided on.
+_SET_DIRECT_ENQUIRY_TYPE = (
+    "enquiry_type = CASE WHEN NOT COALESCE(p.requires_permission, TRUE) AND %(enquiry_type)s IN ('detailed', 'preliminary') "
+    "THEN %(enquiry_type)s ELSE p.enquiry_type END"
+)
+_FILL_EFILE_NO = "efile_no = CASE WHEN COALESCE(BTRIM(p.efile_no), '') = '' THEN %(efile_no)s ELSE p.efile_no END"
+_PERMISSION_APPROVED_SET = (
+    "permission_status = 'approved'",
+    "requires_permission = TRUE",
+    "is_overdue_escalated = CASE WHEN %(mark_overdue_escalated)s THEN TRUE ELSE COALESCE(p.is_overdue_escalated, FALSE) END",
+    "target_cvo = %(target_cvo)s",
+    "organization = COALESCE(%(organization)s, p.organization)",
+    _SET_ENQUIRY_TYPE,
+    _FILL_EFILE_NO,
+)
+_PERMISSION_PENDING_SET = ("requires_permission = TRUE", "permission_status = 'pending'")
+
+WORKFLOW_TRANSITIONS = {
+    'forwarded_to_cvo': {
+        'action': 'Forwarded to CVO',
+        'from_statuses': WORKFLOW_OPEN_STATUSES,
+        'to_status': 'forwarded_to_cvo',
+        'handler': 'cvo',
+        'to_role': 'handler',
+        'set': ("target_cvo = %(target_cvo)s",),
+    },
+    'sent_for_permission': {
+        'action': 'Sent for Permission to PO',
+        'from_statuses': WORKFLOW_OPEN_STATUSES,
+        'to_status': 'sent_for_permission',
+        'handler': 'po',
+        'to_role': 'po',
+        'set': _PERMISSION_PENDING_SET,
+    },
+    'receipt_sent_for_permission': {
+        'action': 'Receipt Sent to PO for Permission',
+        'from_statuses': ('forwarded_to_cvo',),
+        'to_status': 'sent_for_permission',
+        'handler': 'po',
+        'to_role': 'po',
+        'set': _PERMISSION_PENDING_SET,
+    },
+    'direct_enquiry_confirmed': {
+        'action': 'Direct Enquiry Confirmed by CVO',
+        'from_statuses': ('forwarded_to_cvo',),
+        'handler': 'actor',
+        'to_role': 'inspector',
+        'set': ("requires_permission = FALSE", "permission_status = 'not_required'", _SET_ENQUIRY_TYPE),
+    },
+    'permission_approved': {
+        'action': 'Permission Approved - Sent to CVO',
+        'from_statuses': ('sent_for_permission',),
+        'to_status': 'permission_approved',
+        'handler': 'cvo',
+        'from_role': 'po',
+        'to_role': 'handler',
+        'set': _PERMISSION_APPROVED_SET,
+    },
+    'beyond_sla_permission_copy': {
+        'action': 'Beyond SLA Permission Copy Uploaded - Sent to CVO',
+        'from_statuses': tuple(s for s in WORKFLOW_OPEN_STATUSES if s != 'permission_approved'),
+        'to_status': 'permission_approved',
+        'handler': 'cvo',
+        'from_role': 'po',
+        'to_role': 'handler',
+        'set': _PERMISSION_APPROVED_SET,
+    },
+    'permission_rejected': {
+        'action': 'Permission Rejected',
+        'from_statuses': ('sent_for_permission',),
+        'to_status': 'permission_rejected',
+        'from_role': 'po',
+        'set': ("permission_status = 'rejected'",),
+    },
+    'assigned_to_inspector': {
+        'action': 'Assigned to Inspector',
+        'from_statuses': ('permission_approved', 'forwarded_to_cvo'),
+        'to_status': 'assigned_to_inspector',
+        'handler': 'user',
+        'to_role': 'inspector',
+        'set': (_SET_DIRECT_ENQUIRY_TYPE, "assigned_inspector_id = handler.id"),
+        'also_track': {
+            'action': 'Direct Enquiry Acknowledgement Sent to PO (for E-Office File No)',
+            'action_code': 'direct_enquiry_ack_to_po',
+            'to_role': 'po',
+            'when': "NOT COALESCE(before.requires_permission, TRUE)",
+        },
+    },
+    'cvo_forwarded_to_po': {
+        'action': 'CVO Comments Added - Forwarded to PO',
+        'from_statuses': ('enquiry_report_submitted',),
+        'to_status': 'forwarded_to_po',
+        'handler': 'po',
+        'to_role': 'po',
+        'report_set': ("cvo_comments = %(comments)s",),
+    },
+    'cvo_returned_for_reenquiry': {
+        'action': 'Returned to Field Level for Re-enquiry by CVO/DSP',
+        'from_statuses': ('enquiry_report_submitted',),
+        'to_status': 'sent_back_for_reenquiry',
+        'handler': 'user',
+        'to_role': 'inspector',
+        'set': ("assigned_inspector_id = handler.id",),
+    },
+    'po_returned_for_reenquiry': {
+        'action': 'Returned to CVO/DSP for Re-enquiry',
+        'from_statuses': _PO_REVIEW_STATUSES,
+        'to_status_sql': (
+            "(CASE WHEN before.requires_permission THEN 'permission_approved' "
+            "ELSE 'forwarded_to_cvo' END)::petition_status"
+        ),
+        'handler': 'cvo',
+        'from_role': 'po',
+        'to_role': 'handler',
+        'handler_errors': {
+            'no_role': 'Target CVO/DSP is not configured for this petition.',
+            'no_user': 'No active CVO/DSP user found for this petition.',
+        },
+    },
+    'cvo_requested_detailed_enquiry': {
+        'action': 'Preliminary Enquiry Completed - Requested PO Permission for Detailed Enquiry',
+        'from_statuses': ('enquiry_report_submitted',),
+        'to_status': 'sent_for_permission',
+        'handler': 'po',
+        'to_role': 'po',
+        'set': ("enquiry_type = 'detailed'",) + _PERMISSION_PENDING_SET,
+        'report_set': ("cvo_comments = COALESCE(NULLIF(%(comments)s, ''), er.cvo_comments)",),
+    },
+    'final_conclusion_closed': {
+        'action': 'Final Conclusion Given - Petition Closed',
+        'from_statuses': _PO_REVIEW_STATUSES,
+        'to_status': 'closed',
+        'handler': 'actor',
+        'from_role': 'po',
+        'set': (_FILL_EFILE_NO,),
+        'report_set': (
+            "po_conclusion = %(comments)s",
+            "po_instructions = %(instructions)s",
+            "conclusion_file = COALESCE(%(conclusion_file)s, er.conclusion_file)",
+        ),
+    },
+    'forwarded_for_action': {
+        'action': 'Forwarded to CMD/CGM-HR for Action',
+        'action_sql': "'Forwarded to ' || COALESCE(NULLIF(BTRIM(handler.full_name), ''), 'CMD/CGM-HR') || ' for Action'",
+        'from_statuses': _PO_REVIEW_STATUSES,
+        'to_status': 'action_instructed',
+        'handler': 'cmd',
+        'from_role': 'po',
+        'to_role': 'handler',
+        'set': (_FILL_EFILE_NO,),
+        'report_set': ("po_instructions = %(comments)s",),
+        'handler_errors': {
+            'invalid': 'Selected CMD/CGM-HR assignee is invalid.',
+            'no_role': 'No CMD role configured for this jurisdiction.',
+            'no_user': 'No active user found for role {role}.',
+        },
+    },
+    'action_taken_copy_to_po': {
+        'action': 'Action Taken - Copy Sent to PO for Closure',
+        'from_statuses': ('action_instructed',),
+        'to_status': 'action_taken',
+        'handler': 'po',
+        'to_role': 'po',
+        'report_set': (
+            "action_taken = %(comments)s",
+            "cmd_action_report_file = COALESCE(%(action_report_file)s, er.cmd_action_report_file)",
+        ),
+        'handler_errors': {'no_user': 'No active PO user found.'},
+    },
+    'lodged_by_po': {
+        'action': 'Lodged by PO',
+        'from_statuses': _PO_REVIEW_STATUSES + ('action_taken',),
+        'to_status': 'lodged',
+        'handler': 'actor',
+        'from_role': 'po',
+        'set': (_FILL_EFILE_NO,),
+        'report_set': ("po_conclusion = COALESCE(%(comments)s, er.po_conclusion)",),
+    },
+    'direct_lodged_by_po': {
+        'action': 'Direct Lodged by PO (No Enquiry/No Action Required)',
+        'from_statuses': ('sent_for_permission',),
+        'to_status': 'lodged',
+        'handler': 'actor',
+        'from_role': 'po',
+        'set': (_FILL_EFILE_NO,),
+        'report_set': ("po_conclusion = COALESCE(%(comments)s, er.po_conclusion)",),
+    },
+    'direct_lodged_by_cvo': {
+        'action': 'Direct Lodged by CVO (Media Source)',
+        'from_statuses': ('enquiry_report_submitted',),
+        'to_status': 'lodged',
+        'handler': 'actor',
+    },
+    'action_taken': {
+        'action': 'Action Taken',
+        'from_statuses': ('action_instructed',),
+        'to_status': 'action_taken',
+        'report_set': ("action_taken = %(comments)s",),
+    },
+    'closed': {
+        'action': 'Petition Closed',
+        'from_statuses': ('lodged',),
+        'to_status': 'closed',
+    },
+}
+
+
+class WorkflowTransitionError(Exception):
+    """A workflow action does not apply to the petition in its current state."""
+
+
+def _role_by_target_sql(role_map, target_sql):
+    whens = ' '.join(f"WHEN '{target}' THEN '{role}'" for target, role in role_map.items())
+    return f"CASE BTRIM(COALESCE({target_sql}, '')) {whens} END"
+
+
+def _transition_handler_sql(spec, explicit_handler):
+    kind = spec.get('handler')
+    if kind is None:
+        return "SELECT before.id AS petition_id, NULL::integer AS id, NULL::text AS role, NULL::text AS full_name FROM before"
+    if kind == 'actor':
+        return """
+            SELECT before.id AS petition_id, %(actor_id)s::integer AS id, actor.role::text AS role, NULL::text AS full_name
+            FROM before, actor
+        """
+    if kind == 'user':
+        return "SELECT before.id AS petition_id, %(handler_id)s::integer AS id, NULL::text AS role, NULL::text AS full_name FROM before"
+    if explicit_handler:
+        return """
+            SELECT before.id AS petition_id, u.id, u.role::text AS role, u.full_name
+            FROM before
+            LEFT JOIN users u
+              ON u.id = %(handler_id)s AND u.is_active = TRUE AND u.role::text = ANY(%(eligible_roles)s)
+        """
+    if kind == 'po':
+        role_sql = "'po'::text"
+    elif kind == 'cvo':
+        role_sql = _role_by_target_sql(_CVO_ROLE_BY_TARGET, "%(target_cvo)s, before.target_cvo")
+    elif kind == 'cmd':
+        role_sql = _role_by_target_sql(_CMD_ROLE_BY_TARGET, "before.target_cvo")
+    else:
+        raise ValueError(f"Unknown workflow handler kind: {kind}")
+    return f"""
+            SELECT r.petition_id, u.id, r.role, u.full_name
+            FROM (SELECT before.id AS petition_id, {role_sql} AS role FROM before) AS r
+            LEFT JOIN LATERAL (
+                SELECT id, full_name FROM users
+                WHERE role = r.role::user_role AND is_active = TRUE
+                LIMIT 1
+            ) AS u ON TRUE
+        """
+
+
+@functools.lru_cache(maxsize=None)
+def _transition_statement(action_code, explicit_handler=False):
+    """Build the single CTE statement for one WORKFLOW_TRANSITIONS entry over %(petition_ids)s."""
+    spec = WORKFLOW_TRANSITIONS[action_code]
+    guards = ["p.id = before.id"]
+    if spec.get('from_statuses'):
+        guards.append("p.status::text = ANY(%(from_statuses)s)")
+    if spec.get('handler_errors'):
+        guards.append("handler.id IS NOT NULL")
+
+    assignments = []
+    if spec.get('to_status_sql'):
+        assignments.append(f"status = {spec['to_status_sql']}")
+    elif spec.get('to_status'):
+        assignments.append("status = %(to_status)s")
+    if spec.get('handler'):
+        assignments.append("current_handler_id = handler.id")
+    assignments.extend(spec.get('set', ()))
+    assignments.append("updated_at = CURRENT_TIMESTAMP")
+
+    ctes = [
+        "actor AS (SELECT (SELECT role FROM users WHERE id = %(actor_id)s) AS role)",
+        # Locked in id order so overlapping batches cannot deadlock each other.
+        """before AS (
+            SELECT id, status, target_cvo, requires_permission, current_handler_id
+            FROM petitions WHERE id = ANY(%(petition_ids)s)
+            ORDER BY id
+            FOR UPDATE
+        )""",
+        f"handler AS ({_transition_handler_sql(spec, explicit_handler)})",
+        f"""moved AS (
+            UPDATE petitions p SET {', '.join(assignments)}
+            FROM before JOIN handler ON handler.petition_id = before.id
+            WHERE {' AND '.join(guards)}
+            RETURNING p.id, p.status, p.current_handler_id, p.received_date,
+                p.petition_type, p.source_of_petition, p.enquiry_type
+        )""",
+    ]
+    if spec.get('report_set'):
+        ctes.append(f"""report AS (
+            UPDATE enquiry_reports er SET {', '.join(spec['report_set'])}, updated_at = CURRENT_TIMESTAMP
+            FROM moved
+            WHERE er.id = (SELECT id FROM enquiry_reports WHERE petition_id = moved.id ORDER BY submitted_at DESC LIMIT 1)
+            RETURNING er.id
+        )""")
+
+    from_role = "%(from_role)s::user_role" if spec.get('from_role') else "actor.role"
+    to_user = "handler.id" if spec.get('to_role') else "NULL::integer"
+    to_role = "handler.role::user_role" if spec.get('to_role') == 'handler' else "%(to_role)s::user_role"
+    action = spec.get('action_sql') or "%(action)s::text"
+    # Placeholders are cast so the UNION ALL below does not resolve them to text.
+    rows = [f"""SELECT moved.id, %(actor_id)s::integer, {to_user}, {from_role}, {to_role}, {action}, %(action_code)s::text,
+                %(comments)s::text, before.status, moved.status, %(attachment_file)s::text
+            FROM moved
+            JOIN before ON before.id = moved.id
+            JOIN handler ON handler.petition_id = moved.id
+            CROSS JOIN actor"""]
+    also = spec.get('also_track')
+    if also:
+        rows.append(f"""SELECT moved.id, %(actor_id)s::integer,
+                (SELECT id FROM users WHERE role = %(also_to_role)s::user_role AND is_active = TRUE LIMIT 1),
+                {from_role}, %(also_to_role)s::user_role, %(also_action)s::text, %(also_action_code)s::text,
+                %(comments)s::text, before.status, moved.status, %(attachment_file)s::text
+            FROM moved
+            JOIN before ON before.id = moved.id
+            CROSS JOIN actor
+            WHERE {also['when']}""")
+    union = "\n            UNION ALL\n            "
+    ctes.append(f"""tracked AS (
+            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role,
+                action, action_code, comments, status_before, status_after, attachment_file)
+            {union.join(rows)}
+            RETURNING id
+        )""")
+    # The moved rows hold the new handler and status, so the work queue follows in the same statement.
+    ctes.append(f"inbox_cleared AS ({_INBOX_DELETE_SQL.format(source='moved', where='')} RETURNING i.petition_id)")
+    ctes.append(
+        f"inboxed AS ({_INBOX_UPSERT_SQL.format(source='moved', since='CURRENT_TIMESTAMP', where='')} RETURNING petition_id)"
+    )
+    return (
+        "WITH " + ",\n        ".join(ctes) + """
+        SELECT before.id AS petition_id, before.status::text AS status_before, moved.status::text AS status_after,
+            handler.id AS handler_id, handler.role AS handler_role, moved.id IS NOT NULL AS moved,
+            before.current_handler_id AS handler_before, moved.current_handler_id AS handler_after
+        FROM before
+        JOIN handler ON handler.petition_id = before.id
+        LEFT JOIN moved ON moved.id = before.id
+        ORDER BY before.id
+        """
+    )
+
+
+def _transition_refused(action, status):
+    status = (status or 'unknown').replace('_', ' ')
+    return f"'{action}' is not allowed while the petition is {status}."
+
+
+def _transition_error(spec, row, action, explicit_handler):
+    """Why a result row of _transition_statement did not move, or None if it did."""
+    if row.get('moved'):
+        return None
+    errors = spec.get('handler_errors') or {}
+    if errors and row.get('handler_id') is None:
+        if explicit_handler:
+            key = 'invalid'
+        elif not row.get('handler_role'):
+            key = 'no_role'
+        else:
+            key = 'no_user'
+        return errors.get(key, errors.get('no_user', '')).format(role=row.get('handler_role'))
+    return _transition_refused(action, row.get('status_before'))
+
+
+def apply_workflow_transitions(cur, action_code, petition_ids, actor_id, comments=None, attachment_file=None, action=None, **values):
+    """Run one transition over petition_ids on an open cursor; return {petition_id: (row, error)}."""
+    spec = WORKFLOW_TRANSITIONS[action_code]
+    explicit_handler = spec.get('handler') == 'cmd' and values.get('handler_id') is not None
+    params = {
+        'petition_ids': [int(pid) for pid in petition_ids],
+        'actor_id': actor_id,
+        'comments': comments,
+        'attachment_file': attachment_file,
+        'action': action or spec['action'],
+        'action_code': action_code,
+        'from_statuses': list(spec.get('from_statuses') or ()),
+        'to_status': spec.get('to_status'),
+        'from_role': spec.get('from_role'),
+        'to_role': spec.get('to_role'),
+        'target_cvo': None,
+        'handler_id': None,
+        'eligible_roles': list(CMD_ROLES),
+    }
+    also = spec.get('also_track')
+    if also:
+        params.update(also_action=also['action'], also_action_code=also['action_code'], also_to_role=also['to_role'])
+    params.update(values)
+    cur.execute(_transition_statement(action_code, explicit_handler), params)
+    results = {
+        row['petition_id']: (row, _transition_error(spec, row, params['action'], explicit_handler))
+        for row in cur.fetchall()
+    }
+    notify_inbox_changes(cur, [
+        (pid, row.get('handler_before'), row.get('handler_after'), row.get('status_after'))
+        for pid, (row, error) in results.items()
+        if error is None
+    ])
+    return results
+
+
+def run_workflow_transition(action_code, petition_id, actor_id, **kwargs):
+    """Apply one WORKFLOW_TRANSITIONS entry in its own transaction and return the result row."""
     conn = get_db()
     try:
         cur = dict_cursor(conn)
-        cur.execute("SELECT role FROM users WHERE id = %s", (from_user_id,))
-        from_user = cur.fetchone()
-        from_role = from_user['role'] if from_user else None
-
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        status_before = petition['status'] if petition else None
-
-        # Find the CVO user for this office
-        cvo_role = _cvo_role_for_target(target_cvo)
-        
-        cur.execute("SELECT id FROM users WHERE role = %s AND is_active = TRUE LIMIT 1", (cvo_role,))
-        cvo_user = cur.fetchone()
-        cvo_id = cvo_user['id'] if cvo_user else None
-        
-        cur.execute("""
-            UPDATE petitions SET status = 'forwarded_to_cvo', target_cvo = %s,
-                current_handler_id = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (target_cvo, cvo_id, petition_id))
-        
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role, 
-                action, comments, status_before, status_after)
-            VALUES (%s, %s, %s, %s, %s, 'Forwarded to CVO', %s, %s, 'forwarded_to_cvo')
-        """, (petition_id, from_user_id, cvo_id, from_role, cvo_role, comments, status_before))
-        
+        results = apply_workflow_transitions(cur, action_code, [petition_id], actor_id, **kwargs)
+        if not results:
+            raise WorkflowTransitionError("Petition not found.")
+        row, error = next(iter(results.values()))
+        if error:
+            raise WorkflowTransitionError(error)
         conn.commit()
+        return row
     except Exception as e:
         conn.rollback()
         raise e
     finally:
         conn.close()
 
-def send_for_permission(petition_id, from_user_id, comments=None):
-    """Current handler sends petition to PO for permission"""
+
+@invalidates_petitions
+def bulk_workflow_transition(petition_ids, action_code, actor_id, actor_role, precheck=None, **kwargs):
+    """Apply one transition to many petitions in a single transaction.
+
+    Ids outside the actor's petition scope read as not found. `precheck(row)` may return an
+    error for a petition before anything is written. Returns {petition_id: error or None}.
+    """
+    spec = WORKFLOW_TRANSITIONS[action_code]
+    ids = sorted({int(pid) for pid in petition_ids})
+    results = {pid: "Petition not found." for pid in ids}
+    if not ids:
+        return results
+    conditions, scope_params = _petition_scope_conditions(actor_id, actor_role)
+    where = ' AND '.join(['p.id = ANY(%s)'] + conditions)
     conn = get_db()
     try:
         cur = dict_cursor(conn)
-        cur.execute("SELECT role FROM users WHERE id = %s", (from_user_id,))
-        from_user = cur.fetchone()
-        from_role = from_user['role'] if from_user else None
-
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        status_before = petition['status'] if petition else None
-
-        cur.execute("SELECT id FROM users WHERE role = 'po' AND is_active = TRUE LIMIT 1")
-        po_user = cur.fetchone()
-        po_id = po_user['id'] if po_user else None
-        
-        cur.execute("""
-            UPDATE petitions SET status = 'sent_for_permission', requires_permission = TRUE,
-                permission_status = 'pending', current_handler_id = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (po_id, petition_id))
-        
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role,
-                action, comments, status_before, status_after)
-            VALUES (%s, %s, %s, %s, 'po', 'Sent for Permission to PO', %s, %s, 'sent_for_permission')
-        """, (petition_id, from_user_id, po_id, from_role, comments, status_before))
-        
+        cur.execute(f"""
+            SELECT p.id, p.status::text AS status, p.efile_no, p.requires_permission,
+                p.assigned_inspector_id, p.source_of_petition,
+                EXISTS (
+                    SELECT 1 FROM petition_tracking t
+                    WHERE t.petition_id = p.id
+                      AND t.action_code IN ('cvo_requested_detailed_enquiry', 'inspector_requested_detailed_enquiry')
+                ) AS conversion_requested
+            FROM petitions p
+            WHERE {where}
+        """, [ids] + scope_params)
+        allowed = set(spec.get('from_statuses') or ())
+        eligible = []
+        for row in cur.fetchall():
+            if allowed and row['status'] not in allowed:
+                error = _transition_refused(kwargs.get('action') or spec['action'], row['status'])
+            else:
+                error = precheck(row) if precheck else None
+            results[row['id']] = error
+            if error is None:
+                eligible.append(row['id'])
+        if eligible:
+            outcomes = apply_workflow_transitions(cur, action_code, eligible, actor_id, **kwargs)
+            for petition_id in eligible:
+                # A petition deleted between the two statements has no result row.
+                results[petition_id] = outcomes[petition_id][1] if petition_id in outcomes else "Petition not found."
         conn.commit()
+        return results
     except Exception as e:
         conn.rollback()
         raise e
     finally:
         conn.close()
 
-def cvo_send_receipt_to_po(petition_id, cvo_user_id, comments=None, attachment_file=None):
-    """CVO sends petition with receipt to PO for mandatory permission route."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT id FROM users WHERE role = 'po' AND is_active = TRUE LIMIT 1")
-        po_user = cur.fetchone()
-        po_id = po_user['id'] if po_user else None
 
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        status_before = petition['status'] if petition else None
+@invalidates_petition
+def forward_petition_to_cvo(petition_id, from_user_id, target_cvo, comments=None):
+    """Forward petition to respective CVO from current handler"""
+    return run_workflow_transition('forwarded_to_cvo', petition_id, from_user_id, comments=comments, target_cvo=target_cvo)
 
-        cur.execute("""
-            UPDATE petitions
-            SET status = 'sent_for_permission',
-                requires_permission = TRUE,
-                permission_status = 'pending',
-                current_handler_id = %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (po_id, petition_id))
+@invalidates_petition
+def send_for_permission(petition_id, from_user_id, comments=None):
+    """Current handler sends petition to PO for permission"""
+    return run_workflow_transition('sent_for_permission', petition_id, from_user_id, comments=comments)
 
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role,
-                action, comments, status_before, status_after, attachment_file)
-            VALUES (%s, %s, %s, (SELECT role FROM users WHERE id = %s), 'po',
-                'Receipt Sent to PO for Permission', %s, %s, 'sent_for_permission', %s)
-        """, (petition_id, cvo_user_id, po_id, cvo_user_id, comments, status_before, attachment_file))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+@invalidates_petition
+def cvo_send_receipt_to_po(petition_id, cvo_user_id, comments=None, attachment_file=None):
+    """CVO sends petition with receipt to PO for mandatory permission route."""
+    return run_workflow_transition(
+        'receipt_sent_for_permission', petition_id, cvo_user_id, comments=comments, attachment_file=attachment_file
+    )
 
 
+@invalidates_petition
 def update_imported_petition_state(
     petition_id,
     actor_user_id,
@@ -1999,11 +3828,14 @@ def update_imported_petition_state(
             fields.append("updated_at = CURRENT_TIMESTAMP")
             params.extend([petition_id])
             cur.execute(f"UPDATE petitions SET {', '.join(fields)} WHERE id = %s", tuple(params))
+            if received_date is not None:
+                _refresh_petitioner_directory(cur, petition_id)
+            _sync_inbox(cur, [petition_id])
 
         status_after = status or status_before
         cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, comments, status_before, status_after)
-            VALUES (%s, %s, (SELECT role FROM users WHERE id = %s), 'Bulk Petition Import Sync', %s, %s, %s)
+            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, action_code, comments, status_before, status_after)
+            VALUES (%s, %s, (SELECT role FROM users WHERE id = %s), 'Bulk Petition Import Sync', 'bulk_import_sync', %s, %s, %s)
         """, (
             petition_id,
             actor_user_id,
@@ -2020,41 +3852,14 @@ def update_imported_petition_state(
         conn.close()
 
 
+@invalidates_petition
 def cvo_mark_direct_enquiry(petition_id, cvo_user_id, comments=None, enquiry_type=None):
     """CVO confirms direct enquiry (no PO permission route)."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        status_before = petition['status'] if petition else None
-
-        cur.execute("""
-            UPDATE petitions
-            SET requires_permission = FALSE,
-                permission_status = 'not_required',
-                enquiry_type = CASE
-                    WHEN %s IN ('detailed', 'preliminary') THEN %s
-                    ELSE enquiry_type
-                END,
-                current_handler_id = %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (enquiry_type, enquiry_type, cvo_user_id, petition_id))
-
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role,
-                action, comments, status_before, status_after)
-            VALUES (%s, %s, %s, (SELECT role FROM users WHERE id = %s), 'inspector',
-                'Direct Enquiry Confirmed by CVO', %s, %s, 'forwarded_to_cvo')
-        """, (petition_id, cvo_user_id, cvo_user_id, cvo_user_id, comments, status_before))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return run_workflow_transition(
+        'direct_enquiry_confirmed', petition_id, cvo_user_id, comments=comments, enquiry_type=enquiry_type
+    )
 
+@invalidates_petition
 def approve_permission(
     petition_id,
     from_user_id,
@@ -2066,145 +3871,65 @@ def approve_permission(
     attachment_file=None,
     tracking_action='Permission Approved - Sent to CVO',
     mark_overdue_escalated=False,
+    action_code='permission_approved',
 ):
     """PO approves permission and sends to CVO"""
+    return run_workflow_transition(
+        action_code,
+        petition_id,
+        from_user_id,
+        comments=comments,
+        attachment_file=attachment_file,
+        action=tracking_action,
+        target_cvo=target_cvo,
+        efile_no=efile_no,
+        enquiry_type=enquiry_type,
+        organization=organization,
+        mark_overdue_escalated=bool(mark_overdue_escalated),
+    )
+
+@invalidates_petition
+def reject_permission(petition_id, from_user_id, comments=None):
+    """PO rejects permission"""
+    return run_workflow_transition('permission_rejected', petition_id, from_user_id, comments=comments)
+
+@invalidates_petition
+def assign_to_inspector(petition_id, from_user_id, inspector_id, comments=None, enquiry_type=None, attachment_file=None):
+    """CVO assigns petition to field inspector"""
+    return run_workflow_transition(
+        'assigned_to_inspector',
+        petition_id,
+        from_user_id,
+        comments=comments,
+        attachment_file=attachment_file,
+        handler_id=inspector_id,
+        enquiry_type=enquiry_type,
+    )
+
+@invalidates_petition
+def set_ereceipt(petition_id, user_id, ereceipt_no, ereceipt_file=None):
+    """CVO updates E-Receipt number and optional uploaded receipt file."""
     conn = get_db()
     try:
         cur = dict_cursor(conn)
-        cvo_role = _cvo_role_for_target(target_cvo)
-        
-        cur.execute("SELECT id FROM users WHERE role = %s AND is_active = TRUE LIMIT 1", (cvo_role,))
-        cvo_user = cur.fetchone()
-        cvo_id = cvo_user['id'] if cvo_user else None
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
+        cur.execute("SELECT ereceipt_no, ereceipt_file, status FROM petitions WHERE id = %s", (petition_id,))
         petition = cur.fetchone()
+        previous_receipt = petition['ereceipt_no'] if petition else None
         status_before = petition['status'] if petition else None
-        
+
         cur.execute("""
-            UPDATE petitions SET status = 'permission_approved', permission_status = 'approved',
-                requires_permission = TRUE,
-                is_overdue_escalated = CASE WHEN %s THEN TRUE ELSE COALESCE(is_overdue_escalated, FALSE) END,
-                target_cvo = %s,
-                organization = COALESCE(%s, organization),
-                enquiry_type = CASE
-                    WHEN %s IN ('detailed', 'preliminary') THEN %s
-                    ELSE enquiry_type
-                END,
-                efile_no = CASE
-                    WHEN COALESCE(BTRIM(efile_no), '') = '' THEN %s
-                    ELSE efile_no
-                END,
-                current_handler_id = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (mark_overdue_escalated, target_cvo, organization, enquiry_type, enquiry_type, efile_no, cvo_id, petition_id))
-        
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role,
-                action, comments, status_before, status_after, attachment_file)
-            VALUES (%s, %s, %s, 'po', %s, %s, %s, %s, 'permission_approved', %s)
-        """, (petition_id, from_user_id, cvo_id, cvo_role, tracking_action, comments, status_before, attachment_file))
-        
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-def reject_permission(petition_id, from_user_id, comments=None):
-    """PO rejects permission"""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("""
-            UPDATE petitions SET status = 'permission_rejected', permission_status = 'rejected',
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (petition_id,))
-        
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role,
-                action, comments, status_before, status_after)
-            VALUES (%s, %s, 'po', 'Permission Rejected', %s, 'sent_for_permission', 'permission_rejected')
-        """, (petition_id, from_user_id, comments))
-        
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-def assign_to_inspector(petition_id, from_user_id, inspector_id, comments=None, enquiry_type=None, attachment_file=None):
-    """CVO assigns petition to field inspector"""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT status, requires_permission FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        status_before = petition['status'] if petition else None
-        requires_permission = petition['requires_permission'] if petition else True
-
-        cur.execute("""
-            UPDATE petitions SET status = 'assigned_to_inspector',
-                enquiry_type = CASE
-                    WHEN %s IN ('detailed', 'preliminary') THEN %s
-                    ELSE enquiry_type
-                END,
-                assigned_inspector_id = %s,
-                current_handler_id = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (enquiry_type, enquiry_type, inspector_id, inspector_id, petition_id))
-        
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, 
-                from_role, to_role, action, comments, status_before, status_after, attachment_file)
-            VALUES (%s, %s, %s, (SELECT role FROM users WHERE id = %s), 'inspector', 
-                'Assigned to Inspector', %s, 
-                %s, 'assigned_to_inspector', %s)
-        """, (petition_id, from_user_id, inspector_id, from_user_id, comments, status_before, attachment_file))
-
-        if not requires_permission:
-            cur.execute("SELECT id FROM users WHERE role = 'po' AND is_active = TRUE LIMIT 1")
-            po_user = cur.fetchone()
-            po_id = po_user['id'] if po_user else None
-            cur.execute("""
-                INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role, action, comments, status_before, status_after, attachment_file)
-                VALUES (%s, %s, %s, (SELECT role FROM users WHERE id = %s), 'po',
-                    'Direct Enquiry Acknowledgement Sent to PO (for E-Office File No)',
-                    %s, %s, 'assigned_to_inspector', %s)
-            """, (petition_id, from_user_id, po_id, from_user_id, comments, status_before, attachment_file))
-        
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-def set_ereceipt(petition_id, user_id, ereceipt_no, ereceipt_file=None):
-    """CVO updates E-Receipt number and optional uploaded receipt file."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT ereceipt_no, ereceipt_file, status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        previous_receipt = petition['ereceipt_no'] if petition else None
-        status_before = petition['status'] if petition else None
-
-        cur.execute("""
-            UPDATE petitions
-            SET ereceipt_no = %s,
-                ereceipt_file = COALESCE(%s, ereceipt_file),
-                updated_at = CURRENT_TIMESTAMP
+            UPDATE petitions
+            SET ereceipt_no = %s,
+                ereceipt_file = COALESCE(%s, ereceipt_file),
+                updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
         """, (ereceipt_no, ereceipt_file, petition_id))
 
         file_note = " with file upload" if ereceipt_file else ""
         comment = f"E-Receipt No updated from '{previous_receipt or '-'}' to '{ereceipt_no}'{file_note}"
         cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, comments, status_before, status_after)
-            VALUES (%s, %s, (SELECT role FROM users WHERE id = %s), 'E-Receipt Updated', %s, %s, %s)
+            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, action_code, comments, status_before, status_after)
+            VALUES (%s, %s, (SELECT role FROM users WHERE id = %s), 'E-Receipt Updated', 'ereceipt_updated', %s, %s, %s)
         """, (petition_id, user_id, user_id, comment, status_before, status_before))
 
         conn.commit()
@@ -2214,6 +3939,7 @@ def set_ereceipt(petition_id, user_id, ereceipt_no, ereceipt_file=None):
     finally:
         conn.close()
 
+@invalidates_petition
 def submit_enquiry_report(
     petition_id,
     inspector_id,
@@ -2257,28 +3983,30 @@ def submit_enquiry_report(
             accident_type, deceased_category, departmental_type, non_departmental_type,
             deceased_count, general_public_count, animals_count
         ))
+        report_id = cur.fetchone()['id']
         
         cur.execute("""
             UPDATE petitions SET status = 'enquiry_report_submitted', 
-                current_handler_id = %s, updated_at = CURRENT_TIMESTAMP
+                current_handler_id = %s, latest_enquiry_report_id = %s, updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
-        """, (cvo_id, petition_id))
+        """, (cvo_id, report_id, petition_id))
         
         cur.execute("""
             INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, 
-                from_role, to_role, action, comments, status_before, status_after)
+                from_role, to_role, action, action_code, comments, status_before, status_after)
             VALUES (%s, %s, %s, 'inspector', (SELECT role FROM users WHERE id = %s), 
-                'Enquiry Report Submitted', %s, 
+                'Enquiry Report Submitted', 'enquiry_report_submitted', %s, 
                 %s, 'enquiry_report_submitted')
         """, (petition_id, inspector_id, cvo_id, cvo_id, 'Report uploaded for CVO review' if report_file else 'Report submitted for CVO review', status_before))
+        _sync_inbox(cur, [petition_id])
 
         if request_detailed_permission:
             req_comment = (detailed_request_reason or '').strip() or 'Inspector requested permission to convert preliminary enquiry to detailed enquiry.'
             cur.execute("""
                 INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id,
-                    from_role, to_role, action, comments, status_before, status_after)
+                    from_role, to_role, action, action_code, comments, status_before, status_after)
                 VALUES (%s, %s, %s, 'inspector', (SELECT role FROM users WHERE id = %s),
-                    'Inspector Requested Detailed Enquiry Permission', %s,
+                    'Inspector Requested Detailed Enquiry Permission', 'inspector_requested_detailed_enquiry', %s,
                     'enquiry_report_submitted', 'enquiry_report_submitted')
             """, (petition_id, inspector_id, cvo_id, cvo_id, req_comment))
         
@@ -2289,172 +4017,33 @@ def submit_enquiry_report(
     finally:
         conn.close()
 
+@invalidates_petition
 def cvo_add_comments(petition_id, cvo_user_id, cvo_comments):
     """CVO adds comments and forwards to PO"""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-
-        # Update latest enquiry report row for this petition.
-        cur.execute("""
-            UPDATE enquiry_reports SET cvo_comments = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = (SELECT id FROM enquiry_reports WHERE petition_id = %s ORDER BY submitted_at DESC LIMIT 1)
-        """, (cvo_comments, petition_id))
-        
-        cur.execute("SELECT id FROM users WHERE role = 'po' AND is_active = TRUE LIMIT 1")
-        po_user = cur.fetchone()
-        po_id = po_user['id'] if po_user else None
-        
-        cur.execute("""
-            UPDATE petitions SET status = 'forwarded_to_po', current_handler_id = %s, 
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (po_id, petition_id))
-        
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id,
-                from_role, to_role, action, comments, status_before, status_after)
-            VALUES (%s, %s, %s, (SELECT role FROM users WHERE id = %s), 'po',
-                'CVO Comments Added - Forwarded to PO', %s,
-                'enquiry_report_submitted', 'forwarded_to_po')
-        """, (petition_id, cvo_user_id, po_id, cvo_user_id, cvo_comments))
-        
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return run_workflow_transition('cvo_forwarded_to_po', petition_id, cvo_user_id, comments=cvo_comments)
 
+@invalidates_petition
 def cvo_send_back_to_inspector_for_reenquiry(petition_id, cvo_user_id, inspector_id, comments):
     """CVO/DSP sends report back to field level for re-enquiry."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        if not petition:
-            raise Exception("Petition not found.")
-        status_before = petition['status']
-
-        cur.execute("""
-            UPDATE petitions
-            SET status = 'sent_back_for_reenquiry',
-                assigned_inspector_id = %s,
-                current_handler_id = %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (inspector_id, inspector_id, petition_id))
-
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id,
-                from_role, to_role, action, comments, status_before, status_after)
-            VALUES (%s, %s, %s, (SELECT role FROM users WHERE id = %s), 'inspector',
-                'Returned to Field Level for Re-enquiry by CVO/DSP',
-                %s, %s, 'sent_back_for_reenquiry')
-        """, (petition_id, cvo_user_id, inspector_id, cvo_user_id, comments, status_before))
-
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return run_workflow_transition(
+        'cvo_returned_for_reenquiry', petition_id, cvo_user_id, comments=comments, handler_id=inspector_id
+    )
 
 
+@invalidates_petition
 def po_send_back_to_cvo_for_reenquiry(petition_id, po_user_id, comments):
     """PO sends petition back to concerned CVO/DSP for re-enquiry routing."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT target_cvo, status, requires_permission FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        if not petition:
-            raise Exception("Petition not found.")
-        status_before = petition['status']
-        is_permission_flow = bool(petition.get('requires_permission'))
-        status_after = 'permission_approved' if is_permission_flow else 'forwarded_to_cvo'
-
-        cvo_role = _cvo_role_for_target(petition.get('target_cvo'))
-        if not cvo_role:
-            raise Exception("Target CVO/DSP is not configured for this petition.")
-
-        cur.execute("SELECT id FROM users WHERE role = %s AND is_active = TRUE LIMIT 1", (cvo_role,))
-        cvo_user = cur.fetchone()
-        cvo_id = cvo_user['id'] if cvo_user else None
-        if not cvo_id:
-            raise Exception("No active CVO/DSP user found for this petition.")
-
-        cur.execute("""
-            UPDATE petitions
-            SET status = %s,
-                current_handler_id = %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (status_after, cvo_id, petition_id))
-
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id,
-                from_role, to_role, action, comments, status_before, status_after)
-            VALUES (%s, %s, %s, 'po', %s,
-                'Returned to CVO/DSP for Re-enquiry',
-                %s, %s, %s)
-        """, (petition_id, po_user_id, cvo_id, cvo_role, comments, status_before, status_after))
-
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return run_workflow_transition('po_returned_for_reenquiry', petition_id, po_user_id, comments=comments)
 
+@invalidates_petition
 def cvo_request_detailed_enquiry(petition_id, cvo_user_id, cvo_comments=None, attachment_file=None):
     """After preliminary report, CVO requests PO permission to continue as detailed enquiry."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        status_before = petition['status'] if petition else None
-
-        if cvo_comments:
-            cur.execute("""
-                UPDATE enquiry_reports
-                SET cvo_comments = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = (SELECT id FROM enquiry_reports WHERE petition_id = %s ORDER BY submitted_at DESC LIMIT 1)
-            """, (cvo_comments, petition_id))
-
-        cur.execute("SELECT id FROM users WHERE role = 'po' AND is_active = TRUE LIMIT 1")
-        po_user = cur.fetchone()
-        po_id = po_user['id'] if po_user else None
-
-        cur.execute("""
-            UPDATE petitions
-            SET enquiry_type = 'detailed',
-                requires_permission = TRUE,
-                permission_status = 'pending',
-                status = 'sent_for_permission',
-                current_handler_id = %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (po_id, petition_id))
-
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role,
-                action, comments, status_before, status_after, attachment_file)
-            VALUES (%s, %s, %s, (SELECT role FROM users WHERE id = %s), 'po',
-                'Preliminary Enquiry Completed - Requested PO Permission for Detailed Enquiry',
-                %s, %s, 'sent_for_permission', %s)
-        """, (petition_id, cvo_user_id, po_id, cvo_user_id, cvo_comments, status_before, attachment_file))
-
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return run_workflow_transition(
+        'cvo_requested_detailed_enquiry', petition_id, cvo_user_id, comments=cvo_comments, attachment_file=attachment_file
+    )
 
 
+@invalidates_petition
 def cvo_upload_consolidated_report(petition_id, cvo_user_id, consolidated_report_file):
     """CVO/DSP uploads consolidated report after inspector report submission."""
     conn = get_db()
@@ -2472,10 +4061,10 @@ def cvo_upload_consolidated_report(petition_id, cvo_user_id, consolidated_report
         """, (consolidated_report_file, petition_id))
 
         cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, comments, status_before, status_after)
+            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, action_code, comments, status_before, status_after)
             VALUES (
                 %s, %s, (SELECT role FROM users WHERE id = %s),
-                'CVO/DSP Consolidated Report Uploaded',
+                'CVO/DSP Consolidated Report Uploaded', 'consolidated_report_uploaded',
                 %s, %s, %s
             )
         """, (petition_id, cvo_user_id, cvo_user_id, consolidated_report_file, status_before, status_before))
@@ -2487,115 +4076,83 @@ def cvo_upload_consolidated_report(petition_id, cvo_user_id, consolidated_report
     finally:
         conn.close()
 
+@invalidates_petition
 def po_give_conclusion(petition_id, po_user_id, efile_no, final_conclusion, instructions=None, conclusion_file=None):
     """PO gives final conclusion and closes petition."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        
-        cur.execute("""
-            UPDATE enquiry_reports
-            SET po_conclusion = %s,
-                po_instructions = %s,
-                conclusion_file = COALESCE(%s, conclusion_file),
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = (SELECT id FROM enquiry_reports WHERE petition_id = %s ORDER BY submitted_at DESC LIMIT 1)
-        """, (final_conclusion, instructions, conclusion_file, petition_id))
-        
-        cur.execute("""
-            UPDATE petitions SET
-                efile_no = CASE
-                    WHEN COALESCE(BTRIM(efile_no), '') = '' THEN %s
-                    ELSE efile_no
-                END,
-                status = 'closed', current_handler_id = %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (efile_no, po_user_id, petition_id))
-        
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role,
-                action, comments, status_before, status_after)
-            VALUES (%s, %s, 'po', 'Final Conclusion Given - Petition Closed', %s,
-                'forwarded_to_po', 'closed')
-        """, (petition_id, po_user_id, final_conclusion))
-        
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return run_workflow_transition(
+        'final_conclusion_closed',
+        petition_id,
+        po_user_id,
+        comments=final_conclusion,
+        efile_no=efile_no,
+        instructions=instructions,
+        conclusion_file=conclusion_file,
+    )
 
 
+@invalidates_petition
 def po_send_to_cmd(petition_id, po_user_id, instructions=None, efile_no=None, cmd_user_id=None):
     """PO forwards case to concerned CMD for action based on petition target CVO."""
+    # Without an explicit assignee the CMD/CGM-HR is resolved from the petition's target CVO.
+    return run_workflow_transition(
+        'forwarded_for_action', petition_id, po_user_id, comments=instructions, efile_no=efile_no, handler_id=cmd_user_id or None
+    )
+
+
+@invalidates_petition
+def cmd_submit_action_report(petition_id, cmd_user_id, action_taken, action_report_file=None):
+    """CMD marks action taken, uploads report copy, and sends it to PO for closure."""
+    return run_workflow_transition(
+        'action_taken_copy_to_po', petition_id, cmd_user_id, comments=action_taken, action_report_file=action_report_file
+    )
+
+
+@invalidates_petition
+def po_lodge_petition(petition_id, po_user_id, lodge_remarks=None, efile_no=None):
+    """PO lodges and closes petition, either directly or after CMD action report."""
+    return run_workflow_transition('lodged_by_po', petition_id, po_user_id, comments=lodge_remarks, efile_no=efile_no)
+
+
+@invalidates_petition
+def po_update_efile_number(petition_id, po_user_id, efile_no, remarks=None):
+    """PO updates E-Office File No for direct enquiries in parallel."""
     conn = get_db()
     try:
         cur = dict_cursor(conn)
-        cur.execute("SELECT target_cvo, status FROM petitions WHERE id = %s", (petition_id,))
+        cur.execute("SELECT status, efile_no FROM petitions WHERE id = %s", (petition_id,))
         petition = cur.fetchone()
         if not petition:
             raise Exception("Petition not found.")
-
-        cmd_role = None
-        cmd_id = None
-        cmd_name = None
-        if cmd_user_id:
-            cur.execute("""
-                SELECT id, role, full_name
-                FROM users
-                WHERE id = %s
-                  AND role IN ('cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco')
-                  AND is_active = TRUE
-                LIMIT 1
-            """, (cmd_user_id,))
-            cmd_user = cur.fetchone()
-            if not cmd_user:
-                raise Exception("Selected CMD/CGM-HR assignee is invalid.")
-            cmd_id = cmd_user['id']
-            cmd_role = cmd_user['role']
-            cmd_name = (cmd_user.get('full_name') or '').strip() or None
-        else:
-            # Backward-compatible fallback for flows not yet passing an explicit assignee.
-            cmd_role_map = {'apspdcl': 'cmd_apspdcl', 'apepdcl': 'cmd_apepdcl', 'apcpdcl': 'cmd_apcpdcl', 'headquarters': 'cgm_hr_transco'}
-            cmd_role = cmd_role_map.get(petition['target_cvo'])
-            if not cmd_role:
-                raise Exception("No CMD role configured for this jurisdiction.")
-
-            cur.execute("SELECT id, full_name FROM users WHERE role = %s AND is_active = TRUE LIMIT 1", (cmd_role,))
-            cmd_user = cur.fetchone()
-            cmd_id = cmd_user['id'] if cmd_user else None
-            cmd_name = (cmd_user.get('full_name') or '').strip() if cmd_user else None
-            if not cmd_id:
-                raise Exception(f"No active user found for role {cmd_role}.")
-
         status_before = petition['status']
+        old_efile = petition.get('efile_no')
+
         cur.execute("""
             UPDATE petitions
-            SET status = 'action_instructed',
-                efile_no = CASE
+            SET efile_no = CASE
                     WHEN COALESCE(BTRIM(efile_no), '') = '' THEN %s
                     ELSE efile_no
                 END,
-                current_handler_id = %s,
                 updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
-        """, (efile_no, cmd_id, petition_id))
-
-        cur.execute("""
-            UPDATE enquiry_reports
-            SET po_instructions = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = (SELECT id FROM enquiry_reports WHERE petition_id = %s ORDER BY submitted_at DESC LIMIT 1)
-        """, (instructions, petition_id))
+        """, (efile_no, petition_id))
+        if cur.rowcount == 0:
+            conn.rollback()
+            return False
+        cur.execute("SELECT efile_no FROM petitions WHERE id = %s", (petition_id,))
+        latest = cur.fetchone()
+        latest_efile = (latest['efile_no'] if latest else None) or ''
+        if old_efile and latest_efile == old_efile:
+            conn.rollback()
+            return False
 
-        action_label = f"Forwarded to {(cmd_name or 'CMD/CGM-HR')} for Action"
+        comment = remarks or f"E-Office File No updated from '{old_efile or '-'}' to '{efile_no}'"
         cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role, action, comments, status_before, status_after)
-            VALUES (%s, %s, %s, 'po', %s, %s, %s, %s, 'action_instructed')
-        """, (petition_id, po_user_id, cmd_id, cmd_role, action_label, instructions, status_before))
+            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, action_code, comments, status_before, status_after)
+            VALUES (%s, %s, 'po', 'PO Updated E-Office File No', 'efile_updated_by_po', %s, %s, %s)
+        """, (petition_id, po_user_id, comment, status_before, status_before))
 
         conn.commit()
+        return True
     except Exception as e:
         conn.rollback()
         raise e
@@ -2603,287 +4160,43 @@ def po_send_to_cmd(petition_id, po_user_id, instructions=None, efile_no=None, cm
         conn.close()
 
 
-def cmd_submit_action_report(petition_id, cmd_user_id, action_taken, action_report_file=None):
-    """CMD marks action taken, uploads report copy, and sends it to PO for closure."""
+@invalidates_petition
+def po_direct_lodge_no_enquiry(petition_id, po_user_id, lodge_remarks=None, efile_no=None):
+    """PO directly lodges petition when enquiry/action are not required."""
+    return run_workflow_transition('direct_lodged_by_po', petition_id, po_user_id, comments=lodge_remarks, efile_no=efile_no)
+
+@invalidates_petition
+def cvo_direct_lodge_petition(petition_id, cvo_user_id, lodge_remarks=None):
+    """CVO directly lodges petition for eligible media-source cases."""
+    return run_workflow_transition('direct_lodged_by_cvo', petition_id, cvo_user_id, comments=lodge_remarks)
+
+@invalidates_petition
+def cvo_take_action(petition_id, cvo_user_id, action_taken):
+    """CVO takes necessary action and closes petition"""
+    return run_workflow_transition('action_taken', petition_id, cvo_user_id, comments=action_taken)
+
+@invalidates_petition
+def close_petition(petition_id, user_id, comments=None):
+    return run_workflow_transition('closed', petition_id, user_id, comments=comments)
+
+
+@invalidates_petition
+def po_update_efile_no(petition_id, user_id, efile_no):
+    """PO sets e-office number once without changing petition flow."""
     conn = get_db()
     try:
         cur = dict_cursor(conn)
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
+        cur.execute("SELECT status, current_handler_id FROM petitions WHERE id = %s", (petition_id,))
         petition = cur.fetchone()
-        if not petition:
-            raise Exception("Petition not found.")
-
-        cur.execute("SELECT id FROM users WHERE role = 'po' AND is_active = TRUE LIMIT 1")
-        po_user = cur.fetchone()
-        po_id = po_user['id'] if po_user else None
-        if not po_id:
-            raise Exception("No active PO user found.")
-
-        cur.execute("""
-            UPDATE enquiry_reports
-            SET action_taken = %s,
-                cmd_action_report_file = COALESCE(%s, cmd_action_report_file),
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = (SELECT id FROM enquiry_reports WHERE petition_id = %s ORDER BY submitted_at DESC LIMIT 1)
-        """, (action_taken, action_report_file, petition_id))
+        status_before = petition['status'] if petition else None
+        to_user_id = petition['current_handler_id'] if petition else None
 
         cur.execute("""
             UPDATE petitions
-            SET status = 'action_taken',
-                current_handler_id = %s,
-                updated_at = CURRENT_TIMESTAMP
+            SET efile_no = %s, updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
-        """, (po_id, petition_id))
-
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role, action, comments, status_before, status_after)
-            VALUES (
-                %s, %s, %s, (SELECT role FROM users WHERE id = %s), 'po',
-                'Action Taken - Copy Sent to PO for Closure', %s, %s, 'action_taken'
-            )
-        """, (petition_id, cmd_user_id, po_id, cmd_user_id, action_taken, petition['status']))
-
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-
-def po_lodge_petition(petition_id, po_user_id, lodge_remarks=None, efile_no=None):
-    """PO lodges and closes petition, either directly or after CMD action report."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        if not petition:
-            raise Exception("Petition not found.")
-        status_before = petition['status']
-
-        cur.execute("""
-            UPDATE petitions
-            SET status = 'lodged',
-                efile_no = CASE
-                    WHEN COALESCE(BTRIM(efile_no), '') = '' THEN %s
-                    ELSE efile_no
-                END,
-                current_handler_id = %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (efile_no, po_user_id, petition_id))
-
-        cur.execute("""
-            UPDATE enquiry_reports
-            SET po_conclusion = COALESCE(%s, po_conclusion),
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = (SELECT id FROM enquiry_reports WHERE petition_id = %s ORDER BY submitted_at DESC LIMIT 1)
-        """, (lodge_remarks, petition_id))
-
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, comments, status_before, status_after)
-            VALUES (%s, %s, 'po', 'Lodged by PO', %s, %s, 'lodged')
-        """, (petition_id, po_user_id, lodge_remarks, status_before))
-
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-
-def po_update_efile_number(petition_id, po_user_id, efile_no, remarks=None):
-    """PO updates E-Office File No for direct enquiries in parallel."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT status, efile_no FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        if not petition:
-            raise Exception("Petition not found.")
-        status_before = petition['status']
-        old_efile = petition.get('efile_no')
-
-        cur.execute("""
-            UPDATE petitions
-            SET efile_no = CASE
-                    WHEN COALESCE(BTRIM(efile_no), '') = '' THEN %s
-                    ELSE efile_no
-                END,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (efile_no, petition_id))
-        if cur.rowcount == 0:
-            conn.rollback()
-            return False
-        cur.execute("SELECT efile_no FROM petitions WHERE id = %s", (petition_id,))
-        latest = cur.fetchone()
-        latest_efile = (latest['efile_no'] if latest else None) or ''
-        if old_efile and latest_efile == old_efile:
-            conn.rollback()
-            return False
-
-        comment = remarks or f"E-Office File No updated from '{old_efile or '-'}' to '{efile_no}'"
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, comments, status_before, status_after)
-            VALUES (%s, %s, 'po', 'PO Updated E-Office File No', %s, %s, %s)
-        """, (petition_id, po_user_id, comment, status_before, status_before))
-
-        conn.commit()
-        return True
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-
-def po_direct_lodge_no_enquiry(petition_id, po_user_id, lodge_remarks=None, efile_no=None):
-    """PO directly lodges petition when enquiry/action are not required."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        if not petition:
-            raise Exception("Petition not found.")
-        status_before = petition['status']
-
-        cur.execute("""
-            UPDATE petitions
-            SET status = 'lodged',
-                efile_no = CASE
-                    WHEN COALESCE(BTRIM(efile_no), '') = '' THEN %s
-                    ELSE efile_no
-                END,
-                current_handler_id = %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (efile_no, po_user_id, petition_id))
-
-        cur.execute("""
-            UPDATE enquiry_reports
-            SET po_conclusion = COALESCE(%s, po_conclusion),
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = (SELECT id FROM enquiry_reports WHERE petition_id = %s ORDER BY submitted_at DESC LIMIT 1)
-        """, (lodge_remarks, petition_id))
-
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, comments, status_before, status_after)
-            VALUES (%s, %s, 'po', 'Direct Lodged by PO (No Enquiry/No Action Required)', %s, %s, 'lodged')
-        """, (petition_id, po_user_id, lodge_remarks, status_before))
-
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-def cvo_direct_lodge_petition(petition_id, cvo_user_id, lodge_remarks=None):
-    """CVO directly lodges petition for eligible media-source cases."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        if not petition:
-            raise Exception("Petition not found.")
-        status_before = petition['status']
-
-        cur.execute("""
-            UPDATE petitions
-            SET status = 'lodged',
-                current_handler_id = %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (cvo_user_id, petition_id))
-
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role, action, comments, status_before, status_after)
-            VALUES (%s, %s, (SELECT role FROM users WHERE id = %s), 'Direct Lodged by CVO (Media Source)', %s, %s, 'lodged')
-        """, (petition_id, cvo_user_id, cvo_user_id, lodge_remarks, status_before))
-
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-def cvo_take_action(petition_id, cvo_user_id, action_taken):
-    """CVO takes necessary action and closes petition"""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        
-        cur.execute("""
-            UPDATE enquiry_reports SET action_taken = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = (SELECT id FROM enquiry_reports WHERE petition_id = %s ORDER BY submitted_at DESC LIMIT 1)
-        """, (action_taken, petition_id))
-        
-        cur.execute("""
-            UPDATE petitions SET status = 'action_taken', updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (petition_id,))
-        
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role,
-                action, comments, status_before, status_after)
-            VALUES (%s, %s, (SELECT role FROM users WHERE id = %s), 
-                'Action Taken', %s, 'action_instructed', 'action_taken')
-        """, (petition_id, cvo_user_id, cvo_user_id, action_taken))
-        
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-def close_petition(petition_id, user_id, comments=None):
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT status FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        status_before = petition['status'] if petition else None
-
-        cur.execute("UPDATE petitions SET status = 'closed', updated_at = CURRENT_TIMESTAMP WHERE id = %s", (petition_id,))
-        
-        cur.execute("""
-            INSERT INTO petition_tracking (petition_id, from_user_id, from_role,
-                action, comments, status_before, status_after)
-            VALUES (%s, %s, (SELECT role FROM users WHERE id = %s), 
-                'Petition Closed', %s, %s, 'closed')
-        """, (petition_id, user_id, user_id, comments, status_before))
-        
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-
-def po_update_efile_no(petition_id, user_id, efile_no):
-    """PO sets e-office number once without changing petition flow."""
-    conn = get_db()
-    try:
-        cur = dict_cursor(conn)
-        cur.execute("SELECT status, current_handler_id FROM petitions WHERE id = %s", (petition_id,))
-        petition = cur.fetchone()
-        status_before = petition['status'] if petition else None
-        to_user_id = petition['current_handler_id'] if petition else None
-
-        cur.execute("""
-            UPDATE petitions
-            SET efile_no = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-              AND COALESCE(BTRIM(efile_no), '') = ''
-        """, (efile_no, petition_id))
+              AND COALESCE(BTRIM(efile_no), '') = ''
+        """, (efile_no, petition_id))
 
         if cur.rowcount == 0:
             conn.rollback()
@@ -2891,9 +4204,9 @@ def po_update_efile_no(petition_id, user_id, efile_no):
 
         cur.execute("""
             INSERT INTO petition_tracking (petition_id, from_user_id, to_user_id, from_role, to_role,
-                action, comments, status_before, status_after)
+                action, action_code, comments, status_before, status_after)
             VALUES (%s, %s, %s, 'po', (SELECT role FROM users WHERE id = %s),
-                'E-Office File Number Updated', %s, %s, %s)
+                'E-Office File Number Updated', 'efile_updated', %s, %s, %s)
         """, (
             petition_id, user_id, to_user_id, to_user_id,
             f'E-Office File No updated to: {efile_no}', status_before, status_before
@@ -2911,6 +4224,7 @@ def po_update_efile_no(petition_id, user_id, efile_no):
 # TRACKING & REPORTS
 # ========================================
 
+@cached_query(('petition:{petition_id}',))
 def get_petition_tracking(petition_id):
     conn = get_db()
     try:
@@ -2927,6 +4241,7 @@ def get_petition_tracking(petition_id):
     finally:
         conn.close()
 
+@cached_query(('petition:{petition_id}',))
 def get_enquiry_report(petition_id):
     conn = get_db()
     try:
@@ -2950,9 +4265,8 @@ def get_latest_enquiry_report_accident_details(petition_ids):
     conn = get_db()
     try:
         cur = dict_cursor(conn)
-        placeholders = ', '.join(['%s'] * len(petition_ids))
-        cur.execute(f"""
-            SELECT DISTINCT ON (er.petition_id)
+        cur.execute("""
+            SELECT
                 er.petition_id,
                 er.accident_type,
                 er.deceased_category,
@@ -2961,10 +4275,10 @@ def get_latest_enquiry_report_accident_details(petition_ids):
                 er.deceased_count,
                 er.general_public_count,
                 er.animals_count
-            FROM enquiry_reports er
-            WHERE er.petition_id IN ({placeholders})
-            ORDER BY er.petition_id, er.submitted_at DESC, er.id DESC
-        """, tuple(petition_ids))
+            FROM petitions p
+            JOIN enquiry_reports er ON er.id = p.latest_enquiry_report_id
+            WHERE p.id = ANY(%s)
+        """, (list(petition_ids),))
         out = {}
         for row in cur.fetchall():
             r = dict(row)
@@ -3006,7 +4320,7 @@ def _get_po_permission_given_count(po_user_id):
             SELECT COUNT(DISTINCT petition_id) AS c
             FROM petition_tracking
             WHERE from_user_id = %s
-              AND action = 'Permission Approved - Sent to CVO'
+              AND action_code = 'permission_approved'
         """, (po_user_id,))
         row = cur.fetchone()
         return row['c'] if row else 0
@@ -3113,9 +4427,8 @@ def _get_latest_enquiry_reports_for_petitions(petition_ids):
     conn = get_db()
     try:
         cur = dict_cursor(conn)
-        placeholders = ', '.join(['%s'] * len(petition_ids))
-        cur.execute(f"""
-            SELECT DISTINCT ON (er.petition_id)
+        cur.execute("""
+            SELECT
                 er.petition_id,
                 er.accident_type,
                 er.deceased_category,
@@ -3125,10 +4438,10 @@ def _get_latest_enquiry_reports_for_petitions(petition_ids):
                 er.general_public_count,
                 er.animals_count,
                 er.submitted_at
-            FROM enquiry_reports er
-            WHERE er.petition_id IN ({placeholders})
-            ORDER BY er.petition_id, er.submitted_at DESC, er.id DESC
-        """, tuple(petition_ids))
+            FROM petitions p
+            JOIN enquiry_reports er ON er.id = p.latest_enquiry_report_id
+            WHERE p.id = ANY(%s)
+        """, (list(petition_ids),))
         return [dict(r) for r in cur.fetchall()]
     finally:
         conn.close()
@@ -3137,7 +4450,6 @@ def _get_latest_enquiry_reports_for_petitions(petition_ids):
 def _get_electrical_accident_stats_for_petitions(petitions):
     electrical_petitions = [p for p in petitions if (p.get('petition_type') or '').strip() == 'electrical_accident']
     petition_ids = [p.get('id') for p in electrical_petitions if p.get('id')]
-    reports = _get_latest_enquiry_reports_for_petitions(petition_ids)
     stats = {
         'electrical_accident_total': len(electrical_petitions),
         'electrical_accident_fatal': 0,
@@ -3150,37 +4462,57 @@ def _get_electrical_accident_stats_for_petitions(petitions):
         'electrical_accident_animals_petitions': 0,
         'electrical_accident_animals_count': 0,
     }
-    for row in reports:
-        accident_type = (row.get('accident_type') or '').strip()
-        deceased_category = (row.get('deceased_category') or '').strip()
-        departmental_type = (row.get('departmental_type') or '').strip()
-        non_departmental_type = (row.get('non_departmental_type') or '').strip()
-        deceased_count = int(row.get('deceased_count') or 0)
-        deceased_units = deceased_count if deceased_count > 0 else 1
-        general_public_count = int(row.get('general_public_count') or 0)
-        animals_count = int(row.get('animals_count') or 0)
-
-        if accident_type == 'fatal':
-            stats['electrical_accident_fatal'] += 1
-        elif accident_type == 'non_fatal':
-            stats['electrical_accident_non_fatal'] += 1
-
-        if deceased_category == 'departmental':
-            if departmental_type in ('regular', 'outsourced'):
-                stats['electrical_accident_departmental'] += deceased_units
-            else:
-                stats['electrical_accident_departmental'] += 1
-        elif deceased_category == 'non_departmental':
-            if non_departmental_type in ('private_electricians', 'private'):
-                stats['electrical_accident_non_departmental_private'] += deceased_units
-            elif non_departmental_type in ('contract_labour', 'contract'):
-                stats['electrical_accident_non_departmental_contract'] += deceased_units
-        elif deceased_category == 'general_public':
-            stats['electrical_accident_general_public_petitions'] += 1
-            stats['electrical_accident_general_public_count'] += max(general_public_count or deceased_count, 0)
-        elif deceased_category == 'animals':
-            stats['electrical_accident_animals_petitions'] += 1
-            stats['electrical_accident_animals_count'] += max(animals_count or deceased_count, 0)
+    if not petition_ids:
+        return stats
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        # One aggregate over the latest report of each petition. Counts of deceased persons fall
+        # back to one per petition when the report leaves deceased_count empty.
+        cur.execute("""
+            WITH latest AS (
+                SELECT
+                    BTRIM(COALESCE(er.accident_type, '')) AS accident_type,
+                    BTRIM(COALESCE(er.deceased_category, '')) AS deceased_category,
+                    BTRIM(COALESCE(er.departmental_type, '')) AS departmental_type,
+                    BTRIM(COALESCE(er.non_departmental_type, '')) AS non_departmental_type,
+                    COALESCE(er.deceased_count, 0) AS deceased_count,
+                    CASE WHEN COALESCE(er.deceased_count, 0) > 0 THEN er.deceased_count ELSE 1 END AS deceased_units,
+                    GREATEST(COALESCE(NULLIF(er.general_public_count, 0), er.deceased_count, 0), 0) AS general_public_units,
+                    GREATEST(COALESCE(NULLIF(er.animals_count, 0), er.deceased_count, 0), 0) AS animal_units
+                FROM petitions p
+                JOIN enquiry_reports er ON er.id = p.latest_enquiry_report_id
+                WHERE p.id = ANY(%s)
+            )
+            SELECT
+                COUNT(*) FILTER (WHERE accident_type = 'fatal') AS fatal,
+                COUNT(*) FILTER (WHERE accident_type = 'non_fatal') AS non_fatal,
+                COALESCE(SUM(CASE
+                    WHEN departmental_type IN ('regular', 'outsourced') THEN deceased_units
+                    ELSE 1
+                END) FILTER (WHERE deceased_category = 'departmental'), 0) AS departmental,
+                COALESCE(SUM(deceased_units) FILTER (
+                    WHERE deceased_category = 'non_departmental'
+                      AND non_departmental_type IN ('private_electricians', 'private')
+                ), 0) AS non_departmental_private,
+                COALESCE(SUM(deceased_units) FILTER (
+                    WHERE deceased_category = 'non_departmental'
+                      AND non_departmental_type IN ('contract_labour', 'contract')
+                ), 0) AS non_departmental_contract,
+                COUNT(*) FILTER (WHERE deceased_category = 'general_public') AS general_public_petitions,
+                COALESCE(SUM(general_public_units) FILTER (WHERE deceased_category = 'general_public'), 0) AS general_public_count,
+                COUNT(*) FILTER (WHERE deceased_category = 'animals') AS animals_petitions,
+                COALESCE(SUM(animal_units) FILTER (WHERE deceased_category = 'animals'), 0) AS animals_count
+            FROM latest
+        """, (petition_ids,))
+        row = cur.fetchone() or {}
+    finally:
+        conn.close()
+    for key in (
+        'fatal', 'non_fatal', 'departmental', 'non_departmental_private', 'non_departmental_contract',
+        'general_public_petitions', 'general_public_count', 'animals_petitions', 'animals_count',
+    ):
+        stats[f'electrical_accident_{key}'] = int(row.get(key) or 0)
     return stats
 
 
@@ -3294,7 +4626,7 @@ def get_dashboard_drilldown(user_role, user_id, cvo_office, metric):
                 SELECT DISTINCT petition_id
                 FROM petition_tracking
                 WHERE from_user_id = %s
-                  AND action = 'Permission Approved - Sent to CVO'
+                  AND action_code = 'permission_approved'
             """, (user_id,))
             ids = [r['petition_id'] for r in cur.fetchall()]
             if not ids:
@@ -3362,6 +4694,14 @@ def _get_sla_stats_for_petitions(petitions):
     }
 
 
+# SLA days per rule, shared by _resolve_sla_policy_for_petition and its SQL form _SLA_DAYS_SQL.
+SLA_PRELIMINARY_DAYS = 15
+SLA_SPECIAL_DAYS = 45
+SLA_GENERAL_DAYS = 90
+SLA_SPECIAL_PETITION_TYPES = ('electrical_accident',)
+SLA_SPECIAL_SOURCES = ('media',)
+
+
 def _resolve_sla_policy_for_petition(petition, converted_to_detailed=False):
     petition_type = (petition.get('petition_type') or '').strip()
     source = (petition.get('source_of_petition') or '').strip()
@@ -3369,28 +4709,61 @@ def _resolve_sla_policy_for_petition(petition, converted_to_detailed=False):
 
     if enquiry_type == 'preliminary':
         return {
-            'sla_days': 15,
+            'sla_days': SLA_PRELIMINARY_DAYS,
             'escalation_days': None,
             'auto_escalate_to_po_days': 90,
             'rule_code': 'PRELIMINARY_15',
         }
 
-    if petition_type == 'electrical_accident' or source == 'media':
+    if petition_type in SLA_SPECIAL_PETITION_TYPES or source in SLA_SPECIAL_SOURCES:
         return {
-            'sla_days': 45,
+            'sla_days': SLA_SPECIAL_DAYS,
             'escalation_days': 60,
             'auto_escalate_to_po_days': 90,
             'rule_code': 'DETAILED_SPECIAL_45_ESC60',
         }
 
     return {
-        'sla_days': 90,
+        'sla_days': SLA_GENERAL_DAYS,
         'escalation_days': 90,
         'auto_escalate_to_po_days': 90,
         'rule_code': 'DETAILED_GENERAL_90',
     }
 
 
+def _sql_text_list(values):
+    return ', '.join("'" + value.replace("'", "''") + "'" for value in values)
+
+
+# SQL form of the sla_days rule above over an aliased petitions row `p`, built from the same constants.
+_SLA_DAYS_SQL = f"""
+    CASE
+        WHEN LOWER(TRIM(COALESCE(NULLIF(p.enquiry_type, ''), 'detailed'))) = 'preliminary' THEN {SLA_PRELIMINARY_DAYS}
+        WHEN p.petition_type::text IN ({_sql_text_list(SLA_SPECIAL_PETITION_TYPES)})
+            OR TRIM(COALESCE(p.source_of_petition, '')) IN ({_sql_text_list(SLA_SPECIAL_SOURCES)}) THEN {SLA_SPECIAL_DAYS}
+        ELSE {SLA_GENERAL_DAYS}
+    END
+"""
+
+
+# First assignment, first closure and detailed-enquiry conversion of one petition, as used by
+# get_sla_evaluation_rows; format with the alias of the petition row.
+_SLA_TRACKING_SQL = """
+    SELECT
+        MIN(CASE WHEN pt.status_after = 'assigned_to_inspector' THEN pt.created_at END) AS assigned_at,
+        MIN(CASE WHEN pt.status_after = 'closed' THEN pt.created_at END) AS closed_at,
+        MAX(
+            CASE
+                WHEN pt.action_code IN ('inspector_requested_detailed_enquiry', 'cvo_requested_detailed_enquiry', 'detailed_enquiry_permission')
+                THEN 1
+                ELSE 0
+            END
+        ) AS converted_to_detailed
+    FROM petition_tracking pt
+    WHERE pt.petition_id = {petition}.id
+"""
+
+
 def _resolve_sla_days_for_petition(petition, converted_to_detailed=False):
     return _resolve_sla_policy_for_petition(petition, converted_to_detailed).get('sla_days') or 0
 
@@ -3426,8 +4799,7 @@ def get_sla_evaluation_rows(petitions):
                 MIN(CASE WHEN status_after = 'closed' THEN created_at END) AS closed_at,
                 MAX(
                     CASE
-                        WHEN LOWER(COALESCE(action, '')) LIKE '%%detailed enquiry%%'
-                         AND LOWER(COALESCE(action, '')) LIKE '%%permission%%'
+                        WHEN action_code IN ('inspector_requested_detailed_enquiry', 'cvo_requested_detailed_enquiry', 'detailed_enquiry_permission')
                         THEN 1
                         ELSE 0
                     END
@@ -3447,43 +4819,48 @@ def get_sla_evaluation_rows(petitions):
         petition_id = petition.get('id')
         if not petition_id:
             continue
-        track = tracking_index.get(petition_id) or {}
-        assigned_at = track.get('assigned_at')
-        closed_at = track.get('closed_at')
-        if not assigned_at:
-            continue
+        row = _build_sla_evaluation_row(petition, tracking_index.get(petition_id) or {}, now)
+        if row:
+            out.append(row)
+    return out
 
-        converted_to_detailed = bool(track.get('converted_to_detailed'))
-        sla_policy = _resolve_sla_policy_for_petition(petition, converted_to_detailed)
-        sla_days = sla_policy.get('sla_days') or 0
-        escalation_days = sla_policy.get('escalation_days')
-        auto_escalate_to_po_days = sla_policy.get('auto_escalate_to_po_days')
-        end_time = closed_at or now
-        elapsed_days = max(0, (end_time - assigned_at).days)
 
-        if closed_at:
-            sla_state = 'within' if elapsed_days <= sla_days else 'beyond'
-            sla_bucket = sla_state
-        else:
-            sla_state = 'beyond' if elapsed_days > sla_days else 'in_progress'
-            sla_bucket = 'beyond' if elapsed_days > sla_days else 'within'
-
-        row = dict(petition)
-        row.update({
-            'assigned_at': assigned_at,
-            'closed_at': closed_at,
-            'converted_to_detailed': converted_to_detailed,
-            'sla_days': sla_days,
-            'escalation_days': escalation_days,
-            'auto_escalate_to_po_days': auto_escalate_to_po_days,
-            'elapsed_days': elapsed_days,
-            'sla_state': sla_state,
-            'sla_bucket': sla_bucket,
-            'sla_rule_code': sla_policy.get('rule_code'),
-        })
-        row['is_beyond_sla_for_po'] = _is_po_beyond_sla_row(row)
-        out.append(row)
-    return out
+def _build_sla_evaluation_row(petition, track, now):
+    assigned_at = track.get('assigned_at')
+    closed_at = track.get('closed_at')
+    if not assigned_at:
+        return None
+
+    converted_to_detailed = bool(track.get('converted_to_detailed'))
+    sla_policy = _resolve_sla_policy_for_petition(petition, converted_to_detailed)
+    sla_days = sla_policy.get('sla_days') or 0
+    escalation_days = sla_policy.get('escalation_days')
+    auto_escalate_to_po_days = sla_policy.get('auto_escalate_to_po_days')
+    end_time = closed_at or now
+    elapsed_days = max(0, (end_time - assigned_at).days)
+
+    if closed_at:
+        sla_state = 'within' if elapsed_days <= sla_days else 'beyond'
+        sla_bucket = sla_state
+    else:
+        sla_state = 'beyond' if elapsed_days > sla_days else 'in_progress'
+        sla_bucket = 'beyond' if elapsed_days > sla_days else 'within'
+
+    row = dict(petition)
+    row.update({
+        'assigned_at': assigned_at,
+        'closed_at': closed_at,
+        'converted_to_detailed': converted_to_detailed,
+        'sla_days': sla_days,
+        'escalation_days': escalation_days,
+        'auto_escalate_to_po_days': auto_escalate_to_po_days,
+        'elapsed_days': elapsed_days,
+        'sla_state': sla_state,
+        'sla_bucket': sla_bucket,
+        'sla_rule_code': sla_policy.get('rule_code'),
+    })
+    row['is_beyond_sla_for_po'] = _is_po_beyond_sla_row(row)
+    return row
 
 
 def get_po_beyond_sla_petition_ids(petitions):
@@ -3491,15 +4868,104 @@ def get_po_beyond_sla_petition_ids(petitions):
     return [int(r['id']) for r in rows if r.get('id') and _is_po_beyond_sla_row(r)]
 
 
-def _get_sla_filtered_petitions(petitions, metric):
-    rows = get_sla_evaluation_rows(petitions)
-    if metric == 'sla_total':
-        return rows
-    if metric == 'sla_closed_total':
-        return [r for r in rows if r.get('closed_at')]
-    if metric == 'sla_open_total':
-        return [r for r in rows if not r.get('closed_at')]
-    if metric == 'sla_closed_within':
+# Smallest auto_escalate_to_po_days returned by _resolve_sla_policy_for_petition. SLA starts at
+# first assignment, which never precedes petition creation, so younger petitions are skipped.
+SLA_SWEEP_MIN_AGE_DAYS = 90
+_SLA_SWEEP_LOCK_KEY = 720301
+
+
+@invalidates_petition_lists
+def run_sla_escalation_sweep(batch_size=500):
+    """Persist the PO auto-escalation flag for open petitions past their SLA threshold.
+
+    Candidates are walked in primary-key batches over the partial pending index and
+    evaluated with get_sla_evaluation_rows, so the flag matches _is_po_beyond_sla_row.
+    Elapsed time only grows until closure, so a flag is set once and cleared on close.
+    petition_ids lists the petitions whose flag flipped, for a targeted rollup refresh.
+    """
+    batch_size = max(1, int(batch_size or 500))
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("SELECT pg_try_advisory_lock(%s) AS locked", (_SLA_SWEEP_LOCK_KEY,))
+        lock_row = cur.fetchone()
+        if not lock_row or not lock_row.get('locked'):
+            conn.rollback()
+            return {'escalated': 0, 'cleared': 0, 'scanned': 0, 'skipped': True, 'petition_ids': []}
+        try:
+            cur.execute("""
+                UPDATE petitions
+                SET is_sla_escalated = FALSE,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE is_sla_escalated = TRUE AND status = 'closed'
+                RETURNING id
+            """)
+            changed_ids = [int(r['id']) for r in cur.fetchall()]
+            cleared = len(changed_ids)
+            conn.commit()
+
+            escalated = 0
+            scanned = 0
+            last_id = 0
+            while True:
+                cur.execute("""
+                    SELECT id, petition_type, source_of_petition, enquiry_type
+                    FROM petitions
+                    WHERE is_sla_escalated = FALSE
+                      AND status <> 'closed'
+                      AND id > %s
+                      AND created_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+                    ORDER BY id
+                    LIMIT %s
+                """, (last_id, SLA_SWEEP_MIN_AGE_DAYS, batch_size))
+                batch = [dict(r) for r in cur.fetchall()]
+                if not batch:
+                    break
+                scanned += len(batch)
+                last_id = int(batch[-1]['id'])
+                due_ids = [int(r['id']) for r in get_sla_evaluation_rows(batch) if _is_po_beyond_sla_row(r)]
+                if due_ids:
+                    cur.execute("""
+                        UPDATE petitions
+                        SET is_sla_escalated = TRUE,
+                            sla_escalated_at = CURRENT_TIMESTAMP,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = ANY(%s) AND is_sla_escalated = FALSE
+                        RETURNING id
+                    """, (due_ids,))
+                    flagged = [int(r['id']) for r in cur.fetchall()]
+                    escalated += len(flagged)
+                    changed_ids.extend(flagged)
+                conn.commit()
+                if len(batch) < batch_size:
+                    break
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (_SLA_SWEEP_LOCK_KEY,))
+            conn.commit()
+        return {
+            'escalated': escalated,
+            'cleared': cleared,
+            'scanned': scanned,
+            'skipped': False,
+            'petition_ids': changed_ids,
+        }
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def _get_sla_filtered_petitions(petitions, metric):
+    rows = get_sla_evaluation_rows(petitions)
+    if metric == 'sla_total':
+        return rows
+    if metric == 'sla_closed_total':
+        return [r for r in rows if r.get('closed_at')]
+    if metric == 'sla_open_total':
+        return [r for r in rows if not r.get('closed_at')]
+    if metric == 'sla_closed_within':
         return [r for r in rows if r.get('closed_at') and r.get('sla_state') == 'within']
     if metric == 'sla_closed_beyond':
         return [r for r in rows if r.get('closed_at') and r.get('sla_state') == 'beyond']
@@ -3538,8 +5004,7 @@ def _get_sla_stats(conn, user_role, user_id=None):
             MIN(CASE WHEN pt.status_after = 'closed' THEN pt.created_at END) AS closed_at,
             MAX(
                 CASE
-                    WHEN LOWER(COALESCE(pt.action, '')) LIKE '%%detailed enquiry%%'
-                     AND LOWER(COALESCE(pt.action, '')) LIKE '%%permission%%'
+                    WHEN pt.action_code IN ('inspector_requested_detailed_enquiry', 'cvo_requested_detailed_enquiry', 'detailed_enquiry_permission')
                     THEN 1
                     ELSE 0
                 END
@@ -3643,13 +5108,16 @@ def _get_user_roles_map(user_ids):
         conn.close()
 
 
+SLA_OFFICER_ROLES = (
+    'cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco',
+    'dsp', 'cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'inspector',
+)
+
+
 def _resolve_sla_row_officer(row, user_roles=None):
     # Prefer current handler so dashboard reflects "petitions with officer now";
     # fallback to assigned inspector for rows without a current handler.
-    allowed_roles = {
-        'cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco',
-        'dsp', 'cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'inspector'
-    }
+    allowed_roles = set(SLA_OFFICER_ROLES)
     role_map = user_roles or {}
 
     handler_id = int(row.get('current_handler_id') or 0)
@@ -3666,6 +5134,7 @@ def _resolve_sla_row_officer(row, user_roles=None):
     return 0, ''
 
 
+@cached_query(petition_scope_cache_tags)
 def get_sla_dashboard_data_for_user(user_role, user_id=None, cvo_office=None):
     petitions = get_petitions_for_user(user_id, user_role, cvo_office, status_filter=None)
     if user_role == 'data_entry' and user_id:
@@ -3747,75 +5216,1156 @@ def get_sla_dashboard_data_for_user(user_role, user_id=None, cvo_office=None):
     }
 
 
+def _empty_sla_employee_summary():
+    return {
+        'total': 0,
+        'closed_total': 0,
+        'open_total': 0,
+        'closed_within': 0,
+        'closed_beyond': 0,
+        'open_within': 0,
+        'open_beyond': 0,
+        'total_within': 0,
+        'total_beyond': 0,
+        'within': 0,
+        'beyond': 0,
+        'in_progress': 0,
+    }
+
+
 def get_sla_employee_profile_for_user(user_role, viewer_user_id, cvo_office, officer_id):
-    dashboard_data = get_sla_dashboard_data_for_user(user_role, viewer_user_id, cvo_office)
+    """SLA profile for one officer within the viewer's petition scope.
+
+    Resolves the officer's petitions the same way as _resolve_sla_row_officer (current handler
+    with an officer role, else assigned inspector) and aggregates the SLA buckets in SQL, so a
+    profile no longer rebuilds the whole dashboard.
+    """
+    officer_id = int(officer_id)
     privileged_full_access = user_role in ('super_admin', 'po')
-    allowed_officer_ids = {
-        int(e.get('officer_id') or 0)
-        for e in dashboard_data.get('employees', [])
-        if int(e.get('officer_id') or 0)
-    }
-    if not privileged_full_access and int(officer_id) not in allowed_officer_ids:
+    conditions, params = _petition_scope_conditions(viewer_user_id, user_role)
+    if user_role == 'data_entry' and viewer_user_id:
+        conditions.append("(p.created_by = %s OR p.current_handler_id = %s)")
+        params.extend([viewer_user_id, viewer_user_id])
+    conditions.append("""
+        (
+            (p.current_handler_id = %s AND COALESCE(uh.role::text, '') = ANY(%s))
+            OR (
+                p.assigned_inspector_id = %s
+                AND (ui.id IS NULL OR ui.role::text = ANY(%s))
+                AND NOT (COALESCE(p.current_handler_id, 0) > 0 AND COALESCE(uh.role::text, '') = ANY(%s))
+            )
+        )
+    """)
+    roles = list(SLA_OFFICER_ROLES)
+    params.extend([officer_id, roles, officer_id, roles, roles])
+
+    query = f"""
+        WITH officer_petitions AS (
+            SELECT p.*,
+                u1.full_name AS created_by_name,
+                ui.full_name AS inspector_name,
+                uh.full_name AS handler_name,
+                {_SLA_DAYS_SQL} AS sla_days_sql
+            FROM petitions p
+            LEFT JOIN users u1 ON p.created_by = u1.id
+            LEFT JOIN users ui ON p.assigned_inspector_id = ui.id
+            LEFT JOIN users uh ON p.current_handler_id = uh.id
+            WHERE {' AND '.join(conditions)}
+        ),
+        evaluated AS (
+            SELECT op.*, t.assigned_at, t.closed_at, t.converted_to_detailed,
+                GREATEST(0, EXTRACT(DAY FROM COALESCE(t.closed_at, LOCALTIMESTAMP) - t.assigned_at))::int AS elapsed_days_sql
+            FROM officer_petitions op
+            JOIN LATERAL ({_SLA_TRACKING_SQL.format(petition='op')}) t ON t.assigned_at IS NOT NULL
+        )
+        SELECT e.*,
+            COUNT(*) FILTER (WHERE e.closed_at IS NOT NULL) OVER () AS agg_closed_total,
+            COUNT(*) FILTER (WHERE e.closed_at IS NOT NULL AND e.elapsed_days_sql <= e.sla_days_sql) OVER () AS agg_closed_within,
+            COUNT(*) FILTER (WHERE e.closed_at IS NOT NULL AND e.elapsed_days_sql > e.sla_days_sql) OVER () AS agg_closed_beyond,
+            COUNT(*) FILTER (WHERE e.closed_at IS NULL AND e.elapsed_days_sql <= e.sla_days_sql) OVER () AS agg_open_within,
+            COUNT(*) FILTER (WHERE e.closed_at IS NULL AND e.elapsed_days_sql > e.sla_days_sql) OVER () AS agg_open_beyond
+        FROM evaluated e
+        ORDER BY e.created_at DESC
+    """
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute(query, params)
+        fetched = [dict(r) for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+    if not privileged_full_access and not fetched and officer_id != int(viewer_user_id or 0):
         return {
             'officer': None,
-            'summary': {
-                'total': 0,
-                'closed_total': 0,
-                'open_total': 0,
-                'closed_within': 0,
-                'closed_beyond': 0,
-                'open_within': 0,
-                'open_beyond': 0,
-                'total_within': 0,
-                'total_beyond': 0,
-                'within': 0,
-                'beyond': 0,
-                'in_progress': 0,
-            },
+            'summary': _empty_sla_employee_summary(),
             'petitions': [],
             'unauthorized': True,
         }
 
-    relevant_user_ids = set()
-    for r in dashboard_data.get('petitions', []):
-        hid = int(r.get('current_handler_id') or 0)
-        iid = int(r.get('assigned_inspector_id') or 0)
-        if hid:
-            relevant_user_ids.add(hid)
-        if iid:
-            relevant_user_ids.add(iid)
-    user_roles = _get_user_roles_map(list(relevant_user_ids))
+    summary = _empty_sla_employee_summary()
+    if fetched:
+        head = fetched[0]
+        closed_within = int(head.get('agg_closed_within') or 0)
+        closed_beyond = int(head.get('agg_closed_beyond') or 0)
+        open_within = int(head.get('agg_open_within') or 0)
+        open_beyond = int(head.get('agg_open_beyond') or 0)
+        closed_total = int(head.get('agg_closed_total') or 0)
+        open_total = open_within + open_beyond
+        summary.update({
+            'total': closed_total + open_total,
+            'closed_total': closed_total,
+            'open_total': open_total,
+            'closed_within': closed_within,
+            'closed_beyond': closed_beyond,
+            'open_within': open_within,
+            'open_beyond': open_beyond,
+            'total_within': (closed_within + open_within),
+            'total_beyond': (closed_beyond + open_beyond),
+            # Backward compatibility
+            'within': (closed_within + open_within),
+            'beyond': (closed_beyond + open_beyond),
+            'in_progress': open_total,
+        })
+
+    now = datetime.now()
+    petitions = []
+    for raw in fetched:
+        track = {k: raw.pop(k, None) for k in ('assigned_at', 'closed_at', 'converted_to_detailed')}
+        for key in ('sla_days_sql', 'elapsed_days_sql', 'agg_closed_total', 'agg_closed_within',
+                    'agg_closed_beyond', 'agg_open_within', 'agg_open_beyond'):
+            raw.pop(key, None)
+        row = _build_sla_evaluation_row(raw, track, now)
+        if row:
+            petitions.append(row)
 
-    petitions = [
-        row for row in dashboard_data.get('petitions', [])
-        if int(_resolve_sla_row_officer(row, user_roles=user_roles)[0] or 0) == int(officer_id)
-    ]
-    closed_rows = [p for p in petitions if p.get('closed_at')]
-    open_rows = [p for p in petitions if not p.get('closed_at')]
-    closed_within = sum(1 for p in closed_rows if p.get('sla_state') == 'within')
-    closed_beyond = sum(1 for p in closed_rows if p.get('sla_state') == 'beyond')
-    open_within = sum(1 for p in open_rows if p.get('sla_bucket') == 'within')
-    open_beyond = sum(1 for p in open_rows if p.get('sla_bucket') == 'beyond')
-    summary = {
-        'total': len(petitions),
-        'closed_total': len(closed_rows),
-        'open_total': len(open_rows),
-        'closed_within': closed_within,
-        'closed_beyond': closed_beyond,
-        'open_within': open_within,
-        'open_beyond': open_beyond,
-        'total_within': (closed_within + open_within),
-        'total_beyond': (closed_beyond + open_beyond),
-        # Backward compatibility
-        'within': (closed_within + open_within),
-        'beyond': (closed_beyond + open_beyond),
-        'in_progress': len(open_rows),
-    }
-    officer = get_user_by_id(officer_id)
     return {
-        'officer': officer,
+        'officer': get_user_by_id(officer_id),
         'summary': summary,
         'petitions': petitions,
         'unauthorized': False,
     }
 
+
+# ========================================
+# WORK QUEUE (INBOX)
+# ========================================
+
+# Upsert the inbox row of each open, handled petition in {source} (aliased p; the petitions
+# table or the RETURNING rows of a workflow UPDATE). `since` only moves when the handler or
+# status changes; due_at is the received date plus the petition's SLA days.
+_INBOX_UPSERT_SQL = """
+    INSERT INTO inbox (petition_id, user_id, status, since, due_at)
+    SELECT p.id, p.current_handler_id, p.status::text, {since},
+        COALESCE(p.received_date, CURRENT_DATE) + (""" + _SLA_DAYS_SQL + """)
+    FROM {source} p
+    WHERE p.current_handler_id IS NOT NULL AND p.status::text <> 'closed'{where}
+    ON CONFLICT (petition_id) DO UPDATE SET
+        user_id = EXCLUDED.user_id,
+        status = EXCLUDED.status,
+        since = CASE
+            WHEN inbox.user_id = EXCLUDED.user_id AND inbox.status = EXCLUDED.status THEN inbox.since
+            ELSE EXCLUDED.since
+        END,
+        due_at = EXCLUDED.due_at
+"""
+
+# Drop the inbox row of each petition in {source} that was closed or lost its handler.
+_INBOX_DELETE_SQL = """
+    DELETE FROM inbox i
+    USING {source} p
+    WHERE i.petition_id = p.id
+      AND (p.current_handler_id IS NULL OR p.status::text = 'closed'){where}
+"""
+
+INBOX_PAGE_MAX = 100
+
+
+def _sync_inbox(cur, petition_ids):
+    """Bring the inbox rows of petition_ids in line with petitions, inside the caller's transaction."""
+    params = {'petition_ids': [int(pid) for pid in petition_ids]}
+    where = " AND p.id = ANY(%(petition_ids)s)"
+    inbox_rows_sql = "SELECT petition_id, user_id, status FROM inbox WHERE petition_id = ANY(%(petition_ids)s)"
+    prior = {}
+    if config.EVENTS_ENABLED:
+        cur.execute(inbox_rows_sql, params)
+        prior = {row['petition_id']: row['user_id'] for row in cur.fetchall()}
+    cur.execute(_INBOX_DELETE_SQL.format(source='petitions', where=where), params)
+    cur.execute(_INBOX_UPSERT_SQL.format(source='petitions', since='CURRENT_TIMESTAMP', where=where), params)
+    if config.EVENTS_ENABLED:
+        cur.execute(inbox_rows_sql, params)
+        current = {row['petition_id']: row for row in cur.fetchall()}
+        notify_inbox_changes(cur, [
+            (pid, prior.get(pid), (current.get(pid) or {}).get('user_id'), (current.get(pid) or {}).get('status'))
+            for pid in params['petition_ids']
+        ])
+
+
+def get_inbox_counts(user_id):
+    """Open items in a user's queue: total, per status, overdue and arrived today."""
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("""
+            SELECT status, COUNT(*) AS total,
+                COUNT(*) FILTER (WHERE due_at < CURRENT_DATE) AS overdue,
+                COUNT(*) FILTER (WHERE since >= CURRENT_DATE) AS today
+            FROM inbox
+            WHERE user_id = %s
+            GROUP BY status
+        """, (user_id,))
+        counts = {'total': 0, 'overdue': 0, 'today': 0, 'by_status': {}}
+        for row in cur.fetchall():
+            counts['by_status'][row['status']] = int(row['total'])
+            counts['total'] += int(row['total'])
+            counts['overdue'] += int(row['overdue'])
+            counts['today'] += int(row['today'])
+        return counts
+    finally:
+        conn.close()
+
+
+def get_inbox_page(user_id, limit=25, after=None, status=None):
+    """One page of a user's queue, newest arrivals first.
+
+    `after` is the (since, petition_id) pair of the last row of the previous page; the
+    returned next_cursor is that pair for this page, or None on the last page.
+    """
+    limit = max(1, min(int(limit or 25), INBOX_PAGE_MAX))
+    conditions = ["i.user_id = %s"]
+    params = [user_id]
+    if status:
+        conditions.append("i.status = %s")
+        params.append(status)
+    if after:
+        conditions.append("(i.since, i.petition_id) < (%s, %s)")
+        params.extend([after[0], int(after[1])])
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute(f"""
+            SELECT i.petition_id, i.status, i.since, i.due_at,
+                p.sno, p.subject, p.petitioner_name, p.petition_type, p.received_date
+            FROM inbox i
+            JOIN petitions p ON p.id = i.petition_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY i.since DESC, i.petition_id DESC
+            LIMIT %s
+        """, params + [limit + 1])
+        rows = [dict(r) for r in cur.fetchall()]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['since'], rows[-1]['petition_id'])
+        return {'items': rows, 'next_cursor': next_cursor}
+    finally:
+        conn.close()
+
+
+# ========================================
+# PETITIONER DIRECTORY
+# ========================================
+
+def normalize_petitioner_key(value):
+    return ' '.join((value or '').split()).lower()
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_petitioner_directory(user_id, user_role, query, limit=12):
+    """Petitioner names matching `query` (substring, case-insensitive) with petition counts.
+
+    Roles that see every petition read the directory table; scoped roles aggregate their
+    visible petitions on the indexed name key so counts respect the same visibility rules.
+    """
+    key = normalize_petitioner_key(query)
+    if len(key) < 2:
+        return []
+    pattern = f"%{_escape_like(key)}%"
+    limit = max(1, min(int(limit or 12), 50))
+    conditions, params = _petition_scope_conditions(user_id, user_role)
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        if not conditions:
+            cur.execute("""
+                SELECT display_name AS name, petition_count AS count
+                FROM petitioner_directory
+                WHERE name_key LIKE %s
+                ORDER BY petition_count DESC, name_key
+                LIMIT %s
+            """, (pattern, limit))
+        else:
+            conditions.append("p.petitioner_name_key LIKE %s")
+            conditions.append("NOT (p.petitioner_name_key = ANY(%s))")
+            params.extend([pattern, list(PETITIONER_EXCLUDED_KEYS), limit])
+            cur.execute(f"""
+                SELECT
+                    (ARRAY_AGG(
+                        BTRIM(REGEXP_REPLACE(p.petitioner_name, '\\s+', ' ', 'g'))
+                        ORDER BY p.created_at DESC, p.id DESC
+                    ))[1] AS name,
+                    COUNT(*) AS count
+                FROM petitions p
+                WHERE {' AND '.join(conditions)}
+                GROUP BY p.petitioner_name_key
+                ORDER BY COUNT(*) DESC, p.petitioner_name_key
+                LIMIT %s
+            """, tuple(params))
+        return [{'name': r['name'], 'count': int(r['count'] or 0)} for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def get_petitioner_petitions(user_id, user_role, petitioner_name):
+    """Visible petitions of one petitioner (exact normalized name), newest first."""
+    key = normalize_petitioner_key(petitioner_name)
+    if key in PETITIONER_EXCLUDED_KEYS:
+        return []
+    conditions, params = _petition_scope_conditions(user_id, user_role)
+    conditions.append("p.petitioner_name_key = %s")
+    params.append(key)
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute(f"""
+            SELECT p.id, p.sno, p.subject, p.status, p.petition_type, p.source_of_petition,
+                p.received_date, p.petitioner_name
+            FROM petitions p
+            WHERE {' AND '.join(conditions)}
+            ORDER BY p.received_date DESC NULLS LAST, p.id DESC
+        """, tuple(params))
+        return [dict(r) for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+# ========================================
+# ANALYTICS ROLLUPS
+# ========================================
+
+_PETITION_ROLLUP_LOCK_KEY = 720302
+_PETITION_ROLLUP_COLUMNS = (
+    'received_day', 'target_cvo', 'received_at', 'petition_type', 'source_of_petition', 'status',
+    'officer_id', 'requires_permission', 'enquiry_type', 'is_overdue_escalated', 'sla_bucket',
+)
+
+
+def _petition_rollup_key(petition, sla_bucket):
+    return (
+        petition.get('received_date'),
+        petition.get('target_cvo'),
+        petition.get('received_at'),
+        petition.get('petition_type'),
+        petition.get('source_of_petition'),
+        petition.get('status'),
+        petition.get('assigned_inspector_id'),
+        bool(petition.get('requires_permission')),
+        petition.get('enquiry_type'),
+        bool(petition.get('is_overdue_escalated')),
+        sla_bucket or '',
+    )
+
+
+def _rollup_day_filter(column, days):
+    """(sql, params) matching `column` against days; None in days matches NULL."""
+    dated = [d for d in days if d is not None]
+    return f"({column} = ANY(%s) OR (%s AND {column} IS NULL))", [dated, len(dated) != len(days)]
+
+
+def refresh_petition_rollups(days=None, petition_ids=None, batch_size=2000):
+    """Recompute petition_daily_rollups.
+
+    With neither argument every day is rebuilt and petition_rollup_state is stamped, which
+    is what makes get_petition_rollup_rows answer. Otherwise only the given received days,
+    or the received days of the given petitions, are replaced. SLA buckets are evaluated
+    with get_sla_evaluation_rows so they match the per-petition dashboards as of the refresh.
+    """
+    full_rebuild = days is None and petition_ids is None
+    batch_size = max(1, int(batch_size or 2000))
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        if petition_ids is not None:
+            cur.execute(
+                "SELECT DISTINCT received_date FROM petitions WHERE id = ANY(%s)",
+                (list(petition_ids),),
+            )
+            days = [r['received_date'] for r in cur.fetchall()]
+        if not full_rebuild and not days:
+            return {'rows': 0, 'petitions': 0}
+        day_sql, day_params = ('TRUE', []) if full_rebuild else _rollup_day_filter('received_date', list(days))
+
+        counts = Counter()
+        scanned = 0
+        last_id = 0
+        while True:
+            cur.execute(f"""
+                SELECT id, received_date, target_cvo, received_at, petition_type::text AS petition_type,
+                       source_of_petition, status::text AS status, assigned_inspector_id,
+                       requires_permission, enquiry_type, is_overdue_escalated
+                FROM petitions
+                WHERE id > %s AND {day_sql}
+                ORDER BY id
+                LIMIT %s
+            """, [last_id] + day_params + [batch_size])
+            batch = [dict(r) for r in cur.fetchall()]
+            if not batch:
+                break
+            scanned += len(batch)
+            last_id = int(batch[-1]['id'])
+            buckets = {r['id']: r.get('sla_bucket') for r in get_sla_evaluation_rows(batch)}
+            for petition in batch:
+                counts[_petition_rollup_key(petition, buckets.get(petition['id']))] += 1
+            if len(batch) < batch_size:
+                break
+
+        # Refreshes replace whole days; serialize only the swap so two writers never both insert
+        # a day, while the scan above runs unlocked and never queues request-path refreshes.
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_PETITION_ROLLUP_LOCK_KEY,))
+        if full_rebuild:
+            cur.execute("DELETE FROM petition_daily_rollups")
+        else:
+            delete_sql, delete_params = _rollup_day_filter('received_day', list(days))
+            cur.execute(f"DELETE FROM petition_daily_rollups WHERE {delete_sql}", delete_params)
+        if counts:
+            psycopg2.extras.execute_values(
+                cur,
+                f"INSERT INTO petition_daily_rollups ({', '.join(_PETITION_ROLLUP_COLUMNS)}, petition_count) VALUES %s",
+                [key + (count,) for key, count in counts.items()],
+                page_size=1000,
+            )
+        if full_rebuild:
+            cur.execute("""
+                INSERT INTO petition_rollup_state (id, rebuilt_at) VALUES (1, CURRENT_TIMESTAMP)
+                ON CONFLICT (id) DO UPDATE SET rebuilt_at = EXCLUDED.rebuilt_at
+            """)
+        conn.commit()
+        return {'rows': len(counts), 'petitions': scanned}
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def _petition_rollup_scope_conditions(user_id, user_role):
+    """Rollup form of _petition_scope_conditions, or None when the scope needs per-petition columns."""
+    if user_role == 'po' or user_role in ('cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco'):
+        return None
+    if user_role in ('cvo_apspdcl', 'cvo_apepdcl', 'cvo_apcpdcl', 'dsp'):
+        targets = _target_cvos_for_cvo_role(user_role)
+        if not targets:
+            return ["1 = 0"], []
+        return ["r.target_cvo = ANY(%s)"], [targets]
+    if user_role == 'inspector':
+        return ["r.officer_id = %s"], [user_id]
+    return [], []
+
+
+def get_petition_rollup_rows(user_id, user_role):
+    """Visible daily rollup rows shaped like petition dicts, plus petition_count and sla_bucket.
+
+    Returns None when the role cannot be answered from rollups or no full rebuild has run
+    yet; callers then fall back to the per-petition list.
+    """
+    scope = _petition_rollup_scope_conditions(user_id, user_role)
+    if scope is None:
+        return None
+    conditions, params = scope
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("SELECT rebuilt_at FROM petition_rollup_state WHERE id = 1")
+        if not cur.fetchone():
+            return None
+        cur.execute(f"""
+            SELECT r.received_day AS received_date, r.target_cvo, r.received_at, r.petition_type,
+                   r.source_of_petition, r.status, r.officer_id AS assigned_inspector_id,
+                   u.full_name AS inspector_name, r.requires_permission, r.enquiry_type,
+                   r.is_overdue_escalated, r.sla_bucket, SUM(r.petition_count)::int AS petition_count
+            FROM petition_daily_rollups r
+            LEFT JOIN users u ON u.id = r.officer_id
+            {where_sql}
+            GROUP BY r.received_day, r.target_cvo, r.received_at, r.petition_type, r.source_of_petition,
+                     r.status, r.officer_id, u.full_name, r.requires_permission, r.enquiry_type,
+                     r.is_overdue_escalated, r.sla_bucket
+        """, params)
+        return [dict(row) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+# ========================================
+# ANALYSIS REPORT SNAPSHOTS
+# ========================================
+
+# Roles whose petition visibility depends on the user themselves; every other role sees the
+# same petitions as its peers, so they share report snapshots.
+_PER_USER_SCOPE_ROLES = {'po', 'inspector', 'cmd_apspdcl', 'cmd_apepdcl', 'cmd_apcpdcl', 'cgm_hr_transco'}
+
+
+def report_scope_key(user_id, user_role):
+    if user_role in _PER_USER_SCOPE_ROLES:
+        return f"{user_role}:{int(user_id)}"
+    return f"{user_role}:*"
+
+
+# A fresh sequence reports last_value 1 before and after its first nextval; is_called tells them apart.
+_PETITION_DATA_VERSION_SQL = (
+    "SELECT CASE WHEN is_called THEN last_value ELSE 0 END AS version FROM petition_data_version_seq"
+)
+
+
+def report_snapshot_key(scope_key, filters):
+    raw = json.dumps([scope_key, filters], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def bump_petition_data_version():
+    """Mark petition data as changed; call after the write has committed.
+
+    A sequence rather than a counter row: concurrent writers never queue on it, and bumping
+    after commit means a reader that sees the new version also sees the new data.
+    """
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("SELECT nextval('petition_data_version_seq') AS version")
+        version = cur.fetchone()['version']
+        conn.commit()
+        return version
+    finally:
+        conn.close()
+
+
+def get_petition_data_version():
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute(_PETITION_DATA_VERSION_SQL)
+        return cur.fetchone()['version']
+    finally:
+        conn.close()
+
+
+def get_report_snapshot(snapshot_key, max_age_seconds):
+    """The stored snapshot (report decoded) with the current data version, in one round trip.
+
+    is_fresh means built from the current data version within max_age_seconds (SLA buckets age
+    even when nothing is written). Also stamps viewed_at (at most hourly), which keeps the
+    snapshot on the worker's refresh list.
+    """
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute(f"""
+            WITH touched AS (
+                UPDATE analysis_report_snapshots SET viewed_at = CURRENT_TIMESTAMP
+                WHERE snapshot_key = %s AND viewed_at < CURRENT_TIMESTAMP - INTERVAL '1 hour'
+            )
+            SELECT v.version AS current_version, s.data_version, s.report_json, s.generated_at,
+                   s.refresh_requested_at, s.last_error,
+                   COALESCE(s.data_version = v.version
+                            AND s.generated_at >= CURRENT_TIMESTAMP - make_interval(secs => %s), FALSE) AS is_fresh
+            FROM ({_PETITION_DATA_VERSION_SQL}) v
+            LEFT JOIN analysis_report_snapshots s ON s.snapshot_key = %s
+        """, (snapshot_key, max(1, int(max_age_seconds)), snapshot_key))
+        row = dict(cur.fetchone())
+        conn.commit()
+        raw_report = row.pop('report_json', None)
+        row['report'] = json.loads(raw_report) if raw_report else None
+        return row
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def claim_report_snapshot_refresh(snapshot_key, scope_key, user_id, user_role, cvo_office, filters, lease_seconds=300):
+    """Record that a snapshot is being (re)generated; False when another request already is.
+
+    Keeps a burst of viewers on one stale or missing report down to a single generation.
+    """
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("""
+            INSERT INTO analysis_report_snapshots
+                (snapshot_key, scope_key, user_id, user_role, cvo_office, filters_json, refresh_requested_at)
+            VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (snapshot_key) DO UPDATE
+            SET refresh_requested_at = CURRENT_TIMESTAMP
+            WHERE analysis_report_snapshots.refresh_requested_at IS NULL
+               OR analysis_report_snapshots.refresh_requested_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+            RETURNING snapshot_key
+        """, (
+            snapshot_key, scope_key, user_id, user_role, cvo_office,
+            json.dumps(filters, sort_keys=True, default=str), max(1, int(lease_seconds)),
+        ))
+        claimed = cur.fetchone() is not None
+        conn.commit()
+        return claimed
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def save_report_snapshot(snapshot_key, data_version, report, error=None):
+    """Store a generated report (or the generation error) and release the refresh claim.
+
+    A snapshot built from an older data version never replaces a newer one.
+    """
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        if error is not None:
+            cur.execute("""
+                UPDATE analysis_report_snapshots
+                SET refresh_requested_at = NULL, last_error = %s
+                WHERE snapshot_key = %s
+            """, (str(error)[:1000], snapshot_key))
+        else:
+            cur.execute("""
+                UPDATE analysis_report_snapshots
+                SET data_version = %s, report_json = %s, generated_at = CURRENT_TIMESTAMP,
+                    refresh_requested_at = NULL, last_error = NULL
+                WHERE snapshot_key = %s AND (data_version IS NULL OR data_version <= %s)
+            """, (data_version, json.dumps(report, default=str), snapshot_key, data_version))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def get_stale_report_snapshots(max_age_seconds, retention_days=7, limit=50):
+    """Snapshots viewed within retention_days that are behind the data version or older than max_age_seconds."""
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute(f"""
+            SELECT s.snapshot_key, s.scope_key, s.user_id, s.user_role, s.cvo_office, s.filters_json
+            FROM analysis_report_snapshots s
+            CROSS JOIN ({_PETITION_DATA_VERSION_SQL}) v
+            WHERE s.viewed_at >= CURRENT_TIMESTAMP - make_interval(days => %s)
+              AND s.generated_at IS NOT NULL
+              AND s.refresh_requested_at IS NULL
+              AND (s.data_version < v.version
+                   OR s.generated_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+            ORDER BY s.generated_at
+            LIMIT %s
+        """, (max(1, int(retention_days)), max(1, int(max_age_seconds)), max(1, int(limit))))
+        rows = []
+        for row in cur.fetchall():
+            row = dict(row)
+            row['filters'] = json.loads(row.pop('filters_json') or '{}')
+            rows.append(row)
+        return rows
+    finally:
+        conn.close()
+
+
+def purge_report_snapshots(retention_days=7):
+    """Drop snapshots nobody has viewed within retention_days; returns the count."""
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("""
+            DELETE FROM analysis_report_snapshots
+            WHERE viewed_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+        """, (max(1, int(retention_days)),))
+        deleted = cur.rowcount
+        conn.commit()
+        return deleted
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+# ========================================
+# STREAMING EXPORTS
+# ========================================
+
+EXPORT_ITERSIZE = 2000
+
+
+def iter_query_rows(query, params=None, itersize=EXPORT_ITERSIZE):
+    """Yield the rows of a read-only query from a named cursor.
+
+    The connection is held until the generator is exhausted or closed, and only itersize rows
+    are in memory at a time, so exports stay flat regardless of how many rows match.
+    """
+    conn = get_db()
+    try:
+        cur = named_dict_cursor(conn, itersize)
+        cur.execute(query, params)
+        for row in cur:
+            yield row
+    finally:
+        conn.close()
+
+
+def iter_petitions_for_export(user_id, user_role, filters=None, status_filter=None, enquiry_mode='all',
+                              itersize=EXPORT_ITERSIZE):
+    """Stream the petitions user_role may see, narrowed by the dashboard and list filters.
+
+    filters uses the keys of app._extract_dashboard_filters (dates as date objects); the
+    officer is applied as given because the scope conditions already bound what is visible.
+    Beyond SLA exports match get_petitions_for_user: the sweeper's is_sla_escalated flag with
+    SLA_ESCALATION_SWEEP_ENABLED, else the open petitions get_po_beyond_sla_petition_ids selects.
+    Nothing runs until the first row is requested.
+    """
+    filters = filters or {}
+    is_beyond_sla_filter = status_filter == 'beyond_sla'
+    use_sla_escalation_flag = is_beyond_sla_filter and config.SLA_ESCALATION_SWEEP_ENABLED
+    conditions, params = _petition_scope_conditions(user_id, user_role, include_all_for_po=is_beyond_sla_filter)
+    if filters.get('from_date'):
+        conditions.append("p.received_date >= %s")
+        params.append(filters['from_date'])
+    if filters.get('to_date'):
+        conditions.append("p.received_date <= %s")
+        params.append(filters['to_date'])
+    for key, column in (
+        ('petition_type', 'p.petition_type::text'),
+        ('source_of_petition', 'p.source_of_petition'),
+        ('received_at', 'p.received_at'),
+        ('target_cvo', 'p.target_cvo'),
+    ):
+        value = filters.get(key)
+        if value and value != 'all':
+            conditions.append(f"{column} = %s")
+            params.append(value)
+    if filters.get('officer_id'):
+        conditions.append("p.assigned_inspector_id = %s")
+        params.append(int(filters['officer_id']))
+    if enquiry_mode == 'direct':
+        conditions.append("p.requires_permission = FALSE")
+    elif enquiry_mode == 'permission':
+        conditions.append("p.requires_permission = TRUE")
+    if status_filter == 'overdue_tagged':
+        conditions.append("COALESCE(p.is_overdue_escalated, FALSE) = TRUE")
+    elif is_beyond_sla_filter and user_role not in ('po', 'super_admin'):
+        conditions.append("1 = 0")
+    elif use_sla_escalation_flag:
+        conditions.append("p.is_sla_escalated = TRUE")
+    elif is_beyond_sla_filter:
+        conn = get_db()
+        try:
+            cur = dict_cursor(conn)
+            cur.execute(f"""
+                SELECT p.id, p.petition_type::text AS petition_type, p.source_of_petition, p.enquiry_type
+                FROM petitions p
+                WHERE {' AND '.join(conditions + ["p.status <> 'closed'"])}
+            """, params)
+            candidates = [dict(r) for r in cur.fetchall()]
+        finally:
+            conn.close()
+        conditions.append("p.id = ANY(%s)")
+        params.append(get_po_beyond_sla_petition_ids(candidates))
+    elif status_filter and status_filter != 'all':
+        conditions.append("p.status::text = %s")
+        params.append(status_filter)
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    yield from iter_query_rows(f"""
+        SELECT p.id, p.sno, p.efile_no, p.received_date, p.petitioner_name, p.contact, p.place, p.subject,
+               p.petition_type::text AS petition_type, p.source_of_petition, p.received_at, p.target_cvo,
+               p.status::text AS status, p.enquiry_type, p.requires_permission, p.is_overdue_escalated,
+               p.created_at, ui.full_name AS inspector_name, uh.full_name AS handler_name
+        FROM petitions p
+        LEFT JOIN users ui ON ui.id = p.assigned_inspector_id
+        LEFT JOIN users uh ON uh.id = p.current_handler_id
+        {where_sql}
+        ORDER BY p.created_at DESC, p.id DESC
+    """, params, itersize=itersize)
+
+
+def iter_sla_rows_for_export(user_role, user_id=None, officer_id=None, itersize=EXPORT_ITERSIZE):
+    """Stream the SLA drilldown (assigned petitions with SLA days, elapsed days and state).
+
+    Same scope as get_sla_dashboard_data_for_user; evaluated in SQL with _SLA_DAYS_SQL like
+    get_sla_employee_profile_for_user. officer_id narrows to one officer's petitions.
+    """
+    conditions, params = _petition_scope_conditions(user_id, user_role)
+    if user_role == 'data_entry' and user_id:
+        conditions.append("(p.created_by = %s OR p.current_handler_id = %s)")
+        params.extend([user_id, user_id])
+    roles = list(SLA_OFFICER_ROLES)
+    if officer_id:
+        conditions.append("""
+            (
+                (p.current_handler_id = %s AND COALESCE(uh.role::text, '') = ANY(%s))
+                OR (
+                    p.assigned_inspector_id = %s
+                    AND (ui.id IS NULL OR ui.role::text = ANY(%s))
+                    AND NOT (COALESCE(p.current_handler_id, 0) > 0 AND COALESCE(uh.role::text, '') = ANY(%s))
+                )
+            )
+        """)
+        params.extend([int(officer_id), roles, int(officer_id), roles, roles])
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return iter_query_rows(f"""
+        WITH evaluated AS (
+            SELECT p.id, p.sno, p.petitioner_name, p.subject, p.status::text AS status, p.target_cvo,
+                   p.created_at,
+                   CASE WHEN COALESCE(uh.role::text, '') = ANY(%s) THEN uh.full_name ELSE ui.full_name END AS officer_name,
+                   t.assigned_at, t.closed_at,
+                   {_SLA_DAYS_SQL} AS sla_days,
+                   GREATEST(0, EXTRACT(DAY FROM COALESCE(t.closed_at, LOCALTIMESTAMP) - t.assigned_at))::int AS elapsed_days
+            FROM petitions p
+            LEFT JOIN users ui ON ui.id = p.assigned_inspector_id
+            LEFT JOIN users uh ON uh.id = p.current_handler_id
+            JOIN LATERAL ({_SLA_TRACKING_SQL.format(petition='p')}) t ON t.assigned_at IS NOT NULL
+            {where_sql}
+        )
+        SELECT e.*,
+               CASE
+                   WHEN e.closed_at IS NOT NULL AND e.elapsed_days <= e.sla_days THEN 'within'
+                   WHEN e.elapsed_days > e.sla_days THEN 'beyond'
+                   ELSE 'in_progress'
+               END AS sla_state
+        FROM evaluated e
+        ORDER BY e.created_at DESC, e.id DESC
+    """, [roles] + params, itersize=itersize)
+
+# ========================================
+# DUPLICATE DETECTION
+# ========================================
+
+DUPLICATE_BLOCK_LIMIT = 400
+DUPLICATE_PLACE_WINDOW_DAYS = 31
+# Subject similarity (0-100, token_set_ratio) for a likely duplicate on its own, and when
+# the petitioner name or phone also matches.
+DUPLICATE_SUBJECT_THRESHOLD = 85
+DUPLICATE_SUBJECT_THRESHOLD_WITH_KEY = 60
+
+
+def duplicate_blocking_keys(petitioner_name=None, contact=None, place=None, received_date=None):
+    name_key = normalize_petitioner_key(petitioner_name)
+    if name_key in PETITIONER_EXCLUDED_KEYS:
+        name_key = ''
+    digits = ''.join(ch for ch in (contact or '') if ch.isdigit())[-10:]
+    if len(digits) < 6:
+        digits = ''
+    return {
+        'name_key': name_key,
+        'contact_digits': digits,
+        'place_key': ' '.join((place or '').split()).lower(),
+        'received_date': received_date or date.today(),
+    }
+
+
+def score_duplicate_candidates(subject, candidates, keys, limit=5):
+    """Rank blocked candidates by subject similarity; returns the likely duplicates only.
+
+    All subjects are scored in one rapidfuzz process.extract call (cdist would need numpy,
+    which is not a dependency). Without rapidfuzz only candidates that share the petitioner
+    name or phone are returned, unscored.
+    """
+    if not candidates:
+        return []
+    name_key = keys.get('name_key') or ''
+    contact_digits = keys.get('contact_digits') or ''
+    if _fuzz_process is not None and (subject or '').strip():
+        scores = [0] * len(candidates)
+        for _choice, score, idx in _fuzz_process.extract(
+            subject,
+            [c.get('subject') or '' for c in candidates],
+            scorer=_fuzz.token_set_ratio,
+            processor=_fuzz_utils.default_process,
+            limit=None,
+            score_cutoff=DUPLICATE_SUBJECT_THRESHOLD_WITH_KEY,
+        ):
+            scores[idx] = int(score)
+    else:
+        scores = [None] * len(candidates)
+
+    out = []
+    for candidate, score in zip(candidates, scores):
+        matched_on = []
+        if name_key and candidate.get('petitioner_name_key') == name_key:
+            matched_on.append('petitioner')
+        if contact_digits and candidate.get('contact_digits') == contact_digits:
+            matched_on.append('contact')
+        if score is None:
+            if not matched_on:
+                continue
+        elif not (
+            score >= DUPLICATE_SUBJECT_THRESHOLD
+            or (matched_on and score >= DUPLICATE_SUBJECT_THRESHOLD_WITH_KEY)
+        ):
+            continue
+        row = {k: v for k, v in candidate.items() if k not in ('petitioner_name_key', 'contact_digits')}
+        row['score'] = score
+        row['matched_on'] = matched_on
+        out.append(row)
+    out.sort(key=lambda r: (-(r['score'] or 0), -len(r['matched_on']), -int(r.get('id') or 0)))
+    return out[:limit]
+
+
+def find_duplicate_petition_candidates(
+    subject,
+    petitioner_name=None,
+    contact=None,
+    place=None,
+    received_date=None,
+    exclude_petition_id=None,
+    limit=5,
+):
+    """Existing petitions that look like the same complaint.
+
+    Stage 1 narrows to petitions sharing a blocking key (normalized petitioner name, phone
+    digits, or place within a month of the received date), each served by its own index.
+    Stage 2 scores only those candidates with score_duplicate_candidates.
+    """
+    keys = duplicate_blocking_keys(petitioner_name, contact, place, received_date)
+    blocks = []
+    params = []
+    if keys['name_key']:
+        blocks.append("SELECT id FROM petitions WHERE petitioner_name_key = %s")
+        params.append(keys['name_key'])
+    if keys['contact_digits']:
+        blocks.append("SELECT id FROM petitions WHERE contact_digits = %s")
+        params.append(keys['contact_digits'])
+    if keys['place_key']:
+        window = timedelta(days=DUPLICATE_PLACE_WINDOW_DAYS)
+        blocks.append("SELECT id FROM petitions WHERE place_key = %s AND received_date BETWEEN %s AND %s")
+        params.extend([keys['place_key'], keys['received_date'] - window, keys['received_date'] + window])
+    if not blocks:
+        return []
+    params.extend([int(exclude_petition_id or 0), DUPLICATE_BLOCK_LIMIT])
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute(f"""
+            SELECT p.id, p.sno, p.subject, p.petitioner_name, p.place, p.received_date, p.status,
+                p.petitioner_name_key, p.contact_digits
+            FROM petitions p
+            WHERE p.id IN ({' UNION '.join(blocks)})
+              AND p.id <> %s
+            ORDER BY p.received_date DESC NULLS LAST, p.id DESC
+            LIMIT %s
+        """, tuple(params))
+        candidates = [dict(r) for r in cur.fetchall()]
+    finally:
+        conn.close()
+    return score_duplicate_candidates(subject, candidates, keys, limit=limit)
+
+# ========================================
+# BACKGROUND JOBS
+# ========================================
+
+def _decode_job_row(row):
+    if not row:
+        return None
+    job = dict(row)
+    for raw_key, key in (('payload_json', 'payload'), ('result_json', 'result')):
+        raw_value = job.pop(raw_key, None)
+        try:
+            job[key] = json.loads(raw_value) if raw_value else None
+        except (TypeError, ValueError):
+            job[key] = None
+    return job
+
+
+def enqueue_job(job_type, payload=None, created_by=None, max_attempts=5, delay_seconds=0):
+    """Persist a job for the worker pool and return its id."""
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("""
+            INSERT INTO jobs (job_type, payload_json, created_by, max_attempts, run_after)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+            RETURNING id
+        """, (job_type, json.dumps(payload or {}, default=str), created_by, max(1, int(max_attempts)), max(0, int(delay_seconds))))
+        job_id = cur.fetchone()['id']
+        conn.commit()
+        return job_id
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def claim_next_job(worker_id, job_types=None, lease_seconds=900):
+    """Lock and mark the next runnable job as running.
+
+    Workers compete with FOR UPDATE SKIP LOCKED, so concurrent claims never block
+    each other or hand out the same job. Jobs whose worker died mid-run are
+    reclaimed once their lease expires.
+    """
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("""
+            UPDATE jobs
+            SET status = 'failed',
+                last_error = COALESCE(last_error, 'Worker lease expired'),
+                payload_json = '{}',
+                locked_by = NULL,
+                locked_at = NULL,
+                finished_at = CURRENT_TIMESTAMP,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running'
+              AND attempts >= max_attempts
+              AND locked_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+        """, (lease_seconds,))
+        type_filter = ""
+        params = [lease_seconds]
+        if job_types:
+            type_filter = "AND job_type = ANY(%s)"
+            params.append(list(job_types))
+        cur.execute(f"""
+            UPDATE jobs
+            SET status = 'running',
+                attempts = attempts + 1,
+                locked_by = %s,
+                locked_at = CURRENT_TIMESTAMP,
+                started_at = COALESCE(started_at, CURRENT_TIMESTAMP),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id
+                FROM jobs
+                WHERE (
+                    (status = 'queued' AND run_after <= CURRENT_TIMESTAMP)
+                    OR (status = 'running' AND locked_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+                )
+                {type_filter}
+                ORDER BY run_after, id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+        """, tuple([worker_id] + params))
+        row = cur.fetchone()
+        conn.commit()
+        return _decode_job_row(row)
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def complete_job(job_id, result=None):
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("""
+            UPDATE jobs
+            SET status = 'succeeded',
+                result_json = %s,
+                payload_json = '{}',
+                last_error = NULL,
+                locked_by = NULL,
+                locked_at = NULL,
+                finished_at = CURRENT_TIMESTAMP,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (json.dumps(result, default=str) if result is not None else None, job_id))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def fail_job(job_id, error_message, retry_delay_seconds=0):
+    """Record a failed attempt; requeue with a delay until max_attempts is reached.
+
+    Payloads (uploaded rows) are kept only while the job can still run: a finished job,
+    succeeded or failed, keeps its result and error but not its input.
+    """
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("""
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                run_after = CASE
+                    WHEN attempts >= max_attempts THEN run_after
+                    ELSE CURRENT_TIMESTAMP + make_interval(secs => %s)
+                END,
+                finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP ELSE NULL END,
+                payload_json = CASE WHEN attempts >= max_attempts THEN '{}' ELSE payload_json END,
+                last_error = %s,
+                locked_by = NULL,
+                locked_at = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+            RETURNING status
+        """, (max(0, int(retry_delay_seconds)), (error_message or '')[:1000], job_id))
+        row = cur.fetchone()
+        conn.commit()
+        return row['status'] if row else None
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def purge_finished_jobs(retention_days):
+    """Delete succeeded and failed jobs finished more than retention_days ago."""
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("""
+            DELETE FROM jobs
+            WHERE status IN ('succeeded', 'failed')
+              AND finished_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+        """, (max(1, int(retention_days)),))
+        purged = cur.rowcount
+        conn.commit()
+        return purged
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def get_job(job_id):
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        cur.execute("SELECT * FROM jobs WHERE id = %s", (job_id,))
+        return _decode_job_row(cur.fetchone())
+    finally:
+        conn.close()
+
+
+def list_jobs(created_by=None, status=None, limit=50):
+    conn = get_db()
+    try:
+        cur = dict_cursor(conn)
+        conditions = []
+        params = []
+        if created_by:
+            conditions.append("created_by = %s")
+            params.append(created_by)
+        if status:
+            conditions.append("status = %s")
+            params.append(status)
+        query = """
+            SELECT id, job_type, status, attempts, max_attempts, last_error, run_after,
+                created_by, created_at, started_at, finished_at, updated_at
+            FROM jobs
+        """
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+        params.append(max(1, min(int(limit or 50), 500)))
+        cur.execute(query, tuple(params))
+        return [dict(r) for r in cur.fetchall()]
+    finally:
+        conn.close()
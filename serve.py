@@ -6,5 +6,5 @@ from config import Config
 
 if __name__ == "__main__":
     cfg = Config()
-    serve(app, host=cfg.HOST, port=cfg.PORT)
+    serve(app, host=cfg.HOST, port=cfg.PORT, threads=cfg.WAITRESS_THREADS)
 
@@ -10,6 +10,13 @@ document.addEventListener('DOMContentLoaded', () => {
     const viewportMobile = 768;
     const viewportTablet = 1100;
     const i18nVersion = '20260304-7';
+    const langCookieName = 'ui_lang';
+    let i18nBundles = {};
+    try {
+        i18nBundles = JSON.parse(rootEl.getAttribute('data-i18n-bundles') || '{}') || {};
+    } catch (e) {
+        i18nBundles = {};
+    }
     const originalTextNodes = new WeakMap();
     const originalAttrValues = new WeakMap();
     let activeLanguage = 'en';
@@ -261,7 +268,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
     const loadLanguage = async (lang) => {
         try {
-            const res = await fetch(`/static/i18n/${lang}.json?v=${i18nVersion}`, { cache: 'reload' });
+            // Server bundle URLs carry a content version and are cached immutably.
+            const url = i18nBundles[lang] || `/static/i18n/${lang}.json?v=${i18nVersion}`;
+            const res = await fetch(url);
             if (!res.ok) return;
             const dict = await res.json();
             activeLanguage = lang;
@@ -288,12 +297,19 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     };
 
+    // The server renders data-i18n text in the cookie's language, so keep it in step with the toggle.
+    const saveLangCookie = (lang) => {
+        document.cookie = `${langCookieName}=${lang}; path=/; max-age=31536000; SameSite=Lax`;
+    };
+
     const savedLang = localStorage.getItem(langStorageKey) || 'en';
     activeLanguage = savedLang;
+    if ((rootEl.getAttribute('lang') || 'en') !== savedLang) saveLangCookie(savedLang);
     setLangUiState(savedLang);
     langToggleGroups.forEach((group) => {
         const setLanguage = async (nextLang) => {
             localStorage.setItem(langStorageKey, nextLang);
+            saveLangCookie(nextLang);
             setLangUiState(nextLang);
             await loadLanguage(nextLang);
         };
@@ -567,6 +583,7 @@ document.addEventListener('DOMContentLoaded', () => {
     initPetitionerProfiles();
     initPageTransitions();
     initRippleEffect();
+    initNotificationStream();
 });
 
 function initStatCardAnimations() {
@@ -945,3 +962,74 @@ function initRippleEffect() {
     });
 }
 
+function initNotificationStream() {
+    const toggle = document.getElementById('notifToggle');
+    const menu = document.getElementById('notifMenu');
+    const url = toggle ? toggle.getAttribute('data-events-url') : '';
+    if (!toggle || !menu || !url || !window.EventSource) return;
+
+    const renderBell = (bell) => {
+        let badge = toggle.querySelector('.notif-badge');
+        if (bell.badge_count > 0) {
+            if (!badge) {
+                badge = document.createElement('span');
+                badge.className = 'notif-badge';
+                toggle.appendChild(badge);
+            }
+            badge.textContent = bell.badge_text;
+        } else if (badge) {
+            badge.remove();
+        }
+
+        const counts = menu.querySelectorAll('.notif-summary b');
+        if (counts.length >= 2) {
+            counts[0].textContent = bell.received_count;
+            counts[1].textContent = bell.pending_count;
+        }
+
+        const list = menu.querySelector('.notif-list');
+        if (!list) return;
+        list.replaceChildren();
+        if (!bell.items.length) {
+            const empty = document.createElement('div');
+            empty.className = 'notif-empty';
+            empty.setAttribute('data-i18n', 'top.no_pending');
+            empty.textContent = 'No pending petitions right now.';
+            list.appendChild(empty);
+            return;
+        }
+        bell.items.forEach((item) => {
+            const link = document.createElement('a');
+            link.className = 'notif-item';
+            link.href = `/petitions/${item.id}`;
+            [
+                ['notif-item-top', `${item.sno} • ${item.status_label}`],
+                ['notif-item-subject', item.subject],
+                ['notif-item-date', item.received_date],
+            ].forEach(([className, text]) => {
+                const span = document.createElement('span');
+                span.className = className;
+                span.textContent = text;
+                link.appendChild(span);
+            });
+            list.appendChild(link);
+        });
+    };
+
+    // The server ends each stream after a while (or refuses one when busy) and sets the retry
+    // delay; EventSource reconnects on its own, so there is no polling here.
+    const source = new EventSource(url);
+    source.addEventListener('bell', (e) => {
+        try {
+            renderBell(JSON.parse(e.data));
+        } catch (err) {
+            // Keep the last rendered bell on a malformed event.
+        }
+    });
+    source.addEventListener('moved', () => {
+        toggle.classList.remove('notif-new');
+        void toggle.offsetWidth;
+        toggle.classList.add('notif-new');
+    });
+    window.addEventListener('pagehide', () => source.close());
+}
@@ -1,6 +1,7 @@
 import io
 import time
-from datetime import date
+import types
+from datetime import date, datetime
 
 import app as app_module
 
@@ -166,6 +167,19 @@ class RichModelsStub:
         return _fn
 
 
+
+class _ListeningStub:
+    """Change listener stand-in that keeps LocalCacheBackend serving hits."""
+
+    listening = True
+
+    def subscribe(self, channel, on_notify, on_reset=None):
+        pass
+
+    def ensure_started(self):
+        pass
+
+
 def _pdf(name="file.pdf"):
     return (io.BytesIO(b"%PDF-1.4 test"), name)
 
@@ -1148,6 +1162,8 @@ def test_users_upload_xlsx_and_row_level_validation(monkeypatch):
     def _fake_user_by_username(username):
         if username == "badcvo":
             return {"id": 77, "role": "po"}
+        if username.startswith("u"):
+            return None
         return {"id": 2, "role": "cvo_apspdcl"}
 
     stub.get_user_by_username = _fake_user_by_username
@@ -1195,3 +1211,684 @@ def test_users_upload_xlsx_and_row_level_validation(monkeypatch):
             data={"users_file": (io.BytesIO(csv_payload), "users.csv")},
             content_type="multipart/form-data",
         ).status_code == 302
+
+
+def test_bulk_uploads_enqueue_background_jobs_when_enabled(monkeypatch):
+    stub = RichModelsStub()
+    stub.enqueue_job = lambda job_type, payload, created_by=None, max_attempts=5: stub._record(
+        "enqueue_job", job_type=job_type, payload=payload, created_by=created_by, max_attempts=max_attempts
+    ) or 12
+    monkeypatch.setattr(app_module, "models", stub)
+    monkeypatch.setattr(app_module.config, "BACKGROUND_JOBS_ENABLED", True)
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        login_as(client, user_id=5, role="super_admin")
+        csv_data = io.BytesIO(b"username,password,full_name,role\nuser.one,secret123,User One,po\n")
+        assert client.post(
+            "/users/upload",
+            data={"users_file": (csv_data, "users.csv")},
+            content_type="multipart/form-data",
+        ).status_code == 302
+        csv_data = io.BytesIO(b"subject,petitioner_name\nPower theft,Ravi\n")
+        assert client.post(
+            "/petitions/import/upload",
+            data={"petitions_file": (csv_data, "petitions.csv")},
+            content_type="multipart/form-data",
+        ).status_code == 302
+
+    queued = [c[1] for c in stub.calls if c[0] == "enqueue_job"]
+    assert [q["job_type"] for q in queued] == ["users_upload", "petition_import"]
+    assert queued[0]["payload"]["rows"] == [{"username": "user.one", "full_name": "User One", "role": "po"}]
+    assert queued[1]["payload"]["actor_user_id"] == 5 and queued[1]["max_attempts"] == 1
+    assert not any(c[0] in ("create_user", "create_petition") for c in stub.calls)
+
+
+def test_background_job_worker_and_status_api(monkeypatch):
+    stub = RichModelsStub()
+    jobs = [
+        {"id": 3, "job_type": "users_upload", "attempts": 2, "payload": {"rows": [
+            {"username": "user.one", "full_name": "User One", "role": "po"},
+            {"username": "user.two", "full_name": "User Two", "role": "po"},
+        ]}},
+    ]
+    stub.claim_next_job = lambda worker_id, job_types=None, lease_seconds=900: jobs.pop(0) if jobs else None
+    # user.one was created by the attempt that stopped partway; the retry skips it.
+    stub.get_user_by_username = lambda username: {"id": 8} if username == "user.one" else None
+    monkeypatch.setattr(app_module, "models", stub)
+    assert app_module.process_next_background_job("w1") is True
+    assert app_module.process_next_background_job("w1") is False
+    completed = [c[1] for c in stub.calls if c[0] == "complete_job"]
+    assert completed[0]["args"] == (3, {"created": 1, "skipped": 1, "failed": 0, "errors": []})
+    assert [c[1]["args"][0] for c in stub.calls if c[0] == "create_user"] == ["user.two"]
+
+    jobs.append({"id": 4, "job_type": "petition_import", "attempts": 2, "payload": {}})
+    assert app_module.process_next_background_job("w1") is True
+    failed = [c[1] for c in stub.calls if c[0] == "fail_job"]
+    assert failed[0]["args"][0] == 4 and "KeyError" in failed[0]["args"][1]
+    assert failed[0]["kwargs"]["retry_delay_seconds"] == 2 * app_module.config.JOB_RETRY_BASE_SECONDS
+
+    stub.get_job = lambda job_id: {"id": job_id, "job_type": "users_upload", "status": "failed", "created_by": 9,
+                                   "last_error": "KeyError", "result": None}
+    stub.list_jobs = lambda **_k: [stub.get_job(3)]
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        base_get_user = stub.get_user_by_id
+        stub.get_user_by_id = lambda uid: dict(base_get_user(uid), role="po")
+        login_as(client, user_id=1, role="po")
+        assert client.get("/api/jobs/3").status_code == 404
+        assert "last_error" not in client.get("/api/jobs").get_json()["jobs"][0]
+        assert client.get("/api/jobs?status=bogus").status_code == 400
+        stub.get_user_by_id = base_get_user
+        login_as(client, user_id=1, role="super_admin")
+        body = client.get("/api/jobs/3").get_json()
+        assert body["status"] == "failed" and body["last_error"] == "KeyError"
+
+
+def test_petition_new_surfaces_duplicate_candidates_before_save(monkeypatch):
+    stub = RichModelsStub()
+    stub.find_duplicate_petition_candidates = lambda *_a, **_k: [
+        {"id": 5, "sno": "VIG/PO/2026/0005", "subject": "Lineman bribe", "petitioner_name": "Pet One",
+         "received_date": date(2026, 2, 10), "status": "received", "score": 92, "matched_on": ["petitioner"]}
+    ]
+    monkeypatch.setattr(app_module, "models", stub)
+    app_module.PETITION_SUBMISSION_ATTEMPTS.clear()
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        login_as(client, role="data_entry")
+        api = client.get("/api/petitions/duplicate-candidates?subject=Lineman+bribe&petitioner_name=Pet+One")
+        assert api.status_code == 200
+        item = api.get_json()["items"][0]
+        assert item["sno"] == "VIG/PO/2026/0005" and item["received_date"] == "10/02/2026"
+        assert item["view_url"].endswith("/petitions/5")
+
+        payload = {
+            "received_date": "2026-02-17",
+            "received_at": "cvo_apspdcl_tirupathi",
+            "petitioner_name": "Pet One",
+            "contact": "+919999999999",
+            "place": "Hyd",
+            "subject": "Lineman bribe",
+            "petition_type": "bribe",
+            "source_of_petition": "media",
+            "remarks": "ok",
+            "target_cvo": "apspdcl",
+            "permission_request_type": "direct_enquiry",
+            "ereceipt_no": "ER-1005",
+        }
+        first = client.post("/petitions/new", data=dict(payload, ereceipt_file=_pdf("dup.pdf")), content_type="multipart/form-data")
+        assert first.status_code == 200 and b"VIG/PO/2026/0005" in first.data
+        assert not any(name == "create_petition" for name, _ in stub.calls)
+
+        confirmed = dict(payload, duplicate_ack="1", ereceipt_file=_pdf("dup.pdf"))
+        assert client.post("/petitions/new", data=confirmed, content_type="multipart/form-data").status_code == 302
+
+
+def test_chatbot_intent_classifier_matches_priority_rules():
+    classify = app_module._classify_chatbot_intent
+    cases = {
+        "hi": "greet",
+        "hello there": "greet",
+        "history": "updates",
+        "thanks a lot": "thanks",
+        "help": "help",
+        "help me with my role": "role_info",
+        "what should i do": "role_info",
+        "show overdue petitions": "pending",
+        "sla breach list": "urgent",
+        "download report": "download",
+        "daily summary": "stats",
+        "what next": "suggest",
+        "search ravi kumar": "search_name",
+        "efile vig/hq/2024/01": "search_efile",
+        "vig/hq/2024/01": "search_sno",
+        "cor/2025/100": "bare_efile",
+        "er2024001": "bare_ereceipt",
+        "pendin": "pending",
+        "zzz": None,
+    }
+    for message, expected in cases.items():
+        assert classify(message)[0] == expected, message
+    assert classify("search ravi kumar")[1].group(1) == "ravi kumar"
+
+
+def test_chatbot_intent_classifier_matches_linear_scan():
+    """The compiled matcher picks the same intent as the old per-request linear any() scans."""
+    phrase_intents = app_module._CHATBOT_PHRASE_INTENTS
+
+    def linear_classify(msg_lower):
+        # The previous chatbot_api: tuples rebuilt on every call, then one any() scan per intent.
+        tables = [(name, tuple(words)) for name, words in phrase_intents]
+        for name, words in tables:
+            if any(w in msg_lower for w in words):
+                return name
+        return None
+
+    corpus = [
+        "show me my pending petitions", "any updates since yesterday", "how many petitions in total",
+        "guide me through the workflow", "petitions beyond sla", "who are you", "vig/hq/2024/01",
+        "search ravi kumar", "what next", "please export the analysis report", "lineman bribe case",
+        "transformer complaint in nellore rural", "i am stuck with this screen", "daily summary please",
+    ]
+    for msg in corpus:
+        compiled = app_module._classify_chatbot_intent(msg)[0]
+        if msg not in app_module._CHATBOT_HELP_MESSAGES and not app_module._CHATBOT_GREET_RE.match(msg):
+            baseline = linear_classify(msg)
+            if baseline is not None:
+                assert compiled == baseline, msg
+
+
+def test_chatbot_api_dispatches_intents(monkeypatch):
+    stub = RichModelsStub()
+    snapshot_calls = []
+
+    def get_chatbot_snapshot(*args, **kwargs):
+        snapshot_calls.append(args)
+        return {"stats": {"total": 3, "received": 1, "closed": 1, "open": 2}, "pending": [], "updates": []}
+
+    stub.get_chatbot_snapshot = get_chatbot_snapshot
+    stub.search_petitions = lambda *_a, **_k: []
+    stub.get_user_by_id = lambda uid: dict(RichModelsStub.get_user_by_id(stub, uid), role="po")
+    stub.CACHE = app_module.models.LocalCacheBackend(_ListeningStub())
+    stub.petition_scope_cache_tags = app_module.models.petition_scope_cache_tags
+    monkeypatch.setattr(app_module, "models", stub)
+    monkeypatch.setattr(app_module.config, "CHATBOT_SNAPSHOT_TTL_SECONDS", 30, raising=False)
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        login_as(client, role="po")
+
+        def ask(message):
+            return client.post("/api/chatbot", json={"message": message}).get_json()
+        assert ask("pending")["type"] == "pending"
+        assert ask("stas")["type"] == "stats"
+        assert ask("help")["type"] == "help"
+        assert ask("my role")["role_data"]["title"] == "Petitions Officer"
+        assert ask("what next")["actions"][0]["title"] == "Approve/Reject Permissions"
+        assert ask("overdue sla")["type"] == "pending"
+        assert ask("beyond sla")["type"] == "urgent"
+        found = ask("search ravi")
+        assert found["type"] == "petitions" and found["query"] == "ravi"
+        assert ask("zzz")["type"] == "text"
+        assert ask("daily summary")["stats"]["total"] == 3
+        assert ask("today")["pending_count"] == 0
+        # One snapshot query served every data intent above.
+        assert len(snapshot_calls) == 1
+
+        # A workflow write in any process drops the tags of the petition's scope and handlers.
+        stub.CACHE.forget_tags(["user:99"])
+        ask("pending")
+        assert len(snapshot_calls) == 1
+        stub.CACHE.forget_tags(["scope:all"])
+        ask("pending")
+        assert len(snapshot_calls) == 2
+
+
+def test_dashboard_analytics_reads_daily_rollups(monkeypatch):
+    stub = RichModelsStub()
+    day = date.today()
+    stub.get_petition_rollup_rows = lambda *_a, **_k: [
+        {"received_date": day, "target_cvo": "apspdcl", "status": "closed", "petition_type": "bribe",
+         "source_of_petition": "media", "assigned_inspector_id": 5, "inspector_name": "Insp",
+         "sla_bucket": "within", "petition_count": 3},
+        {"received_date": day, "target_cvo": "apspdcl", "status": "lodged", "petition_type": "bribe",
+         "source_of_petition": "media", "assigned_inspector_id": None, "sla_bucket": "beyond",
+         "petition_count": 2},
+    ]
+    refreshed = []
+    stub.refresh_petition_rollups = lambda **kwargs: refreshed.append(kwargs)
+    stub.get_petitions_for_user = lambda *_a, **_k: (_ for _ in ()).throw(AssertionError("per-petition read"))
+    monkeypatch.setattr(app_module, "models", stub)
+    monkeypatch.setattr(app_module.config, "ANALYTICS_ROLLUPS_ENABLED", True, raising=False)
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        login_as(client, role="super_admin")
+        data = client.get("/api/dashboard-analytics").get_json()
+        assert data["summary"]["total_visible"] == 5 and data["summary"]["closed"] == 3
+        assert data["summary"]["sla_within"] == 3 and data["summary"]["sla_breached"] == 2
+        assert data["analytics"]["monthly_trend"]["values"][-1] == 5
+
+        client.post("/petitions/1/action", data={"action": "unknown"})
+        assert refreshed == [{"petition_ids": [1]}]
+
+
+def test_petition_rollup_refreshes_run_on_the_job_queue(monkeypatch):
+    stub = RichModelsStub()
+    refreshed = []
+    stub.refresh_petition_rollups = lambda **kwargs: refreshed.append(kwargs) or {"rows": 1, "petitions": 1}
+    stub.enqueue_job = lambda job_type, payload, created_by=None, max_attempts=5: stub._record(
+        "enqueue_job", job_type=job_type, payload=payload
+    ) or 21
+    monkeypatch.setattr(app_module, "models", stub)
+    monkeypatch.setattr(app_module.config, "ANALYTICS_ROLLUPS_ENABLED", True, raising=False)
+    monkeypatch.setattr(app_module.config, "REPORT_SNAPSHOTS_ENABLED", True, raising=False)
+    monkeypatch.setattr(app_module.config, "BACKGROUND_JOBS_ENABLED", True)
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        login_as(client, role="super_admin")
+        client.post("/petitions/1/action", data={"action": "unknown"})
+    queued = [c[1] for c in stub.calls if c[0] == "enqueue_job"]
+    assert queued == [{"job_type": "petition_rollup_refresh", "payload": {"petition_ids": [1]}}]
+    assert refreshed == []
+
+    jobs = [{"id": 21, "job_type": "petition_rollup_refresh", "attempts": 1, "payload": queued[0]["payload"]}]
+    stub.claim_next_job = lambda worker_id, job_types=None, lease_seconds=900: jobs.pop(0) if jobs else None
+    stub.calls.clear()
+    assert app_module.process_next_background_job("w1") is True
+    assert refreshed == [{"petition_ids": [1]}]
+    # Reports stamped by the request's version bump are rebuilt once the rollups caught up.
+    assert [c[0] for c in stub.calls] == ["bump_petition_data_version", "complete_job"]
+
+    # An inline import refreshes the received days it created petitions on.
+    monkeypatch.setattr(app_module.config, "BACKGROUND_JOBS_ENABLED", False)
+    stub.create_petition = lambda data, actor_user_id: {"id": 31}
+    refreshed.clear()
+    with app_module.app.test_client() as client:
+        login_as(client, role="super_admin")
+        csv_data = io.BytesIO(b"subject,petitioner_name,received_date\nPower theft,Ravi,2026-03-02\n")
+        assert client.post(
+            "/petitions/import/upload",
+            data={"petitions_file": (csv_data, "petitions.csv")},
+            content_type="multipart/form-data",
+        ).status_code == 302
+    assert refreshed == [{"days": [date(2026, 3, 2)]}]
+
+    refreshed.clear()
+    result = app_module._run_petition_import_job({
+        "rows": [{"subject": "Meter theft", "received_date": "2026-03-04"}], "actor_user_id": 1,
+    })
+    assert result["created"] == 1 and refreshed == [{"days": [date(2026, 3, 4)]}]
+
+
+def test_analysis_report_serves_cached_snapshots(monkeypatch):
+    stub = RichModelsStub()
+    stub.get_sla_evaluation_rows = lambda rows: []
+    stub.report_scope_key = lambda uid, role: f"{role}:*"
+    stub.report_snapshot_key = lambda scope, filters: f"{scope}|{filters['petition_type']}"
+    stub.get_petition_data_version = lambda: 5
+    saved = {}
+    snapshots = {}
+    claims = []
+    stub.get_report_snapshot = lambda key, max_age: snapshots.get(key, {"current_version": 5, "report": None, "is_fresh": False})
+    stub.claim_report_snapshot_refresh = lambda key, *a, **k: claims.append(key) or True
+    stub.save_report_snapshot = lambda key, version, report, error=None: saved.update({key: (version, report)})
+    monkeypatch.setattr(app_module, "models", stub)
+    monkeypatch.setattr(app_module.config, "REPORT_SNAPSHOTS_ENABLED", True, raising=False)
+    monkeypatch.setattr(app_module.config, "BACKGROUND_JOBS_ENABLED", False, raising=False)
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        login_as(client, role="super_admin")
+        assert client.get("/analysis-report").status_code == 200
+        version, context = saved["super_admin:*|all"]
+        assert version == 5 and context["dashboard_filter"]["petition_type"] == "all"
+
+        snapshots["super_admin:*|all"] = {
+            "current_version": 5, "report": context, "is_fresh": True, "generated_at": datetime(2026, 3, 2, 9, 5),
+        }
+        stub.get_petitions_for_user = lambda *_a, **_k: (_ for _ in ()).throw(AssertionError("report rebuilt"))
+        body = client.get("/analysis-report").get_data(as_text=True)
+        assert "02 Mar 2026, 09:05 AM" in body and claims == ["super_admin:*|all"]
+
+        monkeypatch.setattr(app_module.config, "BACKGROUND_JOBS_ENABLED", True, raising=False)
+        stub.enqueue_job = lambda *a, **k: 11
+        body = client.get("/analysis-report?petition_type=bribe").get_data(as_text=True)
+        assert "Preparing your report" in body
+
+
+def test_petition_and_analysis_exports_stream(monkeypatch):
+    stub = RichModelsStub()
+    export_calls = []
+
+    def iter_petitions_for_export(user_id, role, filters, status_filter=None, enquiry_mode="all"):
+        export_calls.append((filters["petition_type"], filters["officer_id"], status_filter, enquiry_mode))
+        yield {"sno": "VIG/1", "subject": "=HYPERLINK(\"x\")", "status": "closed", "petition_type": "bribe",
+               "requires_permission": False, "received_date": date(2026, 3, 2)}
+
+    stub.iter_petitions_for_export = iter_petitions_for_export
+    stub.get_sla_evaluation_rows = lambda rows: []
+    monkeypatch.setattr(app_module, "models", stub)
+    monkeypatch.setattr(app_module.config, "REPORT_SNAPSHOTS_ENABLED", False, raising=False)
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        login_as(client, role="super_admin")
+        resp = client.get("/petitions/export?petition_type=bribe&officer_id=7&status=closed&mode=direct")
+        assert resp.is_streamed and resp.mimetype == "text/csv"
+        lines = resp.get_data(as_text=True).lstrip("\ufeff").splitlines()
+        assert lines[0].startswith("S.No,E-Office No,Received Date")
+        assert lines[1].startswith("VIG/1,,2026-03-02,") and "'=HYPERLINK" in lines[1] and ",Closed," in lines[1]
+        assert export_calls == [("bribe", 7, "closed", "direct")]
+
+        resp = client.get("/petitions/export?format=xlsx")
+        workbook = app_module.load_workbook(io.BytesIO(resp.get_data()), read_only=True)
+        sheet_rows = list(workbook["Petitions"].iter_rows(values_only=True))
+        assert sheet_rows[0][0] == "S.No" and sheet_rows[1][0] == "VIG/1"
+
+        resp = client.get("/analysis-report/export?format=xlsx")
+        workbook = app_module.load_workbook(io.BytesIO(resp.get_data()), read_only=True)
+        assert workbook.sheetnames == ["Status", "Type", "Source", "Offices", "Officers"]
+
+
+def test_petition_action_flashes_stale_workflow_transitions(monkeypatch):
+    stub = RichModelsStub()
+    stub.petition = dict(stub.petition, status="lodged")
+
+    def _close(*_a, **_k):
+        raise app_module.WorkflowTransitionError("'Petition Closed' is not allowed while the petition is closed.")
+
+    stub.close_petition = _close
+    monkeypatch.setattr(app_module, "models", stub)
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        assert _post_action(client, "po", "close", {"comments": "done"}).status_code == 302
+        with client.session_transaction() as sess:
+            flashes = sess.get("_flashes") or []
+        assert ("warning", "'Petition Closed' is not allowed while the petition is closed.") in flashes
+
+
+def test_bulk_action_api_validates_and_reports_per_petition(client):
+    stub = client.models_stub
+    calls = []
+
+    def _bulk(petition_ids, transition, user_id, user_role, precheck=None, **values):
+        calls.append((petition_ids, transition, user_role, values))
+        if precheck:
+            assert precheck({"status": "forwarded_to_cvo", "requires_permission": False}) is None
+            assert "PO approval" in precheck({"status": "forwarded_to_cvo", "requires_permission": True})
+        return {pid: None if pid != 3 else "Petition not found." for pid in petition_ids}
+
+    stub.bulk_workflow_transition = _bulk
+    login_as(client, role="inspector")
+    assert client.post("/api/petitions/bulk-action", json={"action": "close", "petition_ids": [1]}).status_code == 403
+
+    login_as(client, role="cvo_apspdcl")
+    assert client.post("/api/petitions/bulk-action", json={"action": "drop", "petition_ids": [1]}).status_code == 400
+    assert client.post("/api/petitions/bulk-action", json={"action": "assign_inspector", "petition_ids": []}).status_code == 400
+    assert client.post("/api/petitions/bulk-action", json={"action": "assign_inspector", "petition_ids": ["x"]}).status_code == 400
+    assert client.post("/api/petitions/bulk-action", json={"action": "assign_inspector", "petition_ids": [1]}).status_code == 400
+    resp = client.post(
+        "/api/petitions/bulk-action",
+        json={"action": "assign_inspector", "petition_ids": [1, "3", 1], "inspector_id": 8, "enquiry_type_decision": "detailed"},
+    )
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["succeeded"] == 1 and body["failed"] == 1
+    assert body["results"] == [
+        {"petition_id": 1, "ok": True, "error": None},
+        {"petition_id": 3, "ok": False, "error": "Petition not found."},
+    ]
+    assert calls == [([1, 3], "assigned_to_inspector", "cvo_apspdcl", {"comments": None, "handler_id": 8, "enquiry_type": "detailed"})]
+
+
+def test_inbox_api_returns_counts_and_keyset_cursor(client):
+    stub = client.models_stub
+    pages = []
+    stub.get_inbox_counts = lambda user_id: {"total": 3, "overdue": 1, "today": 0, "by_status": {"received": 3}}
+
+    def _page(user_id, limit=25, after=None, status=None):
+        pages.append((user_id, limit, after, status))
+        return {
+            "items": [{
+                "petition_id": 5, "sno": "VIG/1", "subject": "s", "status": "received",
+                "since": datetime(2026, 3, 1, 9, 30), "due_at": date(2026, 5, 30), "received_date": date(2026, 3, 1),
+            }],
+            "next_cursor": (datetime(2026, 3, 1, 9, 30), 5),
+        }
+
+    stub.get_inbox_page = _page
+    login_as(client, role="po", user_id=4)
+    assert client.get("/api/inbox?after=bogus").status_code == 400
+    resp = client.get("/api/inbox?limit=10&status=received&after=2026-03-02T08:00:00_9")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["counts"]["total"] == 3
+    assert body["items"][0]["due_at"] == "2026-05-30"
+    assert body["next_cursor"] == "2026-03-01T09:30:00_5"
+    assert pages == [(4, 10, (datetime(2026, 3, 2, 8, 0), 9), "received")]
+
+
+def test_events_stream_pushes_bell_and_moved_notices(client, monkeypatch):
+    import queue
+
+    stub = client.models_stub
+    closed = []
+    events = queue.SimpleQueue()
+    events.put({"petition_id": 5, "from_user_id": 3, "to_user_id": 4, "status": "forwarded_to_po"})
+    events.put({"petition_id": 6, "from_user_id": 4, "to_user_id": 2, "status": "action_instructed"})
+    stub.INBOX_EVENTS = types.SimpleNamespace(
+        open_stream=lambda user_id: events if user_id == 4 else None,
+        close_stream=lambda user_id, q: closed.append(user_id),
+    )
+    stub.get_inbox_counts = lambda user_id: {"total": 1, "overdue": 0, "today": 1, "by_status": {"forwarded_to_po": 1}}
+    stub.get_inbox_page = lambda user_id, limit=6: {
+        "items": [{"petition_id": 5, "sno": "VIG/5", "status": "forwarded_to_po", "subject": "s", "received_date": date(2026, 3, 1)}],
+        "next_cursor": None,
+    }
+    monkeypatch.setattr(app_module.config, "EVENTS_ENABLED", False, raising=False)
+    login_as(client, role="po", user_id=4)
+    assert client.get("/api/events").status_code == 404
+
+    monkeypatch.setattr(app_module.config, "EVENTS_ENABLED", True, raising=False)
+    monkeypatch.setattr(app_module.config, "EVENTS_STREAM_MAX_SECONDS", 1, raising=False)
+    monkeypatch.setattr(app_module.config, "EVENTS_HEARTBEAT_SECONDS", 1, raising=False)
+    resp = client.get("/api/events")
+    assert resp.mimetype == "text/event-stream"
+    body = resp.get_data(as_text=True)
+    assert body.count("event: bell") == 2
+    assert 'event: moved\ndata: {"petition_id": 5' in body and '"petition_id": 6, "status"' not in body
+    assert '"badge_text": "1"' in body and closed == [4]
+
+    login_as(client, role="po", user_id=9)
+    busy = client.get("/api/events")
+    assert busy.get_data(as_text=True) == "retry: 60000\n\n"
+
+
+def test_petition_changes_api_round_trips_cursor_and_fields(client):
+    stub = client.models_stub
+    calls = []
+
+    def _changes(user_id, user_role, since=None, limit=500, fields=None):
+        calls.append((user_id, user_role, since, limit, fields))
+        return {
+            "petitions": [{"id": 5, "updated_at": datetime(2026, 4, 1, 12, 0), "received_date": date(2026, 3, 30)}],
+            "tracking": [],
+            "cursor": (datetime(2026, 4, 1, 12, 0), 5, 41),
+            "has_more": False,
+        }
+
+    stub.get_petition_changes = _changes
+    stub.PETITION_CHANGE_FIELDS = ("status", "received_date")
+    login_as(client, role="cvo_apspdcl", user_id=3)
+    assert client.get("/api/petitions/changes?since=nope").status_code == 400
+    assert client.get("/api/petitions/changes?fields=status,password").status_code == 400
+    resp = client.get("/api/petitions/changes?since=_0_40&fields=received_date&limit=50")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["petitions"] == [{"id": 5, "updated_at": "2026-04-01T12:00:00", "received_date": "2026-03-30"}]
+    assert body["cursor"] == "2026-04-01T12:00:00_5_41"
+    assert calls == [(3, "cvo_apspdcl", (None, 0, 40), 50, ["received_date"])]
+
+
+def test_responses_are_compressed_and_built_assets_served_immutable(client, monkeypatch, tmp_path):
+    import gzip
+    import re
+
+    import build_static
+
+    monkeypatch.setattr(app_module.config, "COMPRESSION_ENABLED", True, raising=False)
+    monkeypatch.setattr(app_module.config, "COMPRESSION_MIN_BYTES", 200, raising=False)
+    monkeypatch.setattr(app_module, "brotli", None)
+    big = [{"petition_id": n, "error": None} for n in range(50)]
+    monkeypatch.setitem(app_module.app.view_functions, "api_stats", lambda: app_module.jsonify(big))
+    login_as(client, role="po")
+    plain = client.get("/api/stats")
+    assert "Content-Encoding" not in plain.headers and plain.get_json() == big
+    packed = client.get("/api/stats", headers={"Accept-Encoding": "gzip, deflate"})
+    assert packed.headers["Content-Encoding"] == "gzip" and "Accept-Encoding" in packed.headers["Vary"]
+    assert app_module.json.loads(gzip.decompress(packed.data)) == big
+    # Signed-in pages are compressed too: they only carry the CSRF token behind a per-response pad.
+    pages = [client.get("/profile", headers={"Accept-Encoding": "gzip"}) for _ in range(2)]
+    with client.session_transaction() as sess:
+        token = sess["_csrf_token"]
+    masked = []
+    for page in pages:
+        assert page.headers["Content-Encoding"] == "gzip"
+        html = gzip.decompress(page.data).decode("utf-8")
+        assert token not in html
+        masked.append(re.search(r'<meta name="csrf-token" content="([^"]+)">', html).group(1))
+    assert masked[0] != masked[1]
+    assert all(app_module._csrf_token_matches(m, token) for m in masked)
+    assert app_module._csrf_token_matches(token, token)
+    assert not app_module._csrf_token_matches(masked[0][:-4] + "AAAA", token)
+    assert not app_module._csrf_token_matches("not base64!", token)
+
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "style.css").write_text("body { color: red; }\n" * 20)
+    (tmp_path / "img.png").write_bytes(b"png")
+    manifest = build_static.build_static_assets(str(tmp_path))
+    built = manifest["css/style.css"]
+    assert list(manifest) == ["css/style.css"] and built.startswith("css/style.") and built.endswith(".css")
+    assert (tmp_path / "dist" / built).exists() and (tmp_path / "dist" / (built + ".gz")).exists()
+
+    monkeypatch.setattr(app_module, "STATIC_DIST_DIR", str(tmp_path / "dist"))
+    monkeypatch.setattr(app_module, "STATIC_MANIFEST", manifest)
+    with app_module.app.test_request_context():
+        assert app_module.asset_url("css/style.css", v="1") == f"/assets/{built}"
+        assert app_module.asset_url("js/app.js", v="9") == "/static/js/app.js?v=9"
+    resp = client.get(f"/assets/{built}", headers={"Accept-Encoding": "br, gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip" and resp.mimetype == "text/css"
+    assert resp.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert gzip.decompress(resp.data).startswith(b"body { color: red; }")
+    resp.close()
+
+
+def test_templates_render_translations_and_serve_versioned_bundles(client, tmp_path):
+    (tmp_path / "te.json").write_text(
+        '{"top.logout": "లాగౌట్", "top.pending": "???", "__auto__": {"words": {}}}',
+        encoding="utf-8",
+    )
+    catalogs = app_module.compile_i18n_catalogs(str(tmp_path))
+    assert catalogs["te"]["messages"] == {"top.logout": "లాగౌట్"}
+    assert b'"__auto__"' in catalogs["te"]["bundle"]
+
+    te = app_module.I18N_CATALOGS["te"]
+    login_as(client, role="po")
+    client.set_cookie(app_module.I18N_COOKIE_NAME, "te")
+    page = client.get("/profile").get_data(as_text=True)
+    assert '<html lang="te"' in page and f"/i18n/te/{te['version']}.json" in page
+    assert f'data-i18n="top.logout">{te["messages"]["top.logout"]}<' in page
+
+    resp = client.get(f"/i18n/te/{te['version']}.json")
+    assert resp.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert resp.get_json()["top.logout"] == te["messages"]["top.logout"]
+    assert client.get("/i18n/te/stale.json").headers["Cache-Control"] == "no-cache"
+    assert client.get("/i18n/xx/1.json").status_code == 404
+
+
+def test_every_translated_template_key_has_an_english_entry():
+    # Switching a server-rendered Telugu page back to EN replaces each data-i18n text from en.json.
+    import glob
+    import os
+    import re
+
+    keys = set()
+    for path in glob.glob(os.path.join(app_module.app.root_path, "templates", "**", "*.html"), recursive=True):
+        with open(path, encoding="utf-8") as fh:
+            keys.update(re.findall(r"\bt\('([^']+)'", fh.read()))
+    english = app_module.I18N_CATALOGS["en"]["messages"]
+    telugu = app_module.I18N_CATALOGS["te"]["messages"]
+    assert sorted(key for key in keys if key in telugu and key not in english) == []
+
+
+def test_template_render_metrics_and_precompile(client, monkeypatch):
+    app_module.TEMPLATE_RENDER_STATS.reset()
+    assert app_module.precompile_templates() == len(app_module.app.jinja_env.list_templates(extensions=["html"]))
+
+    login_as(client, role="po")
+    assert client.get("/profile").status_code == 200
+    assert client.get("/api/admin/template-metrics").status_code == 403
+
+    monkeypatch.setattr(app_module.config, "TEMPLATE_SLOW_RENDER_MS", 0, raising=False)
+    login_as(client, role="super_admin")
+    client.get("/profile")
+    rows = client.get("/api/admin/template-metrics").get_json()["templates"]
+    profile = next(row for row in rows if row["template"] == "profile.html")
+    assert profile["renders"] == 2 and profile["max_ms"] >= profile["avg_ms"] >= 0
+    assert client.get("/api/admin/template-metrics?reset=1").status_code == 200
+    assert app_module.TEMPLATE_RENDER_STATS.snapshot() == []
+
+
+def test_fragment_cache_tag_reuses_and_invalidates_rendered_blocks(monkeypatch):
+    cache = app_module.models.LocalCacheBackend(_ListeningStub())
+    monkeypatch.setattr(app_module.models, "CACHE", cache)
+    monkeypatch.setattr(app_module.models, "get_petition_data_version", lambda: 7)
+    renders = []
+    template = app_module.app.jinja_env.from_string(
+        "{% cache ('tracking', pid), ['petition:' ~ pid] %}{{ count(pid) }}<b>{{ label }}</b>{% endcache %}"
+    )
+
+    def render(**values):
+        with app_module.app.test_request_context():
+            return template.render(count=lambda pid: renders.append(pid) or len(renders), **values)
+
+    assert render(pid=3, label="<x>") == "1<b>&lt;x&gt;</b>"
+    assert render(pid=3, label="<x>") == "2<b>&lt;x&gt;</b>"  # disabled: every render runs the block
+
+    monkeypatch.setattr(app_module.config, "FRAGMENT_CACHE_ENABLED", True, raising=False)
+    monkeypatch.setattr(app_module.models.config, "FRAGMENT_CACHE_ENABLED", True, raising=False)
+    assert render(pid=3, label="a") == "3<b>a</b>"
+    assert render(pid=3, label="a") == "3<b>a</b>" and len(renders) == 3
+    assert render(pid=4, label="a") == "4<b>a</b>"
+    cache.forget_tags(["petition:3"])
+    assert render(pid=3, label="a") == "5<b>a</b>"
+    # Keys carry no data version: as for cached_query reads, the write's tags invalidate.
+    assert render(pid=4, label="a") == "4<b>a</b>" and len(renders) == 5
+
+
+def test_cached_page_fragments_skip_their_data_loads(monkeypatch):
+    stub = RichModelsStub()
+    stub.CACHE = app_module.models.LocalCacheBackend(_ListeningStub())
+    stub.fragment_cache_active = lambda: True
+    stub.encode_cache_value = app_module.models.encode_cache_value
+    stub.report_scope_key = app_module.models.report_scope_key
+    stub.petition_scope_cache_tags = app_module.models.petition_scope_cache_tags
+    sla_loads = []
+    stub.get_sla_dashboard_data_for_user = lambda role, uid, office: sla_loads.append(uid) or {
+        "summary": {"sla_total": 4},
+        "employees": [{"officer_id": 5, "officer_name": "Insp Five", "total": 4, "within": 3, "beyond": 1, "in_progress": 0}],
+        "petitions": [],
+    }
+    stats_loads = []
+    monkeypatch.setattr(
+        app_module, "_build_filtered_dashboard_stats",
+        lambda role, uid, *_a: stats_loads.append(uid) or {"kpi_cards": [{"label": "Open Cases", "value": 2}], "sla_total": 4},
+    )
+    roles = {3: "super_admin", 8: "data_entry", 9: "data_entry"}
+    stub.get_user_by_id = lambda uid: dict(stub.user, id=uid, role=roles[uid])
+    monkeypatch.setattr(app_module, "models", stub)
+    monkeypatch.setattr(app_module.config, "FRAGMENT_CACHE_ENABLED", True, raising=False)
+    app_module.app.config["TESTING"] = True
+    with app_module.app.test_client() as client:
+        login_as(client, user_id=3, role="super_admin")
+        for path in ("/dashboard", "/dashboard?page=2&page_size=50", "/sla-dashboard", "/sla-dashboard"):
+            page = client.get(path).get_data(as_text=True)
+            assert "Open Cases" in page or "Insp Five" in page
+        # Paging the petition table does not change the stats fragment.
+        assert stats_loads == [3] and sla_loads == [3]
+        client.get("/dashboard?petition_type=bribe")
+        assert stats_loads == [3, 3]
+
+        # Data entry users see only their own petitions on the SLA dashboard.
+        login_as(client, user_id=8, role="data_entry")
+        client.get("/sla-dashboard")
+        login_as(client, user_id=9, role="data_entry")
+        client.get("/sla-dashboard")
+        assert sla_loads == [3, 8, 9]
+
+        stub.CACHE.forget_tags(["scope:all"])
+        client.get("/sla-dashboard")
+        assert sla_loads == [3, 8, 9, 9]
+
+
+def test_pages_render_brand_name(client):
+    login_as(client, role="po")
+    page = client.get("/profile").get_data(as_text=True)
+    brand = app_module.config.BRAND_NAME
+    assert f'alt="{brand} Logo"' in page and f'<span class="logo-title">{brand}</span>' in page
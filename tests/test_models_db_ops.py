@@ -1,4 +1,6 @@
-from datetime import datetime
+import json
+import re
+from datetime import date, datetime, timedelta
 
 import models
 
@@ -23,6 +25,9 @@ class CursorStub:
             return self.fetchall_items.pop(0)
         return []
 
+    def __iter__(self):
+        return iter(self.fetchall())
+
 
 class ConnStub:
     def __init__(self, cursor):
@@ -46,6 +51,7 @@ def bind_db(monkeypatch, fetchone_items=None, fetchall_items=None, rowcount=1):
     conn = ConnStub(cursor)
     monkeypatch.setattr(models, "get_db", lambda: conn)
     monkeypatch.setattr(models, "dict_cursor", lambda _conn: cursor)
+    monkeypatch.setattr(models, "named_dict_cursor", lambda _conn, itersize=2000: cursor)
     return conn, cursor
 
 
@@ -63,6 +69,13 @@ def bind_failing_db(monkeypatch):
     return conn
 
 
+MOVED = {"petition_id": 1, "status_before": "received", "status_after": "forwarded_to_cvo", "handler_id": 2, "handler_role": "po", "moved": True}
+
+
+def stuck(**row):
+    return {"petition_id": 1, "status_before": "forwarded_to_po", "status_after": None, "handler_id": None, "moved": False, **row}
+
+
 def test_user_management_db_functions(monkeypatch):
     monkeypatch.setattr(models, "generate_password_hash", lambda pwd: f"h::{pwd}")
     monkeypatch.setattr(models, "check_password_hash", lambda h, p: h == f"h::{p}")
@@ -184,23 +197,23 @@ def test_form_config_and_petition_queries(monkeypatch):
 
 
 def test_workflow_functions_success_paths(monkeypatch):
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"role": "data_entry"}, {"status": "received"}, {"id": 2}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.send_for_permission(1, 9, "send")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"id": 2}, {"status": "forwarded_to_cvo"}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.cvo_send_receipt_to_po(1, 3, "ok")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"id": 4}])
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.approve_permission(1, 2, "apspdcl", "EO-1", "ok", "preliminary")
-    assert conn.commits == 1
+    assert conn.commits == 1 and cur.executed[-1][1]["action_code"] == "permission_approved"
 
-    conn, _ = bind_db(monkeypatch)
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.reject_permission(1, 2, "reason")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"status": "forwarded_to_cvo", "requires_permission": False}, {"id": 7}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.assign_to_inspector(1, 2, 8, "assign", "detailed")
     assert conn.commits == 1
 
@@ -208,15 +221,16 @@ def test_workflow_functions_success_paths(monkeypatch):
     models.set_ereceipt(1, 5, "E2", "r.pdf")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"status": "assigned_to_inspector"}, {"assigned_cvo_id": 4}])
+    conn, cur = bind_db(monkeypatch, fetchone_items=[{"status": "assigned_to_inspector"}, {"assigned_cvo_id": 4}, {"id": 12}])
     models.submit_enquiry_report(1, 8, "report", "", "rec", "file.pdf")
     assert conn.commits == 1
+    assert "latest_enquiry_report_id" in cur.executed[3][0] and cur.executed[3][1] == (4, 12, 1)
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"id": 2}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.cvo_add_comments(1, 4, "cmt")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"status": "enquiry_report_submitted"}, {"id": 2}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.cvo_request_detailed_enquiry(1, 4, "need details")
     assert conn.commits == 1
 
@@ -224,27 +238,27 @@ def test_workflow_functions_success_paths(monkeypatch):
     models.cvo_upload_consolidated_report(1, 4, "cvo.pdf")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"status": "enquiry_report_submitted"}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.cvo_send_back_to_inspector_for_reenquiry(1, 4, 8, "recheck")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"target_cvo": "apspdcl", "status": "forwarded_to_po"}, {"id": 6}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.po_send_back_to_cvo_for_reenquiry(1, 2, "recheck")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch)
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.po_give_conclusion(1, 2, "EO-1", "closed", "ins", "concl.pdf")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"target_cvo": "apspdcl", "status": "forwarded_to_po"}, {"id": 6}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.po_send_to_cmd(1, 2, "do action", "EO-1")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"status": "action_instructed"}, {"id": 2}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.cmd_submit_action_report(1, 6, "done", "a.pdf")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"status": "action_taken"}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.po_lodge_petition(1, 2, "lodged", "EO-2")
     assert conn.commits == 1
 
@@ -252,15 +266,15 @@ def test_workflow_functions_success_paths(monkeypatch):
     assert models.po_update_efile_number(1, 2, "EO-3", "set") is True
     assert conn.commits == 1 and cur.rowcount == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"status": "sent_for_permission"}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.po_direct_lodge_no_enquiry(1, 2, "direct", "EO-4")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch)
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.cvo_take_action(1, 4, "action")
     assert conn.commits == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"status": "lodged"}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[MOVED]])
     models.close_petition(1, 2, "close")
     assert conn.commits == 1
 
@@ -291,7 +305,7 @@ def test_workflow_and_error_branches(monkeypatch):
         assert "Petition not found" in str(exc)
         assert conn.rollbacks == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"target_cvo": "invalid", "status": "x"}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[stuck(handler_role=None)]])
     try:
         models.po_send_to_cmd(1, 2, "x", "EO-1")
         assert False, "Expected exception"
@@ -299,7 +313,7 @@ def test_workflow_and_error_branches(monkeypatch):
         assert "No CMD role configured" in str(exc)
         assert conn.rollbacks == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"target_cvo": "apspdcl", "status": "x"}, None])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[stuck(handler_role="cmd_apspdcl")]])
     try:
         models.po_send_to_cmd(1, 2, "x", "EO-1")
         assert False, "Expected exception"
@@ -315,7 +329,7 @@ def test_workflow_and_error_branches(monkeypatch):
         assert "Petition not found" in str(exc)
         assert conn.rollbacks == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"status": "action_instructed"}, None])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[stuck(handler_role="po")]])
     try:
         models.cmd_submit_action_report(1, 2, "done")
         assert False, "Expected exception"
@@ -331,7 +345,7 @@ def test_workflow_and_error_branches(monkeypatch):
         assert "Petition not found" in str(exc)
         assert conn.rollbacks == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"target_cvo": "bad", "status": "forwarded_to_po"}])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[stuck(handler_role=None)]])
     try:
         models.po_send_back_to_cvo_for_reenquiry(1, 2, "x")
         assert False, "Expected exception"
@@ -339,7 +353,7 @@ def test_workflow_and_error_branches(monkeypatch):
         assert "Target CVO/DSP is not configured" in str(exc)
         assert conn.rollbacks == 1
 
-    conn, _ = bind_db(monkeypatch, fetchone_items=[{"target_cvo": "apspdcl", "status": "forwarded_to_po"}, None])
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[stuck(handler_role="cvo_apspdcl")]])
     try:
         models.po_send_back_to_cvo_for_reenquiry(1, 2, "x")
         assert False, "Expected exception"
@@ -382,7 +396,7 @@ def test_schema_and_connection_helpers(monkeypatch):
 def test_forward_and_dashboard_stats_helpers(monkeypatch):
     conn, _ = bind_db(
         monkeypatch,
-        fetchone_items=[{"role": "data_entry"}, {"status": "received"}, {"id": 3}],
+        fetchall_items=[[MOVED]],
     )
     models.forward_petition_to_cvo(1, 2, "apspdcl", "note")
     assert conn.commits == 1
@@ -499,3 +513,852 @@ def test_model_kpi_and_sla_remaining_branches(monkeypatch):
     monkeypatch.setattr(models, "dict_cursor", lambda _conn: cursor)
     out = models._get_sla_stats(conn, "inspector", user_id=2)
     assert out["sla_total"] == 0
+
+
+def test_background_job_queue_functions(monkeypatch):
+    conn, cur = bind_db(monkeypatch, fetchone_items=[{"id": 41}])
+    assert models.enqueue_job("users_upload", {"rows": [{"username": "u1"}]}, created_by=1, max_attempts=3) == 41
+    assert conn.commits == 1 and '"username": "u1"' in cur.executed[0][1][1]
+
+    conn, cur = bind_db(monkeypatch, fetchone_items=[{"id": 41, "job_type": "users_upload", "payload_json": '{"rows": []}', "result_json": None}])
+    job = models.claim_next_job("host:1:1", job_types=["users_upload"], lease_seconds=60)
+    assert job["payload"] == {"rows": []} and job["result"] is None
+    assert "FOR UPDATE SKIP LOCKED" in cur.executed[1][0]
+    assert cur.executed[1][1] == ("host:1:1", 60, ["users_upload"])
+
+    bind_db(monkeypatch)
+    assert models.claim_next_job("host:1:1") is None
+
+    conn, cur = bind_db(monkeypatch, fetchone_items=[{"status": "queued"}])
+    assert models.fail_job(41, "boom", retry_delay_seconds=30) == "queued"
+    assert cur.executed[0][1] == (30, "boom", 41)
+    assert "payload_json = CASE WHEN attempts >= max_attempts THEN '{}' ELSE payload_json END" in cur.executed[0][0]
+
+    conn, cur = bind_db(monkeypatch)
+    models.complete_job(41, {"created": 2})
+    assert conn.commits == 1 and cur.executed[0][1] == ('{"created": 2}', 41)
+    assert "payload_json = '{}'" in cur.executed[0][0]
+
+    conn, cur = bind_db(monkeypatch, rowcount=3)
+    assert models.purge_finished_jobs(14) == 3
+    assert "status IN ('succeeded', 'failed')" in cur.executed[0][0] and cur.executed[0][1] == (14,)
+
+    bind_db(monkeypatch, fetchone_items=[{"id": 41, "payload_json": "not-json", "result_json": '{"created": 2}'}])
+    assert models.get_job(41)["result"] == {"created": 2}
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"id": 41}]])
+    assert models.list_jobs(created_by=1, status="failed", limit=5000) == [{"id": 41}]
+    assert cur.executed[0][1] == (1, "failed", 500)
+
+    conn = bind_failing_db(monkeypatch)
+    try:
+        models.enqueue_job("users_upload")
+    except Exception:
+        pass
+    assert conn.rollbacks == 1 and conn.closed
+
+
+def test_sla_escalation_sweep_batches_and_lock(monkeypatch):
+    bind_db(monkeypatch, fetchone_items=[{"locked": False}])
+    assert models.run_sla_escalation_sweep()["skipped"] is True
+
+    monkeypatch.setattr(models, "get_sla_evaluation_rows", lambda rows: [dict(r, due=r["id"] % 2 == 0) for r in rows])
+    monkeypatch.setattr(models, "_is_po_beyond_sla_row", lambda row: row["due"])
+    conn, cur = bind_db(
+        monkeypatch,
+        fetchone_items=[{"locked": True}],
+        # Cleared ids, then per batch: candidates and the ids the flag UPDATE returned.
+        fetchall_items=[[{"id": 9}], [{"id": 1}, {"id": 2}], [{"id": 2}], [{"id": 4}], [{"id": 4}]],
+    )
+    out = models.run_sla_escalation_sweep(batch_size=2)
+    assert out == {"escalated": 2, "cleared": 1, "scanned": 3, "skipped": False, "petition_ids": [9, 2, 4]}
+    selects = [params for query, params in cur.executed if "ORDER BY id" in query]
+    assert selects == [(0, models.SLA_SWEEP_MIN_AGE_DAYS, 2), (2, models.SLA_SWEEP_MIN_AGE_DAYS, 2)]
+    updates = [params for query, params in cur.executed if "is_sla_escalated = TRUE," in query]
+    assert updates == [([2],), ([4],)]
+    # Flag flips move updated_at so delta sync clients see them.
+    flips = [query for query, _params in cur.executed if query.lstrip().startswith("UPDATE petitions")]
+    assert len(flips) == 3 and all("updated_at = CURRENT_TIMESTAMP" in query for query in flips)
+    assert "pg_advisory_unlock" in cur.executed[-1][0] and conn.closed
+
+
+def test_beyond_sla_listing_uses_sweeper_flag(monkeypatch):
+    monkeypatch.setattr(models.config, "SLA_ESCALATION_SWEEP_ENABLED", True)
+    monkeypatch.setattr(models, "get_po_beyond_sla_petition_ids", lambda rows: (_ for _ in ()).throw(AssertionError("not used")))
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"id": 7}]])
+    assert models.get_petitions_for_user(1, "po", status_filter="beyond_sla") == [{"id": 7}]
+    assert "p.is_sla_escalated = TRUE" in cur.executed[0][0]
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"id": 7}]])
+    assert models.get_petitions_for_user(2, "inspector", status_filter="beyond_sla") == []
+    assert cur.executed == [] and conn.closed
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"id": 8}]])
+    assert models.get_all_petitions(status_filter="beyond_sla") == [{"id": 8}]
+    assert "p.is_sla_escalated = TRUE" in cur.executed[0][0]
+
+
+def test_sla_employee_profile_uses_officer_scoped_query(monkeypatch):
+    monkeypatch.setattr(models, "get_sla_dashboard_data_for_user", lambda *a: (_ for _ in ()).throw(AssertionError("not used")))
+    monkeypatch.setattr(models, "get_user_by_id", lambda uid: {"id": uid, "full_name": "Officer"})
+    row = {
+        "id": 5, "petition_type": "electrical_accident", "source_of_petition": "public_individual",
+        "enquiry_type": "detailed", "assigned_at": datetime(2024, 1, 1), "closed_at": datetime(2024, 3, 1),
+        "converted_to_detailed": 0, "sla_days_sql": 45, "elapsed_days_sql": 60,
+        "agg_closed_total": 1, "agg_closed_within": 0, "agg_closed_beyond": 1, "agg_open_within": 2, "agg_open_beyond": 0,
+    }
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[row]])
+    out = models.get_sla_employee_profile_for_user("cvo_apspdcl", 3, "apspdcl", 9)
+    assert out["unauthorized"] is False and out["officer"]["id"] == 9
+    assert out["summary"]["total"] == 3 and out["summary"]["closed_beyond"] == 1 and out["summary"]["in_progress"] == 2
+    assert out["petitions"][0]["sla_state"] == "beyond" and "agg_closed_total" not in out["petitions"][0]
+    assert len(cur.executed) == 1 and "p.target_cvo" in cur.executed[0][0]
+    assert 9 in cur.executed[0][1] and conn.closed
+
+    bind_db(monkeypatch, fetchall_items=[[]])
+    out = models.get_sla_employee_profile_for_user("inspector", 3, None, 9)
+    assert out["unauthorized"] is True and out["summary"]["total"] == 0
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[]])
+    out = models.get_sla_employee_profile_for_user("data_entry", 4, None, 9)
+    assert out["unauthorized"] is True and "p.created_by = %s" in cur.executed[0][0]
+
+    bind_db(monkeypatch, fetchall_items=[[]])
+    out = models.get_sla_employee_profile_for_user("po", 1, None, 9)
+    assert out["unauthorized"] is False and out["petitions"] == []
+
+    bind_db(monkeypatch, fetchall_items=[[]])
+    out = models.get_sla_employee_profile_for_user("inspector", 9, None, 9)
+    assert out["unauthorized"] is False and out["officer"]["id"] == 9 and out["summary"]["total"] == 0
+
+
+def test_sla_days_sql_matches_python_policy_for_every_type_and_source():
+    def sql_days(petition_type, source, enquiry_type):
+        # Evaluate the CASE the way Postgres would for this one row.
+        sql = models._SLA_DAYS_SQL
+        branches = re.findall(r"WHEN (.*?) THEN (\d+)", sql, re.S)
+        assert len(branches) == 2 and "ELSE %d" % models.SLA_GENERAL_DAYS in sql
+        if (enquiry_type or "detailed").strip().lower() == "preliminary":
+            assert "'preliminary'" in branches[0][0]
+            return int(branches[0][1])
+        special_types = re.search(r"p\.petition_type::text IN \(([^)]*)\)", branches[1][0]).group(1)
+        special_sources = re.search(r"p\.source_of_petition, ''\)\) IN \(([^)]*)\)", branches[1][0]).group(1)
+        if f"'{petition_type}'" in special_types.split(", ") or f"'{source}'" in special_sources.split(", "):
+            return int(branches[1][1])
+        return models.SLA_GENERAL_DAYS
+
+    petition_types = [
+        "bribe", "corruption", "harassment", "electrical_accident", "misconduct", "works_related",
+        "irregularities_in_tenders", "illegal_assets", "fake_certificates", "theft_misappropriation_materials",
+        "other", "theft_of_materials", "",
+    ]
+    sources = ["media", "public_individual", "govt", "sumoto", "cmd_office", ""]
+    for petition_type in petition_types:
+        for source in sources:
+            for enquiry_type in ("preliminary", "detailed", None):
+                petition = {"petition_type": petition_type, "source_of_petition": source, "enquiry_type": enquiry_type}
+                assert sql_days(petition_type, source, enquiry_type) == models._resolve_sla_days_for_petition(petition)
+
+
+def test_tracking_action_codes_backfill_and_counts(monkeypatch):
+    cur = CursorStub()
+    models._backfill_tracking_action_codes(cur)
+    actions, codes = cur.executed[0][1]
+    assert codes[actions.index("Permission Approved - Sent to CVO")] == "permission_approved"
+    assert all(query.count("action_code IS NULL") == 1 for query, _ in cur.executed)
+
+    conn, cur = bind_db(monkeypatch, fetchone_items=[{"c": 3}])
+    assert models._get_po_permission_given_count(5) == 3
+    assert "action_code = 'permission_approved'" in cur.executed[0][0]
+
+
+def test_electrical_accident_stats_use_latest_report_pointer(monkeypatch):
+    assert models._get_electrical_accident_stats_for_petitions([{"id": 1, "petition_type": "works_related"}])["electrical_accident_total"] == 0
+
+    conn, cur = bind_db(monkeypatch, fetchone_items=[{"fatal": 2, "departmental": 3, "animals_count": None}])
+    stats = models._get_electrical_accident_stats_for_petitions([
+        {"id": 1, "petition_type": "electrical_accident"},
+        {"id": 2, "petition_type": "electrical_accident"},
+    ])
+    assert stats["electrical_accident_total"] == 2 and stats["electrical_accident_fatal"] == 2
+    assert stats["electrical_accident_departmental"] == 3 and stats["electrical_accident_animals_count"] == 0
+    assert "p.latest_enquiry_report_id" in cur.executed[0][0] and cur.executed[0][1] == ([1, 2],)
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"petition_id": 2, "accident_type": "fatal"}]])
+    assert models.get_latest_enquiry_report_accident_details([1, 2]) == {2: {"petition_id": 2, "accident_type": "fatal"}}
+    assert "= ANY(%s)" in cur.executed[0][0] and cur.executed[0][1] == ([1, 2],)
+
+
+def test_petitioner_directory_lookups(monkeypatch):
+    assert models.normalize_petitioner_key("  Ravi   KUMAR ") == "ravi kumar"
+    assert models.search_petitioner_directory(1, "super_admin", "r") == []
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"name": "Ravi Kumar", "count": 3}]])
+    assert models.search_petitioner_directory(1, "super_admin", "ravi_") == [{"name": "Ravi Kumar", "count": 3}]
+    assert "FROM petitioner_directory" in cur.executed[0][0] and cur.executed[0][1] == ("%ravi\\_%", 12)
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"name": "Ravi Kumar", "count": 1}]])
+    models.search_petitioner_directory(7, "inspector", "Ravi", limit=500)
+    assert "p.assigned_inspector_id = %s" in cur.executed[0][0] and cur.executed[0][1][0] == 7
+    assert cur.executed[0][1][-1] == 50
+
+    assert models.get_petitioner_petitions(1, "super_admin", "Anonymous") == []
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"id": 4}]])
+    assert models.get_petitioner_petitions(1, "super_admin", "Ravi  Kumar") == [{"id": 4}]
+    assert cur.executed[0][1] == ("ravi kumar",)
+
+    cur = CursorStub()
+    models._refresh_petitioner_directory(cur, 9)
+    assert "ON CONFLICT (name_key)" in cur.executed[0][0] and cur.executed[0][1][-1] == 9
+
+
+def test_duplicate_candidate_blocking_and_scoring(monkeypatch):
+    keys = models.duplicate_blocking_keys(" Ravi  Kumar ", "+91 98480-12345", "  Nellore  Rural ", datetime(2026, 3, 1).date())
+    assert keys["name_key"] == "ravi kumar" and keys["contact_digits"] == "9848012345"
+    assert keys["place_key"] == "nellore rural"
+    assert models.duplicate_blocking_keys("Anonymous", "123")["name_key"] == ""
+    assert models.duplicate_blocking_keys("Anonymous", "123")["contact_digits"] == ""
+    assert models.find_duplicate_petition_candidates("Bribe", petitioner_name="Anonymous") == []
+
+    candidates = [
+        {"id": 1, "subject": "Lineman demanding bribe for new service connection", "petitioner_name_key": "ravi kumar", "contact_digits": ""},
+        {"id": 2, "subject": "Transformer failure in village", "petitioner_name_key": "other", "contact_digits": ""},
+        {"id": 3, "subject": "Bribe demanded by lineman for new service connection", "petitioner_name_key": "x", "contact_digits": "9848012345"},
+    ]
+    ranked = models.score_duplicate_candidates("Lineman demanded bribe for new service connection", candidates, keys)
+    assert [(r["id"], r["matched_on"]) for r in ranked] == [(3, ["contact"]), (1, ["petitioner"])]
+    assert ranked[0]["score"] >= models.DUPLICATE_SUBJECT_THRESHOLD
+    assert all("petitioner_name_key" not in r for r in ranked)
+
+    monkeypatch.setattr(models, "_fuzz_process", None)
+    unscored = models.score_duplicate_candidates("anything", candidates, keys)
+    assert [r["id"] for r in unscored] == [3, 1] and unscored[0]["score"] is None
+    monkeypatch.undo()
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[dict(candidates[0], sno="VIG/1")]])
+    found = models.find_duplicate_petition_candidates(
+        "Lineman demanding bribe", petitioner_name="Ravi Kumar", contact="9848012345", place="Nellore",
+        received_date=datetime(2026, 3, 1).date(), exclude_petition_id=7,
+    )
+    assert [r["id"] for r in found] == [1] and conn.closed
+    query, params = cur.executed[0]
+    assert query.count(" UNION ") == 2 and "petitioner_name_key = %s" in query and "contact_digits = %s" in query
+    assert params[:3] == ("ravi kumar", "9848012345", "nellore")
+    assert params[-2:] == (7, models.DUPLICATE_BLOCK_LIMIT)
+
+
+def test_duplicate_candidate_blocking_query_bounds_each_block(monkeypatch):
+    received = datetime(2026, 3, 1).date()
+    window = timedelta(days=models.DUPLICATE_PLACE_WINDOW_DAYS)
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[]])
+    assert models.find_duplicate_petition_candidates("Bribe", petitioner_name="Ravi Kumar") == []
+    query, params = cur.executed[0]
+    assert " UNION " not in query and "WHERE p.id IN (SELECT id FROM petitions WHERE petitioner_name_key = %s)" in query
+    assert "AND p.id <> %s" in query and query.rstrip().endswith("LIMIT %s")
+    assert params == ("ravi kumar", 0, models.DUPLICATE_BLOCK_LIMIT) and conn.closed
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[]])
+    models.find_duplicate_petition_candidates("Bribe", place=" Nellore  Rural ", received_date=received, exclude_petition_id=3)
+    query, params = cur.executed[0]
+    assert "place_key = %s AND received_date BETWEEN %s AND %s" in query and "petitioner_name_key = %s" not in query
+    assert params == ("nellore rural", received - window, received + window, 3, models.DUPLICATE_BLOCK_LIMIT)
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[]])
+    models.find_duplicate_petition_candidates("Bribe", petitioner_name="Anonymous", contact="+91 98480 12345")
+    query, params = cur.executed[0]
+    assert "contact_digits = %s" in query and "petitioner_name_key = %s" not in query
+    assert params == ("9848012345", 0, models.DUPLICATE_BLOCK_LIMIT)
+
+
+def test_duplicate_candidates_cap_a_full_block_at_the_limit(monkeypatch):
+    received = datetime(2026, 3, 1).date()
+    window = timedelta(days=models.DUPLICATE_PLACE_WINDOW_DAYS)
+    # Worst case the blocking query can return: a block filled up to its SQL LIMIT.
+    block = [
+        {
+            "id": pid,
+            "subject": "Lineman demanding bribe for new service connection",
+            "petitioner_name_key": "ravi kumar",
+            "contact_digits": "9848012345",
+        }
+        for pid in range(1, models.DUPLICATE_BLOCK_LIMIT + 1)
+    ]
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[block])
+    found = models.find_duplicate_petition_candidates(
+        "Lineman demanding bribe for new service connection",
+        petitioner_name="Ravi Kumar",
+        contact="+91 98480 12345",
+        place="Nellore",
+        received_date=received,
+        exclude_petition_id=9,
+        limit=3,
+    )
+    assert [row["id"] for row in found] == [400, 399, 398]
+    assert all(row["matched_on"] == ["petitioner", "contact"] for row in found)
+    assert all("petitioner_name_key" not in row and "contact_digits" not in row for row in found)
+
+    query, params = cur.executed[0]
+    assert query.count(" UNION ") == 2 and query.rstrip().endswith("LIMIT %s")
+    assert params == (
+        "ravi kumar", "9848012345", "nellore", received - window, received + window,
+        9, models.DUPLICATE_BLOCK_LIMIT,
+    )
+    assert conn.closed
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[block])
+    assert len(models.find_duplicate_petition_candidates("Bribe", petitioner_name="Ravi Kumar")) == 5
+
+
+def test_chatbot_snapshot_single_round_trip(monkeypatch):
+    today = datetime(2026, 3, 2)
+    rows = [
+        {"stat_total": 9, "stat_received": 2, "stat_closed": 3, "stat_open": 6, "kind": "pending", "id": 4, "received_date": today},
+        {"stat_total": 9, "stat_received": 2, "stat_closed": 3, "stat_open": 6, "kind": "updates", "id": 5, "updated_at": today},
+    ]
+    conn, cur = bind_db(monkeypatch, fetchall_items=[rows])
+    snap = models.get_chatbot_snapshot(7, "inspector", None, limit=20)
+    assert snap["stats"] == {"total": 9, "received": 2, "closed": 3, "open": 6}
+    assert snap["pending"] == [{"id": 4, "received_date": today}]
+    assert snap["updates"] == [{"id": 5, "updated_at": today}]
+    assert len(cur.executed) == 1 and conn.closed
+    query, params = cur.executed[0]
+    assert "assigned_inspector_id = %s" in query and "UNION ALL" in query
+    assert params == [7, 7, 20, 7, 20]
+
+    bind_db(monkeypatch, fetchall_items=[[{"stat_total": 0, "stat_received": 0, "stat_closed": 0, "stat_open": 0, "kind": None}]])
+    empty = models.get_chatbot_snapshot(1, "po", None)
+    assert empty == {"stats": {"total": 0, "received": 0, "closed": 0, "open": 0}, "pending": [], "updates": []}
+
+
+def test_petition_rollup_refresh_and_scoped_reads(monkeypatch):
+    day = date(2026, 3, 2)
+    batch = [
+        {"id": 1, "received_date": day, "target_cvo": "apspdcl", "status": "closed", "assigned_inspector_id": 5},
+        {"id": 2, "received_date": day, "target_cvo": "apspdcl", "status": "closed", "assigned_inspector_id": 5},
+        {"id": 3, "received_date": None, "target_cvo": "headquarters", "status": "lodged", "assigned_inspector_id": None},
+    ]
+    inserted = []
+    monkeypatch.setattr(models, "get_sla_evaluation_rows", lambda rows: [{"id": 1, "sla_bucket": "within"}, {"id": 2, "sla_bucket": "within"}])
+    monkeypatch.setattr(models.psycopg2.extras, "execute_values", lambda _cur, sql, rows, page_size=100: inserted.append((sql, rows)))
+    conn, cur = bind_db(monkeypatch, fetchall_items=[batch])
+    assert models.refresh_petition_rollups() == {"rows": 2, "petitions": 3}
+    # The scan runs unlocked; the advisory lock covers only the delete/insert swap.
+    assert "FROM petitions" in cur.executed[0][0] and "pg_advisory_xact_lock" in cur.executed[1][0]
+    assert "DELETE FROM petition_daily_rollups" in cur.executed[2][0]
+    assert "petition_rollup_state" in cur.executed[-1][0] and conn.commits == 1
+    rows = sorted(inserted[0][1], key=lambda r: r[-1])
+    assert rows[0][0] is None and rows[0][-1] == 1
+    assert rows[1][0] == day and rows[1][-2] == "within" and rows[1][-1] == 2
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"received_date": day}, {"received_date": None}], []])
+    assert models.refresh_petition_rollups(petition_ids=[1, 3]) == {"rows": 0, "petitions": 0}
+    delete_sql, delete_params = cur.executed[-1]
+    assert "received_day = ANY(%s)" in delete_sql and delete_params == [[day], True]
+    assert not any("petition_rollup_state" in q for q, _ in cur.executed)
+
+    assert models.get_petition_rollup_rows(1, "po") is None
+    bind_db(monkeypatch, fetchone_items=[None])
+    assert models.get_petition_rollup_rows(1, "inspector") is None
+    conn, cur = bind_db(monkeypatch, fetchone_items=[{"rebuilt_at": day}], fetchall_items=[[{"petition_count": 4}]])
+    assert models.get_petition_rollup_rows(1, "cvo_apspdcl") == [{"petition_count": 4}]
+    query, params = cur.executed[-1]
+    assert "r.target_cvo = ANY(%s)" in query and params == [models._target_cvos_for_cvo_role("cvo_apspdcl")]
+
+
+def test_report_snapshot_storage(monkeypatch):
+    assert models.report_scope_key(7, "inspector") == "inspector:7"
+    assert models.report_scope_key(7, "cvo_apspdcl") == models.report_scope_key(9, "cvo_apspdcl")
+    key = models.report_snapshot_key("cvo_apspdcl:*", {"petition_type": "all", "from_date": ""})
+    assert key == models.report_snapshot_key("cvo_apspdcl:*", {"from_date": "", "petition_type": "all"})
+
+    conn, cur = bind_db(monkeypatch, fetchone_items=[{
+        "current_version": 4, "data_version": 4, "report_json": '{"report": {"total": 3}}',
+        "generated_at": datetime(2026, 3, 2, 9, 0), "refresh_requested_at": None, "last_error": None, "is_fresh": True,
+    }])
+    snap = models.get_report_snapshot(key, 3600)
+    assert snap["report"] == {"report": {"total": 3}} and snap["is_fresh"] and "report_json" not in snap
+    assert cur.executed[0][1] == (key, 3600, key) and conn.commits == 1
+
+    conn, cur = bind_db(monkeypatch, fetchone_items=[None])
+    assert models.claim_report_snapshot_refresh(key, "cvo_apspdcl:*", 9, "cvo_apspdcl", None, {}, lease_seconds=300) is False
+    assert "refresh_requested_at IS NULL" in cur.executed[0][0]
+
+    conn, cur = bind_db(monkeypatch)
+    models.save_report_snapshot(key, 4, {"report": {}})
+    query, params = cur.executed[0]
+    assert "data_version <= %s" in query and params[0] == 4 and params[-1] == 4
+    models.save_report_snapshot(key, 4, None, error="boom")
+    assert "last_error = %s" in cur.executed[1][0] and cur.executed[1][1] == ("boom", key)
+
+
+def test_export_iterators_stream_scoped_rows(monkeypatch):
+    rows = [{"id": 2, "sno": "VIG/2"}, {"id": 1, "sno": "VIG/1"}]
+    conn, cur = bind_db(monkeypatch, fetchall_items=[rows])
+    stream = models.iter_petitions_for_export(
+        5, "inspector", {"from_date": date(2026, 1, 1), "petition_type": "bribe", "officer_id": 9, "target_cvo": "all"},
+        status_filter="closed", enquiry_mode="direct",
+    )
+    assert not cur.executed  # nothing runs until the response starts iterating
+    assert list(stream) == rows and conn.closed
+    query, params = cur.executed[0]
+    assert "p.assigned_inspector_id = %s" in query and "p.requires_permission = FALSE" in query
+    assert params == [5, date(2026, 1, 1), "bribe", 9, "closed"]
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[]])
+    list(models.iter_petitions_for_export(5, "cvo_apspdcl", {}, status_filter="beyond_sla"))
+    assert "1 = 0" in cur.executed[0][0]
+
+    # Sweep off (the default): the same computed set as the Beyond SLA list on screen.
+    monkeypatch.setattr(models.config, "SLA_ESCALATION_SWEEP_ENABLED", False)
+    monkeypatch.setattr(models, "get_po_beyond_sla_petition_ids", lambda rows: [r["id"] for r in rows if r["id"] == 7])
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"id": 7}, {"id": 8}], [{"id": 7, "sno": "VIG/7"}]])
+    assert list(models.iter_petitions_for_export(1, "po", {}, status_filter="beyond_sla")) == [{"id": 7, "sno": "VIG/7"}]
+    (candidate_query, _), (export_query, export_params) = cur.executed
+    assert "p.status <> 'closed'" in candidate_query and "is_sla_escalated" not in export_query
+    assert "p.id = ANY(%s)" in export_query and export_params[-1] == [7]
+
+    monkeypatch.setattr(models.config, "SLA_ESCALATION_SWEEP_ENABLED", True)
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[]])
+    list(models.iter_petitions_for_export(1, "po", {}, status_filter="beyond_sla"))
+    assert len(cur.executed) == 1 and "p.is_sla_escalated = TRUE" in cur.executed[0][0]
+
+    conn, cur = bind_db(monkeypatch, fetchall_items=[[{"id": 3, "sla_state": "beyond"}]])
+    assert list(models.iter_sla_rows_for_export("data_entry", 4, officer_id=8))[0]["sla_state"] == "beyond"
+    query, params = cur.executed[0]
+    assert "JOIN LATERAL" in query and "p.created_by = %s OR p.current_handler_id = %s" in query
+    assert params[0] == list(models.SLA_OFFICER_ROLES) and params[1:4] == [4, 4, 8]
+
+
+def test_petition_lists_read_compact_rows(monkeypatch):
+    import tracemalloc
+
+    rows = [{"id": 2, "sno": "VIG/2", "subject": "s"}, {"id": 1, "sno": "VIG/1", "subject": "t"}]
+    _conn, cur = bind_db(monkeypatch, fetchall_items=[rows])
+    result = models.get_petitions_for_user(1, "po", status_filter="all")
+    assert result == rows and isinstance(result[0], models.CompactRow)
+    assert result[0]["sno"] == "VIG/2" and result[1].get("missing") is None and dict(result[1]) == rows[1]
+    query = cur.executed[0][0]
+    assert "LEFT(p.subject, 300) AS subject" in query and "p.*" not in query
+
+    _conn, cur = bind_db(monkeypatch, fetchall_items=[rows])
+    assert list(models.get_all_petitions(status_filter="received")[1]) == ["id", "sno", "subject"]
+    assert "p.*" not in cur.executed[0][0]
+
+    columns = [f"col_{idx}" for idx in range(30)]
+
+    def _peak(build):
+        tracemalloc.start()
+        kept = build()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del kept
+        return peak
+
+    def _source():
+        return ({col: idx for idx, col in enumerate(columns)} for _ in range(20000))
+
+    dict_peak = _peak(lambda: [dict(row) for row in _source()])
+    compact_peak = _peak(lambda: list(models.iter_compact_rows(_source())))
+    assert compact_peak < dict_peak / 2
+
+
+class FakeListener:
+    def __init__(self, listening=True):
+        self.listening = listening
+        self.subscriptions = {}
+
+    def subscribe(self, channel, on_notify, on_reset=None):
+        self.subscriptions[channel] = (on_notify, on_reset)
+
+    def ensure_started(self):
+        pass
+
+
+def test_reference_cache_freezes_and_invalidates(monkeypatch):
+    import copy
+    import json
+
+    import pytest
+
+    frozen = models.freeze_reference_data({"a": {"options": [{"value": "x"}]}})
+    assert isinstance(frozen["a"], dict) and frozen["a"]["options"] == ({"value": "x"},)
+    with pytest.raises(TypeError):
+        frozen["a"]["label"] = "changed"
+    assert type(copy.deepcopy(frozen)) is dict and json.loads(json.dumps(frozen))["a"]["options"][0]["value"] == "x"
+
+    monkeypatch.setattr(models.config, "REFERENCE_CACHE_ENABLED", True)
+    listener = FakeListener(listening=False)
+    cache = models.ReferenceCache(listener)
+    calls = []
+
+    def _loader():
+        calls.append(1)
+        return [{"id": len(calls)}]
+
+    assert cache.get("users", "cvo_users", _loader)[0]["id"] == 1  # not listening yet: bypassed
+    listener.listening = True
+    assert cache.get("users", "cvo_users", _loader)[0]["id"] == 2
+    assert cache.get("users", "cvo_users", _loader)[0]["id"] == 2 and len(calls) == 2
+    cache.invalidate("help_resources")
+    assert cache.get("users", "cvo_users", _loader)[0]["id"] == 2
+    listener.subscriptions[models.REFERENCE_CACHE_CHANNEL][0]({"users"})
+    assert cache.get("users", "cvo_users", _loader)[0]["id"] == 3
+
+    def _racing_loader():
+        cache.invalidate("users")  # a writer committed while this load was running
+        return ["stale"]
+
+    cache.invalidate("users")
+    assert cache.get("users", "cvo_users", _racing_loader) == ("stale",)
+    assert cache.get("users", "cvo_users", _loader)[0]["id"] == 4
+    listener.subscriptions[models.REFERENCE_CACHE_CHANNEL][1]()  # listener reconnected
+    assert cache.get("users", "cvo_users", _loader)[0]["id"] == 5
+
+    conn, cur = bind_db(monkeypatch)
+    models.toggle_user_status(5)
+    assert cur.executed[-1] == ("SELECT pg_notify(%s, %s)", (models.REFERENCE_CACHE_CHANNEL, "users")) and conn.commits == 1
+
+
+def test_change_listener_dispatches_notifications(monkeypatch):
+    import threading
+    from types import SimpleNamespace
+
+    listener = models.ChangeListener()
+    received, resets = [], []
+    listener.subscribe("chan_a", received.append, lambda: resets.append(listener.listening))
+    listener.subscribe("chan_b", lambda payloads: 1 / 0)  # a failing handler must not stop the others
+    stop_event = threading.Event()
+
+    class ListenConn:
+        autocommit = False
+
+        def __init__(self):
+            self.listened = []
+            self.notifies = []
+
+        def cursor(self):
+            return SimpleNamespace(execute=self.listened.append)
+
+        def poll(self):
+            for channel, payload in (("chan_a", "x"), ("chan_b", "y"), ("chan_a", "z"), ("chan_a", "x")):
+                self.notifies.append(SimpleNamespace(channel=channel, payload=payload))
+
+        def close(self):
+            pass
+
+    listen_conn = ListenConn()
+    monkeypatch.setattr(models.psycopg2, "connect", lambda **_k: listen_conn)
+    selects = []
+
+    def _select(readable, _w, _x, _timeout):
+        selects.append(listener.listening)
+        if len(selects) == 2:
+            stop_event.set()
+            return [], [], []
+        return readable, [], []
+
+    monkeypatch.setattr(models.select, "select", _select)
+    listener._listen(stop_event)
+    assert listen_conn.listened == ["LISTEN chan_a", "LISTEN chan_b"] and listen_conn.autocommit
+    assert received == [{"x", "z"}] and selects == [True, True]
+    assert resets == [True, False] and not listener.listening
+
+
+def test_cache_values_round_trip_as_fresh_copies():
+    row = models.CompactRow({"id": 0, "when": 1}, (3, datetime(2026, 1, 2, 3, 4)))
+    value = {"rows": [row], "day": date(2026, 1, 2), "amount": models.Decimal("1.50"), "ids": {2, 1}}
+    decoded = models.decode_cache_value(models.encode_cache_value(value))
+    assert decoded == {"rows": [{"id": 3, "when": datetime(2026, 1, 2, 3, 4)}], "day": date(2026, 1, 2),
+                       "amount": models.Decimal("1.50"), "ids": [1, 2]}
+    null = models.NullCacheBackend()
+    assert null.get("k") is models.CACHE_MISS and null.get_or_set("k", lambda: 5) == 5
+    assert isinstance(models.build_cache_backend("none"), models.NullCacheBackend)
+    assert isinstance(models.build_cache_backend("postgres").l2, models.PostgresCacheBackend)
+
+
+def test_local_cache_backend_lru_tags_and_single_flight(monkeypatch):
+    import threading
+
+    listener = FakeListener()
+    l1 = models.LocalCacheBackend(listener, max_entries=2, ttl_seconds=60)
+    l1.set("a", {"n": 1}, tags=["petition:1"])
+    l1.set("b", {"n": 2}, tags=["petition:2"])
+    first = l1.get("a")
+    first["n"] = 99  # hits are copies
+    assert l1.get("a") == {"n": 1}
+    l1.set("c", {"n": 3}, tags=["scope:apspdcl"])
+    assert l1.get("b") is models.CACHE_MISS and l1.get("a") == {"n": 1}  # "a" was used more recently
+
+    listener.subscriptions[models.CACHE_TAG_CHANNEL][0]({"petition:1\nuser:4"})
+    assert l1.get("a") is models.CACHE_MISS and l1.get("c") == {"n": 3}
+    _conn, cur = bind_db(monkeypatch)
+    l1.delete_by_tag("scope:apspdcl", cur=cur)
+    assert l1.get("c") is models.CACHE_MISS
+    assert cur.executed == [("SELECT pg_notify(%s, %s)", (models.CACHE_TAG_CHANNEL, "scope:apspdcl"))]
+
+    calls, release = [], threading.Event()
+
+    def _slow_loader():
+        calls.append(1)
+        release.wait(5)
+        return {"total": 7}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(l1.get_or_set("k", _slow_loader, tags=["dashboard"])))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert results == [{"total": 7}] * 4 and len(calls) == 1
+
+    def _racing_loader():
+        l1.forget_tags(["dashboard:po"])  # a write committed while this load was running
+        return {"total": 0}
+
+    assert l1.get_or_set("race", _racing_loader, tags=["dashboard:po"]) == {"total": 0}
+    assert l1.get("race") is models.CACHE_MISS
+    listener.listening = False
+    assert l1.get("k") is models.CACHE_MISS and l1.get_or_set("k", lambda: "direct") == "direct"
+
+
+def test_postgres_cache_backend_statements(monkeypatch):
+    l2 = models.PostgresCacheBackend()
+    _conn, cur = bind_db(monkeypatch, fetchone_items=[{"value_json": '{"n":1}', "ttl_left": 12.5}])
+    assert l2.get("k") == {"n": 1}
+    assert "expires_at > clock_timestamp()" in cur.executed[0][0] and cur.executed[0][1] == ("k",)
+
+    conn, cur = bind_db(monkeypatch)
+    l2.delete_by_tag("petition:1", "scope:apspdcl")
+    assert "tags && %s::text[]" in cur.executed[0][0] and cur.executed[0][1] == (["petition:1", "scope:apspdcl"],)
+    assert "cache_tag_invalidations" in cur.executed[1][0] and conn.commits == 1
+
+    started = datetime(2026, 1, 1, 10, 0)
+    conn, cur = bind_db(monkeypatch, fetchone_items=[None, {"started_at": started}])
+    value, raw = l2.load_once("k", lambda: {"n": 2}, ttl_seconds=30, tags=["dashboard"])
+    assert value == {"n": 2} and raw == '{"n":2}' and conn.autocommit and conn.closed
+    statements = [query for query, _params in cur.executed]
+    assert "pg_advisory_lock" in statements[1] and "pg_advisory_unlock" in statements[-1]
+    insert_params = next(params for query, params in cur.executed if "INSERT INTO cache_entries" in query)
+    assert insert_params == ("k", raw, ["dashboard"], 30, started, ["dashboard"], started)
+
+    _conn, cur = bind_db(monkeypatch, fetchone_items=[{"value_json": '{"n":3}', "ttl_left": 9.0}])
+    assert l2.load_once("k", lambda: {"n": 4}) == ({"n": 3}, '{"n":3}')  # filled while we waited
+
+    tiered = models.TieredCacheBackend(models.LocalCacheBackend(FakeListener()), l2)
+    bind_db(monkeypatch, fetchone_items=[{"value_json": '{"n":5}', "ttl_left": 9.0}])
+    assert tiered.get_or_set("t", lambda: {"n": 6}, tags=["dashboard"]) == {"n": 5}
+    assert tiered.l1.get("t") == {"n": 5}
+
+
+def test_query_cache_decorator_and_write_invalidation(monkeypatch):
+    cache = models.LocalCacheBackend(FakeListener())
+    monkeypatch.setattr(models, "CACHE", cache)
+    monkeypatch.setattr(models.config, "QUERY_CACHE_ENABLED", True)
+
+    _conn, cur = bind_db(monkeypatch, fetchone_items=[{"id": 4, "petition_id": 9, "findings": "ok"}])
+    assert models.get_enquiry_report(9)["findings"] == "ok"
+    assert models.get_enquiry_report(petition_id=9)["findings"] == "ok" and len(cur.executed) == 1
+    bind_db(monkeypatch, fetchall_items=[[{"id": 1}], [{"id": 2}]])
+    assert models.get_petitions_for_user(5, "inspector", status_filter="all") == [{"id": 1}]
+    assert models.get_petitions_for_user(5, "inspector", status_filter="closed") == [{"id": 2}]
+    assert models.get_petitions_for_user(5, "inspector", None, "all") == [{"id": 1}]
+
+    assert models.petition_scope_cache_tags({"user_role": "cvo_apspdcl", "user_id": 3}) == ["petitions", "scope:apspdcl", "scope:apcpdcl"]
+    assert models.petition_scope_cache_tags({"user_role": "cmd_apepdcl", "user_id": 3}) == ["petitions", "scope:apepdcl", "user:3"]
+    assert models.petition_scope_cache_tags({"user_role": "po", "user_id": 3}) == ["petitions", "scope:all"]
+
+    states = iter([{"petition:9", "scope:all", "user:5"}, {"petition:9", "scope:all", "user:6"}])
+    monkeypatch.setattr(models, "_petition_cache_tags", lambda _pid: next(states))
+    cache.set("old-inspector-queue", [1], tags=["user:5"])
+    cache.set("new-inspector-queue", [], tags=["user:6"])
+    cache.set("other-office", [2], tags=["scope:apepdcl"])
+
+    @models.invalidates_petition
+    def _reassign(petition_id, inspector_id):
+        return {"id": petition_id, "inspector": inspector_id}
+
+    bind_db(monkeypatch)
+    assert _reassign(9, 6) == {"id": 9, "inspector": 6}
+    assert cache.get("old-inspector-queue") is models.CACHE_MISS and cache.get("new-inspector-queue") is models.CACHE_MISS
+    assert cache.get("other-office") == [2]
+    assert models.get_enquiry_report(9) is None  # petition:9 was dropped, so this read went to the database
+
+    @models.invalidates_petition_lists
+    def _sweep(skip):
+        return {"skipped": skip}
+
+    bind_db(monkeypatch, fetchall_items=[[{"id": 1}]])
+    assert models.get_petitions_for_user(5, "inspector", status_filter="all") == [{"id": 1}]
+    _sweep(True)
+    assert models.get_petitions_for_user(5, "inspector", status_filter="all") == [{"id": 1}]
+    _sweep(False)
+    bind_db(monkeypatch, fetchall_items=[[{"id": 3}]])
+    assert models.get_petitions_for_user(5, "inspector", status_filter="all") == [{"id": 3}]
+
+
+def test_workflow_transitions_run_as_one_statement(monkeypatch):
+    calls = [
+        lambda: models.forward_petition_to_cvo(1, 2, "apspdcl", "note"),
+        lambda: models.approve_permission(1, 2, "apspdcl", "EO-1", action_code="beyond_sla_permission_copy", mark_overdue_escalated=True),
+        lambda: models.assign_to_inspector(1, 2, 8, "assign", "detailed", "memo.pdf"),
+        lambda: models.po_give_conclusion(1, 2, "EO-1", "done", "ins", "c.pdf"),
+        lambda: models.po_send_to_cmd(1, 2, "act", "EO-1", cmd_user_id=6),
+        lambda: models.cmd_submit_action_report(1, 6, "done", "a.pdf"),
+        lambda: models.close_petition(1, 2, "close"),
+    ]
+    for call in calls:
+        conn, cur = bind_db(monkeypatch, fetchall_items=[[MOVED]])
+        assert call()["moved"] is True
+        assert len(cur.executed) == 1 and conn.commits == 1
+        query, params = cur.executed[0]
+        assert query.lstrip().startswith("WITH actor AS") and "FOR UPDATE" in query
+        assert set(re.findall(r"%\((\w+)\)s", query)) <= set(params)
+
+    _, cur = bind_db(monkeypatch, fetchall_items=[[MOVED]])
+    models.assign_to_inspector(1, 2, 8)
+    query, params = cur.executed[0]
+    assert "UNION ALL" in query and params["also_action_code"] == "direct_enquiry_ack_to_po"
+    assert params["from_statuses"] == ["permission_approved", "forwarded_to_cvo"]
+
+    _, cur = bind_db(monkeypatch, fetchall_items=[[MOVED]])
+    models.po_send_to_cmd(1, 2, "act")
+    assert "ON u.id = %(handler_id)s" not in cur.executed[0][0]
+
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[stuck(status_before="closed", handler_id=2, handler_role="po")]])
+    try:
+        models.close_petition(1, 2, "again")
+        assert False, "Expected exception"
+    except models.WorkflowTransitionError as exc:
+        assert "while the petition is closed" in str(exc)
+        assert conn.rollbacks == 1 and conn.commits == 0
+
+    conn, _ = bind_db(monkeypatch, fetchall_items=[[stuck()]])
+    try:
+        models.po_send_to_cmd(1, 2, "act", cmd_user_id=99)
+        assert False, "Expected exception"
+    except models.WorkflowTransitionError as exc:
+        assert "assignee is invalid" in str(exc)
+
+
+def test_bulk_workflow_transition_prechecks_then_applies_once(monkeypatch):
+    monkeypatch.setattr(models, "cache_invalidation_active", lambda: True)
+    dropped = []
+    monkeypatch.setattr(models, "_drop_cache_tags", dropped.append)
+    prechecked = [
+        {"id": 1, "status": "lodged", "efile_no": "EO-1"},
+        {"id": 2, "status": "lodged", "efile_no": ""},
+        {"id": 3, "status": "received", "efile_no": "EO-3"},
+        {"id": 4, "status": "lodged", "efile_no": "EO-4"},
+    ]
+    applied = [
+        {"petition_id": 1, "status_before": "lodged", "moved": True},
+        {"petition_id": 4, "status_before": "closed", "handler_id": None, "moved": False},
+    ]
+    conn, cur = bind_db(monkeypatch, fetchall_items=[prechecked, applied])
+    results = models.bulk_workflow_transition(
+        [4, 3, 2, 1, 5], "closed", 9, "po",
+        precheck=lambda row: None if row["efile_no"] else "E-Office File No is required.",
+        comments="bulk",
+    )
+    assert results == {
+        1: None,
+        2: "E-Office File No is required.",
+        3: "'Petition Closed' is not allowed while the petition is received.",
+        4: "'Petition Closed' is not allowed while the petition is closed.",
+        5: "Petition not found.",
+    }
+    assert len(cur.executed) == 2 and conn.commits == 1
+    scope_query, scope_params = cur.executed[0]
+    assert "p.id = ANY(%s)" in scope_query and scope_params[0] == [1, 2, 3, 4, 5] and scope_params[1] == 9
+    assert cur.executed[1][1]["petition_ids"] == [1, 4] and "ORDER BY id" in cur.executed[1][0]
+    assert dropped == [{"petition:1", "petitions"}]
+
+
+def test_inbox_follows_workflow_writes_and_pages_by_keyset(monkeypatch):
+    _, cur = bind_db(monkeypatch, fetchall_items=[[MOVED]])
+    models.forward_petition_to_cvo(1, 2, "apspdcl")
+    query = cur.executed[0][0]
+    assert "inbox_cleared AS (" in query and "inboxed AS (" in query
+    assert "FROM moved p" in query and "ON CONFLICT (petition_id) DO UPDATE" in query
+
+    _, cur = bind_db(monkeypatch, fetchone_items=[{"status": "received"}])
+    models.update_imported_petition_state(7, 1, status="forwarded_to_po", current_handler_id=2)
+    inbox_writes = [(q, p) for q, p in cur.executed if "inbox" in q]
+    assert [q.split()[0] for q, _ in inbox_writes] == ["DELETE", "INSERT"]
+    assert all(p == {"petition_ids": [7]} for _, p in inbox_writes)
+
+    since = datetime(2026, 1, 5, 10, 0)
+    rows = [{"petition_id": pid, "since": since} for pid in (9, 8, 7)]
+    _, cur = bind_db(monkeypatch, fetchall_items=[rows])
+    page = models.get_inbox_page(4, limit=2, after=(datetime(2026, 1, 6), 12), status="received")
+    assert [r["petition_id"] for r in page["items"]] == [9, 8]
+    assert page["next_cursor"] == (since, 8)
+    query, params = cur.executed[0]
+    assert "(i.since, i.petition_id) < (%s, %s)" in query
+    assert params == [4, "received", datetime(2026, 1, 6), 12, 3]
+
+    _, cur = bind_db(monkeypatch, fetchall_items=[[
+        {"status": "received", "total": 3, "overdue": 1, "today": 2},
+        {"status": "forwarded_to_po", "total": 2, "overdue": 0, "today": 0},
+    ]])
+    assert models.get_inbox_counts(4) == {
+        "total": 5, "overdue": 1, "today": 2, "by_status": {"received": 3, "forwarded_to_po": 2},
+    }
+
+
+def test_inbox_events_notify_on_commit_and_fan_out_per_user(monkeypatch):
+    monkeypatch.setattr(models.config, "EVENTS_ENABLED", True, raising=False)
+    monkeypatch.setattr(models.config, "EVENTS_MAX_STREAMS", 2, raising=False)
+    moved = dict(MOVED, handler_before=3, handler_after=2)
+    _, cur = bind_db(monkeypatch, fetchall_items=[[moved]])
+    models.forward_petition_to_cvo(1, 3, "apspdcl")
+    query, params = cur.executed[1]
+    assert "pg_notify" in query and params[0] == models.INBOX_EVENTS_CHANNEL
+    assert [json.loads(p) for p in params[1]] == [
+        {"petition_id": 1, "from_user_id": 3, "to_user_id": 2, "status": "forwarded_to_cvo"},
+    ]
+
+    class ListenerStub:
+        def subscribe(self, channel, on_notify, on_reset=None):
+            self.on_notify, self.on_reset = on_notify, on_reset
+
+        def ensure_started(self):
+            pass
+
+    listener = ListenerStub()
+    hub = models.InboxEventHub(listener)
+    mine, theirs = hub.open_stream(2), hub.open_stream(3)
+    assert hub.open_stream(4) is None
+    listener.on_notify({params[1][0]})
+    assert mine.get_nowait()["to_user_id"] == 2 and theirs.get_nowait()["from_user_id"] == 3
+    hub.close_stream(3, theirs)
+    listener.on_reset()
+    assert mine.get_nowait() == {"resync": True} and hub.stream_count == 1
+
+
+def test_petition_changes_walk_updated_at_and_tracking_cursors(monkeypatch):
+    stamp = datetime(2026, 4, 1, 12, 0)
+    petitions = [{"id": pid, "updated_at": stamp, "status": "received"} for pid in (4, 5, 6)]
+    tracking = [{"id": 40, "petition_id": 4}]
+    _, cur = bind_db(monkeypatch, fetchall_items=[petitions, tracking])
+    changes = models.get_petition_changes(
+        7, "inspector", since=(datetime(2026, 3, 1), 2, 30), limit=2, fields=["status", "bogus"],
+    )
+    assert [p["id"] for p in changes["petitions"]] == [4, 5]
+    assert changes["cursor"] == (stamp, 5, 40) and changes["has_more"] is True
+    petition_query, petition_params = cur.executed[0]
+    assert "SELECT p.id, p.updated_at, p.status\n" in petition_query and "bogus" not in petition_query
+    assert "(p.updated_at, p.id) > (%s, %s)" in petition_query and "ORDER BY p.updated_at, p.id" in petition_query
+    assert petition_params == [models.PETITION_CHANGES_SETTLE_SECONDS, datetime(2026, 3, 1), 2, 7, 3]
+    tracking_query, tracking_params = cur.executed[1]
+    assert "p.assigned_inspector_id = %s" in tracking_query
+    assert tracking_params == [30, models.PETITION_CHANGES_SETTLE_SECONDS, 7, 3]
+
+    _, cur = bind_db(monkeypatch, fetchall_items=[[], []])
+    changes = models.get_petition_changes(1, "super_admin")
+    assert changes["cursor"] == (None, 0, 0) and changes["has_more"] is False
+    assert "(p.updated_at, p.id) >" not in cur.executed[0][0]
@@ -1,4 +1,5 @@
 import io
+import os
 from datetime import datetime, timedelta
 
 from werkzeug.datastructures import FileStorage
@@ -277,3 +278,18 @@ def test_sla_stats_with_conn_role_filters(monkeypatch):
     assert stats["sla_breached"] == 0
     assert stats["sla_in_progress"] == 1
     assert any("WHERE p.target_cvo IN (" in q for q, _ in cursor.queries)
+
+
+def test_production_config_enables_template_bytecode_cache(monkeypatch):
+    from config import Config
+
+    monkeypatch.setenv("APP_ENV", "production")
+    monkeypatch.setenv("SECRET_KEY", "test-secret")
+    monkeypatch.setenv("DB_PASSWORD", "test-password")
+    monkeypatch.delenv("TEMPLATE_BYTECODE_CACHE_DIR", raising=False)
+    production = Config()
+    assert production.TEMPLATE_BYTECODE_CACHE_DIR.endswith(os.path.join("instance", "jinja_cache"))
+    assert production.TEMPLATE_AUTO_RELOAD is False and production.TEMPLATE_PRECOMPILE is True
+
+    monkeypatch.setenv("TEMPLATE_BYTECODE_CACHE_DIR", "")
+    assert Config().TEMPLATE_BYTECODE_CACHE_DIR == ""
@@ -0,0 +1,192 @@
+"""
+Background Job Worker
+Processes queued bulk imports and bulk user uploads. Run alongside the web server:
+    python worker.py                 # uses JOB_WORKER_THREADS from .env
+    python worker.py --threads 4
+    python worker.py --once          # drain the queue and exit (cron / scheduled task)
+    python worker.py --sweep-sla     # run one overdue escalation sweep and exit
+    python worker.py --refresh-rollups  # rebuild the daily analytics rollups and exit
+Enable enqueueing in the web app with BACKGROUND_JOBS_ENABLED=1. With
+SLA_ESCALATION_SWEEP_ENABLED=1 the worker also flags overdue petitions every
+SLA_SWEEP_INTERVAL_SECONDS; with ANALYTICS_ROLLUPS_ENABLED=1 it rebuilds the
+analytics rollups every ANALYTICS_ROLLUP_REFRESH_SECONDS (queued petition writes,
+imports and the SLA sweep refresh just the days they touch), and with
+REPORT_SNAPSHOTS_ENABLED=1 it rebuilds stale analysis report snapshots every
+REPORT_SNAPSHOT_REFRESH_SECONDS. With CACHE_BACKEND=postgres it purges expired
+shared cache entries every CACHE_PURGE_INTERVAL_SECONDS. Finished jobs are deleted
+hourly once they are older than JOB_RETENTION_DAYS.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+
+import models
+from app import app, config, process_next_background_job, refresh_stale_report_snapshots
+
+JOB_PURGE_INTERVAL_SECONDS = 3600
+
+
+def _worker_loop(worker_id, stop_event, run_once=False):
+    while not stop_event.is_set():
+        try:
+            processed = process_next_background_job(worker_id)
+        except Exception:
+            app.logger.exception('Worker %s could not claim a job', worker_id)
+            processed = False
+        if not processed:
+            if run_once:
+                return
+            stop_event.wait(max(1, config.JOB_POLL_INTERVAL_SECONDS))
+
+
+def _run_sla_sweep():
+    try:
+        summary = models.run_sla_escalation_sweep(batch_size=config.SLA_SWEEP_BATCH_SIZE)
+    except Exception:
+        app.logger.exception('SLA escalation sweep failed')
+        return None
+    changed_ids = summary.pop('petition_ids', None)
+    if changed_ids and config.ANALYTICS_ROLLUPS_ENABLED:
+        # Newly escalated petitions moved SLA bucket; keep their received days current.
+        try:
+            models.refresh_petition_rollups(petition_ids=changed_ids)
+        except Exception:
+            app.logger.exception('Petition rollup refresh after the SLA sweep failed')
+    if not summary.get('skipped'):
+        app.logger.info(
+            'SLA escalation sweep: scanned=%s escalated=%s cleared=%s',
+            summary['scanned'], summary['escalated'], summary['cleared'],
+        )
+    return summary
+
+
+def _sla_sweep_loop(stop_event):
+    while not stop_event.is_set():
+        _run_sla_sweep()
+        stop_event.wait(max(60, config.SLA_SWEEP_INTERVAL_SECONDS))
+
+
+def _run_rollup_refresh():
+    try:
+        summary = models.refresh_petition_rollups()
+    except Exception:
+        app.logger.exception('Petition rollup refresh failed')
+        return None
+    app.logger.info('Petition rollups rebuilt: petitions=%s rows=%s', summary['petitions'], summary['rows'])
+    return summary
+
+
+def _rollup_refresh_loop(stop_event):
+    while not stop_event.is_set():
+        _run_rollup_refresh()
+        stop_event.wait(max(60, config.ANALYTICS_ROLLUP_REFRESH_SECONDS))
+
+
+def _report_snapshot_loop(stop_event):
+    while not stop_event.is_set():
+        try:
+            summary = refresh_stale_report_snapshots()
+            if summary['rebuilt'] or summary['purged']:
+                app.logger.info('Report snapshots: rebuilt=%s purged=%s', summary['rebuilt'], summary['purged'])
+        except Exception:
+            app.logger.exception('Report snapshot refresh failed')
+        stop_event.wait(max(60, config.REPORT_SNAPSHOT_REFRESH_SECONDS))
+
+
+def _cache_purge_loop(stop_event):
+    while not stop_event.is_set():
+        try:
+            summary = models.purge_cache_entries()
+            if summary['expired']:
+                app.logger.info('Shared cache: purged %s expired entries', summary['expired'])
+        except Exception:
+            app.logger.exception('Shared cache purge failed')
+        stop_event.wait(max(60, config.CACHE_PURGE_INTERVAL_SECONDS))
+
+
+def _job_purge_loop(stop_event):
+    while not stop_event.is_set():
+        try:
+            purged = models.purge_finished_jobs(config.JOB_RETENTION_DAYS)
+            if purged:
+                app.logger.info('Jobs: purged %s finished jobs older than %s days', purged, config.JOB_RETENTION_DAYS)
+        except Exception:
+            app.logger.exception('Finished job purge failed')
+        stop_event.wait(JOB_PURGE_INTERVAL_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run Petition Tracker background job workers.')
+    parser.add_argument('--threads', type=int, default=config.JOB_WORKER_THREADS, help='Number of worker threads.')
+    parser.add_argument('--once', action='store_true', help='Process runnable jobs and exit when the queue is empty.')
+    parser.add_argument('--sweep-sla', action='store_true', help='Run one overdue escalation sweep and exit.')
+    parser.add_argument('--refresh-rollups', action='store_true', help='Rebuild the daily analytics rollups and exit.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(threadName)s %(message)s')
+    if args.sweep_sla:
+        summary = _run_sla_sweep()
+        print(f'SLA escalation sweep result: {summary}')
+        return
+    if args.refresh_rollups:
+        summary = _run_rollup_refresh()
+        print(f'Petition rollup refresh result: {summary}')
+        return
+    stop_event = threading.Event()
+
+    def _request_stop(_signum, _frame):
+        app.logger.info('Stop requested; workers will exit after their current job.')
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    threads = []
+    for idx in range(max(1, args.threads)):
+        worker_id = f'{prefix}:{idx + 1}'
+        t = threading.Thread(
+            target=_worker_loop,
+            args=(worker_id, stop_event, args.once),
+            name=f'job-worker-{idx + 1}',
+            daemon=True,
+        )
+        t.start()
+        threads.append(t)
+
+    if not args.once:
+        t = threading.Thread(target=_job_purge_loop, args=(stop_event,), name='job-purge', daemon=True)
+        t.start()
+        threads.append(t)
+
+    if config.SLA_ESCALATION_SWEEP_ENABLED and not args.once:
+        t = threading.Thread(target=_sla_sweep_loop, args=(stop_event,), name='sla-sweeper', daemon=True)
+        t.start()
+        threads.append(t)
+
+    if config.ANALYTICS_ROLLUPS_ENABLED and not args.once:
+        t = threading.Thread(target=_rollup_refresh_loop, args=(stop_event,), name='rollup-refresh', daemon=True)
+        t.start()
+        threads.append(t)
+
+    if config.REPORT_SNAPSHOTS_ENABLED and not args.once:
+        t = threading.Thread(target=_report_snapshot_loop, args=(stop_event,), name='report-snapshots', daemon=True)
+        t.start()
+        threads.append(t)
+
+    if config.CACHE_BACKEND == 'postgres' and not args.once:
+        t = threading.Thread(target=_cache_purge_loop, args=(stop_event,), name='cache-purge', daemon=True)
+        t.start()
+        threads.append(t)
+
+    print(f'Started {len(threads)} worker thread(s) as {prefix}.')
+    for t in threads:
+        while t.is_alive():
+            t.join(timeout=1)
+
+
+if __name__ == '__main__':
+    main()